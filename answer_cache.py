@@ -0,0 +1,197 @@
+import os
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """Cache de respuestas indexada por el embedding de la pregunta
+
+    Una pregunta nueva reutiliza la respuesta de otra anterior si la similitud coseno
+    entre sus embeddings supera `threshold` (y se pidió con el mismo top_k y sobre los
+    mismos espacios de nombres: `scope`, que nunca se mezclan). Las
+    entradas caducan a los `ttl` segundos y, al llegar a `max_entries`, se sustituye
+    la usada hace más tiempo. `clear()` invalida todo cuando cambia el corpus.
+
+    Con varios procesos sobre el mismo corpus (workers del servidor, ingestion.py), cada
+    uno tiene su cache: con `stamp_path`, `clear()` reescribe ese fichero compartido con
+    una marca nueva y los demás procesos, que la leen en cada consulta, se invalidan al
+    ver que ha cambiado.
+    """
+
+    def __init__(self, dim: int, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1000,
+                 stamp_path: Optional[str] = None):
+        self.dim = dim
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        # Se incrementa en cada invalidación para descartar respuestas calculadas antes
+        self.generation = 0
+
+        self._lock = threading.Lock()
+        self._embeddings = np.zeros((max_entries, dim), dtype=np.float32)
+        self._top_k = np.zeros(max_entries, dtype=np.int64)
+        # Ámbito de cada entrada, como un código por valor distinto de `scope` (-1 = hueco sin usar).
+        # Solo tienen código los ámbitos de alguna entrada: se asigna al guardar y se libera al
+        # sustituir la última entrada que lo usa, así que no crece con los filtros de cada pregunta
+        self._scope = np.full(max_entries, -1, dtype=np.int64)
+        self._scope_codes: Dict[Hashable, int] = {}
+        self._scope_values: Dict[int, Hashable] = {}
+        self._next_scope_code = 0
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._results: List[Optional[Dict[str, Any]]] = [None] * max_entries
+
+        # Última marca leída del fichero compartido (se crea si no existe)
+        self.stamp_path = stamp_path
+        self._stamp = None
+        if stamp_path:
+            self._stamp = self._read_stamp()
+            if self._stamp is None:
+                self._stamp = self._write_stamp()
+
+    @classmethod
+    def from_env(cls, dim: int) -> Optional["SemanticAnswerCache"]:
+        """Crear la cache si ANSWER_CACHE_ENABLED=true"""
+        if os.getenv('ANSWER_CACHE_ENABLED', 'false').lower() != 'true':
+            return None
+        return cls(
+            dim,
+            threshold=float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95')),
+            ttl=float(os.getenv('ANSWER_CACHE_TTL', '3600')),
+            max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000')),
+            stamp_path=os.getenv('ANSWER_CACHE_STAMP') or None,
+        )
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def _read_stamp(self) -> Optional[str]:
+        try:
+            with open(self.stamp_path, encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_stamp(self) -> Optional[str]:
+        """Reemplazar (de forma atómica) la marca compartida por una nueva"""
+        stamp = uuid.uuid4().hex
+        directory = os.path.dirname(os.path.abspath(self.stamp_path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".answer-cache-")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(stamp)
+            os.replace(tmp_path, self.stamp_path)
+        except OSError as e:
+            logger.error(f"No se pudo actualizar la marca de la cache de respuestas ({self.stamp_path}): {e}")
+        return stamp
+
+    def _sync_stamp(self):
+        """Invalidar si otro proceso ha cambiado la marca compartida (con el lock tomado)"""
+        if not self.stamp_path:
+            return
+        stamp = self._read_stamp()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._reset()
+            logger.info("Cache de respuestas invalidada por otro proceso")
+
+    def _reset(self):
+        self._expires[:] = 0
+        self._results = [None] * self.max_entries
+        self._scope[:] = -1
+        self._scope_codes.clear()
+        self._scope_values.clear()
+        self.generation += 1
+
+    def _scope_code(self, scope: Hashable) -> int:
+        """Código de `scope`, asignándole uno nuevo si no lo tiene"""
+        code = self._scope_codes.get(scope)
+        if code is None:
+            code = self._scope_codes[scope] = self._next_scope_code
+            self._scope_values[code] = scope
+            self._next_scope_code += 1
+        return code
+
+    def _release_scope(self, code: int):
+        """Olvidar el código de un ámbito si ya no lo usa ninguna entrada"""
+        if code >= 0 and not (self._scope == code).any():
+            del self._scope_codes[self._scope_values.pop(code)]
+
+    def lookup(self, embedding: np.ndarray, top_k: int, scope: Hashable = None) -> Optional[Dict[str, Any]]:
+        """Buscar una respuesta para una pregunta parecida; None si no hay ninguna"""
+        query = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            self._sync_stamp()
+            code = self._scope_codes.get(scope)
+            if code is None:
+                # Ninguna entrada de ese ámbito
+                self.misses += 1
+                return None
+            valid = (self._expires > now) & (self._top_k == top_k) & (self._scope == code)
+            if valid.any():
+                similarities = np.where(valid, self._embeddings @ query, -np.inf)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._last_used[best] = now
+                    self.hits += 1
+                    return self._results[best]
+            self.misses += 1
+            return None
+
+    def store(self, embedding: np.ndarray, top_k: int, result: Dict[str, Any], generation: int = None,
+              scope: Hashable = None):
+        """Guardar una respuesta (se ignora si el corpus cambió desde `generation`)"""
+        now = time.time()
+        with self._lock:
+            self._sync_stamp()
+            if generation is not None and generation != self.generation:
+                return
+
+            # Hueco libre o caducado; si no hay, la entrada usada hace más tiempo
+            expired = np.flatnonzero(self._expires <= now)
+            slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+
+            replaced = int(self._scope[slot])
+            self._embeddings[slot] = self._normalize(embedding)
+            self._top_k[slot] = top_k
+            self._scope[slot] = self._scope_code(scope)
+            self._release_scope(replaced)
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._results[slot] = result
+
+    def clear(self):
+        """Invalidar todas las respuestas (el corpus ha cambiado), también en los demás procesos"""
+        with self._lock:
+            self._reset()
+            if self.stamp_path:
+                self._stamp = self._write_stamp()
+        logger.info("Cache de respuestas invalidada")
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos y fallos"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": int((self._expires > time.time()).sum()),
+            "max_entries": self.max_entries,
+        }
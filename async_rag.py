@@ -0,0 +1,304 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, List, Optional
+
+import numpy as np
+
+from rag_system import RAGSystem, NO_CONTEXT_ANSWER, Namespaces
+from metrics import get_metrics
+
+if TYPE_CHECKING:
+    import ollama
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+class AsyncRAGSystem:
+    """Interfaz asíncrona de RAGSystem para atender cientos de preguntas en vuelo desde un event loop
+
+    La generación usa ollama.AsyncClient: mientras Ollama responde (segundos por
+    pregunta) no se ocupa ningún hilo. Lo demás es CPU o llamadas bloqueantes de pymilvus
+    (la 2.3 no tiene cliente asíncrono): el embedding de la pregunta, la búsqueda, BM25,
+    la reordenación, la preparación del prompt y la ingesta se ejecutan en un pool de
+    `threads` hilos (RAG_QUERY_THREADS), que se puede compartir con el servidor.
+
+    Como mucho hay `max_concurrency` generaciones a la vez (RAG_MAX_IN_FLIGHT, 0 sin
+    límite); las demás esperan turno sin ocupar hilos ni conexiones. Cancelar la tarea
+    que espera una respuesta (p. ej. porque el cliente HTTP se ha desconectado) cierra
+    la conexión con Ollama, que deja de generar; una etapa que ya se está ejecutando en
+    el pool termina, pero las siguientes no empiezan.
+    """
+
+    def __init__(self, rag: RAGSystem = None, ollama_client: "ollama.AsyncClient" = None,
+                 executor: Executor = None, threads: Optional[int] = None, max_concurrency: Optional[int] = None):
+        self.rag = rag or RAGSystem()
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv('RAG_MAX_IN_FLIGHT', '256'))
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+        # Pool de hilos para el trabajo bloqueante (propio si no se pasa uno)
+        self._owns_executor = executor is None
+        if executor is None:
+            threads = threads or int(os.getenv('RAG_QUERY_THREADS', '16'))
+            executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="rag-async")
+        self.executor = executor
+
+        # Cliente asíncrono de Ollama (se crea en el primer uso con la configuración del síncrono)
+        self._ollama_client = ollama_client
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.cancelled = 0
+
+    @property
+    def ollama_client(self) -> "ollama.AsyncClient":
+        """Cliente asíncrono de Ollama: mismo host y timeouts que el de RAGSystem y una conexión por generación
+
+        Solo se conservan abiertas OLLAMA_ASYNC_KEEPALIVE (16) conexiones libres: el pool
+        asíncrono de httpcore recorre todas sus conexiones en cada petición y con cientos
+        de conexiones en keep-alive una ráfaga de 200 preguntas tardaba de 2 a 8 s en vez de ~1 s.
+        """
+        if self._ollama_client is None:
+            import ollama
+            pool_size = self.max_concurrency if self.max_concurrency > 0 else 1024
+            keepalive = int(os.getenv('OLLAMA_ASYNC_KEEPALIVE', '16'))
+            self._ollama_client = ollama.AsyncClient(**self.rag.ollama_client_options(pool_size, keepalive))
+        return self._ollama_client
+
+    async def _run(self, function: Callable, *args, **kwargs) -> Any:
+        """Ejecutar una llamada bloqueante en el pool (con el contexto actual: las spans van a la traza en curso)"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, function, *args, **kwargs))
+
+    def _enter(self):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self, error: Optional[BaseException]):
+        self.in_flight -= 1
+        # Cancelada, o un stream que el consumidor cerró antes de terminar
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            self.cancelled += 1
+
+    async def retrieve_context(self, query: str, top_k: int = 5, namespace: Namespaces = None,
+                               filters: Optional[Dict[str, Any]] = None,
+                               output_fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """RAGSystem.retrieve_context en el pool"""
+        return await self._run(self.rag.retrieve_context, query, top_k, namespace, filters, output_fields)
+
+    async def retrieve_batch(self, questions: List[str], top_k: int = 5, namespace: Namespaces = None,
+                             filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """RAGSystem.retrieve_batch en el pool (una sola búsqueda para todas las preguntas)"""
+        return await self._run(self.rag.retrieve_batch, questions, top_k, namespace, filters)
+
+    async def add_documents(self, documents: List[str], **kwargs) -> int:
+        """RAGSystem.add_documents en el pool"""
+        return await self._run(self.rag.add_documents, documents, **kwargs)
+
+    async def generate_response(self, query: str, context_docs: List[Dict[str, Any]],
+                                query_embedding: Optional[np.ndarray] = None) -> str:
+        """Generar la respuesta con el cliente asíncrono de Ollama"""
+        try:
+            request = await self._run(self.rag.chat_request, query, context_docs, query_embedding)
+            metrics = get_metrics()
+            async with self._slot():
+                with metrics.span("generate"):
+                    response = await self.rag.ollama_breaker.call_async(
+                        self.rag.ollama_retry.call_async,
+                        self.ollama_client.chat,
+                        **request
+                    )
+            metrics.observe_generation(self.rag.ollama_model, response)
+            return response['message']['content'].strip()
+
+        except Exception as e:
+            logger.error(f"Error generando respuesta: {e}")
+            raise
+
+    async def generate_response_stream(self, query: str, context_docs: List[Dict[str, Any]],
+                                       query_embedding: Optional[np.ndarray] = None) -> AsyncIterator[str]:
+        """Generar la respuesta devolviendo los tokens a medida que llegan (cerrarlo corta la generación)"""
+        try:
+            request = await self._run(self.rag.chat_request, query, context_docs, query_embedding)
+            metrics = get_metrics()
+            async with self._slot():
+                with metrics.span("generate"):
+                    start = time.perf_counter()
+                    stream = self.rag.ollama_breaker.call_async_stream(
+                        self.rag.ollama_retry.call_async_stream,
+                        self.ollama_client.chat,
+                        **request,
+                        stream=True
+                    )
+                    try:
+                        first_token = True
+                        async for part in stream:
+                            token = part['message']['content']
+                            if token:
+                                if first_token:
+                                    metrics.observe("generate_first_token", time.perf_counter() - start)
+                                    first_token = False
+                                yield token
+                            if part.get('done'):
+                                metrics.observe_generation(self.rag.ollama_model, part)
+                    finally:
+                        await stream.aclose()
+
+        except Exception as e:
+            logger.error(f"Error generando respuesta: {e}")
+            raise
+
+    def _slot(self):
+        """Turno de generación (sin límite si max_concurrency es 0)"""
+        return self._slots if self._slots is not None else _NoSlot()
+
+    async def ask_with_context(self, question: str, context_docs: List[Dict[str, Any]],
+                               query_embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Responder a una pregunta con un contexto ya recuperado"""
+        if not context_docs:
+            return {"question": question, "answer": NO_CONTEXT_ANSWER, "sources": []}
+        try:
+            answer = await self.generate_response(question, context_docs, query_embedding)
+            return {"question": question, "answer": answer, "sources": self.rag._format_sources(context_docs)}
+        except Exception as e:
+            return self.rag._generation_failed(question, context_docs, e)
+
+    async def answer_retrieved(self, question: str, retrieved: Dict[str, Any]) -> Dict[str, Any]:
+        """Responder a una pregunta a partir de lo que devolvió retrieve_batch"""
+        if retrieved["cached"] is not None:
+            return {**retrieved["cached"], "question": question}
+        self._enter()
+        error = None
+        try:
+            with get_metrics().trace("answer"):
+                result = await self.ask_with_context(question, retrieved["context_docs"], retrieved["query_embedding"])
+            self.rag._cache_answer(retrieved, result)
+            return result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._exit(error)
+
+    async def ask(self, question: str, top_k: int = 5, namespace: Namespaces = None,
+                  filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Versión asíncrona de RAGSystem.ask"""
+        self._enter()
+        error = None
+        try:
+            with get_metrics().trace("ask"):
+                try:
+                    retrieved = (await self.retrieve_batch([question], top_k, namespace, filters))[0]
+                except Exception as e:
+                    logger.error(f"Error en consulta RAG: {e}")
+                    get_metrics().annotate(error=str(e))
+                    return self.rag._error_result(question, e)
+                if retrieved["cached"] is not None:
+                    return {**retrieved["cached"], "question": question}
+                result = await self.ask_with_context(question, retrieved["context_docs"], retrieved["query_embedding"])
+                self.rag._cache_answer(retrieved, result)
+                return result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._exit(error)
+
+    async def ask_batch(self, questions: List[str], top_k: int = 5, namespace: Namespaces = None,
+                        filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Varias preguntas: una sola recuperación en lote y las generaciones a la vez"""
+        try:
+            retrieved = await self.retrieve_batch(questions, top_k, namespace, filters)
+        except Exception as e:
+            logger.error(f"Error en consulta RAG: {e}")
+            return [self.rag._error_result(question, e) for question in questions]
+        return list(await asyncio.gather(*(
+            self.answer_retrieved(question, item) for question, item in zip(questions, retrieved)
+        )))
+
+    async def ask_stream(self, question: str, top_k: int = 5, namespace: Namespaces = None,
+                         filters: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Versión asíncrona de RAGSystem.ask_stream (mismos eventos); cerrarlo corta la generación"""
+        self._enter()
+        error = None
+        try:
+            retrieved = (await self.retrieve_batch([question], top_k, namespace, filters))[0]
+
+            if retrieved["cached"] is not None:
+                cached = retrieved["cached"]
+                yield {"type": "sources", "question": question, "sources": cached["sources"]}
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "done"}
+                return
+
+            context_docs = retrieved["context_docs"]
+            sources = self.rag._format_sources(context_docs)
+            yield {"type": "sources", "question": question, "sources": sources}
+
+            if not context_docs:
+                yield {"type": "token", "content": NO_CONTEXT_ANSWER}
+                yield {"type": "done"}
+                return
+
+            tokens = []
+            stream = self.generate_response_stream(question, context_docs, retrieved["query_embedding"])
+            try:
+                async for token in stream:
+                    tokens.append(token)
+                    yield {"type": "token", "content": token}
+            except Exception as e:
+                # Si Ollama no responde antes del primer token, la respuesta son los fragmentos
+                if tokens or not self.rag._use_fallback(e):
+                    raise
+                logger.warning(f"Ollama no disponible ({e}): se responde solo con los fragmentos recuperados")
+                yield {"type": "token", "content": self.rag._retrieval_only_answer(context_docs)}
+                yield {"type": "done", "degraded": True}
+                return
+            finally:
+                await stream.aclose()
+
+            self.rag._cache_answer(retrieved, {"question": question, "answer": "".join(tokens).strip(),
+                                               "sources": sources})
+            yield {"type": "done"}
+
+        except Exception as e:
+            logger.error(f"Error en consulta RAG: {e}")
+            yield {"type": "error", "error": self.rag._error_result(question, e)["answer"]}
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._exit(error)
+
+    def stats(self) -> Dict[str, Any]:
+        """Preguntas en vuelo (ahora y como máximo) y cuántas se cancelaron"""
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "cancelled": self.cancelled,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    async def aclose(self):
+        """Cerrar las conexiones con Ollama y el pool propio"""
+        client = getattr(self._ollama_client, "_client", None)
+        if client is not None:
+            await client.aclose()
+        if self._owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _NoSlot:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
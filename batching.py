@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Agrupa peticiones concurrentes durante unos milisegundos y las resuelve con una sola llamada
+
+    `batch_fn` recibe la lista de elementos acumulados y debe devolver una lista de
+    resultados en el mismo orden. Se ejecuta en `executor` para no bloquear el event loop.
+
+    Como mucho hay `max_in_flight` lotes en ejecución: mientras el encoder está ocupado
+    las peticiones nuevas se siguen acumulando y salen juntas en el siguiente lote.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], executor: Optional[Executor] = None,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, max_in_flight: int = 1):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Encolar un elemento y esperar su resultado"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Enviar lo acumulado si hay hueco para otro lote en ejecución"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending and len(self._tasks) < self.max_in_flight:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._on_batch_done)
+
+    def _on_batch_done(self, task: asyncio.Task):
+        """Al terminar un lote, enviar inmediatamente lo que se haya acumulado"""
+        self._tasks.discard(task)
+        if self._pending:
+            self._flush()
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """Ejecutar batch_fn y repartir los resultados entre las peticiones"""
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+        except Exception as e:
+            logger.error(f"Error procesando un lote de {len(items)} peticiones: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # La petición puede haberse cancelado mientras tanto (cliente desconectado)
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,6 @@
+"""
+Benchmarks del sistema RAG
+
+Se ejecutan desde la raíz del proyecto, por ejemplo:
+    python -m benchmarks.load_test
+"""
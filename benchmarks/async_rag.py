@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+AsyncRAGSystem frente a RAGSystem en un pool de hilos con muchas preguntas en vuelo
+
+Lanza --questions preguntas a la vez contra un Ollama simulado en otro proceso
+(--prefill-latency + --tokens × --token-latency segundos por respuesta) y un Milvus
+simulado en memoria, y compara:
+
+- sync: RAGSystem.ask en un ThreadPoolExecutor de --threads hilos (lo que hacía el servidor)
+- async N: AsyncRAGSystem.ask con como mucho N preguntas en vuelo (--concurrency)
+
+Para cada uno da preguntas/s, latencia p50/p99 y, con --stream (ask_stream), el
+tiempo hasta el primer token (todo desde que se lanzan las preguntas, con la espera
+incluida) y el máximo de hilos del proceso. Al final cancela --cancel preguntas en streaming a
+mitad de la generación con un Ollama simulado en este proceso y cuenta cuántas
+generaciones se cortaron de verdad en Ollama.
+
+    python -m benchmarks.async_rag --questions 400 --concurrency 64 256
+    python -m benchmarks.async_rag --stream --token-latency 0.02
+"""
+
+import time
+import asyncio
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import ollama
+
+from rag_system import RAGSystem
+from async_rag import AsyncRAGSystem
+from benchmarks.load_test import _free_port, _run_fake_ollama, percentile, start_process, wait_until_ready
+from benchmarks.stubs import FakeOllamaServer, HashingEncoder, StubMilvusClient, synthetic_corpus
+
+
+class ThreadSampler:
+    """Máximo de hilos vivos del proceso mientras dura el bloque"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def build_rag(args, ollama_url: str) -> RAGSystem:
+    milvus = StubMilvusClient(HashingEncoder(latency=args.encode_latency), search_latency=args.search_latency)
+    return RAGSystem(milvus_client=milvus, ollama_client=ollama.Client(host=ollama_url))
+
+
+def consume_stream(rag: RAGSystem, question: str, top_k: int, start: float) -> Optional[float]:
+    """Leer ask_stream entero y devolver los segundos desde `start` hasta el primer token"""
+    first_token = None
+    for event in rag.ask_stream(question, top_k):
+        if event["type"] == "token" and first_token is None:
+            first_token = time.perf_counter() - start
+    return first_token
+
+
+def run_sync(rag: RAGSystem, questions: List[str], args) -> Dict[str, Any]:
+    latencies, first_tokens = [], []
+    with ThreadSampler() as sampler, ThreadPoolExecutor(max_workers=args.threads) as executor:
+        start = time.perf_counter()
+
+        def one(question: str):
+            if args.stream:
+                first_tokens.append(consume_stream(rag, question, args.top_k, start))
+            else:
+                rag.ask(question, args.top_k)
+            latencies.append(time.perf_counter() - start)
+
+        list(executor.map(one, questions))
+        total = time.perf_counter() - start
+    return {"total": total, "latencies": latencies, "first_tokens": first_tokens, "threads": sampler.peak}
+
+
+async def _run_async(async_rag: AsyncRAGSystem, questions: List[str], args) -> Dict[str, Any]:
+    latencies, first_tokens = [], []
+    start = time.perf_counter()
+
+    async def one(question: str):
+        if args.stream:
+            first_token = None
+            async for event in async_rag.ask_stream(question, args.top_k):
+                if event["type"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+            first_tokens.append(first_token)
+        else:
+            await async_rag.ask(question, args.top_k)
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(question) for question in questions))
+    return {"total": time.perf_counter() - start, "latencies": latencies, "first_tokens": first_tokens}
+
+
+def run_async(rag: RAGSystem, questions: List[str], concurrency: int, args) -> Dict[str, Any]:
+    async def main():
+        async_rag = AsyncRAGSystem(rag, threads=args.threads, max_concurrency=concurrency)
+        try:
+            # La primera llamada abre el cliente asíncrono y el pool
+            await async_rag.ask(questions[0], args.top_k)
+            with ThreadSampler() as sampler:
+                result = await _run_async(async_rag, questions, args)
+            return {**result, "threads": sampler.peak, "peak_in_flight": async_rag.stats()["peak_in_flight"]}
+        finally:
+            await async_rag.aclose()
+    return asyncio.run(main())
+
+
+def report(name: str, result: Dict[str, Any], args):
+    latencies = result["latencies"]
+    line = (f"{name:<10} {len(latencies) / result['total']:>8.1f} {percentile(latencies, 50):>9.0f} "
+            f"{percentile(latencies, 99):>9.0f} {result['threads']:>6}")
+    if args.stream:
+        line += f" {percentile(result['first_tokens'], 50):>12.0f}"
+    print(line)
+
+
+def bench_cancel(args):
+    """Cancelar preguntas en streaming a mitad de la generación y contar los cortes en Ollama"""
+    with FakeOllamaServer(prefill_latency=args.prefill_latency, token_latency=args.token_latency,
+                          num_tokens=args.tokens) as fake:
+        rag = build_rag(args, fake.url)
+        rag.add_documents(synthetic_corpus(50))
+        logging.getLogger().setLevel(logging.WARNING)
+
+        async def main():
+            async_rag = AsyncRAGSystem(rag, threads=args.threads)
+
+            async def consume(i: int):
+                async for _ in async_rag.ask_stream(f"¿Qué dice el documento doc{i % 50:07d}?", args.top_k):
+                    pass
+
+            tasks = [asyncio.ensure_future(consume(i)) for i in range(args.cancel)]
+            # A mitad de la generación
+            await asyncio.sleep(args.prefill_latency + args.tokens * args.token_latency / 2)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            stats = async_rag.stats()
+            await async_rag.aclose()
+            return stats
+
+        stats = asyncio.run(main())
+        # El Ollama simulado solo nota el corte al escribir el siguiente token
+        time.sleep(max(0.2, args.token_latency * 5))
+        print(f"cancelación: {stats['cancelled']}/{args.cancel} preguntas canceladas, {stats['in_flight']} en vuelo "
+              f"después; en Ollama {fake.aborted} generaciones cortadas, {fake.completed} terminadas y "
+              f"{args.cancel - fake.aborted - fake.completed} canceladas antes de llegar")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de AsyncRAGSystem frente a RAGSystem con hilos")
+    parser.add_argument("--questions", type=int, default=400, help="Preguntas lanzadas a la vez")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[64, 256],
+                        help="Máximo de preguntas en vuelo de AsyncRAGSystem (RAG_MAX_IN_FLIGHT)")
+    parser.add_argument("--threads", type=int, default=16, help="Hilos del pool (RAG_QUERY_THREADS)")
+    parser.add_argument("--docs", type=int, default=300, help="Documentos del corpus sintético")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--encode-latency", type=float, default=0.002, help="Segundos por llamada al encoder")
+    parser.add_argument("--search-latency", type=float, default=0.002, help="Segundos por búsqueda en Milvus")
+    parser.add_argument("--prefill-latency", type=float, default=0.05, help="Segundos de prefill en Ollama")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Segundos por token generado")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens por respuesta")
+    parser.add_argument("--stream", action="store_true", help="Usar ask_stream y medir el primer token")
+    parser.add_argument("--cancel", type=int, default=50, help="Preguntas a cancelar (0 = no medir)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    ollama_port = _free_port()
+    fake_ollama = start_process(_run_fake_ollama, ollama_port, args.prefill_latency, args.token_latency, args.tokens)
+    ollama_url = f"http://127.0.0.1:{ollama_port}"
+    wait_until_ready(f"{ollama_url}/api/tags")
+
+    try:
+        rag = build_rag(args, ollama_url)
+        rag.add_documents(synthetic_corpus(args.docs))
+        # Después de crear el cliente: milvus_client configura el logging al importarse
+        logging.getLogger().setLevel(logging.WARNING)
+        # Sin cache de respuestas: cada pregunta llega a Ollama
+        rag.answer_cache = None
+        questions = [f"¿Qué dice el documento doc{i % args.docs:07d}? ({i})" for i in range(args.questions)]
+
+        seconds = args.prefill_latency + args.tokens * args.token_latency
+        print(f"{args.questions} preguntas a la vez, {seconds:.2f} s por respuesta en Ollama, "
+              f"{args.threads} hilos{', streaming' if args.stream else ''}")
+        header = f"{'modo':<10} {'preg/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'hilos':>6}"
+        print(header + (f" {'1er token ms':>12}" if args.stream else ""))
+        rag.ask(questions[0], args.top_k)
+        report("sync", run_sync(rag, questions, args), args)
+        for concurrency in args.concurrency:
+            report(f"async {concurrency}", run_async(rag, questions, concurrency, args), args)
+    finally:
+        fake_ollama.terminate()
+
+    if args.cancel:
+        bench_cancel(args)
+
+
+if __name__ == "__main__":
+    main()
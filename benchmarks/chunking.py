@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Velocidad de la división en chunks (MB/s)
+
+Escribe un corpus sintético de --mb MB en un fichero temporal (párrafos y frases de
+longitud variable) y mide el troceado con el algoritmo anterior de RAGSystem, con
+TextChunker sobre el texto en memoria, leyendo el fichero en streaming y en modo
+tokens (con el tokenizador de --tokenizer o, sin él, la aproximación por palabras).
+
+    python -m benchmarks.chunking --mb 300
+    python -m benchmarks.chunking --mb 100 --tokenizer sentence-transformers/all-MiniLM-L6-v2
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import logging
+from typing import Callable, Iterable, List, Tuple
+
+from chunking import TextChunker
+from benchmarks.stubs import VOCABULARY
+
+# Tamaño del bloque de texto sintético que se repite hasta llegar a --mb
+BLOCK_CHARS = 1 << 20
+
+
+def legacy_split(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Tuple[int, str]]:
+    """División anterior de RAGSystem._split_text_spans, como referencia"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunk = text[start:end]
+        if end < len(text):
+            cut_point = max(chunk.rfind(' '), chunk.rfind('.'), chunk.rfind('\n'))
+            if cut_point > start + chunk_size // 2:
+                chunk = text[start:start + cut_point + 1]
+                end = start + cut_point + 1
+        chunks.append((start, chunk.strip()))
+        start = max(end - overlap, start + 1)
+        if start >= len(text):
+            break
+    return [(offset, chunk) for offset, chunk in chunks if chunk]
+
+
+def synthetic_block(seed: int = 0) -> str:
+    """~1 MB de texto con párrafos de 2 a 12 frases de 4 a 30 palabras"""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < BLOCK_CHARS:
+        sentences = []
+        for _ in range(rng.randint(2, 12)):
+            words = [rng.choice(VOCABULARY) for _ in range(rng.randint(4, 30))]
+            sentences.append(" ".join(words).capitalize() + rng.choice(".....?!"))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def measure(name: str, megabytes: float, split: Callable[[], Iterable], repeat: int = 1):
+    """Mejor tiempo de `repeat` pasadas (la máquina compartida mete mucho ruido)"""
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = sum(1 for _ in split())
+        seconds = min(seconds, time.perf_counter() - start)
+    print(f"{name:<28} {chunks:>9} chunks {seconds:>8.2f} s {megabytes / seconds:>8.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de velocidad del chunker")
+    parser.add_argument("--mb", type=int, default=300, help="Tamaño del corpus en MB")
+    parser.add_argument("--tokenizer", default=None,
+                        help="Tokenizador de Hugging Face para el modo tokens (p. ej. el del modelo de embeddings)")
+    parser.add_argument("--repeat", type=int, default=3, help="Pasadas por medida (se muestra la mejor)")
+    parser.add_argument("--skip-legacy", action="store_true", help="No medir el algoritmo anterior")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    block = synthetic_block()
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as f:
+        path = f.name
+        for _ in range(args.mb):
+            f.write(block)
+            f.write("\n\n")
+    try:
+        megabytes = os.path.getsize(path) / 2**20
+        print(f"Corpus: {megabytes:.0f} MB en {path}")
+
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        chunker = TextChunker()
+        if not args.skip_legacy:
+            measure("anterior (memoria)", megabytes, lambda: legacy_split(text), args.repeat)
+        measure("TextChunker (memoria)", megabytes, lambda: chunker.iter_spans(text), args.repeat)
+        del text
+
+        def stream():
+            with open(path, encoding="utf-8") as f:
+                yield from chunker.iter_spans(f)
+        measure("TextChunker (streaming)", megabytes, stream, args.repeat)
+
+        tokenizer = None
+        if args.tokenizer:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        token_chunker = TextChunker(254, 32, unit="tokens", tokenizer=tokenizer)
+
+        def stream_tokens():
+            with open(path, encoding="utf-8") as f:
+                yield from token_chunker.iter_spans(f)
+        label = "tokenizador" if tokenizer is not None else "aproximados"
+        measure(f"tokens {label} (streaming)", megabytes, stream_tokens, args.repeat)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
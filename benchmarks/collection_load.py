@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Latencia por consulta de MilvusClient.search_similar con y sin load() en cada búsqueda
+
+Usa el MilvusClient real sobre una colección simulada (StubCollection) que cobra la
+latencia de una llamada a Milvus por cada operación y una carga completa si la
+colección estaba liberada.
+
+    python -m benchmarks.collection_load --queries 200 --rpc-latency 0.002
+"""
+
+import argparse
+import logging
+import time
+from typing import Callable, List
+
+import numpy as np
+
+from milvus_client import MilvusClient
+from benchmarks.stubs import HashingEncoder, StubCollection, synthetic_corpus
+
+
+def measure(queries: List[str], search: Callable[[str], None]) -> List[float]:
+    """Latencia de cada consulta en segundos"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name: str, latencies: List[float], collection: StubCollection):
+    ms = np.array(latencies) * 1000
+    print(f"{name:<38} media {ms.mean():7.2f} ms | p50 {np.percentile(ms, 50):7.2f} ms | "
+          f"p99 {np.percentile(ms, 99):7.2f} ms | load() {collection.calls.get('load', 0)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste de collection.load() en el camino de búsqueda")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--rpc-latency", type=float, default=0.002, help="Segundos por llamada a Milvus")
+    parser.add_argument("--load-latency", type=float, default=0.5, help="Segundos para cargar una colección liberada")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    client = MilvusClient(encoder=HashingEncoder())
+    client.collection = StubCollection(rpc_latency=args.rpc_latency, load_latency=args.load_latency)
+    client.insert_documents(synthetic_corpus(args.docs, words_per_doc=60))
+    client.load_collection()
+
+    queries = [f"doc{i % args.docs:07d} consulta" for i in range(args.queries)]
+
+    def old_search(query: str):
+        # Comportamiento anterior: load() antes de cada búsqueda
+        client.load_collection(force=True)
+        client.search_similar(query)
+
+    client.collection.calls.clear()
+    report("antes (load() en cada consulta)", measure(queries, old_search), client.collection)
+
+    client.collection.calls.clear()
+    report("después (estado de carga)", measure(queries, client.search_similar), client.collection)
+
+    # Un release externo a mitad de la serie: se detecta y se recarga una sola vez
+    client.collection.calls.clear()
+    half = len(queries) // 2
+    latencies = measure(queries[:half], client.search_similar)
+    client.collection.release()
+    latencies += measure(queries[half:], client.search_similar)
+    report("después, con un release externo", latencies, client.collection)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tokens de prompt y prefill con y sin preparación del contexto
+
+Ingiere un corpus sintético con documentos largos (chunks contiguos solapados) y
+algunas versiones casi duplicadas, recupera top_k chunks por consulta y compara el
+prompt original (todos los chunks unidos) con el que prepara ContextBuilder: tokens
+del prompt, tiempo de preparación y prefill. Con --ollama el prefill se mide en un
+Ollama real (prompt_eval_duration, generando un solo token); sin él se estima con
+--prefill-tps.
+
+    python -m benchmarks.context_budget --queries 50
+    python -m benchmarks.context_budget --ollama http://localhost:11434 --budget 1000
+"""
+
+import os
+import time
+import random
+import argparse
+import logging
+from statistics import mean, median
+from typing import Dict, List
+
+import ollama
+
+from rag_system import RAGSystem
+from context_budget import ContextBuilder
+from benchmarks.stubs import HashingEncoder, StubMilvusClient, iter_synthetic_corpus
+
+
+def prefill(client: ollama.Client, model: str, messages: List[Dict[str, str]]) -> Dict[str, float]:
+    """Tokens del prompt y segundos de prefill según Ollama (generando un solo token)"""
+    response = client.chat(model=model, messages=messages, options={"num_predict": 1, "temperature": 0})
+    return {
+        "tokens": response.get("prompt_eval_count", 0),
+        "seconds": response.get("prompt_eval_duration", 0) / 1e9,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la preparación del contexto")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--words", type=int, default=1200, help="Palabras por documento")
+    parser.add_argument("--duplicates", type=float, default=0.2,
+                        help="Fracción de documentos con una segunda versión casi idéntica")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=None, help="Presupuesto de tokens (CONTEXT_TOKEN_BUDGET)")
+    parser.add_argument("--ollama", default=None, help="URL de un Ollama real para medir el prefill")
+    parser.add_argument("--model", default=os.getenv('OLLAMA_MODEL', 'qwen3:4b'))
+    parser.add_argument("--prefill-tps", type=float, default=200.0,
+                        help="Tokens/s de prefill para estimar sin Ollama")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.budget is not None:
+        os.environ['CONTEXT_TOKEN_BUDGET'] = str(args.budget)
+    rag = RAGSystem(milvus_client=StubMilvusClient(HashingEncoder()))
+    builder = ContextBuilder.from_env(rag.milvus_client.encode, rag.milvus_client.get_embeddings)
+
+    rng = random.Random(0)
+    documents = []
+    for i, text in enumerate(iter_synthetic_corpus(args.docs, args.words)):
+        documents.append((f"doc-{i}", text))
+        if rng.random() < args.duplicates:
+            documents.append((f"doc-{i}-v2", text + " Revisado."))
+    rag.sync_documents(documents, source="corpus")
+
+    # Consultas que cruzan la frontera entre dos chunks del mismo documento
+    queries = []
+    for _, text in rng.sample(documents, min(args.queries, len(documents))):
+        start = rng.randrange(max(1, len(text) - 600))
+        queries.append(text[start:start + 600])
+
+    client = ollama.Client(host=args.ollama) if args.ollama else None
+    rows = {"original": [], "preparado": []}
+    build_ms = []
+    for query in queries:
+        docs = rag.retrieve_context(query, args.top_k)
+
+        rag.context_builder = None
+        original = rag._build_messages(query, docs)
+        start = time.perf_counter()
+        rag.context_builder = builder
+        prepared = rag._build_messages(query, docs)
+        build_ms.append((time.perf_counter() - start) * 1000)
+
+        for name, messages in (("original", original), ("preparado", prepared)):
+            if client is not None:
+                rows[name].append(prefill(client, args.model, messages))
+            else:
+                tokens = sum(builder.tokens.count(message["content"]) for message in messages)
+                rows[name].append({"tokens": tokens, "seconds": tokens / args.prefill_tps})
+
+    source = "Ollama" if client is not None else f"estimado a {args.prefill_tps:.0f} tokens/s"
+    print(f"{len(queries)} consultas, top_k={args.top_k}, presupuesto={builder.token_budget} tokens "
+          f"(tokenizador: {builder.stats()['tokenizer']}, prefill {source})")
+    print(f"{'prompt':<10} {'tokens medios':>14} {'prefill medio':>14} {'prefill p50':>12}")
+    for name, measures in rows.items():
+        print(f"{name:<10} {mean(m['tokens'] for m in measures):>14.0f} "
+              f"{mean(m['seconds'] for m in measures) * 1000:>11.0f} ms "
+              f"{median(m['seconds'] for m in measures) * 1000:>9.0f} ms")
+
+    saved = 1 - mean(m["tokens"] for m in rows["preparado"]) / mean(m["tokens"] for m in rows["original"])
+    print(f"Tokens de prompt ahorrados: {100 * saved:.1f}% | preparación del contexto: "
+          f"{median(build_ms):.1f} ms p50")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Backends de embeddings: latencia, throughput, memoria, arranque y fidelidad
+
+Cada backend de EMBEDDING_BACKEND se mide en un proceso propio (para que el tiempo de
+import y la memoria no se mezclen): tiempo de import de su runtime, de carga del modelo
+(la primera carga de ONNX incluye exportarlo y cuantizarlo; se cachea en
+EMBEDDING_ONNX_DIR), latencia de una consulta (p50/p99), throughput en lotes, RSS
+máximo y si se llegó a importar torch. Los vectores de cada backend se comparan con los de torch (coseno mínimo y
+diferencia absoluta máxima).
+
+    python -m benchmarks.embedding_backends --model all-MiniLM-L6-v2
+    python -m benchmarks.embedding_backends --backends torch onnx-int8 --texts 2000
+"""
+
+import os
+import sys
+import json
+import importlib
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+import numpy as np
+
+from embedding_backends import EMBEDDING_BACKENDS
+from benchmarks.stubs import iter_synthetic_corpus
+
+# Módulos que importa cada backend al cargar el modelo
+RUNTIME_MODULES = {
+    "torch": ("torch", "sentence_transformers"),
+    "onnx": ("onnxruntime", "tokenizers"),
+    "onnx-int8": ("onnxruntime", "tokenizers"),
+}
+
+
+def measure(backend: str, model: str, queries: int, texts: int, batch_size: int, output: str) -> dict:
+    """Medir un backend en el proceso actual y guardar sus vectores en `output` (.npy)"""
+    from embedding_backends import create_embedding_backend
+    start = time.perf_counter()
+    for module in RUNTIME_MODULES[backend]:
+        importlib.import_module(module)
+    import_seconds = time.perf_counter() - start
+    encoder = create_embedding_backend(model, backend)
+
+    start = time.perf_counter()
+    encoder.load()
+    load_seconds = time.perf_counter() - start
+    torch_imported = "torch" in sys.modules
+
+    corpus = list(iter_synthetic_corpus(texts, 150))
+    latencies = []
+    for question in corpus[:queries]:
+        question = " ".join(question.split()[:12]) + "?"
+        start = time.perf_counter()
+        encoder.encode([question])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    start = time.perf_counter()
+    embeddings = encoder.encode(corpus, batch_size=batch_size)
+    throughput = len(corpus) / (time.perf_counter() - start)
+    np.save(output, embeddings)
+
+    return {
+        "backend": backend,
+        "import_s": import_seconds,
+        "load_s": load_seconds,
+        "query_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "query_p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "texts_per_s": throughput,
+        # ru_maxrss está en KiB en Linux
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "imports_torch": torch_imported,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los backends de embeddings")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Modelo (nombre del Hub o ruta local)")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--queries", type=int, default=200, help="Consultas sueltas para la latencia")
+    parser.add_argument("--texts", type=int, default=1000, help="Chunks para el throughput en lotes")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--json", default=None, help="Guardar los resultados en este fichero")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        row = measure(args.worker, args.model, args.queries, args.texts, args.batch_size, args.output)
+        print(json.dumps(row))
+        return
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmpdir:
+        vectors = {}
+        for backend in args.backends:
+            output = os.path.join(tmpdir, f"{backend}.npy")
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.embedding_backends", "--worker", backend, "--output", output,
+                 "--model", args.model, "--queries", str(args.queries), "--texts", str(args.texts),
+                 "--batch-size", str(args.batch_size)],
+                capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                print(f"{backend}: error\n{result.stderr[-2000:]}")
+                continue
+            rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+            vectors[backend] = np.load(output)
+
+    reference = vectors.get("torch")
+    print(f"Modelo {args.model}, {args.queries} consultas, {args.texts} chunks en lotes de {args.batch_size}")
+    print(f"{'backend':<10} {'import s':>9} {'carga s':>8} {'p50 ms':>8} {'p99 ms':>8} {'textos/s':>9} "
+          f"{'RSS MB':>8} {'torch':>6} {'coseno min':>11} {'dif. max':>9}")
+    for row in rows:
+        if reference is not None:
+            embeddings = vectors[row["backend"]]
+            row["min_cosine"] = float(
+                ((embeddings * reference).sum(axis=1)
+                 / np.linalg.norm(embeddings, axis=1) / np.linalg.norm(reference, axis=1)).min()
+            )
+            row["max_abs_diff"] = float(np.abs(embeddings - reference).max())
+        fidelity = (f"{row['min_cosine']:>11.5f} {row['max_abs_diff']:>9.5f}" if "min_cosine" in row
+                    else f"{'-':>11} {'-':>9}")
+        print(f"{row['backend']:<10} {row['import_s']:>9.2f} {row['load_s']:>8.2f} {row['query_p50_ms']:>8.2f} "
+              f"{row['query_p99_ms']:>8.2f} {row['texts_per_s']:>9.1f} {row['rss_mb']:>8.0f} "
+              f"{'sí' if row['imports_torch'] else 'no':>6} {fidelity}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Escalado de los embeddings de la ingesta con el pool de procesos
+
+Codifica --chunks textos sintéticos en lotes de --batch-size (como la ingesta) en el
+proceso actual y con EmbeddingPool de 1 a --max-workers workers, comprueba que los
+vectores y su orden coinciden con los del proceso actual y muestra chunks/s, la
+aceleración y la eficiencia (aceleración / workers). Con --ingest mide además
+add_documents_stream completo sobre un almacén local.
+
+Sin --model se usa el encoder simulado por hashing, que es Python puro (como la
+tokenización) y no suelta el GIL: con hilos no escalaría.
+
+    python -m benchmarks.embedding_pool --chunks 20000
+    python -m benchmarks.embedding_pool --model all-MiniLM-L6-v2 --chunks 5000 --ingest
+    python -m benchmarks.embedding_pool --model all-MiniLM-L6-v2 --backend onnx-int8
+"""
+
+import os
+import time
+import argparse
+import logging
+from functools import partial
+from typing import Callable, List
+
+import numpy as np
+
+from embedding_pool import EmbeddingPool
+from embedding_backends import EMBEDDING_BACKENDS, create_embedding_backend
+from benchmarks.stubs import HashingEncoder, StubMilvusClient, iter_synthetic_corpus
+
+
+def encode_all(encode: Callable[[List[str]], np.ndarray], texts: List[str], batch_size: int) -> np.ndarray:
+    return np.concatenate([encode(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+
+def ingest(encoder, pool: EmbeddingPool, texts: List[str], batch_size: int) -> float:
+    """chunks/s de add_documents_stream con los embeddings en `pool` (o en el proceso actual)"""
+    from rag_system import RAGSystem
+    rag = RAGSystem(milvus_client=StubMilvusClient(encoder))
+    rag.milvus_client.embedding_pool = pool
+    return rag.add_documents_stream(iter(texts), batch_size=batch_size)["chunks_per_second"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pool de procesos de embeddings")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=150, help="Palabras por chunk")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks por llamada (lote de la ingesta)")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de torch por worker (por defecto, núcleos/workers)")
+    parser.add_argument("--model", default=None,
+                        help="Modelo de sentence-transformers (por defecto el encoder simulado)")
+    parser.add_argument("--backend", default="torch", choices=EMBEDDING_BACKENDS, help="Backend de embeddings con --model")
+    parser.add_argument("--ingest", action="store_true", help="Medir también add_documents_stream")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    texts = list(iter_synthetic_corpus(args.chunks, args.words))
+
+    if args.model:
+        encoder = create_embedding_backend(args.model, args.backend)
+        encoder.load()
+        factory = partial(create_embedding_backend, args.model, args.backend)
+    else:
+        encoder = HashingEncoder()
+        factory = HashingEncoder
+    name = args.model or "hashing"
+
+    start = time.perf_counter()
+    expected = encode_all(encoder.encode, texts, args.batch_size)
+    baseline = len(texts) / (time.perf_counter() - start)
+    print(f"{len(texts)} chunks de {args.words} palabras, lotes de {args.batch_size}, "
+          f"{os.cpu_count()} núcleos, encoder {name}")
+    print(f"{'workers':>8} {'hilos':>6} {'arranque s':>11} {'chunks/s':>10} {'aceleración':>12} "
+          f"{'eficiencia':>11}{' ingesta chunks/s':>18}")
+    ingest_row = f"{ingest(encoder, None, texts, args.batch_size):>18.0f}" if args.ingest else ""
+    print(f"{'proceso':>8} {'-':>6} {'-':>11} {baseline:>10.0f} {1.0:>11.2f}x {'-':>11}{ingest_row}")
+
+    workers = 1
+    while True:
+        pool = EmbeddingPool(name, encoder.dim, workers=workers, threads=args.threads, encoder_factory=factory)
+        try:
+            # El arranque (spawn + carga del modelo en cada worker) se mide aparte
+            start = time.perf_counter()
+            pool.encode(texts[:workers])
+            startup = time.perf_counter() - start
+
+            start = time.perf_counter()
+            embeddings = encode_all(pool.encode, texts, args.batch_size)
+            throughput = len(texts) / (time.perf_counter() - start)
+            if not np.allclose(embeddings, expected, atol=1e-5):
+                raise SystemExit(f"Los embeddings del pool con {workers} workers no coinciden con los del proceso")
+            ingest_row = f"{ingest(encoder, pool, texts, args.batch_size):>18.0f}" if args.ingest else ""
+        finally:
+            pool.close()
+        speedup = throughput / baseline
+        print(f"{workers:>8} {pool.threads:>6} {startup:>11.2f} {throughput:>10.0f} {speedup:>11.2f}x "
+              f"{speedup / workers:>10.0%}{ingest_row}")
+        if workers == args.max_workers:
+            break
+        workers = min(workers * 2, args.max_workers)
+
+
+if __name__ == "__main__":
+    main()
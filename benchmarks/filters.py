@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Filtros de metadatos: filtrar antes de buscar frente a filtrar los resultados, y proyección de campos
+
+1. Almacén local de --rows filas (vectores aleatorios) repartidas entre --sources
+   sources. Para cada selectividad (fracción de filas que cumplen el filtro) se mide:
+   - prefiltro: search_by_embeddings con filters (lo que hace ahora el sistema)
+   - postfiltro: buscar top_k × --overfetch sin filtro y quedarse con los que lo cumplen
+     (lo que había que hacer antes en la aplicación)
+   con la latencia y el recall@top_k respecto a la búsqueda exacta entre las filas que
+   cumplen el filtro.
+2. Tamaño de la respuesta (JSON) de --queries búsquedas con los campos por defecto
+   (texto incluido) frente a output_fields=["source", "date"] y a solo id y score.
+
+    python -m benchmarks.filters --rows 100000
+    python -m benchmarks.filters --rows 20000 --overfetch 4 20
+"""
+
+import json
+import time
+import argparse
+import logging
+import tempfile
+from typing import Dict, List
+
+import numpy as np
+
+from local_store import LocalVectorStore
+from benchmarks.stubs import HashingEncoder
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1000
+    return {"mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+
+def build_store(workdir: str, args) -> LocalVectorStore:
+    """Almacén con filas repartidas por igual entre los sources s0000, s0001..."""
+    store = LocalVectorStore(path=workdir, encoder=HashingEncoder(args.dim), index_type="FLAT", metric_type="L2")
+    store.embedding_dim = args.dim
+    store.embedding_cache = None
+    store.create_collection()
+    rng = np.random.default_rng(0)
+    text = "palabra " * (args.text_bytes // 8)
+    block = 50000
+    for offset in range(0, args.rows, block):
+        rows = min(block, args.rows - offset)
+        chunks = [{"id": offset + i, "text": f"chunk {offset + i} {text}", "document_id": f"doc{(offset + i) // 10}",
+                   "source": f"s{(offset + i) % args.sources:04d}", "date": 1700000000 + offset + i,
+                   "tags": [f"t{(offset + i) % 7}"]} for i in range(rows)]
+        embeddings = rng.standard_normal((rows, args.dim), dtype=np.float32)
+        store.insert_chunks(chunks, embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True), upsert=False)
+    store.flush()
+    return store
+
+
+def bench_selectivity(store: LocalVectorStore, queries: np.ndarray, args):
+    print(f"{args.rows} filas en {args.sources} sources, top_k {args.top_k}")
+    print(f"{'selectividad':>12} {'método':<16} {'media ms':>9} {'p99 ms':>9} {'recall':>7} {'resultados':>11}")
+    for fraction in args.selectivity:
+        sources = [f"s{i:04d}" for i in range(max(1, round(fraction * args.sources)))]
+        filters = {"source": sources}
+        allowed = set(sources)
+
+        # Prefiltro: la búsqueda solo recorre las filas que cumplen el filtro (y es exacta)
+        latencies, truth = [], []
+        for query in queries:
+            start = time.perf_counter()
+            docs = store.search_by_embeddings(query[None, :], args.top_k, filters=filters,
+                                              output_fields=["source"])[0]
+            latencies.append(time.perf_counter() - start)
+            truth.append({doc["id"] for doc in docs})
+        row = percentiles(latencies)
+        print(f"{len(sources) / args.sources:>12.1%} {'prefiltro':<16} {row['mean_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+              f"{1.0:>7.3f} {np.mean([len(ids) for ids in truth]):>11.1f}")
+
+        for overfetch in args.overfetch:
+            latencies, recall, found = [], [], []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                docs = store.search_by_embeddings(query[None, :], args.top_k * overfetch, output_fields=["source"])[0]
+                docs = [doc for doc in docs if doc["source"] in allowed][:args.top_k]
+                latencies.append(time.perf_counter() - start)
+                recall.append(len({doc["id"] for doc in docs} & expected) / max(1, len(expected)))
+                found.append(len(docs))
+            row = percentiles(latencies)
+            print(f"{'':>12} {f'postfiltro ×{overfetch}':<16} {row['mean_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+                  f"{np.mean(recall):>7.3f} {np.mean(found):>11.1f}")
+
+
+def bench_projection(store: LocalVectorStore, queries: np.ndarray, args):
+    print(f"\nTamaño de la respuesta de {len(queries)} búsquedas (top_k {args.top_k}, textos de "
+          f"~{args.text_bytes} bytes)")
+    print(f"{'campos':<28} {'bytes':>12} {'media ms':>9}")
+    for name, fields in (("por defecto (con texto)", None), ('["source", "date"]', ["source", "date"]),
+                         ("[] (solo id y score)", [])):
+        size, latencies = 0, []
+        for query in queries:
+            start = time.perf_counter()
+            docs = store.search_by_embeddings(query[None, :], args.top_k, output_fields=fields)[0]
+            latencies.append(time.perf_counter() - start)
+            size += len(json.dumps(docs, ensure_ascii=False).encode("utf-8"))
+        print(f"{name:<28} {size:>12} {percentiles(latencies)['mean_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de filtros de metadatos y proyección de campos")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--sources", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--text-bytes", type=int, default=500, help="Tamaño aproximado del texto de cada chunk")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--selectivity", type=float, nargs="+", default=[0.5, 0.1, 0.01, 0.001],
+                        help="Fracciones de filas que cumplen el filtro")
+    parser.add_argument("--overfetch", type=int, nargs="+", default=[4, 20],
+                        help="Múltiplos de top_k que se piden sin filtro en el postfiltro")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix="rag-filters-") as workdir:
+        store = build_store(workdir, args)
+        queries = np.random.default_rng(1).standard_normal((args.queries, args.dim), dtype=np.float32)
+        bench_selectivity(store, queries, args)
+        bench_projection(store, queries, args)
+
+
+if __name__ == "__main__":
+    main()
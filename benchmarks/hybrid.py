@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Recuperación densa, léxica (BM25) e híbrida (RRF)
+
+Ingiere un corpus sintético en un almacén local y mide recall@k y latencia de los
+tres modos de RETRIEVAL_MODE con dos tipos de consulta: identificadores exactos
+(el código docNNNNNNN que lleva cada documento) y fragmentos de texto de un chunk
+(consultas "semánticas"). Sin --model se usa el encoder simulado por hashing.
+
+    python -m benchmarks.hybrid --docs 2000 --queries 200
+    python -m benchmarks.hybrid --model all-MiniLM-L6-v2
+"""
+
+import os
+import re
+import time
+import random
+import argparse
+import logging
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+from rag_system import RAGSystem, RETRIEVAL_MODES
+from benchmarks.stubs import HashingEncoder, StubMilvusClient, iter_synthetic_corpus
+
+RECALL_AT = (1, 3, 5, 10)
+
+# Una consulta y la condición que cumple un resultado relevante
+Query = Tuple[str, Callable[[Dict], bool]]
+
+
+def build_queries(chunks: List[Dict], num_queries: int, words: int, seed: int = 0) -> Dict[str, List[Query]]:
+    """Consultas por identificador y por fragmento de texto, con su criterio de relevancia"""
+    rng = random.Random(seed)
+    sample = rng.sample(chunks, min(num_queries, len(chunks)))
+
+    identifiers = []
+    for chunk in sample:
+        match = re.search(r"doc\d{7}", chunk["text"])
+        if match:
+            code = match.group(0)
+            identifiers.append((f"¿Qué dice el documento {code}?", lambda hit, code=code: code in hit["text"]))
+
+    fragments = []
+    for chunk in sample:
+        tokens = [token for token in chunk["text"].split() if not token.startswith("doc")]
+        start = rng.randrange(max(1, len(tokens) - words))
+        fragment = " ".join(tokens[start:start + words])
+        fragments.append((fragment, lambda hit, chunk_id=chunk["id"]: hit["id"] == chunk_id))
+
+    return {"identificador": identifiers, "fragmento": fragments}
+
+
+def evaluate(rag: RAGSystem, queries: List[Query]) -> Dict[str, float]:
+    """Recall@k (alguna respuesta relevante entre las k primeras) y latencia por consulta"""
+    top_k = max(RECALL_AT)
+    hits = {k: 0 for k in RECALL_AT}
+    latencies = []
+    for question, relevant in queries:
+        start = time.perf_counter()
+        results = rag.retrieve_context(question, top_k)
+        latencies.append(time.perf_counter() - start)
+        first = next((rank for rank, hit in enumerate(results, 1) if relevant(hit)), None)
+        for k in RECALL_AT:
+            hits[k] += first is not None and first <= k
+
+    latencies.sort()
+    row = {f"recall@{k}": hits[k] / len(queries) for k in RECALL_AT}
+    row["p50_ms"] = latencies[len(latencies) // 2] * 1000
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación densa, BM25 e híbrida")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=300, help="Palabras por documento")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas de cada tipo")
+    parser.add_argument("--fragment-words", type=int, default=20, help="Palabras de las consultas por fragmento")
+    parser.add_argument("--model", default=None,
+                        help="Modelo de sentence-transformers (por defecto el encoder simulado)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    encoder = HashingEncoder()
+    if args.model:
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(args.model)
+        encoder.dim = encoder.get_sentence_embedding_dimension()
+
+    # Con el modo híbrido se crea el índice BM25; después se alterna entre los tres modos
+    os.environ['RETRIEVAL_MODE'] = 'hybrid'
+    os.environ['SPARSE_INDEX_DIR'] = tempfile.mkdtemp(prefix="bm25-")
+    rag = RAGSystem(milvus_client=StubMilvusClient(encoder))
+
+    start = time.perf_counter()
+    documents = ((f"doc-{i}", text) for i, text in enumerate(iter_synthetic_corpus(args.docs, args.words)))
+    stats = rag.sync_documents(documents, source="corpus")
+    print(f"Ingesta: {stats['chunks']} chunks en {time.perf_counter() - start:.1f} s")
+
+    chunks = [chunk for batch in rag.milvus_client.iter_chunks(output_fields=["text"]) for chunk in batch]
+    query_sets = build_queries(chunks, args.queries, args.fragment_words)
+
+    header = "".join(f"{'R@' + str(k):>8}" for k in RECALL_AT)
+    print(f"{'consultas':<14} {'modo':<8}{header} {'p50 ms':>8}")
+    for name, queries in query_sets.items():
+        for mode in RETRIEVAL_MODES:
+            rag.retrieval_mode = mode
+            row = evaluate(rag, queries)
+            recalls = "".join(f"{row[f'recall@{k}']:>8.3f}" for k in RECALL_AT)
+            print(f"{name:<14} {mode:<8}{recalls} {row['p50_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Recall frente a latencia de los distintos índices de Milvus
+
+Necesita un Milvus real (docker-compose up milvus). Genera un corpus sintético (o
+lee uno JSONL), aparta un conjunto de consultas que no se insertan y calcula su
+top-k exacto con NumPy. Para cada tipo de índice crea una colección temporal,
+construye el índice con los parámetros automáticos de MilvusClient y barre el
+parámetro de búsqueda (nprobe, ef o search_list), midiendo recall@k, QPS,
+latencia por consulta y memoria de los segmentos cargados.
+
+    python -m benchmarks.index_recall --rows 100000 --queries 500
+    python -m benchmarks.index_recall --indexes HNSW,IVF_SQ8 --metric COSINE --json resultados.json
+"""
+
+import os
+import json
+import time
+import argparse
+import logging
+from typing import Any, Dict, List
+
+import numpy as np
+from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
+
+from vector_store import INDEX_TYPES, SEARCH_PARAM_KEYS, auto_index_params, auto_search_params
+from benchmarks.stubs import HashingEncoder, iter_synthetic_corpus
+from ingestion import iter_jsonl
+
+# Multiplicadores del parámetro de búsqueda automático que se prueban
+SWEEP = (0.25, 0.5, 1, 2, 4)
+
+
+def load_embeddings(args) -> np.ndarray:
+    """Embeddings del corpus más las consultas apartadas (las últimas `queries` filas)"""
+    total = args.rows + args.queries
+    if args.jsonl:
+        texts = [text for _, text in zip(range(total), iter_jsonl(args.jsonl, args.field))]
+    else:
+        texts = list(iter_synthetic_corpus(total, words_per_doc=args.words))
+
+    if args.model:
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(args.model)
+    else:
+        encoder = HashingEncoder()
+
+    embeddings = []
+    for start in range(0, len(texts), 1024):
+        embeddings.append(np.asarray(encoder.encode(texts[start:start + 1024]), dtype=np.float32))
+    embeddings = np.vstack(embeddings)
+    if args.metric in ("IP", "COSINE"):
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    return embeddings
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, top_k: int, metric: str) -> np.ndarray:
+    """IDs del top-k exacto de cada consulta (búsqueda por fuerza bruta en bloques)"""
+    result = np.empty((len(queries), top_k), dtype=np.int64)
+    squared_norms = (corpus ** 2).sum(axis=1)
+    for start in range(0, len(queries), 256):
+        block = queries[start:start + 256]
+        if metric == "L2":
+            scores = squared_norms[None, :] - 2 * block @ corpus.T
+        else:
+            scores = -(block @ corpus.T)
+        best = np.argpartition(scores, top_k - 1, axis=1)[:, :top_k]
+        order = np.take_along_axis(scores, best, axis=1).argsort(axis=1)
+        result[start:start + len(block)] = np.take_along_axis(best, order, axis=1)
+    return result
+
+
+def build_collection(name: str, corpus: np.ndarray) -> Collection:
+    """Crear una colección temporal con el corpus (el ID de cada fila es su posición)"""
+    if utility.has_collection(name):
+        utility.drop_collection(name)
+    schema = CollectionSchema([
+        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=corpus.shape[1]),
+    ])
+    collection = Collection(name, schema)
+    for start in range(0, len(corpus), 10000):
+        block = corpus[start:start + 10000]
+        collection.insert([list(range(start, start + len(block))), block])
+    collection.flush()
+    return collection
+
+
+def segments_memory(name: str) -> int:
+    """Memoria (bytes) de los segmentos cargados de una colección"""
+    return sum(segment.mem_size for segment in utility.get_query_segment_info(name))
+
+
+def measure(collection: Collection, queries: np.ndarray, truth: np.ndarray, top_k: int,
+            search_params: Dict[str, Any]) -> Dict[str, Any]:
+    """Recall@k y latencia buscando las consultas de una en una"""
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = collection.search([query], "embedding", search_params, limit=top_k)
+        latencies.append(time.perf_counter() - start)
+        hits += len(set(results[0].ids) & set(expected.tolist()))
+
+    latencies.sort()
+    return {
+        "recall": hits / truth.size,
+        "qps": len(latencies) / sum(latencies),
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de recall y latencia por tipo de índice")
+    parser.add_argument("--host", default=os.getenv('MILVUS_HOST', 'localhost'))
+    parser.add_argument("--port", default=os.getenv('MILVUS_PORT', '19530'))
+    parser.add_argument("--rows", type=int, default=100000, help="Vectores insertados")
+    parser.add_argument("--queries", type=int, default=500, help="Consultas apartadas (no insertadas)")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--indexes", default="FLAT,IVF_FLAT,IVF_SQ8,IVF_PQ,HNSW,DISKANN",
+                        help="Tipos de índice separados por comas")
+    parser.add_argument("--metric", default="L2", choices=["L2", "IP", "COSINE"])
+    parser.add_argument("--words", type=int, default=60, help="Palabras por documento sintético")
+    parser.add_argument("--jsonl", default=None, help="Corpus JSONL en lugar del sintético")
+    parser.add_argument("--field", default="text", help="Campo con el texto para --jsonl")
+    parser.add_argument("--model", default=None,
+                        help="Modelo de sentence-transformers (por defecto el encoder simulado)")
+    parser.add_argument("--json", default=None, help="Guardar los resultados en este fichero")
+    parser.add_argument("--keep", action="store_true", help="No borrar las colecciones al terminar")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    index_types = [name.strip().upper() for name in args.indexes.split(",") if name.strip()]
+    unknown = [name for name in index_types if name not in INDEX_TYPES]
+    if unknown:
+        parser.error(f"Tipos de índice desconocidos: {', '.join(unknown)}")
+
+    embeddings = load_embeddings(args)
+    corpus, queries = embeddings[:-args.queries], embeddings[-args.queries:]
+    truth = exact_top_k(corpus, queries, args.top_k, args.metric)
+    print(f"Corpus: {len(corpus)} vectores de {corpus.shape[1]} dimensiones, {len(queries)} consultas")
+
+    connections.connect("default", host=args.host, port=args.port)
+    results: List[Dict[str, Any]] = []
+    print(f"{'índice':<10} {'búsqueda':<22} {'recall@' + str(args.top_k):>10} {'QPS':>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'memoria':>10}")
+
+    for index_type in index_types:
+        name = f"bench_index_{index_type.lower()}"
+        collection = build_collection(name, corpus)
+        index_params = auto_index_params(index_type, len(corpus), corpus.shape[1])
+        start = time.perf_counter()
+        collection.create_index("embedding", {
+            "index_type": index_type, "metric_type": args.metric, "params": index_params,
+        })
+        utility.wait_for_index_building_complete(name)
+        build_seconds = time.perf_counter() - start
+        collection.load()
+        memory = segments_memory(name)
+
+        # Barrido del parámetro de búsqueda alrededor del valor automático
+        auto = auto_search_params(index_type, index_params, args.top_k)
+        key = SEARCH_PARAM_KEYS.get(index_type)
+        sweep = [auto]
+        if key:
+            values = {max(1, int(auto[key] * factor)) for factor in SWEEP}
+            if key == "nprobe":
+                values = {min(value, index_params["nlist"]) for value in values}
+            else:
+                values = {max(value, args.top_k) for value in values}
+            sweep = [{key: value} for value in sorted(values)]
+
+        for params in sweep:
+            row = measure(collection, queries, truth, args.top_k, {"metric_type": args.metric, "params": params})
+            row.update({
+                "index_type": index_type,
+                "index_params": index_params,
+                "search_params": params,
+                "build_seconds": build_seconds,
+                "memory_bytes": memory,
+            })
+            results.append(row)
+            print(f"{index_type:<10} {json.dumps(params):<22} {row['recall']:>10.3f} {row['qps']:>9.1f} "
+                  f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} {memory / 2**20:>8.1f} MiB")
+
+        collection.release()
+        if not args.keep:
+            utility.drop_collection(name)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": len(corpus), "queries": len(queries), "top_k": args.top_k,
+                       "metric": args.metric, "results": results}, f, indent=2)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
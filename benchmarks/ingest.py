@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Ingesta: add_documents (todo en memoria) frente a add_documents_stream (pipeline acotado)
+
+Mide chunks/s y el pico de memoria de Python (tracemalloc) de cada modo sobre el
+MilvusClient real con una colección simulada que descarta los datos, de modo que
+la memoria medida es solo la del cliente.
+
+    python -m benchmarks.ingest --docs 5000 --flush-latency 0.2
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+
+from rag_system import RAGSystem
+from benchmarks.stubs import HashingEncoder, StubCollection, iter_synthetic_corpus, offline_milvus_client
+
+
+def build_rag(args) -> RAGSystem:
+    collection = StubCollection(rpc_latency=args.rpc_latency, flush_latency=args.flush_latency, store=False)
+    milvus = offline_milvus_client(collection, HashingEncoder(latency=args.encode_latency))
+    return RAGSystem(milvus_client=milvus)
+
+
+def run(name: str, ingest) -> None:
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    chunks = ingest()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    print(f"{name:<24} {chunks:>8} chunks | {chunks / elapsed:9.1f} chunks/s | pico {peak / 2**20:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta en streaming")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--words", type=int, default=300, help="Palabras por documento")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--flush-every", type=int, default=None)
+    parser.add_argument("--encode-latency", type=float, default=0.01, help="Segundos fijos por llamada al encoder")
+    parser.add_argument("--rpc-latency", type=float, default=0.002, help="Segundos por llamada a Milvus")
+    parser.add_argument("--flush-latency", type=float, default=0.2, help="Segundos por flush")
+    parser.add_argument("--batches", type=int, default=50,
+                        help="Llamadas a add_documents en el modo por lotes (flush en cada una)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    tracemalloc.start()
+
+    rag = build_rag(args)
+    run("add_documents (todo)",
+        lambda: rag.add_documents(list(iter_synthetic_corpus(args.docs, args.words))))
+
+    rag = build_rag(args)
+    docs_per_call = max(1, args.docs // args.batches)
+    corpus = iter_synthetic_corpus(args.docs, args.words)
+
+    def ingest_in_calls():
+        chunks = 0
+        while True:
+            documents = [doc for _, doc in zip(range(docs_per_call), corpus)]
+            if not documents:
+                return chunks
+            chunks += rag.add_documents(documents)
+
+    run(f"add_documents x{args.batches}", ingest_in_calls)
+
+    rag = build_rag(args)
+    run("add_documents_stream",
+        lambda: rag.add_documents_stream(iter_synthetic_corpus(args.docs, args.words),
+                                         batch_size=args.batch_size, flush_every=args.flush_every)["chunks"])
+
+
+if __name__ == "__main__":
+    main()
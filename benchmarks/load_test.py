@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga del servidor HTTP (server.py)
+
+Levanta el servidor y un Ollama simulado en procesos separados (para que no
+compitan por el GIL con el generador de carga), con Milvus simulado en memoria,
+y lanza peticiones concurrentes a /ask, midiendo peticiones/s y latencias p50/p99.
+Con --stream usa /ask/stream y mide además el tiempo hasta el primer token.
+Con --no-async el servidor atiende las preguntas con RAGSystem en su pool de
+hilos (RAG_ASYNC=false) en vez de con AsyncRAGSystem.
+
+    python -m benchmarks.load_test --requests 500 --concurrency 50
+    python -m benchmarks.load_test --stream
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from typing import List
+
+import httpx
+import numpy as np
+import ollama
+import uvicorn
+
+from rag_system import RAGSystem
+from server import create_app
+from benchmarks.stubs import FakeOllamaServer, HashingEncoder, StubMilvusClient, synthetic_corpus
+
+
+def _free_port() -> int:
+    """Obtener un puerto TCP libre"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _run_fake_ollama(port: int, prefill_latency: float, token_latency: float, num_tokens: int):
+    """Proceso hijo: Ollama simulado"""
+    FakeOllamaServer(port=port, prefill_latency=prefill_latency,
+                     token_latency=token_latency, num_tokens=num_tokens).serve_forever()
+
+
+def _run_server(port: int, ollama_url: str, encode_latency: float, search_latency: float,
+                batch_window_ms: float, use_async: bool = True):
+    """Proceso hijo: server.py con Milvus simulado"""
+    os.environ['RAG_ASYNC'] = 'true' if use_async else 'false'
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    def rag_factory() -> RAGSystem:
+        milvus = StubMilvusClient(HashingEncoder(latency=encode_latency), search_latency=search_latency)
+        return RAGSystem(milvus_client=milvus, ollama_client=ollama.Client(host=ollama_url))
+
+    app = create_app(rag_factory, batch_window_ms=batch_window_ms)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_process(target, *args) -> multiprocessing.Process:
+    """Lanzar un proceso hijo en segundo plano"""
+    process = multiprocessing.Process(target=target, args=args, daemon=True)
+    process.start()
+    return process
+
+
+def wait_until_ready(url: str, timeout: float = 60):
+    """Esperar a que un servidor HTTP responda"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise TimeoutError(f"{url} no respondió en {timeout} s")
+
+
+def percentile(latencies: List[float], q: float) -> float:
+    """Percentil q (0-100) de una lista de latencias, en milisegundos"""
+    return float(np.percentile(latencies, q) * 1000) if latencies else 0.0
+
+
+async def _ask(client: httpx.AsyncClient, question: str, top_k: int):
+    """Petición a /ask; devuelve (correcta, tiempo hasta el primer token)"""
+    response = await client.post("/ask", json={"question": question, "top_k": top_k})
+    # RAGSystem.ask devuelve los errores dentro de la respuesta
+    ok = response.status_code == 200 and bool(response.json()["sources"])
+    return ok, None
+
+
+async def _ask_stream(client: httpx.AsyncClient, question: str, top_k: int):
+    """Petición a /ask/stream; devuelve (correcta, tiempo hasta el primer token)"""
+    start = time.perf_counter()
+    first_token = None
+    ok = False
+    async with client.stream("POST", "/ask/stream", json={"question": question, "top_k": top_k}) as response:
+        async for line in response.aiter_lines():
+            if line == "event: token" and first_token is None:
+                first_token = time.perf_counter() - start
+            elif line == "event: done":
+                ok = True
+    return ok and response.status_code == 200, first_token
+
+
+async def run_load(base_url: str, questions: List[str], concurrency: int, top_k: int, stream: bool = False):
+    """Lanzar todas las preguntas con un máximo de `concurrency` en vuelo"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors = 0
+    ask = _ask_stream if stream else _ask
+
+    # Pocas conexiones en keep-alive: con cientos el pool asíncrono de httpx es el cuello de botella
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=min(concurrency, 16))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+
+        async def one(question: str):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                ok, first_token = await ask(client, question, top_k)
+                elapsed = time.perf_counter() - start
+                if ok:
+                    latencies.append(elapsed)
+                    if first_token is not None:
+                        first_tokens.append(first_token)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in questions))
+        total = time.perf_counter() - start
+
+    return latencies, first_tokens, errors, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de /ask con backends simulados")
+    parser.add_argument("--requests", type=int, default=500, help="Número total de peticiones")
+    parser.add_argument("--concurrency", type=int, default=50, help="Peticiones simultáneas")
+    parser.add_argument("--docs", type=int, default=2000, help="Documentos del corpus sintético")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--encode-latency", type=float, default=0.005, help="Segundos por llamada al encoder")
+    parser.add_argument("--search-latency", type=float, default=0.005, help="Segundos por búsqueda en Milvus")
+    parser.add_argument("--prefill-latency", type=float, default=0.05, help="Segundos de prefill en Ollama")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Segundos por token generado")
+    parser.add_argument("--tokens", type=int, default=50, help="Tokens por respuesta")
+    parser.add_argument("--stream", action="store_true", help="Usar /ask/stream (server-sent events)")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0,
+                        help="Ventana de micro-batching de la recuperación (0 = desactivado)")
+    parser.add_argument("--no-async", action="store_true",
+                        help="Servidor con RAGSystem en el pool de hilos en vez de AsyncRAGSystem")
+    args = parser.parse_args()
+
+    # Los logs por petición distorsionan la medida
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    ollama_port = _free_port()
+    fake_ollama = start_process(_run_fake_ollama, ollama_port, args.prefill_latency, args.token_latency, args.tokens)
+    ollama_url = f"http://127.0.0.1:{ollama_port}"
+    wait_until_ready(f"{ollama_url}/api/tags")
+
+    port = _free_port()
+    server = start_process(_run_server, port, ollama_url, args.encode_latency, args.search_latency,
+                           args.batch_window_ms, not args.no_async)
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_ready(f"{base_url}/health")
+
+    try:
+        corpus = synthetic_corpus(args.docs)
+        response = httpx.post(f"{base_url}/ingest", json={"documents": corpus}, timeout=600)
+        response.raise_for_status()
+        print(f"Corpus ingerido: {response.json()}")
+
+        questions = [f"¿Qué dice el documento doc{i % args.docs:07d}?" for i in range(args.requests)]
+        latencies, first_tokens, errors, total = asyncio.run(
+            run_load(base_url, questions, args.concurrency, args.top_k, stream=args.stream))
+
+        print(f"Peticiones: {len(latencies)} correctas, {errors} con error, concurrencia {args.concurrency}")
+        print(f"Throughput: {len(latencies) / total:.1f} peticiones/s")
+        print(f"Latencia p50: {percentile(latencies, 50):.1f} ms | p99: {percentile(latencies, 99):.1f} ms")
+        if args.stream:
+            print(f"Primer token p50: {percentile(first_tokens, 50):.1f} ms | p99: {percentile(first_tokens, 99):.1f} ms")
+    finally:
+        server.terminate()
+        fake_ollama.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Coste de la instrumentación por etapas y desglose del tiempo de ask()
+
+Lanza --queries llamadas a RAGSystem.ask (Milvus y Ollama simulados) con las métricas
+desactivadas, activadas y activadas con trazas JSON, alternando los modos durante
+--rounds rondas, y muestra la mejor latencia media de cada modo y su diferencia con
+el primero. Mide también el coste aislado de una span.
+Al final imprime el desglose por etapa (rag_stage_seconds) del modo con métricas.
+
+    python -m benchmarks.metrics --queries 2000
+    python -m benchmarks.metrics --encode-latency 0.005 --token-latency 0.002
+"""
+
+import os
+import time
+import argparse
+import logging
+import tempfile
+
+import ollama
+
+from metrics import Metrics, set_metrics
+from rag_system import RAGSystem
+from benchmarks.stubs import FakeOllamaServer, HashingEncoder, StubMilvusClient, synthetic_corpus
+
+
+def span_cost(metrics: Metrics, iterations: int = 200000) -> float:
+    """Nanosegundos por span vacía"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with metrics.span("bench"):
+            pass
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la instrumentación del pipeline RAG")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--encode-latency", type=float, default=0.0, help="Segundos por llamada al encoder")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="Segundos por búsqueda")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="Segundos de prefill de Ollama")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Segundos por token de Ollama")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with FakeOllamaServer(prefill_latency=args.prefill_latency, token_latency=args.token_latency) as fake, \
+            tempfile.TemporaryDirectory(prefix="rag-bench-") as tmpdir:
+        milvus = StubMilvusClient(HashingEncoder(latency=args.encode_latency), search_latency=args.search_latency)
+        rag = RAGSystem(milvus_client=milvus, ollama_client=ollama.Client(host=fake.url))
+        rag.add_documents(synthetic_corpus(args.docs))
+        questions = [f"pregunta número {i} sobre el corpus" for i in range(args.queries)]
+
+        trace_path = os.path.join(tmpdir, "traces.jsonl")
+        modes = [
+            ("desactivadas", Metrics(enabled=False)),
+            ("activadas", Metrics(enabled=True)),
+            ("con trazas", Metrics(enabled=True, trace_path=trace_path)),
+        ]
+        # Los modos se alternan en varias rondas y se queda la mejor de cada uno (menos ruido)
+        best = {name: float("inf") for name, _ in modes}
+        for _ in range(args.rounds):
+            for name, metrics in modes:
+                set_metrics(metrics)
+                start = time.perf_counter()
+                for question in questions:
+                    rag.ask(question)
+                best[name] = min(best[name], (time.perf_counter() - start) / len(questions))
+
+        print(f"{args.queries} consultas a ask() con {args.docs} documentos, mejor de {args.rounds} rondas")
+        print(f"{'métricas':<14} {'ms/consulta':>12} {'diferencia µs':>14} {'ns/span':>9}")
+        baseline = best[modes[0][0]]
+        for name, metrics in modes:
+            print(f"{name:<14} {best[name] * 1000:>12.3f} {(best[name] - baseline) * 1e6:>14.1f} "
+                  f"{span_cost(metrics):>9.0f}")
+
+        with open(trace_path, encoding="utf-8") as f:
+            traces = sum(1 for _ in f)
+        print(f"Trazas escritas: {traces}")
+
+        print(f"\n{'etapa':<22} {'llamadas':>9} {'media ms':>9}")
+        for stage, values in sorted(modes[1][1].stats().items(), key=lambda item: -item[1]["mean_ms"]):
+            if stage != "bench":
+                print(f"{stage:<22} {values['count']:>9} {values['mean_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
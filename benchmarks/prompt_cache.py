@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Tiempo hasta el primer token con la cache de prompts y el keep_alive de Ollama
+
+Usa un Ollama simulado que carga el modelo en --load-latency segundos, lo descarga
+cuando pasa el keep_alive (--server-keep-alive hace de los 5 minutos de Ollama) y
+solo paga el prefill (--prefill-token-latency por token) de la parte del prompt que
+no comparte con el anterior (su cache KV). Mide el primer token de ask_stream en:
+
+- arranque: primera pregunta con y sin OLLAMA_PREWARM
+- ráfagas: --bursts ráfagas de --burst-size preguntas separadas por --idle segundos,
+  sin OLLAMA_KEEP_ALIVE (vale el del servidor) y con OLLAMA_KEEP_ALIVE=30m
+- disposición del prompt: --followups preguntas distintas sobre los mismos chunks
+  con la actual (instrucciones en el mensaje de sistema, contexto en orden estable
+  y pregunta al final), la actual con los pasajes ordenados por relevancia para cada
+  pregunta, la anterior (instrucciones delante del contexto en el mensaje del
+  usuario, orden por relevancia) y con la pregunta antes del contexto
+
+    python -m benchmarks.prompt_cache
+    python -m benchmarks.prompt_cache --load-latency 5 --prefill-token-latency 0.005
+"""
+
+import os
+import time
+import argparse
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import ollama
+
+from rag_system import RAGSystem, SYSTEM_PROMPT
+from benchmarks.stubs import FakeOllamaServer, HashingEncoder, StubMilvusClient, synthetic_corpus
+
+# Preguntas de seguimiento sobre el mismo contexto
+FOLLOWUPS = ["Resume los puntos principales.", "¿Qué temas se mencionan?", "¿Hay alguna fecha o cifra?",
+             "Explícalo de forma más sencilla.", "¿Qué conclusión se puede sacar?", "¿Qué falta por aclarar?"]
+
+OLD_SYSTEM_PROMPT = ("Eres un asistente útil que responde preguntas basándose en el contexto proporcionado. "
+                     "Si la información no está en el contexto, indícalo claramente.")
+
+
+def layout_previous(rag: RAGSystem, query: str, context: str) -> List[Dict[str, str]]:
+    """Disposición anterior: instrucciones delante del contexto en el mensaje del usuario"""
+    prompt = f"""Basándote en el siguiente contexto, responde a la pregunta de manera precisa y detallada.
+
+Contexto:
+{context}
+
+Pregunta: {query}
+
+Respuesta:"""
+    return [{"role": "system", "content": OLD_SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+
+
+def layout_question_first(rag: RAGSystem, query: str, context: str) -> List[Dict[str, str]]:
+    """La pregunta antes del contexto: lo que cambia en cada pregunta queda delante"""
+    return [{"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Pregunta: {query}\n\nContexto:\n{context}"}]
+
+
+def use_layout(rag: RAGSystem, layout: Callable):
+    """Sustituir la disposición del prompt de `rag` (el contexto se sigue preparando igual)"""
+    def prompt_messages(query: str, context_docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        if rag.context_builder is None:
+            context = "\n\n".join(doc["text"] for doc in context_docs)
+        else:
+            context = rag.context_builder.build(query, context_docs)
+        return layout(rag, query, context)
+    rag._prompt_messages = prompt_messages
+
+
+def fake_ollama(args) -> FakeOllamaServer:
+    return FakeOllamaServer(prefill_latency=args.prefill_latency, prefill_token_latency=args.prefill_token_latency,
+                            token_latency=args.token_latency, num_tokens=args.tokens, load_latency=args.load_latency,
+                            default_keep_alive=args.server_keep_alive, prompt_cache=True)
+
+
+def build_rag(fake: FakeOllamaServer, corpus: List[str], prewarm: bool = False,
+              keep_alive: Optional[str] = None) -> RAGSystem:
+    os.environ['OLLAMA_PREWARM'] = 'true' if prewarm else 'false'
+    if keep_alive is None:
+        os.environ.pop('OLLAMA_KEEP_ALIVE', None)
+    else:
+        os.environ['OLLAMA_KEEP_ALIVE'] = keep_alive
+    rag = RAGSystem(milvus_client=StubMilvusClient(HashingEncoder()), ollama_client=ollama.Client(host=fake.url))
+    # Sin cache de respuestas: cada pregunta llega a Ollama
+    rag.answer_cache = None
+    rag.add_documents(corpus)
+    logging.getLogger().setLevel(logging.WARNING)
+    return rag
+
+
+def first_token(stream) -> float:
+    """Segundos hasta el primer token de un generador de eventos (que se consume entero)"""
+    start = time.perf_counter()
+    seconds = None
+    for event in stream:
+        if event.get("type", "token") == "token" and seconds is None:
+            seconds = time.perf_counter() - start
+    return seconds
+
+
+def first_token_of(stream) -> float:
+    """Como first_token, para un generador de tokens (generate_response_stream)"""
+    start = time.perf_counter()
+    seconds = None
+    for _ in stream:
+        if seconds is None:
+            seconds = time.perf_counter() - start
+    return seconds
+
+
+def bench_startup(args, corpus: List[str], questions: List[str]):
+    print(f"{'arranque':<24} {'precarga s':>10} {'1er token ms':>13} {'cargas':>7}")
+    for prewarm in (False, True):
+        with fake_ollama(args) as fake:
+            rag = build_rag(fake, corpus, prewarm=prewarm)
+            ttft = first_token(rag.ask_stream(questions[0]))
+            name = "con OLLAMA_PREWARM" if prewarm else "sin precarga"
+            # La precarga es una fase más del arranque (startup_profile["ollama"])
+            print(f"{name:<24} {rag.startup_profile.get('ollama', 0.0):>10.2f} {ttft * 1000:>13.0f} {fake.loads:>7}")
+
+
+def bench_bursts(args, corpus: List[str], questions: List[str]):
+    print(f"\n{'ráfagas':<24} {'p50 ms':>9} {'1ª de la ráfaga ms':>19} {'media ms':>9} {'cargas':>7}")
+    for keep_alive in (None, "30m"):
+        with fake_ollama(args) as fake:
+            rag = build_rag(fake, corpus, prewarm=True, keep_alive=keep_alive)
+            ttfts, firsts = [], []
+            for burst in range(args.bursts):
+                if burst:
+                    time.sleep(args.idle)
+                for i in range(args.burst_size):
+                    ttft = first_token(rag.ask_stream(questions[(burst * args.burst_size + i) % len(questions)]))
+                    ttfts.append(ttft)
+                    if i == 0:
+                        firsts.append(ttft)
+            name = f"OLLAMA_KEEP_ALIVE={keep_alive}" if keep_alive else "keep_alive del servidor"
+            print(f"{name:<24} {np.percentile(ttfts, 50) * 1000:>9.0f} {np.mean(firsts) * 1000:>19.0f} "
+                  f"{np.mean(ttfts) * 1000:>9.0f} {fake.loads:>7}")
+
+
+def bench_layouts(args, corpus: List[str], questions: List[str]):
+    print(f"\n{'disposición':<24} {'1ª ms':>9} {'siguientes ms':>14} {'prompt en cache':>16}")
+    layouts = [
+        ("actual", None, True),
+        ("actual, por relevancia", None, False),
+        ("anterior", layout_previous, False),
+        ("pregunta primero", layout_question_first, True),
+    ]
+    for name, layout, stable_order in layouts:
+        with fake_ollama(args) as fake:
+            rag = build_rag(fake, corpus, prewarm=True, keep_alive="30m")
+            rag.context_builder.stable_order = stable_order
+            if layout is not None:
+                use_layout(rag, layout)
+            firsts, followups, total_chars = [], [], 0
+            for i in range(args.contexts):
+                # Preguntas de seguimiento sobre los mismos chunks (como en una conversación)
+                docs = rag.retrieve_context(questions[i])
+                for j in range(args.followups):
+                    question = FOLLOWUPS[(j - 1) % len(FOLLOWUPS)] if j else questions[i]
+                    messages = rag._prompt_messages(question, docs)
+                    total_chars += sum(len(m["content"]) for m in messages)
+                    ttft = first_token_of(rag.generate_response_stream(question, docs))
+                    (followups if j else firsts).append(ttft)
+            print(f"{name:<24} {np.mean(firsts) * 1000:>9.0f} {np.mean(followups) * 1000:>14.0f} "
+                  f"{fake.cached_chars / total_chars:>16.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Primer token con la cache de prompts y el keep_alive de Ollama")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--load-latency", type=float, default=2.0, help="Segundos de carga del modelo")
+    parser.add_argument("--server-keep-alive", type=float, default=1.0,
+                        help="keep_alive del servidor simulado (los 5 minutos de Ollama, a escala)")
+    parser.add_argument("--idle", type=float, default=1.5, help="Segundos sin preguntas entre ráfagas")
+    parser.add_argument("--bursts", type=int, default=4)
+    parser.add_argument("--burst-size", type=int, default=5)
+    parser.add_argument("--contexts", type=int, default=5, help="Contextos distintos en la prueba de disposición")
+    parser.add_argument("--followups", type=int, default=5, help="Preguntas sobre cada contexto")
+    parser.add_argument("--prefill-latency", type=float, default=0.01, help="Segundos fijos de prefill")
+    parser.add_argument("--prefill-token-latency", type=float, default=0.002,
+                        help="Segundos de prefill por token del prompt que no está en la cache")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Segundos por token generado")
+    parser.add_argument("--tokens", type=int, default=5, help="Tokens de cada respuesta")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    corpus = synthetic_corpus(args.docs)
+    questions = [f"¿Qué dice el documento doc{i:07d}?" for i in range(args.docs)]
+    bench_startup(args, corpus, questions)
+    bench_bursts(args, corpus, questions)
+    bench_layouts(args, corpus, questions)
+
+
+if __name__ == "__main__":
+    main()
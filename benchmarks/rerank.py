@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Reordenación con cross-encoder frente al top-k denso (y frente a pedir más chunks)
+
+Ingiere un corpus sintético en un almacén local y lanza consultas por fragmento de
+texto de un chunk (relevante: el chunk de origen o cualquiera que contenga el
+fragmento). Para cada configuración mide la precisión del contexto (fracción de los
+chunks del contexto que son relevantes), si el contexto incluye alguno relevante,
+la latencia de la recuperación, los pares puntuados y, con ask() contra un Ollama
+simulado cuyo prefill cuesta --prefill-token-latency segundos por token, los tokens
+del prompt y la latencia de extremo a extremo:
+
+- denso top_k: lo que se pasaba al prompt
+- denso top_k × depth: pedir más chunks para no perder el relevante (prefill mayor)
+- rerank: top_k × depth candidatos reordenados por el cross-encoder (profundidad adaptativa)
+- rerank con salida temprana (--margin): sin reordenar si la búsqueda ya separa el top_k
+
+Al final compara reordenar todas las consultas una a una con hacerlo en un solo
+rerank_batch (como los micro-lotes del servidor), que puntúa los pares de todas en una
+llamada al modelo por ronda.
+
+Sin --model se usa un cross-encoder simulado (pares de palabras en común, con
+--pair-latency segundos por par); con --model, un CrossEncoder real de sentence-transformers.
+
+    python -m benchmarks.rerank --docs 1000 --queries 40
+    python -m benchmarks.rerank --model cross-encoder/ms-marco-MiniLM-L-6-v2 --margin 0.1 0.3
+"""
+
+import os
+import re
+import time
+import random
+import argparse
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import ollama
+
+from rag_system import RAGSystem
+from reranking import CrossEncoderReranker
+from benchmarks.stubs import FakeOllamaServer, HashingEncoder, OverlapCrossEncoder, StubMilvusClient, iter_synthetic_corpus
+
+# Una consulta y la condición que cumple un chunk relevante
+Query = Tuple[str, Callable[[Dict], bool]]
+
+
+def build_queries(chunks: List[Dict], num_queries: int, words: int, seed: int = 0) -> List[Query]:
+    """Fragmentos de --fragment-words palabras seguidas de chunks al azar"""
+    rng = random.Random(seed)
+    queries = []
+    for chunk in rng.sample(chunks, min(num_queries, len(chunks))):
+        tokens = [token for token in chunk["text"].split() if not re.fullmatch(r"doc\d{7}\.?", token)]
+        start = rng.randrange(max(1, len(tokens) - words))
+        fragment = " ".join(tokens[start:start + words])
+        queries.append((fragment, lambda hit, chunk_id=chunk["id"], fragment=fragment:
+                        hit["id"] == chunk_id or fragment in hit["text"]))
+    return queries
+
+
+def evaluate(rag: RAGSystem, queries: List[Query], top_k: int) -> Dict[str, float]:
+    precision, found, latencies = [], [], []
+    for question, relevant in queries:
+        start = time.perf_counter()
+        docs = rag.retrieve_context(question, top_k)
+        latencies.append(time.perf_counter() - start)
+        hits = sum(1 for doc in docs if relevant(doc))
+        precision.append(hits / max(1, len(docs)))
+        found.append(hits > 0)
+    return {"precision": float(np.mean(precision)), "found": float(np.mean(found)),
+            "p50_ms": float(np.percentile(latencies, 50)) * 1000}
+
+
+def end_to_end(rag: RAGSystem, queries: List[Query], top_k: int) -> Dict[str, float]:
+    tokens_before = rag.context_builder.tokens_out if rag.context_builder is not None else 0
+    latencies = []
+    for question, _ in queries:
+        start = time.perf_counter()
+        rag.ask(question, top_k)
+        latencies.append(time.perf_counter() - start)
+    tokens = (rag.context_builder.tokens_out - tokens_before) / len(queries) if rag.context_builder is not None else 0
+    return {"ask_ms": float(np.mean(latencies)) * 1000, "context_tokens": tokens}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de reordenación con cross-encoder")
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=300, help="Palabras por documento")
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--fragment-words", type=int, default=20, help="Palabras de cada consulta")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=4, help="Candidatos por cada documento del top_k (RERANK_DEPTH)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Pares por lote del cross-encoder (RERANK_BATCH_SIZE)")
+    parser.add_argument("--predict-batch-size", type=int, default=8,
+                        help="Pares por tanda de cada llamada al modelo (RERANK_PREDICT_BATCH_SIZE)")
+    parser.add_argument("--margin", type=float, nargs="*", default=[0.05, 0.1],
+                        help="Márgenes de la salida temprana a comparar (RERANK_MARGIN)")
+    parser.add_argument("--model", default=None, help="Cross-encoder real (por defecto el simulado)")
+    parser.add_argument("--pair-latency", type=float, default=0.004, help="Segundos por par del cross-encoder simulado")
+    parser.add_argument("--batch-latency", type=float, default=0.001,
+                        help="Segundos fijos por tanda del cross-encoder simulado")
+    parser.add_argument("--prefill-token-latency", type=float, default=0.0005,
+                        help="Segundos de prefill del Ollama simulado por token del prompt")
+    parser.add_argument("--num-tokens", type=int, default=16, help="Tokens de cada respuesta del Ollama simulado")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Segundos por token generado")
+    parser.add_argument("--skip-ask", action="store_true", help="Solo medir la recuperación")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Sin presupuesto de tokens: el prompt paga todos los chunks que se recuperan
+    os.environ['CONTEXT_TOKEN_BUDGET'] = '0'
+    os.environ['RETRIEVAL_MODE'] = 'dense'
+
+    model = OverlapCrossEncoder(pair_latency=args.pair_latency, batch_latency=args.batch_latency) if args.model is None else None
+
+    def reranker(margin: float = 0.0) -> CrossEncoderReranker:
+        return CrossEncoderReranker(model_name=args.model or "simulado", depth=args.depth,
+                                    batch_size=args.batch_size, margin=margin,
+                                    predict_batch_size=args.predict_batch_size, model=model)
+
+    with FakeOllamaServer(prefill_latency=0.0, prefill_token_latency=args.prefill_token_latency,
+                          token_latency=args.token_latency, num_tokens=args.num_tokens) as fake:
+        rag = RAGSystem(milvus_client=StubMilvusClient(HashingEncoder()), ollama_client=ollama.Client(host=fake.url))
+        documents = ((f"doc-{i}", text) for i, text in enumerate(iter_synthetic_corpus(args.docs, args.words)))
+        stats = rag.sync_documents(documents, source="corpus")
+        chunks = [chunk for batch in rag.milvus_client.iter_chunks(output_fields=["text"]) for chunk in batch]
+        queries = build_queries(chunks, args.queries, args.fragment_words)
+        print(f"{stats['chunks']} chunks, {len(queries)} consultas de {args.fragment_words} palabras, "
+              f"top_k {args.top_k}, {args.top_k * args.depth} candidatos")
+
+        deep = args.top_k * args.depth
+        configs: List[Tuple[str, int, Optional[CrossEncoderReranker]]] = [
+            (f"denso top {args.top_k}", args.top_k, None),
+            (f"denso top {deep}", deep, None),
+            (f"rerank {deep}→{args.top_k}", args.top_k, reranker()),
+            *[(f"rerank margen {margin}", args.top_k, reranker(margin)) for margin in args.margin],
+        ]
+        print(f"{'configuración':<20} {'precisión':>9} {'con relevante':>13} {'recup. ms':>9} {'pares':>6} "
+              f"{'saltadas':>8} {'tokens ctx':>10} {'ask ms':>8}")
+        for name, top_k, config_reranker in configs:
+            rag.reranker = config_reranker
+            row = evaluate(rag, queries, top_k)
+            pairs, skipped = 0.0, 0.0
+            if config_reranker is not None:
+                rerank_stats = config_reranker.stats()
+                pairs = rerank_stats["pairs"] / rerank_stats["queries"]
+                skipped = rerank_stats["skipped"] / rerank_stats["queries"]
+            ask = {"ask_ms": float("nan"), "context_tokens": float("nan")}
+            if not args.skip_ask:
+                ask = end_to_end(rag, queries, top_k)
+            print(f"{name:<20} {row['precision']:>9.3f} {row['found']:>13.3f} {row['p50_ms']:>9.2f} {pairs:>6.1f} "
+                  f"{skipped:>8.1%} {ask['context_tokens']:>10.0f} {ask['ask_ms']:>8.1f}")
+
+        # Los mismos candidatos, reordenados consulta a consulta o todos en un rerank_batch
+        rag.reranker = None
+        questions = [question for question, _ in queries]
+        candidates = rag.retrieve_context_batch(questions, deep)
+        print(f"{'reordenación':<20} {'ms/consulta':>11} {'llamadas':>8}")
+        for name, rerank in (
+            ("una a una", lambda r: [r.rerank(q, docs, args.top_k) for q, docs in zip(questions, candidates)]),
+            (f"lote de {len(questions)}", lambda r: r.rerank_batch(questions, candidates, args.top_k)),
+        ):
+            config_reranker = reranker()
+            calls = []
+            predict = config_reranker._score
+            config_reranker._score = lambda pairs: calls.append(len(pairs)) or predict(pairs)
+            start = time.perf_counter()
+            rerank(config_reranker)
+            seconds = time.perf_counter() - start
+            print(f"{name:<20} {seconds / len(questions) * 1000:>11.2f} {len(calls):>8}")
+
+
+if __name__ == "__main__":
+    main()
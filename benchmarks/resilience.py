@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Consultas con Ollama caído o colgado: sin protección frente a timeouts, reintentos y circuito
+
+Con Milvus simulado y un Ollama simulado que responde 503 (caído) o tarda
+--hang segundos en contestar (colgado), lanza --queries llamadas a ask() y mide
+latencia media y p99, cuántas respuestas fueron solo con la recuperación (degraded)
+y cuántas fueron error. "sin protección" es el cliente de antes (sin timeout, sin
+reintentos ni circuito); "con circuito" usa OLLAMA_TIMEOUT, reintentos con jitter y el
+circuito. Al final Ollama vuelve y se mide cuánto tarda en volver a generar.
+
+    python -m benchmarks.resilience --queries 20 --hang 1.5
+"""
+
+import os
+import time
+import argparse
+import logging
+from typing import Dict
+
+import numpy as np
+import ollama
+
+from rag_system import RAGSystem
+from resilience import CircuitBreaker, RetryPolicy
+from benchmarks.stubs import FakeOllamaServer, HashingEncoder, StubMilvusClient, synthetic_corpus
+
+
+def build_rag(fake: FakeOllamaServer, protected: bool, args) -> RAGSystem:
+    rag = RAGSystem(milvus_client=StubMilvusClient(HashingEncoder()))
+    if protected:
+        # Cliente propio de RAGSystem (pool keep-alive y timeouts de OLLAMA_TIMEOUT)
+        rag.ollama_host, rag.ollama_port = fake.url.rsplit(":", 1)
+        rag.ollama_host = rag.ollama_host.replace("http://", "")
+        rag.ollama_retry = RetryPolicy(attempts=args.retries, base_delay=0.05, max_delay=0.5,
+                                       retry_if=rag.ollama_retry.retry_if, name="Ollama")
+        rag.ollama_breaker = CircuitBreaker("Ollama", failure_threshold=args.threshold, reset_timeout=args.reset,
+                                            is_failure=rag.ollama_breaker.is_failure)
+    else:
+        rag.ollama_client = ollama.Client(host=fake.url)
+        rag.ollama_retry = RetryPolicy(attempts=1)
+        rag.ollama_breaker = CircuitBreaker(failure_threshold=0)
+        rag.retrieval_fallback = False
+    rag.add_documents(synthetic_corpus(200))
+    return rag
+
+
+def run(rag: RAGSystem, queries: int) -> Dict[str, float]:
+    latencies, degraded, errors = [], 0, 0
+    for i in range(queries):
+        start = time.perf_counter()
+        result = rag.ask(f"pregunta {i} sobre el corpus")
+        latencies.append(time.perf_counter() - start)
+        if result.get("degraded"):
+            degraded += 1
+        elif result["answer"].startswith("Error procesando"):
+            errors += 1
+    ms = np.array(latencies) * 1000
+    return {"mean_ms": ms.mean(), "p99_ms": np.percentile(ms, 99), "degraded": degraded, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de timeouts, reintentos y circuito de Ollama")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--hang", type=float, default=1.5, help="Segundos que tarda el Ollama colgado")
+    parser.add_argument("--timeout", type=float, default=0.3, help="OLLAMA_TIMEOUT del cliente protegido")
+    parser.add_argument("--retries", type=int, default=2, help="Intentos por llamada")
+    parser.add_argument("--threshold", type=int, default=3, help="Fallos seguidos que abren el circuito")
+    parser.add_argument("--reset", type=float, default=1.0, help="Segundos con el circuito abierto")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    os.environ["OLLAMA_TIMEOUT"] = str(args.timeout)
+    # El cliente protegido se crea después de apuntarlo al Ollama simulado, no al arrancar
+    os.environ["OLLAMA_PREWARM"] = "false"
+
+    print(f"{args.queries} consultas por escenario; timeout {args.timeout} s, {args.retries} intentos, "
+          f"circuito tras {args.threshold} fallos durante {args.reset} s")
+    print(f"{'escenario':<10} {'cliente':<16} {'media ms':>9} {'p99 ms':>9} {'solo recuperación':>18} {'errores':>8}")
+    for scenario in ("caído", "colgado"):
+        for name, protected in (("sin protección", False), ("con circuito", True)):
+            with FakeOllamaServer(prefill_latency=0.01) as fake:
+                if scenario == "caído":
+                    fake.fail_status = 503
+                else:
+                    fake.hang_seconds = args.hang
+                rag = build_rag(fake, protected, args)
+                row = run(rag, args.queries)
+                print(f"{scenario:<10} {name:<16} {row['mean_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+                      f"{row['degraded']:>18} {row['errors']:>8}")
+
+                if protected and scenario == "caído":
+                    # Ollama vuelve: tras reset segundos el circuito deja pasar una prueba y se cierra
+                    fake.fail_status = None
+                    start = time.perf_counter()
+                    while rag.ask("pregunta de prueba").get("degraded"):
+                        time.sleep(0.05)
+                    print(f"{'':<10} {'recuperación':<16} {(time.perf_counter() - start) * 1000:>9.1f} ms hasta "
+                          f"volver a generar (circuito {rag.ollama_breaker.state})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Latencia y recall de la búsqueda BM25 (sparse_index.py) en un corpus grande
+
+Indexa directamente en BM25Index un corpus sintético con vocabulario de Zipf (unas
+pocas palabras aparecen en casi todos los chunks, como en texto real) y un código
+único por chunk, y compara por consulta:
+
+- python: el bucle por listas de postings en Python (la implementación anterior),
+- exacto: la búsqueda con NumPy recorriendo todas las listas (BM25_MAX_POSTINGS=0),
+- máx N: la búsqueda con NumPy recorriendo como mucho N chunks por término.
+
+El recall@k es el de los top_k frente a los exactos; "encontrado" es la fracción de
+consultas cuyo chunk de origen sale entre los top_k.
+
+    python -m benchmarks.sparse_index --chunks 200000 --queries 300
+    python -m benchmarks.sparse_index --chunks 1000000 --max-postings 100000,250000
+"""
+
+import math
+import time
+import heapq
+import argparse
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from sparse_index import BM25Index, tokenize
+
+
+def zipf_corpus(num_chunks: int, words: int, vocabulary: int, seed: int = 0) -> List[str]:
+    """Chunks de `words` palabras con frecuencias de Zipf y un código único cada uno"""
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocabulary + 1)
+    probabilities = 1 / ranks ** 1.1
+    probabilities /= probabilities.sum()
+    terms = np.array([f"t{rank}" for rank in ranks])
+    samples = rng.choice(vocabulary, size=(num_chunks, words), p=probabilities)
+    positions = rng.integers(words + 1, size=num_chunks)
+    chunks = []
+    for i, (sample, position) in enumerate(zip(samples, positions)):
+        sample = terms[sample].tolist()
+        sample.insert(int(position), f"sku-{i:07d}")
+        chunks.append(" ".join(sample))
+    return chunks
+
+
+def python_search(index: BM25Index, query: str, top_k: int) -> List[Tuple[int, float]]:
+    """La búsqueda anterior: un bucle en Python por cada posting, todo bajo el lock"""
+    terms = set(tokenize(query))
+    scores: Dict[int, float] = {}
+    with index._lock:
+        num_docs = len(index._docs)
+        average_length = index._total_length / num_docs
+        for term in terms:
+            postings = index._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, frequency in postings.items():
+                length = index._docs[chunk_id][0]
+                norm = index.k1 * (1 - index.b + index.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (index.k1 + 1) / (frequency + norm)
+    return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def measure(search, queries: List[Tuple[str, int]], top_k: int) -> Tuple[List[List[int]], List[float]]:
+    results, latencies = [], []
+    for query, _ in queries:
+        start = time.perf_counter()
+        hits = search(query, top_k)
+        latencies.append(time.perf_counter() - start)
+        results.append([chunk_id for chunk_id, _ in hits])
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la búsqueda BM25")
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--words", type=int, default=150, help="Palabras por chunk (~1000 caracteres)")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--max-postings", default="50000,100000,150000",
+                        help="Valores de BM25_MAX_POSTINGS a comparar, separados por comas")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    start = time.perf_counter()
+    texts = zipf_corpus(args.chunks, args.words, args.vocabulary)
+    index = BM25Index(max_postings=0)
+    for offset in range(0, len(texts), 10000):
+        index.add({"id": offset + i, "text": text} for i, text in enumerate(texts[offset:offset + 10000]))
+    print(f"Indexados {len(index)} chunks ({index.stats()['terms']} términos) en {time.perf_counter() - start:.1f} s")
+
+    # Fragmentos de un chunk (con palabras frecuentes) y, la mitad, con su código
+    rng = np.random.default_rng(1)
+    queries = []
+    for i in range(args.queries):
+        chunk_id = int(rng.integers(len(texts)))
+        words = texts[chunk_id].split()
+        first = int(rng.integers(max(1, len(words) - args.query_words)))
+        fragment = [word for word in words[first:first + args.query_words] if not word.startswith("sku-")]
+        if i % 2:
+            fragment.append(f"sku-{chunk_id:07d}")
+        queries.append((" ".join(fragment), chunk_id))
+
+    searches = {"python": lambda query, k: python_search(index, query, k), "exacto": index.search}
+    for max_postings in (int(value) for value in args.max_postings.split(",")):
+        # Los mismos datos, con sus propias listas convertidas (recortadas)
+        capped = BM25Index(max_postings=max_postings)
+        capped.__dict__.update({key: value for key, value in index.__dict__.items()
+                                if key not in ("max_postings", "_arrays", "_lock")})
+        searches[f"máx {max_postings}"] = capped.search
+
+    exact, _ = measure(index.search, queries, args.top_k)
+    rows = {}
+    for name, search in searches.items():
+        if name != "python":
+            # Latencia estable: la primera pasada convierte las listas de los términos a arrays
+            measure(search, queries, args.top_k)
+        results, latencies = measure(search, queries, args.top_k)
+        recall = np.mean([len(set(got) & set(want)) / max(len(want), 1) for got, want in zip(results, exact)])
+        found = np.mean([chunk_id in got for got, (_, chunk_id) in zip(results, queries)])
+        rows[name] = (recall, found, np.percentile(latencies, 50) * 1000, np.percentile(latencies, 95) * 1000)
+
+    print(f"{args.queries} consultas, top_k={args.top_k}")
+    print(f"{'búsqueda':<12} {'recall@k':>9} {'encontrado':>11} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, (recall, found, p50, p95) in rows.items():
+        print(f"{name:<12} {recall:>9.3f} {found:>11.3f} {p50:>9.2f} {p95:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Arranque de RAGSystem: tiempo hasta aceptar peticiones y hasta la primera respuesta
+
+Cada modo se mide en un proceso nuevo (los imports cuentan): "eager" construye el
+sistema como siempre (conecta, prepara la colección y carga el modelo antes de
+volver) y "warm" con RAG_WARM_START (vuelve enseguida y termina en un hilo). Se
+muestra el import de rag_system, la construcción (a partir de ahí el proceso acepta
+peticiones), la primera recuperación desde el inicio, el perfil por fases y qué
+módulos pesados se llegaron a importar.
+
+Usa el MilvusClient real sobre una colección simulada que ya tiene índice (un
+reinicio: no se vuelve a pedir create_index) y cuya carga cuesta --load-latency.
+Sin --model el encoder es el simulado por hashing.
+
+    python -m benchmarks.startup --model all-MiniLM-L6-v2 --load-latency 2
+    python -m benchmarks.startup --model all-MiniLM-L6-v2 --backend onnx-int8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import subprocess
+
+from embedding_backends import EMBEDDING_BACKENDS
+
+MODES = ("eager", "warm")
+
+# Módulos cuyo import domina el arranque
+HEAVY_MODULES = ("torch", "pymilvus", "ollama", "onnxruntime")
+
+
+def measure(mode: str, model: str, backend: str, load_latency: float) -> dict:
+    """Medir el arranque en el proceso actual"""
+    # Sin Ollama la precarga solo mediría el fallo de conexión (OLLAMA_PREWARM=true con uno real)
+    os.environ.setdefault('OLLAMA_PREWARM', 'false')
+    start = time.perf_counter()
+    from rag_system import RAGSystem
+    import_seconds = time.perf_counter() - start
+
+    from benchmarks.stubs import HashingEncoder, StubCollection, offline_milvus_client
+    collection = StubCollection(load_latency=load_latency)
+    collection.create_index("embedding", {"index_type": "HNSW", "metric_type": "L2",
+                                          "params": {"M": 16, "efConstruction": 200}})
+    if model:
+        from embedding_backends import create_embedding_backend
+        encoder = create_embedding_backend(model, backend)
+    else:
+        encoder = HashingEncoder()
+    milvus = offline_milvus_client(collection, encoder)
+
+    rag = RAGSystem(milvus_client=milvus, warm_start=mode == "warm")
+    construct_seconds = time.perf_counter() - start
+    imported = [module for module in HEAVY_MODULES if module in sys.modules]
+
+    rag.retrieve_context("¿Cuánto tarda en arrancar el sistema?", top_k=5)
+    first_query_seconds = time.perf_counter() - start
+
+    query_start = time.perf_counter()
+    rag.retrieve_context("¿Y una vez arrancado?", top_k=5)
+    return {
+        "mode": mode,
+        "import_s": import_seconds,
+        "accepting_s": construct_seconds,
+        "first_query_s": first_query_seconds,
+        "query_ms": (time.perf_counter() - query_start) * 1000,
+        "create_index_calls": collection.calls.get("create_index", 0),
+        "imported_at_accept": imported,
+        "phases": rag.stats()["startup"]["phases"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del arranque del sistema RAG")
+    parser.add_argument("--model", default=None, help="Modelo de embeddings (por defecto el encoder simulado)")
+    parser.add_argument("--backend", default="torch", choices=EMBEDDING_BACKENDS, help="Backend de embeddings con --model")
+    parser.add_argument("--load-latency", type=float, default=1.0, help="Segundos que tarda Milvus en cargar la colección")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--json", default=None, help="Guardar los resultados en este fichero")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.model, args.backend, args.load_latency)))
+        return
+
+    rows = []
+    for mode in args.modes:
+        command = [sys.executable, "-m", "benchmarks.startup", "--worker", mode, "--backend", args.backend,
+                   "--load-latency", str(args.load_latency)]
+        if args.model:
+            command += ["--model", args.model]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{mode}: error\n{result.stderr[-2000:]}")
+            continue
+        rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    print(f"Encoder {args.model or 'hashing'} ({args.backend if args.model else '-'}), "
+          f"carga de la colección {args.load_latency:.1f} s")
+    print(f"{'modo':<6} {'import s':>9} {'acepta s':>9} {'1ª consulta s':>14} {'consulta ms':>12} "
+          f"{'create_index':>13}  importados al aceptar")
+    for row in rows:
+        print(f"{row['mode']:<6} {row['import_s']:>9.2f} {row['accepting_s']:>9.2f} {row['first_query_s']:>14.2f} "
+              f"{row['query_ms']:>12.2f} {row['create_index_calls']:>13}  {', '.join(row['imported_at_accept']) or '-'}")
+    for row in rows:
+        phases = ", ".join(f"{name} {seconds:.2f}" for name, seconds in row["phases"].items())
+        print(f"fases ({row['mode']}): {phases}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "backend": args.backend, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
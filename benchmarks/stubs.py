@@ -0,0 +1,680 @@
+"""
+Sustitutos locales de Milvus y Ollama para los benchmarks
+
+Permiten medir el sistema sin levantar el stack de Docker:
+- HashingEncoder: encoder determinista que no carga ningún modelo
+- OverlapCrossEncoder: cross-encoder simulado (pares de palabras en común) con latencia por par
+- StubMilvusClient: almacén local (LocalVectorStore) temporal con latencia de búsqueda simulada
+- StubCollection: imita pymilvus.Collection para probar el MilvusClient real sin servidor
+  (offline_milvus_client devuelve un MilvusClient ya conectado a una StubCollection)
+- FakeOllamaServer: servidor HTTP que imita /api/chat (normal y en streaming) con latencia, fallos, carga
+  del modelo, keep_alive y cache de prompts configurables
+"""
+
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import sys
+import threading
+import zlib
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from local_store import LocalVectorStore
+
+
+VOCABULARY = [
+    "python", "milvus", "ollama", "vector", "embedding", "índice", "consulta", "documento",
+    "modelo", "búsqueda", "latencia", "memoria", "colección", "servidor", "respuesta",
+    "contexto", "chunk", "token", "red", "disco", "cache", "datos", "sistema", "usuario",
+]
+
+
+def iter_synthetic_corpus(num_docs: int, words_per_doc: int = 300, seed: int = 0) -> Iterator[str]:
+    """Generar de forma perezosa un corpus sintético reproducible"""
+    rng = random.Random(seed)
+    for doc_id in range(num_docs):
+        words = [rng.choice(VOCABULARY) for _ in range(words_per_doc)]
+        # Identificador único para que cada documento sea recuperable por su código
+        words.insert(rng.randrange(len(words) + 1), f"doc{doc_id:07d}")
+        sentences = [" ".join(words[i:i + 12]) + "." for i in range(0, len(words), 12)]
+        yield " ".join(sentences)
+
+
+def synthetic_corpus(num_docs: int, words_per_doc: int = 300, seed: int = 0) -> List[str]:
+    """Generar un corpus sintético reproducible"""
+    return list(iter_synthetic_corpus(num_docs, words_per_doc, seed))
+
+
+class HashingEncoder:
+    """Encoder determinista basado en hashing de palabras (sin modelo)
+
+    `latency` simula el coste fijo de una pasada del modelo. Como un modelo real
+    ocupa todos los núcleos, las llamadas concurrentes se serializan con un lock.
+    """
+
+    def __init__(self, dim: int = 384, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Generar embeddings normalizados a partir de las palabras del texto"""
+        if self.latency:
+            with self._lock:
+                time.sleep(self.latency)
+
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return embeddings / norms
+
+
+class OverlapCrossEncoder:
+    """Cross-encoder simulado: puntúa cada (consulta, texto) por los pares de palabras seguidas en común
+
+    Lee la consulta y el texto juntos, como un cross-encoder, así que encuentra el pasaje
+    de un fragmento aunque el encoder por hashing (bolsa de palabras) no lo distinga.
+    `pair_latency` simula el coste del modelo por par y `batch_latency` el fijo de cada
+    lote; como un modelo real ocupa todos los núcleos, los lotes se serializan.
+    """
+
+    def __init__(self, pair_latency: float = 0.004, batch_latency: float = 0.001):
+        self.pair_latency = pair_latency
+        self.batch_latency = batch_latency
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bigrams(text: str) -> set:
+        words = text.lower().replace(".", " ").split()
+        return set(zip(words, words[1:]))
+
+    def predict(self, pairs, batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            with self._lock:
+                time.sleep(self.batch_latency + self.pair_latency * len(batch))
+            for query, text in batch:
+                query_bigrams = self._bigrams(query)
+                scores.append(len(query_bigrams & self._bigrams(text)) / max(1, len(query_bigrams)))
+        return np.asarray(scores, dtype=np.float32)
+
+
+class StubMilvusClient(LocalVectorStore):
+    """Almacén local (LocalVectorStore) en un directorio temporal, con latencia de búsqueda configurable"""
+
+    def __init__(self, encoder: HashingEncoder = None, search_latency: float = 0.0, path: str = None):
+        encoder = encoder or HashingEncoder()
+        # El directorio temporal se borra al destruir el cliente
+        self._tmpdir = None
+        if path is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="rag-bench-")
+            path = self._tmpdir.name
+        super().__init__(path=path, encoder=encoder, index_type="FLAT", metric_type="L2")
+        self.embedding_dim = encoder.dim
+        self.embedding_cache = None
+        self.search_latency = search_latency
+
+    def search_by_embeddings(self, query_embeddings: np.ndarray, top_k: int = 5, namespaces=None,
+                             filters=None, output_fields=None) -> List[List[Dict[str, Any]]]:
+        """Búsqueda exacta; la latencia simulada se paga una vez por lote"""
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        return super().search_by_embeddings(query_embeddings, top_k, namespaces, filters, output_fields)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Cola de conexiones amplia para no rechazar clientes bajo carga
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Un cliente que corta por timeout no es un error del servidor simulado
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Entity(dict):
+    """Entidad devuelta en un hit (hit.entity.get("text"))"""
+
+
+class _Schema:
+    """Schema mínimo de una StubCollection (solo los nombres de los campos)"""
+
+    def __init__(self, names: List[str]):
+        self.fields = [SimpleNamespace(name=name) for name in names]
+
+
+class _QueryIterator:
+    """Imita el iterador de Collection.query_iterator (next() devuelve [] al terminar)"""
+
+    def __init__(self, rows: List[Dict[str, Any]], batch_size: int):
+        self._rows = rows
+        self._batch_size = batch_size
+        self._position = 0
+
+    def next(self) -> List[Dict[str, Any]]:
+        rows = self._rows[self._position:self._position + self._batch_size]
+        self._position += len(rows)
+        return rows
+
+    def close(self):
+        pass
+
+
+class _Partition:
+    """Partición de una StubCollection (name, description y release())"""
+
+    def __init__(self, collection: "StubCollection", name: str, description: str = ""):
+        self._collection = collection
+        self.name = name
+        self.description = description
+
+    def release(self, *args, **kwargs):
+        self._collection._rpc("release_partition")
+        self._collection._loaded.discard(self.name)
+        self._collection._loaded_whole = False
+
+
+def _matches(row: Dict[str, Any], expr: Optional[str]) -> bool:
+    """Evaluar sobre una fila las expresiones que genera MilvusClient (cláusulas unidas con "and")
+
+    Se entienden 'id in [...]', 'id >= 0', 'source == "..."', 'source in [...]',
+    'date >= N', 'date <= N' y 'array_contains_any(tags, [...])'.
+    """
+    if not expr:
+        return True
+    for clause in expr.split(" and "):
+        clause = clause.strip()
+        if clause.startswith("array_contains_any(tags, "):
+            tags = json.loads(clause[len("array_contains_any(tags, "):-1])
+            if not set(row["tags"]) & set(tags):
+                return False
+            continue
+        field, operator, value = clause.split(" ", 2)
+        value = json.loads(value)
+        if operator == "in" and row[field] not in value:
+            return False
+        if operator == "==" and row[field] != value:
+            return False
+        if operator == ">=" and row[field] < value:
+            return False
+        if operator == "<=" and row[field] > value:
+            return False
+    return True
+
+
+class _Hit:
+    def __init__(self, id: int, score: float, entity: Dict[str, Any]):
+        self.id = id
+        self.score = score
+        self.distance = score
+        self.entity = _Entity(entity)
+
+
+class StubCollection:
+    """Sustituto de pymilvus.Collection con la latencia de red de un Milvus real
+
+    Cada llamada paga `rpc_latency`; load() sobre una colección liberada paga además
+    `load_latency` (Milvus tiene que leer segmentos e índice a memoria). Las particiones
+    se cargan y liberan por separado; cargar una paga `load_latency` por cada 10000 filas
+    (mínimo una vez).
+    """
+
+    def __init__(self, dim: int = 384, rpc_latency: float = 0.002, load_latency: float = 0.5,
+                 flush_latency: float = 0.0, store: bool = True):
+        self.dim = dim
+        self.rpc_latency = rpc_latency
+        self.load_latency = load_latency
+        self.flush_latency = flush_latency
+        # Con store=False los datos se descartan (para medir memoria del cliente, no del stub)
+        self.store = store
+        self.calls: Dict[str, int] = {}
+        self.schema = _Schema(["id", "text", "source", "document_id", "chunk_offset", "date", "tags", "embedding"])
+        # Índices por campo: el vectorial (embedding) y los escalares
+        self._indexes: Dict[str, SimpleNamespace] = {}
+        self._ids: List[int] = []
+        self._texts: List[str] = []
+        self._sources: List[str] = []
+        self._document_ids: List[str] = []
+        self._offsets: List[int] = []
+        self._dates: List[int] = []
+        self._tags: List[List[str]] = []
+        self._row_partitions: List[str] = []
+        self._embeddings = np.zeros((0, dim), dtype=np.float32)
+        self._partitions: Dict[str, _Partition] = {"_default": _Partition(self, "_default")}
+        self._loaded = set()
+        # Cargada entera con load(): como en Milvus, las particiones nuevas se cargan al crearlas
+        self._loaded_whole = False
+
+    @property
+    def is_loaded(self) -> bool:
+        return bool(self._loaded)
+
+    @property
+    def partitions(self) -> List[_Partition]:
+        return list(self._partitions.values())
+
+    def has_partition(self, name: str) -> bool:
+        return name in self._partitions
+
+    def create_partition(self, name: str, description: str = "", **kwargs):
+        self._rpc("create_partition")
+        self._partitions[name] = _Partition(self, name, description)
+        if self._loaded_whole:
+            self._loaded.add(name)
+
+    def partition(self, name: str) -> _Partition:
+        return self._partitions[name]
+
+    def _check_loaded(self, partition_names) -> List[str]:
+        """Particiones en las que busca una llamada (todas las cargadas si no se indican)"""
+        if partition_names is None:
+            if not self._loaded:
+                from pymilvus import MilvusException
+                raise MilvusException(message="collection not loaded")
+            return list(self._loaded)
+        if any(name not in self._loaded for name in partition_names):
+            from pymilvus import MilvusException
+            raise MilvusException(message="partition not loaded")
+        return list(partition_names)
+
+    def _rpc(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def load(self, partition_names=None, *args, **kwargs):
+        self._rpc("load")
+        if partition_names is None:
+            if not self.is_loaded:
+                time.sleep(self.load_latency)
+            self._loaded = set(self._partitions)
+            self._loaded_whole = True
+            return
+        for name in partition_names:
+            if name not in self._loaded:
+                rows = sum(1 for partition in self._row_partitions if partition == name)
+                time.sleep(self.load_latency * max(1, rows / 10000))
+                self._loaded.add(name)
+
+    def release(self, *args, **kwargs):
+        self._loaded = set()
+        self._loaded_whole = False
+
+    @property
+    def index_params(self) -> Optional[Dict[str, Any]]:
+        """Parámetros del índice vectorial (None si no tiene)"""
+        index = self._indexes.get("embedding")
+        return index.params if index else None
+
+    @property
+    def indexes(self) -> List[SimpleNamespace]:
+        return list(self._indexes.values())
+
+    def create_index(self, field_name, index_params=None, index_name=None, **kwargs):
+        self._rpc("create_index")
+        self._indexes[field_name] = SimpleNamespace(field_name=field_name, params=index_params,
+                                                    index_name=index_name or f"_{field_name}_idx")
+
+    def drop_index(self, index_name=None, **kwargs):
+        self._rpc("drop_index")
+        self._indexes = {field: index for field, index in self._indexes.items()
+                         if index_name is not None and index.index_name != index_name}
+
+    @property
+    def num_entities(self) -> int:
+        return len(self._ids)
+
+    def insert(self, data, partition_name=None, **kwargs):
+        self._rpc("insert")
+        self._append(data, partition_name or "_default")
+
+    def upsert(self, data, partition_name=None, **kwargs):
+        self._rpc("upsert")
+        if self.store:
+            self._remove(set(data[0]))
+        self._append(data, partition_name or "_default")
+
+    def delete(self, expr, **kwargs):
+        self._rpc("delete")
+        # Solo se entiende la expresión que genera MilvusClient.delete_chunks: "id in [...]"
+        self._remove(set(json.loads(expr.split(" in ", 1)[1])))
+
+    def query_iterator(self, batch_size=1000, limit=-1, expr=None, output_fields=None, partition_names=None,
+                       **kwargs):
+        self._rpc("query_iterator")
+        partitions = self._check_loaded(partition_names)
+        rows = [row for row in self._rows(partitions) if _matches(row, expr)]
+        return _QueryIterator([self._project(row, output_fields) for row in rows], batch_size)
+
+    def query(self, expr, output_fields=None, partition_names=None, **kwargs):
+        self._rpc("query")
+        partitions = self._check_loaded(partition_names)
+        return [self._project(row, output_fields) for row in self._rows(partitions) if _matches(row, expr)]
+
+    def _rows(self, partitions=None):
+        """Filas (de esas particiones, si se indican) como dicts"""
+        columns = zip(self._ids, self._texts, self._sources, self._document_ids, self._offsets, self._dates,
+                      self._tags, self._embeddings, self._row_partitions)
+        return [
+            {"id": id, "text": text, "source": source, "document_id": document_id, "chunk_offset": offset,
+             "date": date, "tags": tags, "embedding": embedding}
+            for id, text, source, document_id, offset, date, tags, embedding, partition in columns
+            if partitions is None or partition in partitions
+        ]
+
+    @staticmethod
+    def _project(row, output_fields):
+        return {field: row[field] for field in output_fields or ["id"]}
+
+    def _append(self, data, partition: str = "_default"):
+        """Guardar las columnas de un insert (schema actual o antiguo sin metadatos)"""
+        if not self.store:
+            return
+        dates, tags = [0] * len(data[0]), [[] for _ in data[0]]
+        if len(data) == 8:
+            ids, texts, sources, document_ids, offsets, dates, tags, embeddings = data
+        elif len(data) == 6:
+            ids, texts, sources, document_ids, offsets, embeddings = data
+        else:
+            texts, embeddings = data
+            start = max(self._ids) + 1 if self._ids else 0
+            ids = range(start, start + len(texts))
+            sources, document_ids, offsets = [""] * len(texts), [""] * len(texts), [0] * len(texts)
+        self._ids.extend(ids)
+        self._offsets.extend(offsets)
+        self._texts.extend(texts)
+        self._sources.extend(sources)
+        self._document_ids.extend(document_ids)
+        self._dates.extend(dates)
+        self._tags.extend(tags)
+        self._row_partitions.extend([partition] * len(texts))
+        self._embeddings = np.vstack([self._embeddings, np.asarray(embeddings, dtype=np.float32)])
+
+    def _remove(self, ids):
+        """Borrar las filas cuyos IDs estén en `ids`"""
+        keep = [i for i, id in enumerate(self._ids) if id not in ids]
+        if len(keep) == len(self._ids):
+            return
+        self._ids = [self._ids[i] for i in keep]
+        self._texts = [self._texts[i] for i in keep]
+        self._sources = [self._sources[i] for i in keep]
+        self._document_ids = [self._document_ids[i] for i in keep]
+        self._offsets = [self._offsets[i] for i in keep]
+        self._dates = [self._dates[i] for i in keep]
+        self._tags = [self._tags[i] for i in keep]
+        self._row_partitions = [self._row_partitions[i] for i in keep]
+        self._embeddings = self._embeddings[keep]
+
+    def flush(self, *args, **kwargs):
+        self._rpc("flush")
+        if self.flush_latency:
+            time.sleep(self.flush_latency)
+
+    def search(self, data, anns_field, param, limit=10, expr=None, output_fields=None, partition_names=None,
+               **kwargs):
+        self._rpc("search")
+        partitions = self._check_loaded(partition_names)
+
+        # Solo se recorren las filas de las particiones de la búsqueda que cumplen el filtro
+        rows = [row for row in self._rows(partitions) if _matches(row, expr)]
+        ids = {row["id"] for row in rows}
+        positions = np.array([i for i, (id, partition) in enumerate(zip(self._ids, self._row_partitions))
+                              if partition in partitions and id in ids], dtype=np.int64)
+        embeddings = self._embeddings[positions]
+        queries = np.asarray(data, dtype=np.float32)
+        distances = (
+            (queries ** 2).sum(axis=1)[:, None]
+            - 2 * queries @ embeddings.T
+            + (embeddings ** 2).sum(axis=1)[None, :]
+        )
+        k = min(limit, len(positions))
+        results = []
+        for row in distances:
+            best = np.argsort(row)[:k]
+            results.append([_Hit(self._ids[positions[i]], float(row[i]), self._project(rows[i], output_fields))
+                             for i in best])
+        return results
+
+
+def offline_milvus_client(collection: StubCollection = None, encoder: HashingEncoder = None):
+    """MilvusClient real (toda su lógica) sobre una StubCollection, sin servidor de Milvus"""
+    from milvus_client import MilvusClient
+
+    class OfflineMilvusClient(MilvusClient):
+        def connect(self):
+            # Como el cliente real, pymilvus se importa al conectar
+            import pymilvus  # noqa: F401
+
+        def create_collection(self):
+            self.collection = stub
+            self._read_partitions()
+            self.loaded = stub.is_loaded
+
+        def delete_collection(self):
+            stub.__init__(stub.dim, stub.rpc_latency, stub.load_latency, stub.flush_latency, stub.store)
+            self.loaded = False
+
+    stub = collection or StubCollection()
+    return OfflineMilvusClient(encoder=encoder or HashingEncoder(stub.dim))
+
+
+def parse_duration(value: Any) -> float:
+    """Segundos de un keep_alive de Ollama: número de segundos o duración como "30s", "5m" o "1h" (negativo = siempre)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    total = 0.0
+    for amount, unit in re.findall(r"(-?[\d.]+)(ms|s|m|h)", value):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total
+
+
+class FakeOllamaServer:
+    """Servidor HTTP local que imita la API de chat de Ollama
+
+    Simula además la carga del modelo (load_latency segundos): la primera petición, la
+    que llega cuando ha pasado el keep_alive de la anterior (el de la petición o
+    default_keep_alive, 5 minutos como en Ollama) y la que cambia num_ctx esperan
+    load_latency segundos. Con prompt_cache, el prefill solo cuenta los tokens que
+    siguen al prefijo más largo en común con los últimos `cache_slots` prompts (la
+    cache KV de Ollama, que se pierde al descargar el modelo).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 prefill_latency: float = 0.05, token_latency: float = 0.0, num_tokens: int = 50,
+                 prefill_token_latency: float = 0.0, load_latency: float = 0.0,
+                 default_keep_alive: float = 300.0, prompt_cache: bool = False, cache_slots: int = 1):
+        self.prefill_latency = prefill_latency
+        # Segundos de prefill por cada token del prompt (~4 caracteres), además del fijo
+        self.prefill_token_latency = prefill_token_latency
+        self.token_latency = token_latency
+        self.num_tokens = num_tokens
+        self.load_latency = load_latency
+        self.default_keep_alive = default_keep_alive
+        self.prompt_cache = prompt_cache
+        self.cache_slots = cache_slots
+        # Modelo cargado: (modelo, num_ctx) y hasta cuándo; prompts en la cache KV
+        self._loaded: Optional[tuple] = None
+        self._loaded_until = 0.0
+        self._cached_prompts: List[str] = []
+        # Cargas del modelo y caracteres del prompt reutilizados de la cache
+        self.loads = 0
+        self.cached_chars = 0
+        # Fallos simulados (se pueden cambiar en caliente): responder con este código HTTP
+        # o tardar estos segundos antes de contestar (un Ollama colgado)
+        self.fail_status: Optional[int] = None
+        self.hang_seconds = 0.0
+        # Respuestas en streaming terminadas y cortadas porque el cliente cerró la conexión
+        self.completed = 0
+        self.aborted = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """URL base del servidor"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        """Arrancar el servidor en un hilo en segundo plano"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Atender peticiones en el hilo actual (bloqueante)"""
+        self._server.serve_forever()
+
+    def stop(self):
+        """Detener el servidor"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _begin(self, request: Dict[str, Any], prompt: str) -> tuple:
+        """Cargar el modelo si hace falta y buscar el prompt en la cache: (segundos de carga, caracteres en cache)"""
+        key = (request.get("model"), (request.get("options") or {}).get("num_ctx"))
+        with self._lock:
+            load = 0.0
+            if self._loaded != key or time.monotonic() > self._loaded_until:
+                load = self.load_latency
+                self.loads += 1
+                self._loaded = key
+                self._cached_prompts = []
+            # Mientras se genera el modelo no se descarga
+            self._loaded_until = float("inf")
+            cached = 0
+            if self.prompt_cache:
+                cached = max((len(os.path.commonprefix([prompt, other])) for other in self._cached_prompts), default=0)
+                if prompt in self._cached_prompts:
+                    self._cached_prompts.remove(prompt)
+                self._cached_prompts = ([prompt] + self._cached_prompts)[:self.cache_slots]
+                self.cached_chars += cached
+            return load, cached
+
+    def _finish(self, request: Dict[str, Any]):
+        """Empezar a contar el keep_alive al terminar la respuesta"""
+        keep_alive = request.get("keep_alive")
+        keep_alive = self.default_keep_alive if keep_alive is None else parse_duration(keep_alive)
+        with self._lock:
+            if keep_alive < 0:
+                self._loaded_until = float("inf")
+            elif keep_alive == 0:
+                self._loaded = None
+                self._cached_prompts = []
+            else:
+                self._loaded_until = time.monotonic() + keep_alive
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Cabeceras y cuerpo van en escrituras separadas: sin esto Nagle añade ~40 ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: Dict[str, Any]):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json({"models": []})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                if fake.hang_seconds:
+                    time.sleep(fake.hang_seconds)
+                if fake.fail_status:
+                    self.send_error(fake.fail_status)
+                    return
+
+                num_tokens = request.get("options", {}).get("num_predict", fake.num_tokens)
+                num_tokens = min(num_tokens, fake.num_tokens)
+                messages = request.get("messages", [])
+                prompt_chars = sum(len(m.get("content", "")) for m in messages)
+                load, cached_chars = fake._begin(
+                    request, "".join(f"\x00{m.get('role')}\x01{m.get('content', '')}" for m in messages))
+                prompt_chars = max(0, prompt_chars - cached_chars)
+                prefill = fake.prefill_latency + fake.prefill_token_latency * (prompt_chars // 4)
+
+                # Contadores y duraciones (en nanosegundos) como los de Ollama
+                stats = {
+                    "load_duration": int(load * 1e9),
+                    "prompt_eval_count": prompt_chars // 4,
+                    "prompt_eval_duration": int(prefill * 1e9),
+                    "eval_count": num_tokens,
+                    "eval_duration": int(fake.token_latency * num_tokens * 1e9),
+                }
+
+                if not request.get("stream", True):
+                    time.sleep(load + prefill + fake.token_latency * num_tokens)
+                    fake._finish(request)
+                    self._send_json({
+                        "model": request.get("model", ""),
+                        "message": {"role": "assistant", "content": " ".join(["token"] * num_tokens)},
+                        "done": True,
+                        **stats,
+                    })
+                    return
+
+                # Respuesta en streaming: una línea JSON por token (NDJSON)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                time.sleep(load + prefill)
+                try:
+                    for i in range(num_tokens):
+                        time.sleep(fake.token_latency)
+                        part = {"message": {"role": "assistant", "content": ("token" if i == 0 else " token")},
+                                "done": False}
+                        self.wfile.write(json.dumps(part).encode("utf-8") + b"\n")
+                        self.wfile.flush()
+                    final = {"message": {"role": "assistant", "content": ""}, "done": True, **stats}
+                    self.wfile.write(json.dumps(final).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente cortó el stream: Ollama deja de generar
+                    fake._finish(request)
+                    with fake._lock:
+                        fake.aborted += 1
+                    return
+                fake._finish(request)
+                with fake._lock:
+                    fake.completed += 1
+
+        return Handler
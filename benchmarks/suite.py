@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks de extremo a extremo con resultados en JSON para comparar commits
+
+Mide, sin Docker ni red (almacén local y Ollama simulado), cada etapa del sistema:
+
+- chunking: división de --docs documentos sintéticos (MB/s y chunks/s)
+- embedding: encode_documents de esos chunks (chunks/s)
+- ingestion: add_documents_stream de los --docs documentos (chunks/s)
+- search: búsqueda en un almacén local de --chunks filas (10k a 10M) con vectores
+  aleatorios (latencia p50/p99 por consulta y QPS en lotes)
+- ask: ask() y ask_stream() de extremo a extremo sobre el corpus ingerido, con un Ollama
+  simulado de --token-latency segundos por token (p50/p99 y tiempo hasta el primer token)
+
+Los resultados (con el commit, la máquina y los parámetros) se escriben en --json. Con
+--compare se comparan con otro fichero y se marcan las métricas que empeoran más de
+--tolerance; el proceso termina con código 1 si alguna empeora.
+
+    python -m benchmarks.suite --json resultados.json
+    python -m benchmarks.suite --chunks 1000000 --stages search --json grande.json
+    python -m benchmarks.suite --json nuevo.json --compare resultados.json --tolerance 0.15
+
+Con 10M de filas el almacén ocupa unos 15 GB en disco (--dim 384) en el directorio
+temporal (--workdir para elegir otro); la búsqueda exacta recorre toda la matriz.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import platform
+import subprocess
+import tempfile
+from typing import Any, Dict, List
+
+import numpy as np
+import ollama
+
+from chunking import TextChunker
+from local_store import LocalVectorStore
+from rag_system import RAGSystem
+from benchmarks.stubs import FakeOllamaServer, HashingEncoder, StubMilvusClient, iter_synthetic_corpus
+
+STAGES = ("chunking", "embedding", "ingestion", "search", "ask")
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    """Media, p50 y p99 en milisegundos"""
+    ms = np.asarray(seconds) * 1000
+    return {"mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+
+def bench_chunking(args) -> Dict[str, Any]:
+    chunker = TextChunker()
+    documents = list(iter_synthetic_corpus(args.docs, args.words))
+    size = sum(len(document.encode("utf-8")) for document in documents)
+    start = time.perf_counter()
+    chunks = sum(1 for document in documents for _ in chunker.iter_spans(document))
+    elapsed = time.perf_counter() - start
+    return {"chunks": chunks, "mb_per_s": size / 2**20 / elapsed, "chunks_per_s": chunks / elapsed}
+
+
+def bench_embedding(args, encoder) -> Dict[str, Any]:
+    chunker = TextChunker()
+    texts = [text for document in iter_synthetic_corpus(args.docs, args.words)
+             for _, text in chunker.iter_spans(document)]
+    store = StubMilvusClient(encoder)
+    start = time.perf_counter()
+    for i in range(0, len(texts), args.batch_size):
+        store.encode_documents(texts[i:i + args.batch_size])
+    elapsed = time.perf_counter() - start
+    return {"chunks": len(texts), "chunks_per_s": len(texts) / elapsed}
+
+
+def bench_ingestion(args, rag: RAGSystem) -> Dict[str, Any]:
+    start = time.perf_counter()
+    stats = rag.add_documents_stream(iter_synthetic_corpus(args.docs, args.words), batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    return {"chunks": stats["chunks"], "seconds_s": elapsed, "chunks_per_s": stats["chunks"] / elapsed}
+
+
+def bench_search(args, workdir: str) -> Dict[str, Any]:
+    """Almacén local de --chunks filas con vectores aleatorios normalizados"""
+    store = LocalVectorStore(path=workdir, encoder=HashingEncoder(args.dim), index_type="FLAT", metric_type="L2")
+    store.embedding_dim = args.dim
+    store.embedding_cache = None
+    store.create_collection()
+    rng = np.random.default_rng(0)
+
+    def unit_vectors(rows: int) -> np.ndarray:
+        vectors = rng.standard_normal((rows, args.dim), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    block = 100000
+    for offset in range(0, args.chunks, block):
+        rows = min(block, args.chunks - offset)
+        chunks = [{"id": offset + i, "text": f"chunk {offset + i}", "document_id": f"doc{(offset + i) // 10}"}
+                  for i in range(rows)]
+        store.insert_chunks(chunks, unit_vectors(rows), upsert=False)
+    store.flush()
+    fill_seconds = time.perf_counter() - start
+
+    queries = unit_vectors(args.queries)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search_by_embeddings(query[None, :], top_k=args.top_k)
+        latencies.append(time.perf_counter() - start)
+
+    batch = min(32, args.queries)
+    start = time.perf_counter()
+    for i in range(0, args.queries, batch):
+        store.search_by_embeddings(queries[i:i + batch], top_k=args.top_k)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "rows": args.chunks,
+        "fill_rows_per_s": args.chunks / fill_seconds,
+        **percentiles(latencies),
+        "qps_per_s": len(latencies) / sum(latencies),
+        "batch_qps_per_s": args.queries / batch_seconds,
+    }
+
+
+def bench_ask(args, rag: RAGSystem) -> Dict[str, Any]:
+    words = ["milvus", "ollama", "latencia", "memoria"]
+    questions = [f"¿Qué dice el documento doc{i % args.docs:07d} sobre {words[i % len(words)]}?"
+                 for i in range(args.queries)]
+    latencies, first_tokens = [], []
+    for question in questions:
+        start = time.perf_counter()
+        rag.ask(question)
+        latencies.append(time.perf_counter() - start)
+    for question in questions:
+        start = time.perf_counter()
+        for event in rag.ask_stream(question):
+            if event["type"] == "token":
+                first_tokens.append(time.perf_counter() - start)
+                break
+    ttft = percentiles(first_tokens)
+    return {**percentiles(latencies), "ttft_p50_ms": ttft["p50_ms"], "ttft_p99_ms": ttft["p99_ms"]}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> int:
+    """Imprimir la variación de cada métrica y devolver cuántas empeoran más de `tolerance`
+
+    Las métricas terminadas en _per_s son mejores cuanto más altas; las terminadas en
+    _ms o _s, cuanto más bajas. El resto (tamaños) no se compara.
+    """
+    regressions = 0
+    print(f"\n{'etapa':<10} {'métrica':<18} {'antes':>12} {'ahora':>12} {'cambio':>8}")
+    for stage, metrics in results.items():
+        for name, value in metrics.items():
+            before = baseline.get(stage, {}).get(name)
+            if name.endswith("_per_s"):
+                higher_is_better = True
+            elif name.endswith("_ms") or name.endswith("_s"):
+                higher_is_better = False
+            else:
+                continue
+            if not before:
+                continue
+            change = value / before - 1
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                regressions += 1
+                flag = "  ← peor"
+            print(f"{stage:<10} {name:<18} {before:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de extremo a extremo del sistema RAG")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--docs", type=int, default=2000, help="Documentos para chunking, embeddings, ingesta y ask")
+    parser.add_argument("--words", type=int, default=300, help="Palabras por documento")
+    parser.add_argument("--chunks", type=int, default=10000, help="Filas del almacén de la etapa search (10k a 10M)")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensión de los vectores de la etapa search")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--model", default=None, help="Modelo de embeddings real (por defecto el encoder simulado)")
+    parser.add_argument("--backend", default="torch", help="Backend de embeddings con --model")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="Segundos de prefill de Ollama")
+    parser.add_argument("--token-latency", type=float, default=0.001, help="Segundos por token de Ollama")
+    parser.add_argument("--num-tokens", type=int, default=64, help="Tokens por respuesta de Ollama")
+    parser.add_argument("--workdir", default=None, help="Directorio para el almacén de la etapa search")
+    parser.add_argument("--json", default=None, help="Guardar los resultados en este fichero")
+    parser.add_argument("--compare", default=None, help="Comparar con los resultados de este fichero")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento tolerado al comparar")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.model:
+        from embedding_backends import create_embedding_backend
+        encoder = create_embedding_backend(args.model, args.backend)
+    else:
+        encoder = HashingEncoder()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    with FakeOllamaServer(prefill_latency=args.prefill_latency, token_latency=args.token_latency,
+                          num_tokens=args.num_tokens) as fake, \
+            tempfile.TemporaryDirectory(prefix="rag-suite-", dir=args.workdir) as workdir:
+        rag = None
+        for stage in STAGES:
+            if stage not in args.stages:
+                continue
+            start = time.perf_counter()
+            if stage == "chunking":
+                results[stage] = bench_chunking(args)
+            elif stage == "embedding":
+                results[stage] = bench_embedding(args, encoder)
+            elif stage == "search":
+                results[stage] = bench_search(args, workdir)
+            else:
+                if rag is None:
+                    rag = RAGSystem(milvus_client=StubMilvusClient(encoder), ollama_client=ollama.Client(host=fake.url))
+                    # ask necesita el corpus aunque no se mida la ingesta
+                    ingested = bench_ingestion(args, rag)
+                    if "ingestion" in args.stages:
+                        results["ingestion"] = ingested
+                if stage == "ask":
+                    results[stage] = bench_ask(args, rag)
+            print(f"{stage}: {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    print(f"{'etapa':<10} {'métrica':<18} {'valor':>12}")
+    for stage, metrics in results.items():
+        for name, value in metrics.items():
+            print(f"{stage:<10} {name:<18} {value:>12.3f}" if isinstance(value, float) else
+                  f"{stage:<10} {name:<18} {value:>12}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processor": platform.processor(), "cpus": os.cpu_count()},
+        "params": vars(args),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparando con {args.compare} (commit {baseline.get('commit')})")
+        # Solo tiene sentido comparar ejecuciones con los mismos tamaños y latencias simuladas
+        ignored = {"stages", "json", "compare", "tolerance", "workdir"}
+        different = {name: (baseline["params"].get(name), value) for name, value in vars(args).items()
+                     if name not in ignored and baseline["params"].get(name) != value}
+        if different:
+            print("Atención, parámetros distintos (antes, ahora): "
+                  + ", ".join(f"{name} {values}" for name, values in different.items()))
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{regressions} métricas empeoran más de un {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
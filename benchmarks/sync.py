@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Resincronización: reconstrucción completa frente a sync_documents incremental
+
+Ingiere un corpus con IDs de documento, modifica una fracción de los documentos,
+borra otra y añade algunos nuevos, y compara el tiempo de reset_database + ingesta
+completa con el de sync_documents (que solo codifica lo nuevo o modificado).
+
+    python -m benchmarks.sync --docs 2000 --changed 0.02
+"""
+
+import argparse
+import logging
+import time
+
+from rag_system import RAGSystem
+from benchmarks.stubs import HashingEncoder, StubCollection, iter_synthetic_corpus, offline_milvus_client
+
+
+def build_rag(args) -> RAGSystem:
+    collection = StubCollection(rpc_latency=args.rpc_latency, load_latency=0.0, flush_latency=args.flush_latency)
+    milvus = offline_milvus_client(collection, HashingEncoder(latency=args.encode_latency))
+    return RAGSystem(milvus_client=milvus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de resincronización incremental")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=300, help="Palabras por documento")
+    parser.add_argument("--changed", type=float, default=0.02, help="Fracción de documentos modificados")
+    parser.add_argument("--deleted", type=float, default=0.01, help="Fracción de documentos borrados")
+    parser.add_argument("--added", type=int, default=10, help="Documentos nuevos")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--encode-latency", type=float, default=0.1,
+                        help="Segundos fijos por llamada al encoder (un lote de batch-size chunks)")
+    parser.add_argument("--rpc-latency", type=float, default=0.002, help="Segundos por llamada a Milvus")
+    parser.add_argument("--flush-latency", type=float, default=0.2, help="Segundos por flush")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    corpus = [(f"doc-{i}", text) for i, text in enumerate(iter_synthetic_corpus(args.docs, args.words))]
+    rag = build_rag(args)
+    rag.sync_documents(corpus, source="corpus", batch_size=args.batch_size)
+
+    # Nueva versión del corpus: unos documentos cambian, otros desaparecen y llegan algunos nuevos
+    num_changed = int(args.docs * args.changed)
+    num_deleted = int(args.docs * args.deleted)
+    updated = [(doc_id, text + " revisado") for doc_id, text in corpus[:num_changed]]
+    updated += corpus[num_changed:args.docs - num_deleted]
+    updated += [(f"new-{i}", text) for i, text in
+                enumerate(iter_synthetic_corpus(args.added, args.words, seed=1))]
+
+    start = time.perf_counter()
+    stats = rag.sync_documents(updated, source="corpus", batch_size=args.batch_size)
+    sync_seconds = time.perf_counter() - start
+    print(f"sync_documents   {sync_seconds:8.2f} s | {stats['chunks']} nuevos, "
+          f"{stats['unchanged']} sin cambios, {stats['deleted']} borrados")
+
+    start = time.perf_counter()
+    rag.reset_database()
+    stats = rag.sync_documents(updated, source="corpus", batch_size=args.batch_size)
+    rebuild_seconds = time.perf_counter() - start
+    print(f"reconstrucción   {rebuild_seconds:8.2f} s | {stats['chunks']} chunks")
+    print(f"La resincronización tarda el {100 * sync_seconds / rebuild_seconds:.1f}% de la reconstrucción")
+
+
+if __name__ == "__main__":
+    main()
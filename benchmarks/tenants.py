@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Varios inquilinos en una colección: búsqueda en su partición y particiones cargadas bajo demanda
+
+1. Latencia de búsqueda con --tenants inquilinos de --rows filas cada uno (almacén
+   local, vectores aleatorios): en toda la colección (lo que se hacía antes: un solo
+   corpus para todos) frente a solo la partición del inquilino (namespace).
+2. MilvusClient sobre una colección simulada en la que cargar una partición cuesta
+   --load-latency segundos por cada 10000 filas: --queries consultas con un reparto de
+   inquilinos sesgado (Zipf, unos pocos concentran casi todo el tráfico) con todo
+   cargado (MILVUS_MAX_LOADED_PARTITIONS=0) y con un máximo de particiones cargadas.
+   Se mide la latencia, las cargas y liberaciones y las filas que quedan en memoria.
+
+    python -m benchmarks.tenants --tenants 50 --rows 2000
+    python -m benchmarks.tenants --max-loaded 4 16 --load-latency 0.05
+"""
+
+import os
+import time
+import argparse
+import logging
+import tempfile
+from typing import Dict, List
+
+import numpy as np
+
+from local_store import LocalVectorStore
+from benchmarks.stubs import HashingEncoder, StubCollection, offline_milvus_client
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1000
+    return {"mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+
+def tenant_chunks(tenants: int, rows: int, dim: int, rng: np.random.Generator):
+    """(chunks, embeddings) de cada inquilino, con vectores aleatorios normalizados"""
+    for tenant in range(tenants):
+        namespace = f"inquilino{tenant:04d}"
+        chunks = [{"id": tenant * rows + i, "text": f"chunk {i} de {namespace}", "document_id": f"doc{i // 10}",
+                   "namespace": namespace} for i in range(rows)]
+        embeddings = rng.standard_normal((rows, dim), dtype=np.float32)
+        yield namespace, chunks, embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def bench_scoped_search(args):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory(prefix="rag-tenants-") as workdir:
+        store = LocalVectorStore(path=workdir, encoder=HashingEncoder(args.dim), index_type="FLAT", metric_type="L2")
+        store.embedding_dim = args.dim
+        store.embedding_cache = None
+        store.create_collection()
+        namespaces = []
+        for namespace, chunks, embeddings in tenant_chunks(args.tenants, args.rows, args.dim, rng):
+            store.insert_chunks(chunks, embeddings, upsert=False)
+            namespaces.append(namespace)
+        store.flush()
+
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        print(f"Búsqueda con {args.tenants} inquilinos de {args.rows} filas ({args.tenants * args.rows} en total)")
+        print(f"{'alcance':<22} {'media ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        for name, scope in (("toda la colección", lambda i: None),
+                            ("partición del inquilino", lambda i: [namespaces[i % len(namespaces)]])):
+            latencies = []
+            for i, query in enumerate(queries):
+                start = time.perf_counter()
+                store.search_by_embeddings(query[None, :], top_k=args.top_k, namespaces=scope(i))
+                latencies.append(time.perf_counter() - start)
+            row = percentiles(latencies)
+            print(f"{name:<22} {row['mean_ms']:>9.3f} {row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f}")
+
+
+def bench_partition_lru(args):
+    rng = np.random.default_rng(1)
+    # Reparto de Zipf: el inquilino i recibe tráfico proporcional a 1 / (i + 1)
+    weights = 1 / np.arange(1, args.tenants + 1)
+    tenants = rng.choice(args.tenants, size=args.queries, p=weights / weights.sum())
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+    print(f"\n{args.queries} consultas con reparto Zipf entre {args.tenants} inquilinos de {args.lru_rows} filas; "
+          f"cargar una partición cuesta {args.load_latency} s por cada 10000 filas")
+    print(f"{'máx. cargadas':<14} {'media ms':>9} {'p99 ms':>9} {'cargas':>7} {'liberaciones':>12} "
+          f"{'filas en memoria':>17}")
+    for max_loaded in [0, *args.max_loaded]:
+        os.environ["MILVUS_MAX_LOADED_PARTITIONS"] = str(max_loaded)
+        collection = StubCollection(dim=args.dim, rpc_latency=0.0, load_latency=0.0)
+        client = offline_milvus_client(collection, HashingEncoder(args.dim))
+        client.create_collection()
+        namespaces = []
+        for namespace, chunks, embeddings in tenant_chunks(args.tenants, args.lru_rows, args.dim, rng):
+            client.insert_chunks(chunks, embeddings, upsert=False)
+            namespaces.append(namespace)
+        client.flush()
+        collection.load_latency = args.load_latency
+
+        latencies = []
+        for tenant, query in zip(tenants, queries):
+            start = time.perf_counter()
+            client.search_by_embeddings(query[None, :], top_k=args.top_k, namespaces=[namespaces[tenant]])
+            latencies.append(time.perf_counter() - start)
+        row = percentiles(latencies)
+        loaded_rows = sum(1 for partition in collection._row_partitions if partition in collection._loaded)
+        print(f"{max_loaded or 'todas':<14} {row['mean_ms']:>9.2f} {row['p99_ms']:>9.2f} {client.partition_loads:>7} "
+              f"{client.partition_releases:>12} {loaded_rows:>17}")
+    os.environ.pop("MILVUS_MAX_LOADED_PARTITIONS")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de búsqueda por inquilino y particiones cargadas bajo demanda")
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=2000, help="Filas por inquilino en la búsqueda local")
+    parser.add_argument("--lru-rows", type=int, default=200, help="Filas por inquilino en la colección simulada")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-loaded", type=int, nargs="+", default=[4, 16],
+                        help="Valores de MILVUS_MAX_LOADED_PARTITIONS a comparar con todo cargado")
+    parser.add_argument("--load-latency", type=float, default=0.05,
+                        help="Segundos por cada 10000 filas al cargar una partición (mínimo una vez)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Sin un log por cada carga y liberación de partición
+    logging.getLogger("milvus_client").setLevel(logging.WARNING)
+    bench_scoped_search(args)
+    bench_partition_lru(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+import os
+import re
+import logging
+from bisect import bisect_left, bisect_right
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Unidades de tamaño para CHUNK_UNIT
+CHUNK_UNITS = ("chars", "tokens")
+
+# Caracteres leídos de cada vez al trocear un fichero
+READ_BLOCK_CHARS = 1 << 20
+
+# Caracteres cuyos límites (y tokens) se indexan de una vez
+INDEX_CHARS = 1 << 18
+
+# Clases de cada carácter (bits) para localizar límites con NumPy. Fin de frase: un signo
+# seguido de un espacio, tabulador o salto de línea; párrafo: una línea en blanco
+_MARK, _BLANK, _NEWLINE, _CARRIAGE_RETURN, _WORD, _SPACE = 1, 2, 4, 8, 16, 32
+
+_SKIP_WHITESPACE = re.compile(r"\s*")
+# Tokenización aproximada cuando no hay tokenizador con offsets
+_APPROXIMATE_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+Document = Union[str, TextIO, "os.PathLike[str]"]
+
+
+class TextChunker:
+    """Divide textos en chunks cortando en fin de párrafo, de frase o de palabra
+
+    El tamaño se mide en caracteres o en tokens del modelo de embeddings (`unit`): con
+    tokens, cada chunk cabe en la ventana del modelo y no se trunca al codificarlo. Cada
+    chunk ocupa entre la mitad y `chunk_size` y el siguiente repite unos `overlap` del
+    final, empezando en frase o palabra.
+
+    El texto se recorre una sola vez: los fines de párrafo y de frase (y, sin
+    tokenizador, los tokens aproximados) se localizan por regiones con operaciones
+    vectorizadas de NumPy sobre la clase de cada carácter, y cada corte se elige con
+    búsquedas binarias, sin bucles de Python por carácter ni por token. iter_spans acepta
+    un texto, un fichero abierto o una ruta: los ficheros se leen por bloques, así que un
+    documento enorme nunca está entero en memoria.
+
+    El coste que queda es fijo por chunk (unos microsegundos de Python para elegir el
+    corte y el solape), así que en caracteres va a la mitad de velocidad que la división
+    anterior de RAGSystem (que cortaba en cualquier espacio, sin frases ni párrafos);
+    ver benchmarks/chunking.py.
+    """
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200, unit: str = "chars", tokenizer=None):
+        if unit not in CHUNK_UNITS:
+            raise ValueError(f"Unidad de chunk no soportada: {unit} (opciones: {', '.join(CHUNK_UNITS)})")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError(f"El solape ({overlap}) tiene que ser menor que el tamaño del chunk ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.unit = unit
+        # Solo sirven los tokenizadores "fast", que devuelven la posición de cada token
+        self.tokenizer = tokenizer if getattr(tokenizer, "is_fast", False) else None
+        if unit == "tokens" and self.tokenizer is None:
+            logger.warning("Sin tokenizador con offsets: los tokens de los chunks se aproximan por palabras")
+
+    @classmethod
+    def from_env(cls, encoder=None) -> "TextChunker":
+        """Crear el chunker con CHUNK_UNIT, CHUNK_SIZE y CHUNK_OVERLAP
+
+        En tokens se usan el tokenizador y la ventana (max_seq_length) de `encoder`, y el
+        tamaño por defecto es la ventana menos los dos tokens especiales que añade el
+        tokenizador. En caracteres el encoder no se toca (ni se carga el modelo).
+        """
+        unit = os.getenv('CHUNK_UNIT', 'chars').lower()
+        tokenizer = None
+        if unit == "tokens":
+            tokenizer = getattr(encoder, "tokenizer", None)
+            default_size, default_overlap = getattr(encoder, "max_seq_length", 256) - 2, 32
+        else:
+            default_size, default_overlap = 1000, 200
+        return cls(
+            chunk_size=int(os.getenv('CHUNK_SIZE', str(default_size))),
+            overlap=int(os.getenv('CHUNK_OVERLAP', str(default_overlap))),
+            unit=unit,
+            tokenizer=tokenizer,
+        )
+
+    def split(self, text: str) -> List[Tuple[int, str]]:
+        """Chunks de un texto como (posición de inicio, texto)"""
+        return list(self.iter_spans(text))
+
+    def iter_spans(self, document: Document) -> Iterator[Tuple[int, str]]:
+        """Chunks de un texto, fichero abierto o ruta, a medida que se producen"""
+        if isinstance(document, str):
+            yield from self._iter_spans([document])
+        elif isinstance(document, os.PathLike):
+            with open(document, encoding="utf-8") as f:
+                yield from self._iter_spans(_read_blocks(f))
+        else:
+            yield from self._iter_spans(_read_blocks(document))
+
+    def _iter_spans(self, blocks: Iterable[str]) -> Iterator[Tuple[int, str]]:
+        reader = _Reader(blocks, tokens=self.unit == "tokens", tokenizer=self.tokenizer)
+        cut = self._cut_chars if self.unit == "chars" else self._cut_tokens
+        start = reader.skip_whitespace(0)
+        while start is not None:
+            end, next_start = cut(reader, start)
+            text = reader.text(start, end).rstrip()
+            if text:
+                yield start, text
+            if next_start - reader.discarded >= READ_BLOCK_CHARS:
+                reader.discard_before(next_start)
+            start = reader.skip_whitespace(next_start)
+
+    def _cut_chars(self, reader: "_Reader", start: int) -> Tuple[int, int]:
+        """(fin del chunk que empieza en `start`, inicio del siguiente) midiendo en caracteres"""
+        hi = start + self.chunk_size
+        if not reader.has(hi + 1):
+            return reader.end, reader.end
+        end, following = reader.boundary(start + self.chunk_size // 2, hi)
+        return end, reader.overlap_start(start, end, end - self.overlap, following)
+
+    def _cut_tokens(self, reader: "_Reader", start: int) -> Tuple[int, int]:
+        """(fin del chunk que empieza en `start`, inicio del siguiente) midiendo en tokens"""
+        first = reader.token_at(start)
+        if not reader.has_tokens(first + self.chunk_size + 1):
+            return reader.end, reader.end
+        hi = int(reader.token_ends[first + self.chunk_size - 1])
+        lo = int(reader.token_starts[first + self.chunk_size // 2])
+        end, following = reader.boundary(lo, hi)
+        # El solape empieza `overlap` tokens antes del final del chunk
+        last = int(np.searchsorted(reader.token_ends, end, side="right")) - 1
+        overlap_from = int(reader.token_starts[last - self.overlap + 1]) if self.overlap and last - self.overlap >= first else end
+        return end, reader.overlap_start(start, end, overlap_from, following)
+
+
+class _Reader:
+    """Texto de un documento leído por bloques, con sus límites indexados por regiones
+
+    Todas las posiciones son absolutas (desde el inicio del documento); del texto solo
+    se guarda lo que queda desde el chunk en curso.
+    """
+
+    def __init__(self, blocks: Iterable[str], tokens: bool = False, tokenizer=None):
+        self._blocks = iter(blocks)
+        self._tokens = tokens
+        self._tokenizer = tokenizer
+        self._buffer = ""
+        self._base = 0
+        self.discarded = 0
+        self.eof = False
+        # Límites ya indexados hasta `_indexed`
+        self._indexed = 0
+        self.paragraphs: List[int] = []
+        self.sentences: List[int] = []
+        # Tokens en arrays: son muchos más que los cortes y no merece la pena pasarlos a int
+        self.token_starts = np.empty(0, dtype=np.int64)
+        self.token_ends = np.empty(0, dtype=np.int64)
+
+    @property
+    def end(self) -> int:
+        return self._base + len(self._buffer)
+
+    def _read(self) -> bool:
+        block = next(self._blocks, None)
+        if block is None:
+            self.eof = True
+            return False
+        self._buffer += block
+        return True
+
+    def has(self, position: int) -> bool:
+        """Leer hasta tener el texto hasta `position`; False si el documento acaba antes"""
+        while self._base + len(self._buffer) < position:
+            if self.eof or not self._read():
+                return False
+        return True
+
+    def has_tokens(self, count: int) -> bool:
+        """Indexar hasta tener `count` tokens; False si el documento tiene menos"""
+        while len(self.token_starts) < count:
+            if self._indexed >= self.end and (self.eof or not self._read()):
+                return False
+            self._index(self._indexed + INDEX_CHARS)
+        return True
+
+    def text(self, start: int, end: int) -> str:
+        return self._buffer[start - self._base:end - self._base]
+
+    def skip_whitespace(self, position: int) -> Optional[int]:
+        """Primera posición no blanca desde `position` (None al final del documento)"""
+        relative = position - self._base
+        if relative < len(self._buffer) and not self._buffer[relative].isspace():
+            return position
+        while True:
+            relative = _SKIP_WHITESPACE.match(self._buffer, position - self._base).end()
+            if relative < len(self._buffer):
+                return self._base + relative
+            position = self.end
+            if self.eof or not self._read():
+                return None
+
+    def discard_before(self, position: int):
+        """Olvidar el texto y los límites anteriores a `position`"""
+        self.discarded = position
+        relative = position - self._base
+        # Compactar solo cuando lo descartado es más de la mitad: coste lineal en total
+        if relative * 2 > len(self._buffer):
+            self._buffer = self._buffer[relative:]
+            self._base = position
+        for positions in (self.paragraphs, self.sentences):
+            del positions[:bisect_left(positions, position)]
+        # Inicios y finales de los mismos tokens, para que sigan emparejados
+        tokens = int(np.searchsorted(self.token_starts, position))
+        self.token_starts, self.token_ends = self.token_starts[tokens:], self.token_ends[tokens:]
+
+    def _index(self, upto: int):
+        """Indexar párrafos, frases y tokens desde `_indexed` hasta ~`upto` (en un espacio)"""
+        self.has(upto + 2)
+        target = min(upto, self.end)
+        if not self.eof or target < self.end:
+            # Terminar la región en un espacio para no partir una palabra ni un token
+            relative = target - self._base
+            space = max(self._buffer.rfind(" ", self._indexed - self._base, relative),
+                        self._buffer.rfind("\n", self._indexed - self._base, relative))
+            if space > self._indexed - self._base:
+                target = self._base + space
+        if target <= self._indexed:
+            return
+
+        base = self._indexed
+        lo, hi = self._indexed - self._base, target - self._base
+        # Clase de cada carácter de la región, con dos de margen detrás
+        flags = _char_flags(self._buffer[lo:hi + 2] + "\0\0")
+        size = hi - lo
+        # Solo se miran los vecinos de los (pocos) signos y saltos de línea
+        marks = np.flatnonzero((flags[:size] & _MARK) != 0)
+        sentences = marks[(flags[marks + 1] & _BLANK) != 0]
+        newlines = np.flatnonzero((flags[:size] & _NEWLINE) != 0)
+        following = flags[newlines + 1]
+        paragraphs = newlines[((following & _NEWLINE) != 0)
+                              | ((following & _CARRIAGE_RETURN) != 0) & ((flags[newlines + 2] & _NEWLINE) != 0)]
+        # Un fin de frase termina después del signo; un párrafo, en el salto de línea
+        self.sentences.extend((sentences + base + 1).tolist())
+        self.paragraphs.extend((paragraphs + base).tolist())
+
+        if self._tokens:
+            self._index_tokens(base, self._buffer[lo:hi], flags[:size])
+        self._indexed = target
+
+    def _index_tokens(self, base: int, region: str, flags: np.ndarray):
+        if self._tokenizer is None:
+            # Los mismos tokens que _APPROXIMATE_TOKEN (\w+ o un signo suelto), a partir de las clases
+            word = (flags & _WORD) != 0
+            sign = ~word & ((flags & _SPACE) == 0)
+            previous_word = np.concatenate(([False], word[:-1]))
+            next_word = np.concatenate((word[1:], [False]))
+            starts = np.flatnonzero(sign | word & ~previous_word)
+            ends = np.flatnonzero(sign | word & ~next_word) + 1
+        else:
+            spans = self._tokenizer(region, add_special_tokens=False, return_offsets_mapping=True,
+                                    return_attention_mask=False, return_token_type_ids=False)["offset_mapping"]
+            offsets = np.array(spans, dtype=np.int64).reshape(-1, 2)
+            starts, ends = offsets[:, 0], offsets[:, 1]
+        self.token_starts = np.concatenate((self.token_starts, starts + base))
+        self.token_ends = np.concatenate((self.token_ends, ends + base))
+
+    def token_at(self, position: int) -> int:
+        """Índice del primer token que empieza en `position` o después"""
+        self.has_tokens(1)
+        index = int(np.searchsorted(self.token_starts, position))
+        while index >= len(self.token_starts) and self._indexed < self.end:
+            self._index(self._indexed + INDEX_CHARS)
+        return index
+
+    def boundary(self, lo: int, hi: int) -> Tuple[int, int]:
+        """Mejor corte con el fin del chunk en [lo, hi]: (fin del chunk, inicio del siguiente)
+
+        Prefiere fin de párrafo, luego de frase y luego de palabra; si no hay ninguno,
+        corta en `hi` (una "palabra" más larga que medio chunk).
+        """
+        if self._indexed <= hi and self._indexed < self.end:
+            self._index(hi + INDEX_CHARS)
+        index = bisect_right(self.paragraphs, hi) - 1
+        if index >= 0 and self.paragraphs[index] > lo:
+            return self.paragraphs[index], self.paragraphs[index]
+        index = bisect_right(self.sentences, hi) - 1
+        if index >= 0 and self.sentences[index] > lo:
+            return self.sentences[index], self.sentences[index]
+
+        relative_lo, relative_hi = lo - self._base, hi - self._base + 1
+        space = max(self._buffer.rfind(" ", relative_lo, relative_hi),
+                    self._buffer.rfind("\n", relative_lo, relative_hi),
+                    self._buffer.rfind("\t", relative_lo, relative_hi))
+        if space > relative_lo:
+            return self._base + space, self._base + space
+        return hi, hi
+
+    def overlap_start(self, start: int, end: int, overlap_from: int, following: int) -> int:
+        """Inicio del chunk siguiente: la primera frase (o palabra) desde `overlap_from`"""
+        if overlap_from <= start or overlap_from >= end:
+            return following
+        index = bisect_left(self.sentences, overlap_from)
+        if index < len(self.sentences) and self.sentences[index] < end:
+            position = self.sentences[index]
+        else:
+            relative, relative_end = overlap_from - self._base, end - self._base
+            spaces = [found for found in (self._buffer.find(" ", relative, relative_end),
+                                          self._buffer.find("\n", relative, relative_end)) if found != -1]
+            if not spaces:
+                return following
+            position = self._base + min(spaces)
+        position = self._base + _SKIP_WHITESPACE.match(self._buffer, position - self._base).end()
+        return position if position < end else following
+
+
+def _flags_of(char: str) -> int:
+    flags = _WORD if char.isalnum() or char == "_" else _SPACE if char.isspace() else 0
+    if char in ".!?…":
+        flags |= _MARK
+    if char in " \t\n":
+        flags |= _BLANK
+    if char == "\n":
+        flags |= _NEWLINE
+    if char == "\r":
+        flags |= _CARRIAGE_RETURN
+    return flags
+
+
+# Clase de cada carácter del plano básico; los que no son latin-1 se clasifican la primera
+# vez que aparecen
+_UNKNOWN = 1 << 7
+_FLAG_TABLE = np.full(0x10000, _UNKNOWN, dtype=np.uint8)
+_FLAG_TABLE[:0x100] = [_flags_of(chr(code)) for code in range(0x100)]
+
+
+def _char_flags(text: str) -> np.ndarray:
+    """Clase de cada carácter de `text` (una por posición)
+
+    Los códigos se leen con el tipo más estrecho que admite el texto (latin-1 o UTF-16
+    sin pares subrogados, que es casi siempre) y se clasifican con una sola consulta a
+    la tabla; los caracteres fuera del plano básico se clasifican uno a uno.
+    """
+    try:
+        return _FLAG_TABLE.take(np.frombuffer(text.encode("latin-1"), dtype=np.uint8))
+    except UnicodeEncodeError:
+        pass
+    data = text.encode("utf-16-le")
+    if len(data) == 2 * len(text):
+        return _basic_flags(np.frombuffer(data, dtype=np.uint16))
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    astral = codes > 0xFFFF
+    flags = _basic_flags(np.where(astral, 0, codes))
+    for code in np.unique(codes[astral]).tolist():
+        flags[codes == code] = _flags_of(chr(code))
+    return flags
+
+
+def _basic_flags(codes: np.ndarray) -> np.ndarray:
+    flags = _FLAG_TABLE.take(codes)
+    unknown = flags == _UNKNOWN
+    if unknown.any():
+        for code in np.unique(codes[unknown]).tolist():
+            _FLAG_TABLE[code] = _flags_of(chr(code))
+        flags = _FLAG_TABLE.take(codes)
+    return flags
+
+
+def _read_blocks(f: TextIO) -> Iterator[str]:
+    while True:
+        block = f.read(READ_BLOCK_CHARS)
+        if not block:
+            return
+        yield block
@@ -0,0 +1,300 @@
+import os
+import math
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Estimación cuando no hay tokenizador: caracteres por token en texto en español
+CHARS_PER_TOKEN = 3.5
+
+# Un chunk que no cabe entero solo se recorta si quedan al menos estos tokens
+MIN_TRUNCATED_TOKENS = 64
+
+SEPARATOR = "\n\n"
+
+
+class TokenCounter:
+    """Cuenta y recorta tokens con el tokenizador del modelo (cargado la primera vez)
+
+    Si no hay tokenizador configurado o no se puede cargar (sin red, sin transformers),
+    se estima a razón de CHARS_PER_TOKEN caracteres por token.
+    """
+
+    def __init__(self, tokenizer_name: Optional[str] = None):
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+        self._loaded = tokenizer_name is None
+        self._lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        from transformers import AutoTokenizer
+                        self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                        logger.info(f"Tokenizador cargado: {self.tokenizer_name}")
+                    except Exception as e:
+                        logger.warning(f"No se pudo cargar el tokenizador {self.tokenizer_name}, se estimarán los tokens: {e}")
+                    self._loaded = True
+        return self._tokenizer
+
+    @property
+    def exact(self) -> bool:
+        """True si se cuenta con el tokenizador del modelo y no con la estimación"""
+        return self._get_tokenizer() is not None
+
+    def count(self, text: str) -> int:
+        """Número de tokens de un texto"""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Los primeros max_tokens tokens de un texto, cortando en el último espacio"""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            text = text[:int(max_tokens * CHARS_PER_TOKEN)]
+        else:
+            ids = tokenizer.encode(text, add_special_tokens=False)
+            if len(ids) <= max_tokens:
+                return text
+            text = tokenizer.decode(ids[:max_tokens])
+        cut = text.rfind(" ")
+        return text[:cut] if cut > len(text) // 2 else text
+
+
+def merge_overlaps(docs: List[Dict[str, Any]], max_overlap: int = 400) -> List[Dict[str, Any]]:
+    """Unir chunks contiguos del mismo documento quitando el texto solapado
+
+    Los chunks se solapan (200 caracteres por defecto), así que dos chunks consecutivos
+    recuperados a la vez repetirían ese texto en el prompt. Los pasajes resultantes
+    conservan el orden de recuperación (la posición del mejor de sus chunks).
+    """
+    passages: List[Dict[str, Any]] = []
+    by_document: Dict[str, List[Dict[str, Any]]] = {}
+    for rank, doc in enumerate(docs):
+        passage = {"text": doc["text"], "ids": [doc.get("id")], "rank": rank, "document_id": doc.get("document_id"),
+                   "offset": doc.get("chunk_offset"), "end": None}
+        if passage["offset"] is not None:
+            passage["end"] = passage["offset"] + len(doc["text"])
+        document_id = doc.get("document_id")
+        if document_id is None or passage["offset"] is None:
+            passages.append(passage)
+        else:
+            by_document.setdefault(document_id, []).append(passage)
+
+    for chunks in by_document.values():
+        chunks.sort(key=lambda chunk: chunk["offset"])
+        current = chunks[0]
+        for chunk in chunks[1:]:
+            # Contiguos: el chunk empieza antes de que termine el anterior (o justo después)
+            if chunk["offset"] <= current["end"] + 1:
+                overlap = _overlap(current["text"], chunk["text"], max_overlap)
+                separator = "" if overlap else " "
+                current["text"] = current["text"] + separator + chunk["text"][overlap:]
+                current["ids"] += chunk["ids"]
+                current["rank"] = min(current["rank"], chunk["rank"])
+                current["end"] = max(current["end"], chunk["end"])
+            else:
+                passages.append(current)
+                current = chunk
+        passages.append(current)
+
+    passages.sort(key=lambda passage: passage["rank"])
+    return passages
+
+
+def _passage_key(passage: Dict[str, Any]) -> tuple:
+    """Clave de orden de un pasaje que no depende de la consulta: documento y posición, o su primer ID de chunk"""
+    if passage["document_id"] is not None and passage["offset"] is not None:
+        return (0, str(passage["document_id"]), passage["offset"])
+    ids = [i for i in passage["ids"] if i is not None]
+    return (1, "", min(ids)) if ids else (2, "", passage["rank"])
+
+
+def _overlap(left: str, right: str, max_overlap: int) -> int:
+    """Longitud del sufijo más largo de `left` que es prefijo de `right`"""
+    limit = min(len(left), len(right), max_overlap)
+    if not limit:
+        return 0
+    tail = left[-limit:]
+    # Solo pueden coincidir las posiciones donde empieza el primer carácter de `right`
+    position = tail.find(right[0])
+    while position != -1:
+        if right.startswith(tail[position:]):
+            return limit - position
+        position = tail.find(right[0], position + 1)
+    return 0
+
+
+def mmr_order(query_embedding: np.ndarray, embeddings: np.ndarray, mmr_lambda: float = 0.7,
+              duplicate_threshold: float = 0.95) -> List[int]:
+    """Orden de Maximal Marginal Relevance, sin los casi duplicados de uno ya elegido
+
+    En cada paso se elige el pasaje que maximiza
+    λ·sim(consulta, pasaje) - (1-λ)·max sim(pasaje, elegidos). Los pasajes con similitud
+    >= duplicate_threshold con alguno ya elegido se descartan.
+    """
+    relevance = embeddings @ query_embedding
+    similarity = embeddings @ embeddings.T
+    remaining = list(range(len(embeddings)))
+    selected: List[int] = []
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = remaining[int(np.argmax(scores))]
+        remaining.remove(best)
+        if selected and similarity[best, selected].max() >= duplicate_threshold:
+            continue
+        selected.append(best)
+    return selected
+
+
+class ContextBuilder:
+    """Prepara el contexto del prompt a partir de los chunks recuperados
+
+    1. Une los chunks contiguos del mismo documento sin repetir el solape.
+    2. Reordena con MMR y descarta los casi duplicados (similitud de embeddings).
+    3. Mete los pasajes en `token_budget` tokens (contados con el tokenizador indicado o
+       estimados), recortando el último si queda sitio suficiente.
+    4. Con `stable_order`, escribe los pasajes elegidos en un orden que no depende de la
+       pregunta (documento y posición): varias preguntas sobre los mismos chunks dan el
+       mismo contexto y Ollama reutiliza su cache KV hasta la pregunta.
+
+    Para MMR se usan el embedding de la consulta que ya se calculó para buscar y los
+    embeddings guardados de los chunks (`get_embeddings`, por ID): el de un pasaje unido es
+    la media de los de sus chunks. `encode` solo se llama para lo que falte (una consulta
+    sin embedding o chunks sin ID), y nada de esto si quedan menos de dos pasajes o la
+    deduplicación está desactivada.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], token_budget: int = 1400,
+                 mmr_lambda: float = 0.7, duplicate_threshold: float = 0.95,
+                 tokenizer_name: Optional[str] = None, stable_order: bool = True,
+                 get_embeddings: Optional[Callable[[List[int]], Dict[int, np.ndarray]]] = None):
+        self.encode = encode
+        self.get_embeddings = get_embeddings
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.stable_order = stable_order
+        self.tokens = TokenCounter(tokenizer_name)
+
+        self.prompts = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, encode: Callable[[List[str]], np.ndarray],
+                 get_embeddings: Optional[Callable[[List[int]], Dict[int, np.ndarray]]] = None
+                 ) -> Optional["ContextBuilder"]:
+        """Crear el constructor de contexto salvo con CONTEXT_BUDGET_ENABLED=false
+
+        Los tokens se estiman salvo que CONTEXT_TOKENIZER indique un tokenizador de
+        Hugging Face (cargarlo puede suponer descargarlo al arrancar).
+        """
+        if os.getenv('CONTEXT_BUDGET_ENABLED', 'true').lower() != 'true':
+            return None
+        return cls(
+            encode,
+            token_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', '1400')),
+            mmr_lambda=float(os.getenv('CONTEXT_MMR_LAMBDA', '0.7')),
+            duplicate_threshold=float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', '0.95')),
+            tokenizer_name=os.getenv('CONTEXT_TOKENIZER') or None,
+            stable_order=os.getenv('CONTEXT_STABLE_ORDER', 'true').lower() == 'true',
+            get_embeddings=get_embeddings,
+        )
+
+    def _passage_embeddings(self, passages: List[Dict[str, Any]]) -> np.ndarray:
+        """Embeddings de los pasajes: los guardados de sus chunks y, si falta alguno, codificando el texto"""
+        stored: Dict[int, np.ndarray] = {}
+        if self.get_embeddings is not None:
+            ids = [chunk_id for passage in passages for chunk_id in passage["ids"] if chunk_id is not None]
+            if ids:
+                stored = self.get_embeddings(ids)
+        vectors: List[Optional[np.ndarray]] = []
+        missing: List[int] = []
+        for i, passage in enumerate(passages):
+            chunk_vectors = [stored[chunk_id] for chunk_id in passage["ids"] if chunk_id in stored]
+            if len(chunk_vectors) == len(passage["ids"]):
+                vectors.append(np.mean(chunk_vectors, axis=0))
+            else:
+                vectors.append(None)
+                missing.append(i)
+        if missing:
+            encoded = self.encode([passages[i]["text"] for i in missing])
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _diversify(self, query: str, passages: List[Dict[str, Any]],
+                   query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        if len(passages) < 2 or (self.mmr_lambda >= 1 and self.duplicate_threshold >= 1):
+            return passages
+        embeddings = self._passage_embeddings(passages)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        if query_embedding is None:
+            query_embedding = self.encode([query])[0]
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+        query_embedding = query_embedding / max(float(np.linalg.norm(query_embedding)), 1e-12)
+        order = mmr_order(query_embedding, embeddings, self.mmr_lambda, self.duplicate_threshold)
+        return [passages[i] for i in order]
+
+    def build(self, query: str, context_docs: List[Dict[str, Any]],
+              query_embedding: Optional[np.ndarray] = None) -> str:
+        """Texto del contexto para el prompt (`query_embedding`, si se tiene, evita codificar la consulta)"""
+        # Cada chunk se cuenta una vez: sirve para el total sin preparar y para los pasajes de un solo chunk
+        doc_tokens = [self.tokens.count(doc["text"]) for doc in context_docs]
+        separator_tokens = self.tokens.count(SEPARATOR)
+        passages = self._diversify(query, merge_overlaps(context_docs), query_embedding)
+
+        parts: List[str] = []
+        chosen: List[Dict[str, Any]] = []
+        used = 0
+        for passage in passages:
+            # Un pasaje de un solo chunk conserva su posición de recuperación en "rank"
+            tokens = doc_tokens[passage["rank"]] if len(passage["ids"]) == 1 else self.tokens.count(passage["text"])
+            cost = tokens + (separator_tokens if parts else 0)
+            if self.token_budget <= 0 or used + cost <= self.token_budget:
+                parts.append(passage["text"])
+                chosen.append(passage)
+                used += cost
+                continue
+            remaining = self.token_budget - used - (separator_tokens if parts else 0)
+            if remaining >= MIN_TRUNCATED_TOKENS:
+                truncated = self.tokens.truncate(passage["text"], remaining)
+                used += self.tokens.count(truncated) + (separator_tokens if parts else 0)
+                parts.append(truncated)
+                chosen.append(passage)
+            break
+
+        if self.stable_order:
+            parts = [part for _, part in sorted(zip(chosen, parts), key=lambda item: _passage_key(item[0]))]
+        # Tokens que habría tenido el contexto sin preparar (todos los chunks unidos), sin volver a tokenizarlo
+        original = sum(doc_tokens) + separator_tokens * max(len(doc_tokens) - 1, 0)
+        with self._lock:
+            self.prompts += 1
+            self.tokens_in += original
+            self.tokens_out += used
+        return SEPARATOR.join(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tokens de contexto antes y después de prepararlo"""
+        return {
+            "prompts": self.prompts,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "tokens_saved": self.tokens_in - self.tokens_out,
+            "tokenizer": self.tokens.tokenizer_name if self.tokens.exact else "estimado",
+        }
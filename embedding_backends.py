@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import inspect
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Backends disponibles para EMBEDDING_BACKEND
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Versión de opset con la que se exporta el modelo a ONNX
+ONNX_OPSET = 14
+
+
+class EmbeddingBackend(ABC):
+    """Modelo de embeddings cargado la primera vez que se usa
+
+    Construir un backend no importa torch ni lee el modelo: eso ocurre en el primer
+    encode() (o al pedir el tokenizador), una sola vez aunque lo pidan varios hilos.
+    Hasta entonces `dim` y `max_seq_length` son los valores por defecto de
+    all-MiniLM-L6-v2; al cargar se toman del modelo.
+    """
+
+    name = ""
+
+    def __init__(self, model_name: str, dim: int = 384, max_seq_length: int = 256, threads: int = 0):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+        # Hilos de inferencia (0 = los que decida el runtime)
+        self.threads = threads
+        self.load_seconds: Optional[float] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def cache_key(self) -> str:
+        """Nombre con el que se guardan sus vectores en la cache de embeddings"""
+        return self.model_name
+
+    def load(self):
+        """Cargar el modelo si aún no está cargado"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            start = time.perf_counter()
+            self._load()
+            self.load_seconds = time.perf_counter() - start
+            self._loaded = True
+            logger.info(f"Modelo de embeddings {self.model_name} cargado con {self.name} en {self.load_seconds:.1f} s")
+
+    @abstractmethod
+    def _load(self):
+        """Importar el runtime y cargar el modelo y el tokenizador"""
+
+    @abstractmethod
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Embeddings float32 de `texts` (el modelo ya está cargado)"""
+
+    @property
+    @abstractmethod
+    def tokenizer(self):
+        """Tokenizador de Hugging Face del modelo (carga el modelo si hace falta)"""
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Embeddings de `texts` como matriz float32 (misma interfaz que SentenceTransformer)"""
+        self.load()
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self._encode(texts, batch_size)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "loaded": self._loaded,
+            "load_seconds": self.load_seconds,
+        }
+
+
+class TorchBackend(EmbeddingBackend):
+    """sentence-transformers sobre PyTorch (la referencia de los demás backends)"""
+
+    name = "torch"
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(self.model_name)
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.max_seq_length = self.model.max_seq_length
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        embeddings = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    @property
+    def tokenizer(self):
+        self.load()
+        return self.model.tokenizer
+
+
+class OnnxBackend(EmbeddingBackend):
+    """El mismo modelo exportado a ONNX y ejecutado con ONNX Runtime (opcionalmente en int8)
+
+    La primera vez se exporta el transformer a `cache_dir` (hace falta torch solo en ese
+    momento) y, con quantize=True, se cuantizan los pesos a int8 (cuantización dinámica).
+    Las siguientes cargas solo leen el fichero .onnx y el tokenizer.json con la librería
+    tokenizers: ni torch ni transformers se importan. El pooling y la normalización se
+    leen de la configuración de sentence-transformers del modelo, así que los vectores
+    coinciden con los de TorchBackend (salvo el error de la cuantización en int8).
+    """
+
+    def __init__(self, model_name: str, dim: int = 384, max_seq_length: int = 256, threads: int = 0,
+                 quantize: bool = False, cache_dir: str = None):
+        super().__init__(model_name, dim, max_seq_length, threads)
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.cache_dir = cache_dir or os.getenv('EMBEDDING_ONNX_DIR', 'data/onnx')
+        self._path: Optional[str] = None
+        self._hf_tokenizer = None
+
+    @property
+    def cache_key(self) -> str:
+        # Los vectores en int8 difieren un poco de los de torch: no comparten cache
+        return f"{self.model_name}@{self.name}" if self.quantize else self.model_name
+
+    def _model_path(self) -> str:
+        """Directorio local del modelo (descargándolo del Hub si no es una ruta)"""
+        if os.path.isdir(self.model_name):
+            return self.model_name
+        from huggingface_hub import snapshot_download
+        repo_id = self.model_name if "/" in self.model_name else f"sentence-transformers/{self.model_name}"
+        return snapshot_download(repo_id)
+
+    def _read_pipeline(self, path: str):
+        """Pooling, normalización y longitud máxima según la configuración de sentence-transformers"""
+        self.pooling, self.normalize = "mean", False
+        modules_path = os.path.join(path, "modules.json")
+        if os.path.exists(modules_path):
+            with open(modules_path, encoding="utf-8") as f:
+                modules = json.load(f)
+            for module in modules:
+                if module["type"].endswith("Pooling"):
+                    with open(os.path.join(path, module["path"], "config.json"), encoding="utf-8") as f:
+                        pooling = json.load(f)
+                    if pooling.get("pooling_mode_cls_token"):
+                        self.pooling = "cls"
+                    elif not pooling.get("pooling_mode_mean_tokens", True):
+                        raise ValueError(f"Pooling no soportado por el backend ONNX: {pooling}")
+                elif module["type"].endswith("Normalize"):
+                    self.normalize = True
+        config_path = os.path.join(path, "sentence_bert_config.json")
+        if os.path.exists(config_path):
+            with open(config_path, encoding="utf-8") as f:
+                self.max_seq_length = json.load(f).get("max_seq_length", self.max_seq_length)
+        with open(os.path.join(path, "config.json"), encoding="utf-8") as f:
+            self.dim = json.load(f).get("hidden_size", self.dim)
+
+    def _load_tokenizer(self, path: str, directory: str):
+        """Tokenizador rápido (librería tokenizers) con truncado a max_seq_length y padding"""
+        from tokenizers import Tokenizer
+        tokenizer_path = os.path.join(path, "tokenizer.json")
+        if not os.path.exists(tokenizer_path):
+            # Modelo sin tokenizer.json: se genera una vez desde el tokenizador de transformers
+            tokenizer_path = os.path.join(directory, "tokenizer.json")
+            if not os.path.exists(tokenizer_path):
+                from transformers import AutoTokenizer
+                AutoTokenizer.from_pretrained(path).backend_tokenizer.save(tokenizer_path)
+        self._tokenizer = Tokenizer.from_file(tokenizer_path)
+        self._tokenizer.enable_truncation(max_length=self.max_seq_length)
+        pad_token = (self._tokenizer.padding or {}).get("pad_token", "[PAD]")
+        self._tokenizer.enable_padding(pad_id=self._tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+    def _tokenize(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        encodings = self._tokenizer.encode_batch(texts)
+        return {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+
+    def _export(self, path: str, target: str):
+        """Exportar el transformer de `path` a ONNX con batch y longitud dinámicos"""
+        import torch
+        from transformers import AutoModel
+        logger.info(f"Exportando {self.model_name} a ONNX en {target}")
+        model = AutoModel.from_pretrained(path)
+        model.eval()
+        accepted = inspect.signature(model.forward).parameters
+        sample = {name: torch.from_numpy(values) for name, values in self._tokenize(["exportar a onnx"]).items()
+                  if name in accepted}
+        inputs = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        axes = {name: {0: "batch", 1: "sequence"} for name in inputs + ["last_hidden_state"]}
+        # Las versiones recientes de torch exportan con dynamo por defecto (requiere onnxscript)
+        options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        tmp_path = target + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(sample[name] for name in inputs), tmp_path, input_names=inputs,
+                              output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=ONNX_OPSET,
+                              **options)
+        os.replace(tmp_path, target)
+
+    def _load(self):
+        import onnxruntime
+
+        path = self._path = self._model_path()
+        self._read_pipeline(path)
+        directory = os.path.join(self.cache_dir, self.model_name.strip("/").replace("/", "__"))
+        os.makedirs(directory, exist_ok=True)
+        self._load_tokenizer(path, directory)
+        onnx_path = os.path.join(directory, "model.onnx")
+        if not os.path.exists(onnx_path):
+            self._export(path, onnx_path)
+        if self.quantize:
+            quantized_path = os.path.join(directory, "model.int8.onnx")
+            if not os.path.exists(quantized_path):
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                logger.info(f"Cuantizando {self.model_name} a int8 en {quantized_path}")
+                quantize_dynamic(onnx_path, quantized_path + ".tmp", weight_type=QuantType.QInt8)
+                os.replace(quantized_path + ".tmp", quantized_path)
+            onnx_path = quantized_path
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self._inputs = [inp.name for inp in self.session.get_inputs()]
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        # Como sentence-transformers: lotes de textos de longitud parecida (menos padding)
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            encoded = self._tokenize([texts[i] for i in rows])
+            feeds = {name: encoded[name] for name in self._inputs}
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            embeddings[rows] = pooled
+        return embeddings
+
+    @property
+    def tokenizer(self):
+        """Tokenizador de transformers (solo para dividir en tokens; importa transformers)"""
+        self.load()
+        if self._hf_tokenizer is None:
+            from transformers import AutoTokenizer
+            self._hf_tokenizer = AutoTokenizer.from_pretrained(self._path)
+        return self._hf_tokenizer
+
+
+def create_embedding_backend(model_name: str, backend: str = None) -> EmbeddingBackend:
+    """Crear (sin cargar) el backend de EMBEDDING_BACKEND (torch por defecto)"""
+    backend = (backend or os.getenv('EMBEDDING_BACKEND', 'torch')).lower()
+    threads = int(os.getenv('EMBEDDING_THREADS', '0'))
+    if backend == "torch":
+        return TorchBackend(model_name, threads=threads)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, threads=threads, quantize=backend == "onnx-int8")
+    raise ValueError(f"Backend de embeddings no soportado: {backend} (opciones: {', '.join(EMBEDDING_BACKENDS)})")
@@ -0,0 +1,207 @@
+import os
+import json
+import atexit
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalizar el texto antes de calcular su hash (espacios colapsados)"""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Cache persistente de embeddings indexada por modelo + hash del texto normalizado
+
+    Los vectores se guardan en una matriz float32 mapeada en memoria
+    (`embeddings.f32`) con capacidad fija, calculada a partir de `max_bytes`. El
+    fichero `index.json` guarda qué hash ocupa cada fila, en orden LRU: cuando la
+    matriz se llena se reutiliza la fila de la entrada usada hace más tiempo.
+    `keys.bin` guarda junto a cada fila el hash que contiene, de modo que un índice
+    desactualizado (p. ej. tras una caída antes de save()) nunca devuelve un vector ajeno.
+    """
+
+    def __init__(self, path: str, model_name: str, dim: int, max_bytes: int = 256 * 2**20,
+                 save_every: int = 1000):
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        self.capacity = max(1, max_bytes // (dim * 4))
+        self.save_every = save_every
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._dirty = 0
+        # Los aciertos solo cambian el orden LRU: se guarda en el siguiente save(), sin
+        # contar para save_every (reescribir el índice cada pocas lecturas sería caro)
+        self._order_changed = False
+
+        os.makedirs(path, exist_ok=True)
+        self._matrix_path = os.path.join(path, "embeddings.f32")
+        self._index_path = os.path.join(path, "index.json")
+        self._keys_path = os.path.join(path, "keys.bin")
+        self._open()
+        atexit.register(self.save)
+
+    @classmethod
+    def from_env(cls, model_name: str, dim: int) -> Optional["EmbeddingCache"]:
+        """Crear la cache si EMBEDDING_CACHE_DIR está definido"""
+        path = os.getenv('EMBEDDING_CACHE_DIR')
+        if not path:
+            return None
+        max_mb = int(os.getenv('EMBEDDING_CACHE_MAX_MB', '256'))
+        return cls(path, model_name, dim, max_bytes=max_mb * 2**20)
+
+    def _open(self):
+        """Abrir (o crear) la matriz y cargar el índice si es compatible"""
+        expected_size = self.capacity * self.dim * 4
+        index = None
+        if os.path.exists(self._index_path) and os.path.exists(self._matrix_path):
+            try:
+                with open(self._index_path, encoding="utf-8") as f:
+                    index = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Índice de la cache de embeddings ilegible, se reinicia: {e}")
+
+        compatible = (
+            index is not None
+            and index.get("model") == self.model_name
+            and index.get("dim") == self.dim
+            and index.get("capacity") == self.capacity
+            and os.path.getsize(self._matrix_path) == expected_size
+            and os.path.exists(self._keys_path)
+            and os.path.getsize(self._keys_path) == self.capacity * 32
+        )
+
+        mode = "r+" if compatible else "w+"
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+        self._row_keys = np.memmap(self._keys_path, dtype="S32", mode=mode, shape=(self.capacity,))
+
+        if compatible:
+            self._index = OrderedDict((key, slot) for key, slot in index["entries"])
+            logger.info(f"Cache de embeddings abierta con {len(self._index)} entradas")
+        else:
+            self._index = OrderedDict()
+            logger.info(f"Cache de embeddings creada en {self.path} ({self.capacity} entradas)")
+
+        used = set(self._index.values())
+        self._free = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used]
+
+    def key(self, text: str) -> str:
+        """Clave de un texto: hash del nombre del modelo y el texto normalizado"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_text(text).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """Buscar varios textos; devuelve la matriz (filas a cero si faltan) y los índices que faltan"""
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = self.key(text)
+                slot = self._index.get(key)
+                if slot is None or self._row_keys[slot] != key.encode("ascii"):
+                    missing.append(i)
+                    continue
+                self._index.move_to_end(key)
+                result[i] = self._matrix[slot]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            if len(missing) < len(texts):
+                self._order_changed = True
+        return result, missing
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """Guardar varios embeddings, expulsando las entradas menos usadas si no hay sitio"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                key = self.key(text)
+                slot = self._index.get(key)
+                if slot is None:
+                    if self._free:
+                        slot = self._free.pop()
+                    else:
+                        _, slot = self._index.popitem(last=False)
+                        self.evictions += 1
+                self._matrix[slot] = embedding
+                self._row_keys[slot] = key.encode("ascii")
+                self._index[key] = slot
+                self._index.move_to_end(key)
+                self._dirty += 1
+            should_save = self._dirty >= self.save_every
+
+        if should_save:
+            self.save()
+
+    def encode(self, encoder, texts: List[str]) -> np.ndarray:
+        """Generar embeddings pasando por el modelo solo los textos que no están en cache"""
+        embeddings, missing = self.get_many(texts)
+        if missing:
+            # Los textos repetidos dentro del lote se codifican una sola vez
+            unique: Dict[str, List[int]] = {}
+            for i in missing:
+                unique.setdefault(self.key(texts[i]), []).append(i)
+            first = [rows[0] for rows in unique.values()]
+
+            computed = np.asarray(encoder.encode([texts[i] for i in first]), dtype=np.float32)
+            for rows, embedding in zip(unique.values(), computed):
+                embeddings[rows] = embedding
+            self.put_many([texts[i] for i in first], computed)
+        return embeddings
+
+    def save(self):
+        """Persistir la matriz y el índice (escritura atómica del índice)"""
+        with self._lock:
+            if not self._dirty and not self._order_changed:
+                return
+            self._matrix.flush()
+            self._row_keys.flush()
+            index = {
+                "model": self.model_name,
+                "dim": self.dim,
+                "capacity": self.capacity,
+                "entries": list(self._index.items()),
+            }
+            tmp_path = self._index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self._index_path)
+            self._dirty = 0
+            self._order_changed = False
+
+    def clear(self):
+        """Vaciar la cache"""
+        with self._lock:
+            self._index.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+            self._dirty += 1
+        self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos y fallos"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._index),
+            "capacity": self.capacity,
+        }
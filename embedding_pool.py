@@ -0,0 +1,193 @@
+import os
+import sys
+import math
+import queue
+import atexit
+import logging
+import threading
+import multiprocessing
+from functools import partial
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from embedding_backends import create_embedding_backend
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Segundos entre comprobaciones de que los workers siguen vivos mientras se espera un lote
+POLL_SECONDS = 1.0
+
+
+def _worker(encoder_factory: Callable[[], Any], threads: int, shm_name: str, shape, tasks, results):
+    """Bucle de un worker: codifica lotes y escribe los vectores en su hueco de memoria compartida"""
+    # Antes de cargar el modelo: cada worker usa solo sus hilos, sin competir con los demás
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "EMBEDDING_THREADS"):
+        os.environ[name] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    encoder = encoder_factory()
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            slot, start, texts = task
+            try:
+                slots[slot, :len(texts)] = np.asarray(encoder.encode(texts), dtype=np.float32)
+                results.put((slot, start, len(texts), None))
+            except Exception as e:
+                results.put((slot, start, 0, f"{type(e).__name__}: {e}"))
+    finally:
+        del slots
+        shm.close()
+
+
+class EmbeddingPool:
+    """Pool de procesos que generan embeddings en paralelo (ingesta en CPU)
+
+    Cada worker carga su propio modelo y usa `threads` hilos de torch. encode() reparte
+    los textos en lotes de como mucho `batch_rows` entre los workers (una cola común,
+    así que el que termina antes coge el siguiente) y cada worker escribe sus vectores
+    en un hueco de un segmento de memoria compartida: solo los textos viajan
+    serializados, no los embeddings. El resultado conserva el orden de la entrada.
+
+    Los procesos se arrancan con "spawn" en la primera llamada y se paran con close()
+    (o al salir). `encoder_factory` es un callable serializable que devuelve un objeto
+    con encode(); por defecto, `model_name` con el backend de embeddings `backend`.
+    """
+
+    def __init__(self, model_name: str, dim: int, workers: int = None, threads: int = None,
+                 batch_rows: int = 64, encoder_factory: Callable[[], Any] = None, backend: str = None):
+        cpus = os.cpu_count() or 1
+        self.model_name = model_name
+        self.dim = dim
+        self.workers = workers or cpus
+        self.threads = threads or max(1, cpus // self.workers)
+        self.batch_rows = batch_rows
+        self.encoder_factory = encoder_factory or partial(create_embedding_backend, model_name, backend)
+        # Dos huecos por worker: uno se codifica mientras se copia el otro
+        self.num_slots = 2 * self.workers
+
+        self.batches = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+        self._processes: List[multiprocessing.Process] = []
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._slots: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_env(cls, model_name: str, dim: int, backend: str = None) -> Optional["EmbeddingPool"]:
+        """Crear el pool si EMBEDDING_WORKERS es mayor que 0 (o "auto": un worker por núcleo)"""
+        value = os.getenv('EMBEDDING_WORKERS', '0').lower()
+        workers = (os.cpu_count() or 1) if value == "auto" else int(value)
+        if workers <= 0:
+            return None
+        threads = os.getenv('EMBEDDING_WORKER_THREADS')
+        return cls(
+            model_name,
+            dim,
+            workers=workers,
+            threads=int(threads) if threads else None,
+            batch_rows=int(os.getenv('EMBEDDING_POOL_BATCH', '64')),
+            backend=backend,
+        )
+
+    def _start(self):
+        if self._processes:
+            return
+        context = multiprocessing.get_context("spawn")
+        shape = (self.num_slots, self.batch_rows, self.dim)
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+        self._slots = np.ndarray(shape, dtype=np.float32, buffer=self._shm.buf)
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._free = list(range(self.num_slots))
+        for i in range(self.workers):
+            process = context.Process(
+                target=_worker,
+                args=(self.encoder_factory, self.threads, self._shm.name, shape, self._tasks, self._results),
+                name=f"rag-embedding-{i}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        atexit.register(self.close)
+        logger.info(f"Pool de embeddings iniciado: {self.workers} workers x {self.threads} hilos ({self.model_name})")
+
+    def _collect(self, output: np.ndarray, errors: List[str]):
+        """Esperar el siguiente lote terminado y copiarlo a su posición en `output`"""
+        while True:
+            try:
+                slot, start, count, error = self._results.get(timeout=POLL_SECONDS)
+                break
+            except queue.Empty:
+                dead = [process.name for process in self._processes if not process.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Workers de embeddings terminados inesperadamente: {', '.join(dead)}")
+        if error is None:
+            output[start:start + count] = self._slots[slot, :count]
+        else:
+            errors.append(error)
+        self._free.append(slot)
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Embeddings de `texts` (float32, en el mismo orden) calculados por los workers"""
+        output = np.empty((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return output
+        with self._lock:
+            self._start()
+            # Lotes del mismo tamaño para todos los workers, sin pasar de batch_rows
+            size = max(1, min(self.batch_rows, math.ceil(len(texts) / self.workers)))
+            errors: List[str] = []
+            pending = 0
+            for start in range(0, len(texts), size):
+                if not self._free:
+                    self._collect(output, errors)
+                    pending -= 1
+                self._tasks.put((self._free.pop(), start, list(texts[start:start + size])))
+                pending += 1
+                self.batches += 1
+            for _ in range(pending):
+                self._collect(output, errors)
+            self.texts += len(texts)
+        if errors:
+            raise RuntimeError(f"Error generando embeddings en el pool: {errors[0]}")
+        return output
+
+    def close(self):
+        """Parar los workers y liberar la memoria compartida"""
+        if not self._processes:
+            return
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._slots = None
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        logger.info("Pool de embeddings detenido")
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuración del pool y textos codificados"""
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads,
+            "batch_rows": self.batch_rows,
+            "batches": self.batches,
+            "texts": self.texts,
+        }
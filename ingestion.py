@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Ingesta masiva en streaming para el sistema RAG
+
+Lee documentos de un iterador, un directorio o un fichero JSONL, los divide en
+chunks de forma perezosa, genera los embeddings en lotes de tamaño fijo y los
+inserta en Milvus mientras se codifica el lote siguiente. La cola entre ambas
+etapas está acotada, así que la memoria no crece con el tamaño del corpus.
+
+    python ingestion.py --dir data/
+    python ingestion.py --jsonl data/corpus.jsonl --field text
+    python ingestion.py --dir data/ --sync --source data
+
+Con --sync cada documento se identifica por su ruta (o por el campo id del JSONL):
+solo se codifican los chunks nuevos o modificados y se borran los de documentos
+que ya no existen.
+"""
+
+import json
+import queue
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from metrics import get_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Marca de fin de la cola productor/consumidor
+_DONE = object()
+
+
+def iter_directory(path: str, pattern: str = "**/*.txt", encoding: str = "utf-8",
+                   with_ids: bool = False, stream: bool = False) -> Iterator[Union[str, Path, Tuple[str, Any]]]:
+    """Leer uno a uno los ficheros de texto de un directorio
+
+    Con with_ids=True devuelve pares (ruta relativa, texto) para RAGSystem.sync_documents.
+    Con stream=True devuelve la ruta (Path) en lugar del texto: el chunker lee el fichero
+    por bloques sin cargarlo entero (solo en UTF-8).
+    """
+    root = Path(path)
+    for file in sorted(root.glob(pattern)):
+        if file.is_file():
+            text = file if stream else file.read_text(encoding=encoding)
+            yield (file.relative_to(root).as_posix(), text) if with_ids else text
+
+
+def iter_jsonl(path: str, field: str = "text", with_ids: bool = False,
+               id_field: str = "id") -> Iterator[Union[str, Tuple[str, str]]]:
+    """Leer documentos de un fichero JSONL (un objeto por línea con el texto en `field`)
+
+    Con with_ids=True devuelve pares (id, texto), tomando el id de `id_field`.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = record.get(field) if isinstance(record, dict) else record
+            if not text:
+                logger.warning(f"Línea {line_number} de {path} sin campo '{field}', se omite")
+                continue
+            if with_ids:
+                document_id = record.get(id_field) if isinstance(record, dict) else None
+                if document_id is None:
+                    logger.warning(f"Línea {line_number} de {path} sin campo '{id_field}', se omite")
+                    continue
+                yield str(document_id), text
+            else:
+                yield text
+
+
+class IngestionPipeline:
+    """Pipeline productor/consumidor: un hilo genera embeddings y el otro inserta en Milvus
+
+    `split_document` convierte cada documento en chunks (dicts con text, source,
+    document_id y chunk_offset). Si se pasa `keep`, los chunks para los que devuelve
+    False se descartan antes de calcular su embedding (p. ej. los que ya están en Milvus).
+    `on_insert` se llama con cada lote ya insertado (p. ej. para el índice BM25).
+    """
+
+    def __init__(self, milvus_client, split_document: Callable[[Any], List[Dict[str, Any]]],
+                 batch_size: int = 256, queue_size: int = 4, flush_every: Optional[int] = None,
+                 keep: Optional[Callable[[Dict[str, Any]], bool]] = None, final_flush: bool = True,
+                 on_insert: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        self.milvus_client = milvus_client
+        self.split_document = split_document
+        self.keep = keep
+        self.on_insert = on_insert
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # Cada cuántos chunks hacer flush (None = solo al final)
+        self.flush_every = flush_every
+        # Con final_flush=False el flush final queda a cargo del llamante (p. ej. tras borrar)
+        self.final_flush = final_flush
+
+    def _chunk_batches(self, documents: Iterable[Any], stats: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """Dividir los documentos en chunks y agruparlos en lotes de batch_size"""
+        batch: List[Dict[str, Any]] = []
+        for doc in documents:
+            stats["documents"] += 1
+            for chunk in self.split_document(doc):
+                if self.keep is not None and not self.keep(chunk):
+                    stats["skipped"] += 1
+                    continue
+                batch.append(chunk)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def run(self, documents: Iterable[Any]) -> Dict[str, Any]:
+        """Ingerir todos los documentos y devolver estadísticas (chunks, segundos, chunks/s)"""
+        stats: Dict[str, Any] = {"documents": 0, "chunks": 0, "skipped": 0, "batches": 0, "flushes": 0}
+        batches: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: List[Exception] = []
+        start = time.perf_counter()
+
+        def produce():
+            try:
+                for chunks in self._chunk_batches(documents, stats):
+                    if stop.is_set():
+                        return
+                    embeddings = self.milvus_client.encode_documents([chunk["text"] for chunk in chunks])
+                    batches.put((chunks, embeddings))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                batches.put(_DONE)
+
+        producer = threading.Thread(target=produce, name="rag-ingest-encoder", daemon=True)
+        producer.start()
+
+        metrics = get_metrics()
+        pending_flush = 0
+        try:
+            while True:
+                # Tiempo que el consumidor espera al encoder (si domina, el cuello de botella son los embeddings)
+                with metrics.span("ingest_wait"):
+                    item = batches.get()
+                if item is _DONE:
+                    break
+                chunks, embeddings = item
+                with metrics.span("insert"):
+                    self.milvus_client.insert_chunks(chunks, embeddings, flush=False)
+                if self.on_insert is not None:
+                    with metrics.span("sparse_index"):
+                        self.on_insert(chunks)
+
+                stats["chunks"] += len(chunks)
+                stats["batches"] += 1
+                pending_flush += len(chunks)
+                if self.flush_every and pending_flush >= self.flush_every:
+                    with metrics.span("flush"):
+                        self.milvus_client.flush()
+                    stats["flushes"] += 1
+                    pending_flush = 0
+
+                elapsed = time.perf_counter() - start
+                logger.info(f"Ingeridos {stats['chunks']} chunks ({stats['chunks'] / elapsed:.1f} chunks/s)")
+        except BaseException:
+            # Desbloquear al productor si estaba esperando hueco en la cola
+            stop.set()
+            while producer.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+        finally:
+            producer.join()
+
+        if errors:
+            raise errors[0]
+
+        if pending_flush and self.final_flush:
+            with metrics.span("flush"):
+                self.milvus_client.flush()
+            stats["flushes"] += 1
+
+        stats["seconds"] = time.perf_counter() - start
+        stats["chunks_per_second"] = stats["chunks"] / stats["seconds"] if stats["seconds"] else 0.0
+        logger.info(
+            f"Ingesta completada: {stats['documents']} documentos, {stats['chunks']} chunks "
+            f"en {stats['seconds']:.1f} s ({stats['chunks_per_second']:.1f} chunks/s)"
+        )
+        return stats
+
+
+def main():
+    """Ingerir un directorio o un fichero JSONL desde la línea de comandos"""
+    import os
+    import argparse
+    from rag_system import RAGSystem
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Ingesta masiva en streaming")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directorio con ficheros de texto")
+    source.add_argument("--jsonl", help="Fichero JSONL con un documento por línea")
+    parser.add_argument("--pattern", default="**/*.txt", help="Patrón de ficheros para --dir")
+    parser.add_argument("--field", default="text", help="Campo con el texto para --jsonl")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks por lote de embeddings")
+    parser.add_argument("--flush-every", type=int, default=None, help="Hacer flush cada N chunks")
+    parser.add_argument("--source", default=None, help="Origen guardado en los chunks (por defecto, --dir o --jsonl)")
+    parser.add_argument("--sync", action="store_true",
+                        help="Sincronizar: insertar solo lo nuevo o modificado y borrar lo que ya no existe")
+    parser.add_argument("--id-field", default="id", help="Campo con el ID del documento para --jsonl --sync")
+    args = parser.parse_args()
+
+    source = args.source if args.source is not None else (args.dir or args.jsonl)
+    if args.dir:
+        documents = iter_directory(args.dir, args.pattern, with_ids=args.sync, stream=True)
+    else:
+        documents = iter_jsonl(args.jsonl, args.field, with_ids=args.sync, id_field=args.id_field)
+
+    # Solo ingesta: no hace falta cargar el modelo en Ollama
+    os.environ.setdefault('OLLAMA_PREWARM', 'false')
+    rag = RAGSystem()
+    if args.sync:
+        stats = rag.sync_documents(documents, source=source, batch_size=args.batch_size,
+                                   flush_every=args.flush_every)
+        print(f"✅ Sincronizado: {stats['chunks']} chunks nuevos, {stats['unchanged']} sin cambios, "
+              f"{stats['deleted']} borrados")
+        return
+
+    stats = rag.add_documents_stream(documents, batch_size=args.batch_size, flush_every=args.flush_every,
+                                     source=source)
+    print(f"✅ {stats['chunks']} chunks ingeridos a {stats['chunks_per_second']:.1f} chunks/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,820 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sequence, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from embedding_backends import EmbeddingBackend
+from vector_store import (
+    VectorStore, CHUNK_FIELDS, SEARCH_FIELDS, METRIC_TYPES, DEFAULT_NAMESPACE, auto_index_params, auto_search_params,
+    check_output_fields, chunk_id, filter_key, matches_filters, normalize_filters, normalize_tags, to_timestamp
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Cargar variables de entorno
+load_dotenv()
+
+# Índices soportados por el almacén local
+LOCAL_INDEX_TYPES = ("FLAT", "IVF")
+
+# Columnas alineadas por fila (además de la matriz de embeddings)
+COLUMNS = {
+    "ids": np.int64,          # ID estable del chunk
+    "norms": np.float32,      # ||x||² de cada embedding (para la distancia L2)
+    "alive": np.uint8,        # 0 si la fila se ha borrado o sustituido
+    "lists": np.int32,        # lista IVF de la fila (-1 sin entrenar)
+    "record_pos": np.int64,   # posición del registro en records.jsonl
+    "record_len": np.int64,   # longitud del registro en bytes
+    "namespace": np.int32,    # espacio de nombres (posición en meta.json["namespaces"])
+    "source": np.int32,       # source (posición en meta.json["sources"])
+    "date": np.int64,         # fecha en segundos Unix (0 = sin fecha)
+}
+
+# Valor de los campos que no tienen los registros escritos antes de existir
+FIELD_DEFAULTS = {"date": 0, "tags": []}
+
+# Filas por bloque en la búsqueda exacta (acota la memoria de la matriz de distancias)
+SEARCH_BLOCK_ROWS = 65536
+
+# Si un filtro deja más de esta fracción de las filas se recorren bloques contiguos y se
+# descartan las demás: copiar las seleccionadas cuesta más que puntuarlas todas
+DENSE_FILTER_FRACTION = 0.25
+
+# Filas mínimas por lista para entrenar el IVF
+MIN_ROWS_PER_LIST = 39
+
+
+class LocalVectorStore(VectorStore):
+    """Almacén de vectores en proceso, sin servidor: matriz float32 mapeada en memoria
+
+    Cada colección es un directorio con la matriz de embeddings (`embeddings.f32`), una
+    columna por cada campo de COLUMNS, el texto y los metadatos de cada fila en
+    `records.jsonl` (una línea por fila) y `meta.json` con el número de filas
+    confirmadas. Abrirla solo mapea los ficheros, así que tarda milisegundos.
+
+    La búsqueda es exacta y vectorizada por bloques. Con index_type="IVF" las filas se
+    reparten en nlist listas (k-means) y cada consulta solo recorre las nprobe más
+    cercanas. Borrar o sustituir una fila la marca como muerta; `compact()` recupera el
+    espacio (después de los recorridos de iter_chunks/iter_embeddings en curso, que leen
+    las filas del momento en que empezaron). Como en Milvus, lo insertado después del
+    último flush() se pierde si el proceso termina sin hacerlo. Una búsqueda limitada a unos espacios de nombres o con
+    un filtro de metadatos solo recorre las filas que los cumplen (source y date son
+    columnas; las etiquetas, un índice invertido en memoria que se construye al filtrar
+    por ellas la primera vez).
+    """
+
+    def __init__(self, path: str = None, encoder: EmbeddingBackend = None,
+                 index_type: str = None, metric_type: str = None):
+        super().__init__(encoder, (metric_type or os.getenv('LOCAL_STORE_METRIC', 'L2')).upper())
+        self.path = path or os.getenv('LOCAL_STORE_DIR', 'data/vector_store')
+        self.index_type = (index_type or os.getenv('LOCAL_STORE_INDEX', 'FLAT')).upper()
+        if self.index_type not in LOCAL_INDEX_TYPES:
+            raise ValueError(f"Tipo de índice no soportado: {self.index_type} (opciones: {', '.join(LOCAL_INDEX_TYPES)})")
+        if self.metric_type not in METRIC_TYPES:
+            raise ValueError(f"Métrica no soportada: {self.metric_type} (opciones: {', '.join(METRIC_TYPES)})")
+        nprobe = os.getenv('LOCAL_STORE_NPROBE')
+        self.nprobe = int(nprobe) if nprobe else None
+        self.filter_cache_size = int(os.getenv('LOCAL_STORE_FILTER_CACHE', '16'))
+
+        self.directory = None
+        self.count = 0
+        self.capacity = 0
+        self.nlist = 0
+        self._lock = threading.RLock()
+        self._embeddings: Optional[np.memmap] = None
+        self._columns: Dict[str, np.memmap] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._records = None
+        self._records_size = 0
+        # ID -> fila, construido solo cuando hace falta (upsert y borrado)
+        self._id_rows: Optional[Dict[int, int]] = None
+        # Filas ordenadas por lista IVF y límites de cada lista (se recalcula tras cambios)
+        self._ivf_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # Espacios de nombres y sources (el código de cada uno es su posición)
+        self._namespaces: List[str] = [DEFAULT_NAMESPACE]
+        self._sources: List[str] = [""]
+        # Etiqueta -> filas, construido la primera vez que se filtra por etiquetas
+        self._tag_rows: Optional[Dict[str, List[int]]] = None
+        # Filas (y máscara) de las últimas combinaciones de espacios de nombres y filtro consultadas
+        # (LRU de filter_cache_size entradas; se recalcula tras cambios, como _ivf_order)
+        self._selected_rows: "OrderedDict[Tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        # Recorridos (iter_chunks / iter_embeddings) en curso: mientras haya alguno la compactación,
+        # que mueve las filas de sitio, se aplaza hasta que termine el último
+        self._readers = 0
+        self._compact_pending = False
+
+    def connect(self):
+        """No hace nada: el almacén vive en el propio proceso"""
+        logger.info(f"Usando el almacén de vectores local en {self.path}")
+
+    def create_collection(self):
+        """Abrir la colección (o crearla vacía si no existe)"""
+        try:
+            with self._lock:
+                if self.directory is not None:
+                    return
+                self.directory = os.path.join(self.path, self.collection_name)
+                os.makedirs(self.directory, exist_ok=True)
+                self._open()
+        except Exception as e:
+            logger.error(f"Error al abrir la colección local: {e}")
+            raise
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _open(self):
+        """Mapear los ficheros de la colección a partir de meta.json"""
+        meta = {}
+        if os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != self.embedding_dim or meta["metric_type"] != self.metric_type:
+                raise ValueError(
+                    f"La colección local tiene dim={meta['dim']} y métrica {meta['metric_type']}; "
+                    f"se esperaba dim={self.embedding_dim} y {self.metric_type}. Ejecuta reset_database()"
+                )
+
+        self.count = meta.get("count", 0)
+        self.capacity = meta.get("capacity", 1024)
+        # Con index_type=FLAT se ignora un IVF entrenado antes
+        self.nlist = meta.get("nlist", 0) if self.index_type == "IVF" else 0
+        self._records_size = meta.get("records_size", 0)
+        self._namespaces = meta.get("namespaces", [DEFAULT_NAMESPACE])
+        self._sources = meta.get("sources", [""])
+        self._tag_rows = None
+        self._selected_rows.clear()
+
+        mode = "r+" if meta else "w+"
+        added = []
+        if meta:
+            # Columnas añadidas después de crear la colección: a cero (espacio de nombres por defecto, sin fecha)
+            for name, dtype in COLUMNS.items():
+                if not os.path.exists(self._file(f"{name}.bin")):
+                    with open(self._file(f"{name}.bin"), "wb") as f:
+                        f.truncate(self.capacity * np.dtype(dtype).itemsize)
+                    added.append(name)
+        self._embeddings = np.memmap(self._file("embeddings.f32"), dtype=np.float32, mode=mode,
+                                     shape=(self.capacity, self.embedding_dim))
+        self._columns = {
+            name: np.memmap(self._file(f"{name}.bin"), dtype=dtype, mode=mode, shape=(self.capacity,))
+            for name, dtype in COLUMNS.items()
+        }
+        self._centroids = None
+        if self.nlist:
+            self._centroids = np.fromfile(self._file("centroids.f32"), dtype=np.float32).reshape(self.nlist, -1)
+
+        # Descartar lo escrito después del último flush
+        self._records = open(self._file("records.jsonl"), "a+b")
+        self._records.truncate(self._records_size)
+        self._id_rows = None
+        self._ivf_order = None
+        if "source" in added:
+            self._backfill_sources()
+        logger.info(f"Colección local '{self.collection_name}' abierta con {self.count} filas")
+
+    def _backfill_sources(self):
+        """Rellenar la columna source de una colección creada antes de existir (desde records.jsonl)"""
+        with open(self._file("records.jsonl"), "rb") as records:
+            codes = [self._source_code(json.loads(line)["source"], create=True)
+                     for _, line in zip(range(self.count), records)]
+        self._columns["source"][:len(codes)] = codes
+        self.flush()
+        logger.info(f"Columna source rellenada para {len(codes)} filas")
+
+    def _close(self):
+        if self._records is not None:
+            self._records.close()
+        self._records = None
+        self._embeddings = None
+        self._columns = {}
+        self.directory = None
+
+    def _grow(self, needed: int):
+        """Ampliar los ficheros mapeados para que quepan `needed` filas"""
+        capacity = max(needed, 2 * self.capacity)
+        self._embeddings.flush()
+        with open(self._file("embeddings.f32"), "r+b") as f:
+            f.truncate(capacity * self.embedding_dim * 4)
+        self._embeddings = np.memmap(self._file("embeddings.f32"), dtype=np.float32, mode="r+",
+                                     shape=(capacity, self.embedding_dim))
+        for name, dtype in COLUMNS.items():
+            self._columns[name].flush()
+            with open(self._file(f"{name}.bin"), "r+b") as f:
+                f.truncate(capacity * np.dtype(dtype).itemsize)
+            self._columns[name] = np.memmap(self._file(f"{name}.bin"), dtype=dtype, mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def create_index(self):
+        """Entrenar el IVF si está configurado y hay filas suficientes (si no, búsqueda exacta)"""
+        if self.index_type != "IVF" or self.nlist:
+            return
+        alive = int(self._columns["alive"][:self.count].sum())
+        nlist = auto_index_params("IVF_FLAT", alive, self.embedding_dim)["nlist"]
+        if alive < nlist * MIN_ROWS_PER_LIST:
+            logger.info(f"Solo hay {alive} filas: búsqueda exacta hasta que rebuild_index() entrene el IVF")
+            return
+        self._train_ivf(nlist)
+
+    def rebuild_index(self):
+        """Reentrenar el IVF con las filas actuales (o volver a búsqueda exacta si son pocas)"""
+        with self._lock:
+            self.nlist = 0
+            self._centroids = None
+            self._columns["lists"][:self.count] = -1
+            self._ivf_order = None
+            self.create_index()
+            self.flush()
+
+    def _train_ivf(self, nlist: int, iterations: int = 10, points_per_list: int = 64):
+        """k-means sobre una muestra de filas y asignación de todas las filas a su lista"""
+        with self._lock:
+            rows = np.flatnonzero(self._columns["alive"][:self.count])
+            rng = np.random.default_rng(0)
+            sample_size = min(len(rows), nlist * points_per_list)
+            sample = np.sort(rng.choice(rows, size=sample_size, replace=False))
+            data = np.asarray(self._embeddings[sample])
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+
+            for _ in range(iterations):
+                assignment = self._nearest_centroids(data, centroids)
+                counts = np.bincount(assignment, minlength=nlist)
+                # Suma de cada lista con las filas ordenadas por lista (mucho más rápido que np.add.at)
+                order = np.argsort(assignment, kind="stable")
+                filled = np.flatnonzero(counts)
+                starts = (np.cumsum(counts) - counts)[filled]
+                empty = counts == 0
+                centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+                # Las listas vacías se reinician con puntos al azar
+                centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+                if self.metric_type != "L2":
+                    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+            self._centroids = centroids.astype(np.float32)
+            self._centroids.tofile(self._file("centroids.f32"))
+            self.nlist = nlist
+            for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+                block = np.asarray(self._embeddings[start:start + SEARCH_BLOCK_ROWS][:self.count - start])
+                self._columns["lists"][start:start + len(block)] = self._nearest_centroids(block, self._centroids)
+            self._ivf_order = None
+            logger.info(f"IVF local entrenado con {nlist} listas sobre {len(sample)} filas")
+
+    def _nearest_centroids(self, vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 16384) -> np.ndarray:
+        """Lista más cercana de cada vector (por bloques para acotar la memoria)"""
+        squared_norms = (centroids ** 2).sum(axis=1)
+        assignment = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_rows):
+            block = vectors[start:start + block_rows]
+            if self.metric_type == "L2":
+                scores = squared_norms[None, :] - 2 * block @ centroids.T
+            else:
+                scores = -(block @ centroids.T)
+            assignment[start:start + len(block)] = np.argmin(scores, axis=1)
+        return assignment
+
+    def load_collection(self, force: bool = False):
+        """Abrir la colección si aún no lo está (los datos se leen bajo demanda)"""
+        self.create_collection()
+
+    def insert_chunks(self, chunks: List[Dict[str, Any]], embeddings: Optional[np.ndarray] = None,
+                      flush: bool = False, upsert: bool = True):
+        """Insertar chunks con sus metadatos; con upsert=True sustituye los que tengan el mismo ID"""
+        try:
+            if embeddings is None:
+                embeddings = self.encode_documents([chunk["text"] for chunk in chunks])
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+
+            # Un mismo ID repetido dentro del lote se inserta una sola vez
+            positions: Dict[int, int] = {}
+            for i, chunk in enumerate(chunks):
+                namespace = chunk.get("namespace", DEFAULT_NAMESPACE)
+                id = chunk["id"] if "id" in chunk else chunk_id(chunk["document_id"], chunk["text"], namespace,
+                                                                chunk.get("chunk_offset", 0))
+                positions.setdefault(id, i)
+            ids = np.fromiter(positions.keys(), dtype=np.int64, count=len(positions))
+            rows = list(positions.values())
+            embeddings = embeddings[rows]
+
+            with self._lock:
+                namespaces = [self._namespace_code(chunks[i].get("namespace", DEFAULT_NAMESPACE), create=True)
+                              for i in rows]
+                sources = [self._source_code(chunks[i].get("source", ""), create=True) for i in rows]
+                dates = [to_timestamp(chunks[i].get("date")) for i in rows]
+                tags = [normalize_tags(chunks[i].get("tags")) for i in rows]
+                if upsert:
+                    self._kill(ids.tolist())
+                start, end = self.count, self.count + len(ids)
+                if end > self.capacity:
+                    self._grow(end)
+
+                records = []
+                for i, date, chunk_tags in zip(rows, dates, tags):
+                    chunk = chunks[i]
+                    records.append(json.dumps({
+                        "text": chunk["text"],
+                        "source": chunk.get("source", ""),
+                        "document_id": chunk.get("document_id", ""),
+                        "chunk_offset": chunk.get("chunk_offset", 0),
+                        "date": date,
+                        "tags": chunk_tags,
+                    }, ensure_ascii=False).encode("utf-8") + b"\n")
+                lengths = np.fromiter((len(record) for record in records), dtype=np.int64, count=len(records))
+                self._records.seek(self._records_size)
+                self._records.write(b"".join(records))
+                self._records.flush()
+
+                self._embeddings[start:end] = embeddings
+                self._columns["ids"][start:end] = ids
+                self._columns["norms"][start:end] = (embeddings ** 2).sum(axis=1)
+                self._columns["alive"][start:end] = 1
+                self._columns["lists"][start:end] = (
+                    self._nearest_centroids(embeddings, self._centroids) if self.nlist else -1
+                )
+                self._columns["record_pos"][start:end] = self._records_size + np.cumsum(lengths) - lengths
+                self._columns["record_len"][start:end] = lengths
+                self._columns["namespace"][start:end] = namespaces
+                self._columns["source"][start:end] = sources
+                self._columns["date"][start:end] = dates
+                self._records_size += int(lengths.sum())
+                self.count = end
+
+                if self._id_rows is not None:
+                    self._id_rows.update(zip(ids.tolist(), range(start, end)))
+                if self._tag_rows is not None:
+                    for row, chunk_tags in zip(range(start, end), tags):
+                        for tag in chunk_tags:
+                            self._tag_rows.setdefault(tag, []).append(row)
+                self._ivf_order = None
+                self._selected_rows.clear()
+
+            if flush:
+                self.flush()
+
+            logger.info(f"Insertados {len(chunks)} chunks exitosamente")
+
+        except Exception as e:
+            logger.error(f"Error al insertar documentos: {e}")
+            raise
+
+    def _namespace_code(self, namespace: str, create: bool = False) -> Optional[int]:
+        """Código de un espacio de nombres (None si no existe y no se pide crearlo)"""
+        try:
+            return self._namespaces.index(namespace)
+        except ValueError:
+            if not create:
+                return None
+            self._namespaces.append(namespace)
+            return len(self._namespaces) - 1
+
+    def _source_code(self, source: str, create: bool = False) -> Optional[int]:
+        """Código de un source (None si no existe y no se pide crearlo)"""
+        try:
+            return self._sources.index(source)
+        except ValueError:
+            if not create:
+                return None
+            self._sources.append(source)
+            return len(self._sources) - 1
+
+    def namespaces(self) -> List[str]:
+        """Espacios de nombres de la colección"""
+        return sorted(self._namespaces)
+
+    def _rows_with_tags(self, tags: List[str], count: int) -> np.ndarray:
+        """Filas con alguna de esas etiquetas (el índice invertido se construye la primera vez)"""
+        if self._tag_rows is None:
+            self._tag_rows = {}
+            with open(self._file("records.jsonl"), "rb") as records:
+                for row, line in zip(range(self.count), records):
+                    for tag in json.loads(line).get("tags", ()):
+                        self._tag_rows.setdefault(tag, []).append(row)
+        rows = [self._tag_rows.get(tag, []) for tag in tags]
+        return np.fromiter((row for tag_rows in rows for row in tag_rows if row < count), dtype=np.int64)
+
+    def _filter_rows(self, namespaces: Optional[Sequence[str]], filters: Optional[Dict[str, Any]],
+                     count: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Filas de esos espacios de nombres que cumplen el filtro y su máscara (None = todas, sin filtrar)
+
+        Se cachean las filter_cache_size últimas hasta el siguiente cambio.
+        """
+        codes = None
+        if namespaces is not None:
+            codes = tuple(sorted(code for code in map(self._namespace_code, namespaces) if code is not None))
+            if len(codes) == len(self._namespaces):
+                codes = None
+        if codes is None and filters is None:
+            return None
+        key = (codes, filter_key(filters))
+        selected = self._selected_rows.get(key)
+        if selected is not None:
+            self._selected_rows.move_to_end(key)
+        else:
+            mask = np.ones(count, dtype=bool)
+            if codes is not None:
+                mask &= np.isin(self._columns["namespace"][:count], codes)
+            filters = filters or {}
+            if "source" in filters:
+                sources = [code for code in map(self._source_code, filters["source"]) if code is not None]
+                mask &= np.isin(self._columns["source"][:count], sources)
+            if "date_from" in filters:
+                mask &= self._columns["date"][:count] >= filters["date_from"]
+            if "date_to" in filters:
+                mask &= self._columns["date"][:count] <= filters["date_to"]
+            if "tags" in filters:
+                tagged = np.zeros(count, dtype=bool)
+                tagged[self._rows_with_tags(filters["tags"], count)] = True
+                mask &= tagged
+            selected = (np.flatnonzero(mask), mask)
+            if self.filter_cache_size > 0:
+                self._selected_rows[key] = selected
+                while len(self._selected_rows) > self.filter_cache_size:
+                    self._selected_rows.popitem(last=False)
+        return selected
+
+    def _rows_by_id(self) -> Dict[int, int]:
+        """Índice ID -> fila de las filas vivas (se construye la primera vez que hace falta)"""
+        if self._id_rows is None:
+            rows = np.flatnonzero(self._columns["alive"][:self.count])
+            self._id_rows = dict(zip(self._columns["ids"][rows].tolist(), rows.tolist()))
+        return self._id_rows
+
+    def _kill(self, ids: List[int]) -> int:
+        """Marcar como muertas las filas de esos IDs; devuelve cuántas había"""
+        id_rows = self._rows_by_id()
+        rows = [row for row in (id_rows.pop(id, None) for id in ids) if row is not None]
+        if rows:
+            self._columns["alive"][rows] = 0
+        return len(rows)
+
+    def flush(self):
+        """Persistir los ficheros mapeados y confirmar las filas en meta.json"""
+        try:
+            with self._lock:
+                self._embeddings.flush()
+                for column in self._columns.values():
+                    column.flush()
+                os.fsync(self._records.fileno())
+
+                meta = {
+                    "dim": self.embedding_dim,
+                    "metric_type": self.metric_type,
+                    "count": self.count,
+                    "capacity": self.capacity,
+                    "nlist": self.nlist,
+                    "records_size": self._records_size,
+                    "namespaces": self._namespaces,
+                    "sources": self._sources,
+                }
+                tmp_path = self._file("meta.json.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                os.replace(tmp_path, self._file("meta.json"))
+
+            dead = self.count - int(self._columns["alive"][:self.count].sum())
+            if self.count >= 1024 and dead > self.count // 2:
+                self.compact()
+
+        except Exception as e:
+            logger.error(f"Error al hacer flush de la colección local: {e}")
+            raise
+
+    def compact(self):
+        """Reescribir la colección sin las filas muertas (al acabar los recorridos en curso, si los hay)"""
+        with self._lock:
+            if self._readers:
+                logger.info(f"Compactación aplazada hasta que terminen {self._readers} recorridos")
+                self._compact_pending = True
+                return
+            self._compact_pending = False
+            rows = np.flatnonzero(self._columns["alive"][:self.count])
+            tmp_path = self._file("records.jsonl.tmp")
+            with open(tmp_path, "wb") as out:
+                for row in rows:
+                    self._records.seek(int(self._columns["record_pos"][row]))
+                    out.write(self._records.read(int(self._columns["record_len"][row])))
+
+            # Las filas vivas se mueven hacia delante en orden, así que se puede copiar en el sitio
+            for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                block = rows[start:start + SEARCH_BLOCK_ROWS]
+                self._embeddings[start:start + len(block)] = self._embeddings[block]
+            for name in ("ids", "norms", "lists", "record_len", "namespace", "source", "date"):
+                self._columns[name][:len(rows)] = self._columns[name][rows]
+            lengths = self._columns["record_len"][:len(rows)]
+            self._columns["record_pos"][:len(rows)] = np.cumsum(lengths) - lengths
+            self._columns["alive"][:len(rows)] = 1
+
+            self._records.close()
+            os.replace(tmp_path, self._file("records.jsonl"))
+            self._records = open(self._file("records.jsonl"), "a+b")
+            logger.info(f"Colección local compactada: {self.count} -> {len(rows)} filas")
+            self._records_size = int(lengths.sum())
+            self.count = len(rows)
+            self._id_rows = None
+            self._ivf_order = None
+            self._tag_rows = None
+            self._selected_rows.clear()
+            self.flush()
+
+    def _read_record(self, row: int) -> Dict[str, Any]:
+        length = int(self._columns["record_len"][row])
+        data = os.pread(self._records.fileno(), length, int(self._columns["record_pos"][row]))
+        return json.loads(data)
+
+    def _candidate_rows(self, query: np.ndarray, count: int, top_k: int,
+                        mask: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Filas de las nprobe listas IVF más cercanas a la consulta (solo las de `mask`; None = todas)"""
+        if not self.nlist:
+            return None
+        nprobe = self.nprobe or auto_search_params("IVF_FLAT", {"nlist": self.nlist}, top_k)["nprobe"]
+        if nprobe >= self.nlist:
+            return None
+
+        if self._ivf_order is None:
+            lists = np.asarray(self._columns["lists"][:count])
+            order = np.argsort(lists, kind="stable")
+            bounds = np.searchsorted(lists[order], np.arange(self.nlist + 1))
+            self._ivf_order = (order, bounds)
+        order, bounds = self._ivf_order
+
+        if self.metric_type == "L2":
+            scores = (self._centroids ** 2).sum(axis=1) - 2 * self._centroids @ query
+        else:
+            scores = -(self._centroids @ query)
+        probe = np.argpartition(scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate([order[bounds[i]:bounds[i + 1]] for i in probe])
+        if mask is not None:
+            rows = rows[mask[rows]]
+        # Si las listas elegidas no tienen filas suficientes se hace la búsqueda exacta
+        return rows if len(rows) >= top_k else None
+
+    def _scores(self, queries: np.ndarray, rows) -> np.ndarray:
+        """Puntuación a minimizar (||x||² - 2q·x para L2, -q·x para IP/COSINE); muertas a +inf
+
+        `rows` puede ser un slice (bloque contiguo, sin copia) o un array de filas.
+        """
+        embeddings = self._embeddings[rows]
+        if self.metric_type == "L2":
+            scores = self._columns["norms"][rows][None, :] - 2 * queries @ embeddings.T
+        else:
+            scores = -(queries @ embeddings.T)
+        scores[:, self._columns["alive"][rows] == 0] = np.inf
+        return scores
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, rows: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k de cada fila de `scores`; `rows` son las filas de cada columna (1D) o de cada celda (2D)"""
+        k = min(top_k, scores.shape[1])
+        best = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        rows = rows[best] if rows.ndim == 1 else np.take_along_axis(rows, best, axis=1)
+        return np.take_along_axis(scores, best, axis=1), rows
+
+    def search_by_embeddings(self, query_embeddings: np.ndarray, top_k: int = 5,
+                             namespaces: Optional[Sequence[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                             output_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Búsqueda exacta por bloques (o sobre las listas IVF más cercanas)
+
+        Solo recorre las filas de `namespaces` que cumplen `filters` si se indican.
+        """
+        try:
+            queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+            if len(queries) == 0:
+                return []
+            check_output_fields(output_fields)
+            fields = SEARCH_FIELDS if output_fields is None else output_fields
+            filters = normalize_filters(filters)
+            self.load_collection()
+
+            # Bajo el lock: una compactación mueve filas de sitio
+            with self._lock:
+                count = self.count
+                selected, mask = self._filter_rows(namespaces, filters, count) or (None, None)
+                if selected is not None and not len(selected):
+                    return [[] for _ in queries]
+                candidates = [self._candidate_rows(query, count, top_k, mask) for query in queries] if self.nlist else []
+
+                if candidates and all(rows is not None for rows in candidates):
+                    best = [self._top_k(self._scores(query[None, :], rows), rows, top_k)
+                            for query, rows in zip(queries, candidates)]
+                    best_scores = [scores[0] for scores, _ in best]
+                    best_rows = [rows[0] for _, rows in best]
+                else:
+                    # Exacta: top-k de cada bloque y top-k de la unión
+                    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+                    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+                    contiguous = selected is None or len(selected) > count * DENSE_FILTER_FRACTION
+                    total = count if contiguous else len(selected)
+                    for start in range(0, total, SEARCH_BLOCK_ROWS):
+                        end = min(start + SEARCH_BLOCK_ROWS, total)
+                        # Bloques contiguos (sin copia) o, con un filtro selectivo, solo las filas que lo cumplen
+                        rows = slice(start, end) if contiguous else selected[start:end]
+                        scores = self._scores(queries, rows)
+                        if contiguous and mask is not None:
+                            scores[:, ~mask[start:end]] = np.inf
+                        block_scores, block_rows = self._top_k(
+                            scores, np.arange(start, end) if contiguous else rows, top_k
+                        )
+                        merged_scores = np.concatenate([best_scores, block_scores], axis=1)
+                        merged_rows = np.concatenate([best_rows, block_rows], axis=1)
+                        best_scores, best_rows = self._top_k(merged_scores, merged_rows, top_k)
+
+                results = []
+                for query, scores, rows in zip(queries, best_scores, best_rows):
+                    hits = []
+                    for position in np.argsort(scores):
+                        if not np.isfinite(scores[position]):
+                            break
+                        row = int(rows[position])
+                        score = float(scores[position])
+                        # Misma escala que Milvus: L2 al cuadrado o similitud
+                        score = score + float(query @ query) if self.metric_type == "L2" else -score
+                        # Sin campos pedidos no hace falta leer el registro
+                        record = self._read_record(row) if fields else {}
+                        hits.append({
+                            **{field: record.get(field, FIELD_DEFAULTS.get(field)) for field in fields},
+                            "score": score,
+                            "id": int(self._columns["ids"][row]),
+                        })
+                    results.append(hits)
+            return results
+
+        except Exception as e:
+            logger.error(f"Error en la búsqueda: {e}")
+            raise
+
+    def _begin_read(self):
+        """Registrar un recorrido (llamar con el lock): las filas no se mueven hasta _end_read()"""
+        self._readers += 1
+
+    def _end_read(self):
+        """Terminar un recorrido y hacer la compactación aplazada si era el último"""
+        with self._lock:
+            self._readers -= 1
+            if not self._readers and self._compact_pending and self.directory is not None:
+                self.compact()
+
+    @staticmethod
+    def _project(chunk_id: int, record: Dict[str, Any], output_fields: Optional[List[str]]) -> Dict[str, Any]:
+        fields = CHUNK_FIELDS if output_fields is None else output_fields
+        return {"id": chunk_id, **{field: record.get(field, FIELD_DEFAULTS.get(field)) for field in fields}}
+
+    def iter_chunks(self, source: Optional[str] = None, output_fields: Optional[List[str]] = None,
+                    batch_size: int = 4096, namespace: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Recorrer los chunks guardados en lotes"""
+        try:
+            self.load_collection()
+            # Copia de las columnas bajo el lock; las filas no se mueven hasta que acabe el recorrido
+            with self._lock:
+                count = self.count
+                alive = np.array(self._columns["alive"][:count], dtype=bool)
+                if namespace is not None:
+                    # Las filas de otros espacios de nombres se tratan como muertas
+                    alive &= self._columns["namespace"][:count] == self._namespace_code(namespace)
+                ids = np.array(self._columns["ids"][:count])
+                # records.jsonl tiene una línea por fila, en el mismo orden (se lee con otro descriptor)
+                records = open(self._file("records.jsonl"), "rb")
+                self._begin_read()
+            try:
+                batch: List[Dict[str, Any]] = []
+                with records:
+                    for row, line in zip(range(count), records):
+                        if not alive[row]:
+                            continue
+                        record = json.loads(line)
+                        if source is not None and record["source"] != source:
+                            continue
+                        batch.append(self._project(int(ids[row]), record, output_fields))
+                        if len(batch) >= batch_size:
+                            yield batch
+                            batch = []
+                if batch:
+                    yield batch
+            finally:
+                self._end_read()
+
+        except Exception as e:
+            logger.error(f"Error al recorrer los chunks: {e}")
+            raise
+
+    def iter_embeddings(self, batch_size: int = 4096,
+                        namespace: Optional[str] = None) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """Recorrer los chunks con sus embeddings en lotes, en el orden de las filas"""
+        try:
+            self.load_collection()
+            # Como en iter_chunks: copia de las columnas bajo el lock y sin compactar hasta el final. Las
+            # filas ya escritas no cambian (un upsert añade otra), así que se leen del mapa de este momento
+            with self._lock:
+                count = self.count
+                alive = np.array(self._columns["alive"][:count], dtype=bool)
+                codes = np.array(self._columns["namespace"][:count])
+                if namespace is not None:
+                    alive &= codes == self._namespace_code(namespace)
+                ids = np.array(self._columns["ids"][:count])
+                namespaces = list(self._namespaces)
+                embeddings = self._embeddings
+                records = open(self._file("records.jsonl"), "rb")
+                self._begin_read()
+            try:
+                rows: List[int] = []
+                batch: List[Dict[str, Any]] = []
+                with records:
+                    for row, line in zip(range(count), records):
+                        if not alive[row]:
+                            continue
+                        rows.append(row)
+                        batch.append({**self._project(int(ids[row]), json.loads(line), None),
+                                      "namespace": namespaces[codes[row]]})
+                        if len(batch) >= batch_size:
+                            yield batch, np.array(embeddings[rows])
+                            rows, batch = [], []
+                if batch:
+                    yield batch, np.array(embeddings[rows])
+            finally:
+                self._end_read()
+
+        except Exception as e:
+            logger.error(f"Error al recorrer los embeddings: {e}")
+            raise
+
+    def get_chunks(self, ids: Iterable[int], output_fields: Optional[List[str]] = None,
+                   namespaces: Optional[Sequence[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Dict[int, Dict[str, Any]]:
+        """Leer chunks por ID (solo de `namespaces` y que cumplan `filters` si se indican)"""
+        try:
+            check_output_fields(output_fields)
+            filters = normalize_filters(filters)
+            self.load_collection()
+            with self._lock:
+                id_rows = self._rows_by_id()
+                rows = {chunk_id: id_rows[chunk_id] for chunk_id in ids if chunk_id in id_rows}
+                if namespaces is not None:
+                    codes = {self._namespace_code(namespace) for namespace in namespaces}
+                    rows = {chunk_id: row for chunk_id, row in rows.items()
+                            if int(self._columns["namespace"][row]) in codes}
+                records = {chunk_id: self._read_record(row) for chunk_id, row in rows.items()}
+                return {
+                    chunk_id: self._project(chunk_id, record, output_fields)
+                    for chunk_id, record in records.items() if matches_filters(record, filters)
+                }
+
+        except Exception as e:
+            logger.error(f"Error al leer chunks: {e}")
+            raise
+
+    def get_embeddings(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Leer los embeddings guardados de unos chunks por ID (sin volver a codificar su texto)"""
+        try:
+            self.load_collection()
+            with self._lock:
+                id_rows = self._rows_by_id()
+                found = [chunk_id for chunk_id in ids if chunk_id in id_rows]
+                if not found:
+                    return {}
+                embeddings = np.array(self._embeddings[[id_rows[chunk_id] for chunk_id in found]])
+            return dict(zip(found, embeddings))
+
+        except Exception as e:
+            logger.error(f"Error al leer embeddings: {e}")
+            raise
+
+    def delete_chunks(self, ids: Iterable[int]) -> int:
+        """Borrar chunks por ID (se marcan como muertos hasta la próxima compactación)"""
+        try:
+            ids = list(ids)
+            with self._lock:
+                self._kill(ids)
+                self._ivf_order = None
+            if ids:
+                logger.info(f"Borrados {len(ids)} chunks")
+            return len(ids)
+
+        except Exception as e:
+            logger.error(f"Error al borrar chunks: {e}")
+            raise
+
+    def delete_collection(self):
+        """Eliminar la colección y sus ficheros"""
+        try:
+            with self._lock:
+                directory = self.directory or os.path.join(self.path, self.collection_name)
+                self._close()
+                if os.path.isdir(directory):
+                    shutil.rmtree(directory)
+                    logger.info(f"Colección local '{self.collection_name}' eliminada")
+                self.count = self.capacity = self.nlist = 0
+                self._centroids = None
+                self._id_rows = None
+                self._ivf_order = None
+                self._namespaces = [DEFAULT_NAMESPACE]
+                self._sources = [""]
+                self._tag_rows = None
+                self._selected_rows.clear()
+                self._compact_pending = False
+
+        except Exception as e:
+            logger.error(f"Error al eliminar la colección: {e}")
+            raise
@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+import functools
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Límites (segundos) de los buckets de las etapas: de un embedding en caché a una generación larga
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000, 2500)
+
+# Un único context manager vacío para las spans con las métricas desactivadas
+_NOOP = nullcontext()
+
+# Traza de la operación en curso en este hilo o tarea
+_current_trace: ContextVar[Optional["_Trace"]] = ContextVar("rag_trace", default=None)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Histograma con buckets fijos y series por etiquetas, en el formato de Prometheus"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Por serie: cuentas por bucket (no acumuladas; el último es +Inf), suma y número
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Número de observaciones y media de cada serie"""
+        with self._lock:
+            return {
+                "/".join(labels) or self.name: {"count": count, "mean": total / count if count else 0.0}
+                for labels, (_, total, count) in self._series.items()
+            }
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                bucket_labels = _format_labels(self.labels, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Counter:
+    """Contador monótono con series por etiquetas, en el formato de Prometheus"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class _Trace:
+    """Spans de una operación (ask, add_documents...) para el log de trazas"""
+
+    def __init__(self, operation: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.operation = operation
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.attributes: Dict[str, Any] = {}
+
+
+class _Span:
+    """Context manager de una etapa (una clase y no @contextmanager: cuesta menos de la mitad)"""
+
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # GeneratorExit (un stream que se cierra antes de acabar) no cuenta como error
+        error = exc if exc_type is not None and issubclass(exc_type, Exception) else None
+        self.metrics._record(self.stage, self.start, time.perf_counter(), error)
+        return False
+
+
+class Metrics:
+    """Tiempos por etapa del pipeline RAG, tokens/s de Ollama y trazas JSON opcionales
+
+    `span(stage)` mide un bloque y lo acumula en el histograma rag_stage_seconds (y, si
+    lanza una excepción, en rag_stage_errors_total). `trace(operation)` agrupa las spans
+    de una operación y, con `trace_path`, escribe al terminar una línea JSON con todas
+    ellas. Las spans de otros hilos (búsqueda BM25 en paralelo, productor de la ingesta)
+    cuentan en los histogramas pero no en la traza. `render()` devuelve todo en el
+    formato de texto de Prometheus.
+
+    Desactivadas (enabled=False), span() y trace() devuelven un context manager vacío.
+    """
+
+    def __init__(self, enabled: bool = True, trace_path: Optional[str] = None):
+        self.enabled = enabled
+        self.trace_path = trace_path if enabled else None
+        self._trace_lock = threading.Lock()
+        self._trace_file = None
+
+        self.stage_seconds = Histogram(
+            "rag_stage_seconds", "Duración de cada etapa del pipeline RAG", ("stage",), STAGE_BUCKETS
+        )
+        self.stage_errors = Counter("rag_stage_errors_total", "Etapas terminadas con una excepción", ("stage",))
+        self.tokens_per_second = Histogram(
+            "rag_generation_tokens_per_second", "Velocidad de generación de Ollama (eval_count / eval_duration)",
+            ("model",), TOKENS_PER_SECOND_BUCKETS
+        )
+        self.prompt_tokens_per_second = Histogram(
+            "rag_prompt_tokens_per_second", "Velocidad de prefill de Ollama (prompt_eval_count / prompt_eval_duration)",
+            ("model",), TOKENS_PER_SECOND_BUCKETS
+        )
+        self.generated_tokens = Counter("rag_generated_tokens_total", "Tokens generados por Ollama", ("model",))
+        self.prompt_tokens = Counter("rag_prompt_tokens_total", "Tokens de prompt evaluados por Ollama", ("model",))
+
+    @classmethod
+    def from_env(cls) -> "Metrics":
+        """Métricas activas salvo con RAG_METRICS_ENABLED=false; trazas en RAG_TRACE_LOG"""
+        return cls(
+            enabled=os.getenv('RAG_METRICS_ENABLED', 'true').lower() == 'true',
+            trace_path=os.getenv('RAG_TRACE_LOG') or None,
+        )
+
+    def span(self, stage: str):
+        """Context manager que mide una etapa"""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, stage)
+
+    def _record(self, stage: str, start: float, end: float, error: Optional[BaseException]):
+        self.stage_seconds.observe(end - start, stage)
+        if error is not None:
+            self.stage_errors.inc(1, stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            span = {"stage": stage, "offset_ms": (start - trace.start) * 1000, "duration_ms": (end - start) * 1000}
+            if error is not None:
+                span["error"] = f"{type(error).__name__}: {error}"
+            trace.spans.append(span)
+
+    def observe(self, stage: str, seconds: float):
+        """Registrar una duración medida por fuera de span() (p. ej. el tiempo hasta el primer token)"""
+        if self.enabled:
+            self.stage_seconds.observe(seconds, stage)
+
+    def trace(self, operation: str):
+        """Medir una operación completa; dentro de otra traza es solo una span más"""
+        if not self.enabled:
+            return _NOOP
+        if self.trace_path is None or _current_trace.get() is not None:
+            return _Span(self, operation)
+        return self._trace(operation)
+
+    @contextmanager
+    def _trace(self, operation: str) -> Iterator[None]:
+        trace = _Trace(operation)
+        token = _current_trace.set(trace)
+        try:
+            with _Span(self, operation):
+                yield
+        finally:
+            _current_trace.reset(token)
+            self._write_trace(trace)
+
+    def annotate(self, **attributes: Any):
+        """Añadir atributos (p. ej. tokens generados) a la traza en curso"""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.attributes.update(attributes)
+
+    def observe_generation(self, model: str, response: Mapping[str, Any]):
+        """Registrar los contadores de una respuesta de Ollama (o del último fragmento del stream)"""
+        if not self.enabled:
+            return
+        eval_count = response.get("eval_count") or 0
+        eval_duration = (response.get("eval_duration") or 0) / 1e9
+        prompt_count = response.get("prompt_eval_count") or 0
+        prompt_duration = (response.get("prompt_eval_duration") or 0) / 1e9
+        self.generated_tokens.inc(eval_count, model)
+        self.prompt_tokens.inc(prompt_count, model)
+        attributes = {"eval_count": eval_count, "prompt_eval_count": prompt_count}
+        if eval_count and eval_duration:
+            attributes["tokens_per_second"] = eval_count / eval_duration
+            self.tokens_per_second.observe(attributes["tokens_per_second"], model)
+        if prompt_count and prompt_duration:
+            attributes["prompt_tokens_per_second"] = prompt_count / prompt_duration
+            self.prompt_tokens_per_second.observe(attributes["prompt_tokens_per_second"], model)
+        self.annotate(**attributes)
+
+    def _write_trace(self, trace: _Trace):
+        record = {
+            "trace_id": trace.id,
+            "operation": trace.operation,
+            "timestamp": trace.timestamp,
+            "duration_ms": (time.perf_counter() - trace.start) * 1000,
+            "spans": trace.spans,
+            **trace.attributes,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._trace_lock:
+                if self._trace_file is None:
+                    directory = os.path.dirname(self.trace_path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    self._trace_file = open(self.trace_path, "a", encoding="utf-8", buffering=1)
+                self._trace_file.write(line)
+        except OSError as e:
+            logger.warning(f"No se pudo escribir la traza en {self.trace_path}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Número de observaciones y duración media (ms) de cada etapa"""
+        return {
+            stage: {"count": values["count"], "mean_ms": values["mean"] * 1000}
+            for stage, values in self.stage_seconds.summary().items()
+        }
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus"""
+        lines: List[str] = []
+        for metric in (self.stage_seconds, self.stage_errors, self.tokens_per_second,
+                       self.prompt_tokens_per_second, self.generated_tokens, self.prompt_tokens):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """Registro de métricas del proceso (se crea con from_env en el primer uso)"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics.from_env()
+    return _metrics
+
+
+def set_metrics(metrics: Metrics):
+    """Sustituir el registro del proceso (p. ej. para desactivarlo en un benchmark)"""
+    global _metrics
+    _metrics = metrics
+
+
+def traced(operation: str) -> Callable:
+    """Decorador que mide una operación completa con get_metrics().trace(operation)"""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_metrics().trace(operation):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
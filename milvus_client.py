@@ -1,10 +1,22 @@
 import os
+import re
+import json
+import time
+import hashlib
 import logging
-from typing import List, Dict, Any
-from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType, utility
-from sentence_transformers import SentenceTransformer
+import itertools
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sequence, Set, Tuple
 import numpy as np
 from dotenv import load_dotenv
+from embedding_backends import EmbeddingBackend
+from resilience import RetryPolicy
+from vector_store import (
+    VectorStore, CHUNK_FIELDS, SEARCH_FIELDS, METADATA_FIELDS, INDEX_TYPES, METRIC_TYPES, SEARCH_PARAM_KEYS,
+    DEFAULT_NAMESPACE, MAX_TAGS, MAX_TAG_LENGTH, auto_index_params, auto_search_params, chunk_id, document_hash,
+    check_output_fields, filter_expression, normalize_filters, normalize_tags, to_timestamp
+)
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -13,41 +25,136 @@ logger = logging.getLogger(__name__)
 # Cargar variables de entorno
 load_dotenv()
 
-class MilvusClient:
+# Tamaño de los lotes de IDs en las expresiones "id in [...]"
+DELETE_BATCH_SIZE = 1000
+
+# Partición de Milvus del espacio de nombres por defecto (la que ya tenían las colecciones)
+DEFAULT_PARTITION = "_default"
+
+# Campos escalares con índice para filtrar (el de embedding es el índice vectorial)
+SCALAR_INDEX_FIELDS = ("source", "date", "tags")
+
+
+def partition_name(namespace: str) -> str:
+    """Partición de Milvus de un espacio de nombres
+
+    Milvus solo admite letras, dígitos y "_" en los nombres: si el espacio de nombres
+    tiene otros caracteres se sustituyen y se añade un hash para que no colisionen.
+    """
+    if not namespace:
+        return DEFAULT_PARTITION
+    safe = re.sub(r"[^0-9A-Za-z_]", "_", namespace)[:200]
+    if safe == namespace:
+        return f"ns_{safe}"
+    return f"ns_{safe}_{hashlib.blake2b(namespace.encode('utf-8'), digest_size=4).hexdigest()}"
+
+def _json_env(name: str) -> Dict[str, Any]:
+    """Leer un diccionario JSON de una variable de entorno (vacío si no está definida)"""
+    value = os.getenv(name)
+    return json.loads(value) if value else {}
+
+
+class MilvusClient(VectorStore):
     """Cliente para gestionar operaciones con Milvus"""
     
-    def __init__(self, host: str = None, port: str = None):
+    def __init__(self, host: str = None, port: str = None, encoder: EmbeddingBackend = None,
+                 index_type: str = None, metric_type: str = None):
+        super().__init__(encoder, (metric_type or os.getenv('MILVUS_METRIC_TYPE', 'L2')).upper())
         self.host = host or os.getenv('MILVUS_HOST', 'localhost')
         self.port = port or os.getenv('MILVUS_PORT', '19530')
-        self.collection_name = "documents"
         self.collection = None
+        # Si la colección está cargada en memoria en Milvus (evita un load() por consulta)
+        self.loaded = False
+        # Colección creada antes de los IDs estables (auto_id y sin metadatos)
+        self.legacy_schema = False
+        # Campos de la colección (las creadas antes de los filtros no tienen date ni tags)
+        self.fields: Set[str] = {"id", *CHUNK_FIELDS, "embedding"}
+        
+        # Configuración del índice (los parámetros que falten se eligen según el número de filas)
+        self.index_type = (index_type or os.getenv('MILVUS_INDEX_TYPE', 'IVF_FLAT')).upper()
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice no soportado: {self.index_type} (opciones: {', '.join(INDEX_TYPES)})")
+        if self.metric_type not in METRIC_TYPES:
+            raise ValueError(f"Métrica no soportada: {self.metric_type} (opciones: {', '.join(METRIC_TYPES)})")
+        # Configuración pedida (el índice existente de la colección puede ser otro)
+        self.configured_index = (self.index_type, self.metric_type)
+        self.index_overrides = _json_env('MILVUS_INDEX_PARAMS')
+        self.search_overrides = _json_env('MILVUS_SEARCH_PARAMS')
+        self.expected_rows = int(os.getenv('MILVUS_EXPECTED_ROWS', '0'))
+        # Índice de los campos escalares (INVERTED desde Milvus 2.4; "" para no crearlos)
+        self.scalar_index_type = os.getenv('MILVUS_SCALAR_INDEX', 'INVERTED').upper()
+        # Parámetros efectivos del índice de la colección
+        self.index_params: Dict[str, Any] = {}
         
-        # Inicializar el modelo de embeddings
-        self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
-        self.embedding_dim = 384  # Dimensión del modelo all-MiniLM-L6-v2
+        # Conexiones: con MILVUS_POOL_SIZE > 1 se abren varios alias (un canal gRPC cada uno) y
+        # las búsquedas se reparten entre ellos; el primero es "default"
+        pool_size = max(1, int(os.getenv('MILVUS_POOL_SIZE', '1')))
+        self.aliases = ["default"] + [f"rag-milvus-{i}" for i in range(1, pool_size)]
+        self._collections: List[Any] = []
+        self._round_robin = itertools.count()
+        # Timeout por llamada en segundos. Si es un número entero se pasa como int: pymilvus solo acota
+        # con él sus propios reintentos de errores gRPC si es int (si no, reintenta hasta 75 veces)
+        timeout = float(os.getenv('MILVUS_TIMEOUT', '10'))
+        self.timeout = int(timeout) if timeout.is_integer() else timeout
+        self.connect_retry = RetryPolicy.from_env('MILVUS', name="Milvus")
+        
+        # Espacios de nombres: una partición por cada uno (espacio de nombres -> partición). Con
+        # MILVUS_MAX_LOADED_PARTITIONS > 0 solo se cargan las particiones que se consultan y, al
+        # pasar de ese número, se liberan las que llevan más tiempo sin usarse
+        self._partitions: Dict[str, str] = {}
+        self.max_loaded_partitions = int(os.getenv('MILVUS_MAX_LOADED_PARTITIONS', '0'))
+        self._loaded_partitions: "OrderedDict[str, float]" = OrderedDict()
+        self._partition_lock = threading.Lock()
+        self.partition_loads = 0
+        self.partition_releases = 0
         
     def connect(self):
         """Conectar a Milvus"""
+        # pymilvus (y pandas) se importan al conectar, no al importar el módulo
+        from pymilvus import connections
         try:
-            connections.connect("default", host=self.host, port=self.port)
-            logger.info(f"Conectado a Milvus en {self.host}:{self.port}")
+            for alias in self.aliases:
+                self.connect_retry.call(connections.connect, alias, host=self.host, port=self.port, timeout=self.timeout)
+            logger.info(f"Conectado a Milvus en {self.host}:{self.port} ({len(self.aliases)} conexiones)")
         except Exception as e:
             logger.error(f"Error al conectar con Milvus: {e}")
             raise
     
     def create_collection(self):
         """Crear la colección si no existe"""
+        from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
         try:
             # Verificar si la colección ya existe
             if utility.has_collection(self.collection_name):
                 logger.info(f"La colección '{self.collection_name}' ya existe")
                 self.collection = Collection(self.collection_name)
+                self._open_pool()
+                self._read_partitions()
+                self.loaded = False
+                self.fields = {field.name for field in self.collection.schema.fields}
+                self.legacy_schema = "document_id" not in self.fields
+                if self.legacy_schema:
+                    logger.warning(
+                        f"La colección '{self.collection_name}' usa el schema antiguo (auto_id, sin metadatos): "
+                        "las reingestas duplicarán chunks. Ejecuta reset_database() para migrarla"
+                    )
+                elif not set(METADATA_FIELDS) <= self.fields:
+                    logger.warning(
+                        f"La colección '{self.collection_name}' no tiene los campos date y tags: no se podrá "
+                        "filtrar por ellos. Ejecuta reset_database() para migrarla"
+                    )
                 return
             
-            # Definir el schema de la colección
+            # Definir el schema de la colección (el ID del chunk es determinista, ver chunk_id)
             fields = [
-                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
                 FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=5000),
+                FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=512),
+                FieldSchema(name="document_id", dtype=DataType.VARCHAR, max_length=256),
+                FieldSchema(name="chunk_offset", dtype=DataType.INT64),
+                FieldSchema(name="date", dtype=DataType.INT64),
+                FieldSchema(name="tags", dtype=DataType.ARRAY, element_type=DataType.VARCHAR,
+                            max_capacity=MAX_TAGS, max_length=MAX_TAG_LENGTH),
                 FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.embedding_dim)
             ]
             
@@ -55,96 +162,516 @@ class MilvusClient:
             
             # Crear la colección
             self.collection = Collection(self.collection_name, schema)
+            self._open_pool()
+            self._read_partitions()
+            self.loaded = False
+            self.legacy_schema = False
+            self.fields = {field.name for field in fields}
             logger.info(f"Colección '{self.collection_name}' creada exitosamente")
             
         except Exception as e:
             logger.error(f"Error al crear la colección: {e}")
             raise
     
+    def _open_pool(self):
+        """Abrir la colección en cada conexión adicional del pool"""
+        from pymilvus import Collection
+        self._collections = [self.collection] + [
+            Collection(self.collection_name, using=alias) for alias in self.aliases[1:]
+        ]
+    
+    def _read_partitions(self):
+        """Leer las particiones de la colección (cada una guarda su espacio de nombres en la descripción)"""
+        self._partitions = {
+            DEFAULT_NAMESPACE if partition.name == DEFAULT_PARTITION else partition.description or partition.name:
+                partition.name
+            for partition in self.collection.partitions
+        }
+        self._loaded_partitions.clear()
+    
+    def _partition(self, namespace: str, create: bool = False) -> Optional[str]:
+        """Partición de un espacio de nombres (None si no existe y no se pide crearla)"""
+        partition = self._partitions.get(namespace)
+        if partition is None and create:
+            partition = partition_name(namespace)
+            with self._partition_lock:
+                if not self.collection.has_partition(partition):
+                    self.collection.create_partition(partition, description=namespace)
+                    logger.info(f"Partición '{partition}' creada para el espacio de nombres '{namespace}'")
+                self._partitions[namespace] = partition
+        return partition
+    
+    def namespaces(self) -> List[str]:
+        """Espacios de nombres de la colección (uno por partición)"""
+        return sorted(self._partitions)
+    
+    def namespace_stats(self) -> Dict[str, Any]:
+        """Espacios de nombres, particiones cargadas y cargas y liberaciones hechas"""
+        return {
+            "namespaces": len(self._partitions),
+            "max_loaded_partitions": self.max_loaded_partitions,
+            "loaded_partitions": list(self._loaded_partitions),
+            "partition_loads": self.partition_loads,
+            "partition_releases": self.partition_releases,
+        }
+    
+    def _scope(self, namespaces: Optional[Sequence[str]]) -> Optional[List[str]]:
+        """Particiones que puede ver una llamada y dejarlas cargadas
+        
+        Sin `namespaces` (None) se usa lo cargado, sin restringir. Devuelve [] si ninguno de
+        los espacios de nombres tiene datos.
+        """
+        if namespaces is None:
+            self.load_collection()
+            return None
+        partitions = [partition for partition in map(self._partitions.get, namespaces) if partition is not None]
+        if not partitions:
+            return []
+        if self.max_loaded_partitions > 0:
+            self._load_partitions(partitions)
+        else:
+            self.load_collection()
+        return partitions
+    
+    def _load_partitions(self, partitions: List[str], force: bool = False):
+        """Cargar las particiones que falten y liberar las usadas hace más tiempo (LRU)
+        
+        Nunca se liberan las que pide esta llamada, aunque sean más que el máximo.
+        """
+        with self._partition_lock:
+            if force:
+                for partition in partitions:
+                    self._loaded_partitions.pop(partition, None)
+            missing = [partition for partition in partitions if partition not in self._loaded_partitions]
+            if missing:
+                start = time.perf_counter()
+                self.collection.load(partition_names=missing, timeout=self.timeout)
+                self.partition_loads += len(missing)
+                logger.info(f"Particiones cargadas en {time.perf_counter() - start:.2f} s: {', '.join(missing)}")
+            now = time.monotonic()
+            for partition in partitions:
+                self._loaded_partitions[partition] = now
+                self._loaded_partitions.move_to_end(partition)
+            
+            excess = len(self._loaded_partitions) - self.max_loaded_partitions
+            idle = [partition for partition in self._loaded_partitions if partition not in partitions][:max(excess, 0)]
+            for partition in idle:
+                self.collection.partition(partition).release(timeout=self.timeout)
+                del self._loaded_partitions[partition]
+                self.partition_releases += 1
+            if idle:
+                logger.info(f"Particiones liberadas por inactividad: {', '.join(idle)}")
+    
+    def _next_collection(self):
+        """Colección por la que va la siguiente búsqueda (reparto por turnos entre las conexiones)"""
+        if len(self._collections) < 2:
+            return self.collection
+        return self._collections[next(self._round_robin) % len(self._collections)]
+    
+    def _vector_index(self):
+        """Índice del campo embedding (None si no tiene); la colección puede tener también índices escalares"""
+        return next((index for index in self.collection.indexes if index.field_name == "embedding"), None)
+    
     def create_index(self):
-        """Crear índice para búsqueda vectorial"""
+        """Crear índice para búsqueda vectorial (o adoptar el que ya tenga la colección) y los escalares"""
         try:
+            self._create_scalar_indexes()
+            existing = self._vector_index()
+            if existing is not None:
+                self._use_existing_index(existing)
+                return
+            
+            # Parámetros automáticos según el tamaño esperado, con los de MILVUS_INDEX_PARAMS encima
+            num_rows = max(self.expected_rows, self.collection.num_entities)
+            params = {**auto_index_params(self.index_type, num_rows, self.embedding_dim), **self.index_overrides}
             index_params = {
-                "metric_type": "L2",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 128}
+                "metric_type": self.metric_type,
+                "index_type": self.index_type,
+                "params": params
             }
             
             self.collection.create_index("embedding", index_params)
-            logger.info("Índice creado exitosamente")
+            self.index_params = params
+            logger.info(f"Índice {self.index_type} ({self.metric_type}) creado exitosamente con {params}")
             
         except Exception as e:
             logger.error(f"Error al crear el índice: {e}")
             raise
     
-    def insert_documents(self, texts: List[str]):
-        """Insertar documentos en la colección"""
+    def _create_scalar_indexes(self):
+        """Índices de source, date y tags para filtrar sin recorrer todas las filas
+        
+        Si Milvus no admite el tipo de índice (MILVUS_SCALAR_INDEX) se sigue sin él: los
+        filtros funcionan igual, pero recorriendo los valores del campo.
+        """
+        if not self.scalar_index_type or self.legacy_schema:
+            return
+        indexed = {index.field_name for index in self.collection.indexes}
+        for field in SCALAR_INDEX_FIELDS:
+            if field not in self.fields or field in indexed:
+                continue
+            try:
+                self.collection.create_index(field, {"index_type": self.scalar_index_type},
+                                             index_name=f"{field}_index", timeout=self.timeout)
+                logger.info(f"Índice escalar {self.scalar_index_type} creado en '{field}'")
+            except Exception as e:
+                logger.warning(f"No se pudo crear el índice escalar de '{field}' ({e}); se filtrará sin índice")
+    
+    def _use_existing_index(self, index):
+        """Tomar tipo, métrica y parámetros del índice que ya existe en la colección"""
+        existing = index.params
+        params = existing.get("params", {})
+        if isinstance(params, str):
+            params = json.loads(params)
+        index_type = existing.get("index_type", self.index_type)
+        metric_type = existing.get("metric_type", self.metric_type)
+        if (index_type, metric_type) != (self.index_type, self.metric_type):
+            logger.warning(
+                f"La colección ya tiene un índice {index_type} ({metric_type}); se usa ese en lugar de "
+                f"{self.index_type} ({self.metric_type}). Ejecuta rebuild_index() para cambiarlo"
+            )
+        self.index_type, self.metric_type, self.index_params = index_type, metric_type, params
+        logger.info(f"Usando el índice existente {index_type} ({metric_type}) con {params}")
+    
+    def rebuild_index(self):
+        """Recrear el índice con la configuración actual y el número de filas real
+        
+        Útil tras una ingesta masiva: los parámetros automáticos (nlist, M) se
+        recalculan con el tamaño que tiene ahora la colección.
+        """
         try:
-            # Generar embeddings
-            embeddings = self.encoder.encode(texts)
+            self.collection.release()
+            self.loaded = False
+            self._loaded_partitions.clear()
+            existing = self._vector_index()
+            if existing is not None:
+                self.collection.drop_index(index_name=existing.index_name)
+            self.index_type, self.metric_type = self.configured_index
+            self.create_index()
+            self.load_collection()
             
-            # Preparar datos para inserción
-            data = [
-                texts,
-                embeddings.tolist()
-            ]
+        except Exception as e:
+            logger.error(f"Error al recrear el índice: {e}")
+            raise
+    
+    def search_params(self, top_k: int) -> Dict[str, Any]:
+        """Parámetros de búsqueda para el índice actual (MILVUS_SEARCH_PARAMS tiene prioridad)"""
+        params = {**auto_search_params(self.index_type, self.index_params, top_k), **self.search_overrides}
+        if "ef" in params:
+            # HNSW exige ef >= top_k
+            params["ef"] = max(params["ef"], top_k)
+        return {"metric_type": self.metric_type, "params": params}
+    
+    def load_collection(self, force: bool = False):
+        """Cargar la colección en memoria en Milvus (solo si no está ya cargada)
+        
+        Con MILVUS_MAX_LOADED_PARTITIONS > 0 solo se carga la partición por defecto; las
+        demás se cargan cuando se consultan.
+        """
+        try:
+            if self.loaded and not force:
+                return
             
-            # Insertar datos
-            mr = self.collection.insert(data)
-            self.collection.flush()
+            if self.max_loaded_partitions > 0:
+                self._load_partitions([DEFAULT_PARTITION], force=force)
+            else:
+                self.collection.load()
+            self.loaded = True
+            logger.info(f"Colección '{self.collection_name}' cargada en memoria")
+            
+        except Exception as e:
+            logger.error(f"Error al cargar la colección: {e}")
+            raise
+    
+    def insert_chunks(self, chunks: List[Dict[str, Any]], embeddings: Optional[np.ndarray] = None,
+                      flush: bool = False, upsert: bool = True):
+        """Insertar chunks con sus metadatos (text, source, document_id, chunk_offset, date y tags)
+        
+        El ID de cada chunk se deriva de su documento y su texto, así que con
+        upsert=True volver a insertar el mismo chunk lo sustituye en lugar de
+        duplicarlo. upsert=False hace un insert normal (más barato) cuando el
+        llamante ya sabe que los IDs son nuevos. Cada chunk va a la partición de su
+        espacio de nombres (campo "namespace"), que se crea si no existe.
+        """
+        try:
+            if embeddings is None:
+                embeddings = self.encode_documents([chunk["text"] for chunk in chunks])
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            
+            if self.legacy_schema:
+                # Colección antigua: solo texto y embedding, con IDs automáticos
+                mr = self.collection.insert([[chunk["text"] for chunk in chunks], embeddings], timeout=self.timeout)
+            else:
+                # Un mismo ID repetido dentro del lote se inserta una sola vez; una escritura por partición
+                by_namespace: Dict[str, Dict[int, int]] = {}
+                for i, chunk in enumerate(chunks):
+                    namespace = chunk.get("namespace", DEFAULT_NAMESPACE)
+                    id = chunk["id"] if "id" in chunk else chunk_id(chunk["document_id"], chunk["text"], namespace,
+                                                                    chunk.get("chunk_offset", 0))
+                    by_namespace.setdefault(namespace, {}).setdefault(id, i)
+                
+                write = self.collection.upsert if upsert else self.collection.insert
+                for namespace, positions in by_namespace.items():
+                    rows = list(positions.values())
+                    selected = [chunks[i] for i in rows]
+                    
+                    # Preparar datos para inserción (pymilvus acepta directamente los arrays de NumPy)
+                    data = [
+                        list(positions.keys()),
+                        [chunk["text"] for chunk in selected],
+                        [chunk.get("source", "") for chunk in selected],
+                        [chunk["document_id"] for chunk in selected],
+                        [chunk.get("chunk_offset", 0) for chunk in selected],
+                    ]
+                    if "date" in self.fields:
+                        data.append([to_timestamp(chunk.get("date")) for chunk in selected])
+                        data.append([normalize_tags(chunk.get("tags")) for chunk in selected])
+                    data.append(embeddings[rows] if len(rows) < len(chunks) else embeddings)
+                    mr = write(data, partition_name=self._partition(namespace, create=True), timeout=self.timeout)
             
-            logger.info(f"Insertados {len(texts)} documentos exitosamente")
+            if flush:
+                self.collection.flush()
+            
+            logger.info(f"Insertados {len(chunks)} chunks exitosamente")
             return mr
             
         except Exception as e:
             logger.error(f"Error al insertar documentos: {e}")
             raise
     
-    def search_similar(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Buscar documentos similares"""
+    @property
+    def search_fields(self) -> List[str]:
+        """Campos de cada resultado de búsqueda (la colección antigua solo tiene el texto)"""
+        return ["text"] if self.legacy_schema else list(SEARCH_FIELDS)
+    
+    def _output_fields(self, output_fields: Optional[List[str]]) -> List[str]:
+        """Campos a devolver en una query (las colecciones antiguas no tienen todos)"""
+        if output_fields is None:
+            output_fields = [field for field in CHUNK_FIELDS if field in self.fields]
+        check_output_fields(output_fields)
+        missing = [field for field in output_fields if field not in self.fields]
+        if missing:
+            raise RuntimeError(
+                f"La colección usa un schema antiguo y no tiene {', '.join(missing)}; ejecuta reset_database()"
+            )
+        return ["id", *output_fields]
+    
+    def _filter_expression(self, filters: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Expresión de Milvus de un filtro de metadatos (None si no hay filtro)"""
+        filters = normalize_filters(filters)
+        if filters is None:
+            return None
+        missing = sorted({"date" if key.startswith("date") else key for key in filters} - self.fields)
+        if missing:
+            raise RuntimeError(
+                f"La colección usa un schema antiguo y no tiene {', '.join(missing)}; ejecuta reset_database()"
+            )
+        return filter_expression(filters)
+    
+    def iter_chunks(self, source: Optional[str] = None, output_fields: Optional[List[str]] = None,
+                    batch_size: int = 4096, namespace: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Recorrer los chunks guardados en lotes (con query_iterator, sin límite de 16384 filas)
+        
+        Sin `namespace`, todos; con particiones cargadas bajo demanda se recorren de una en una.
+        """
+        if namespace is None and self.max_loaded_partitions > 0:
+            for namespace in self.namespaces():
+                yield from self.iter_chunks(source, output_fields, batch_size, namespace)
+            return
+        
         try:
-            # Cargar la colección en memoria
-            self.collection.load()
+            fields = self._output_fields(output_fields)
+            # query_iterator necesita la colección (o la partición) cargada
+            partitions = self._scope(None if namespace is None else [namespace])
+            if partitions == []:
+                return
+            expr = f"source == {json.dumps(source)}" if source is not None else "id >= 0"
+            iterator = self.collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=fields,
+                                                      partition_names=partitions)
+            try:
+                while True:
+                    rows = iterator.next()
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                iterator.close()
             
-            # Generar embedding de la consulta
-            query_embedding = self.encoder.encode([query])
+        except Exception as e:
+            logger.error(f"Error al recorrer los chunks: {e}")
+            raise
+    
+    def iter_embeddings(self, batch_size: int = 4096,
+                        namespace: Optional[str] = None) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """Recorrer los chunks con sus embeddings, partición a partición (con query_iterator)"""
+        try:
+            fields = [*self._output_fields(None), "embedding"]
+            for namespace in (self.namespaces() if namespace is None else [namespace]):
+                partitions = self._scope([namespace])
+                if not partitions:
+                    continue
+                iterator = self.collection.query_iterator(batch_size=batch_size, expr="id >= 0", output_fields=fields,
+                                                          partition_names=partitions)
+                try:
+                    while True:
+                        rows = iterator.next()
+                        if not rows:
+                            break
+                        embeddings = np.asarray([row.pop("embedding") for row in rows], dtype=np.float32)
+                        yield [{**row, "namespace": namespace} for row in rows], embeddings
+                finally:
+                    iterator.close()
+            
+        except Exception as e:
+            logger.error(f"Error al recorrer los embeddings: {e}")
+            raise
+    
+    def get_chunks(self, ids: Iterable[int], output_fields: Optional[List[str]] = None,
+                   namespaces: Optional[Sequence[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Dict[int, Dict[str, Any]]:
+        """Leer chunks por ID (solo los que cumplen `filters` si se indica)"""
+        try:
+            ids = list(ids)
+            if not ids:
+                return {}
+            fields = self._output_fields(output_fields)
+            expr = self._filter_expression(filters)
+            partitions = self._scope(namespaces)
+            if partitions == []:
+                return {}
+            chunks: Dict[int, Dict[str, Any]] = {}
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                batch_expr = f"id in {ids[start:start + DELETE_BATCH_SIZE]}"
+                if expr:
+                    batch_expr = f"{batch_expr} and {expr}"
+                rows = self.collection.query(expr=batch_expr, output_fields=fields,
+                                             partition_names=partitions, timeout=self.timeout)
+                chunks.update((row["id"], row) for row in rows)
+            return chunks
+            
+        except Exception as e:
+            logger.error(f"Error al leer chunks: {e}")
+            raise
+    
+    def get_embeddings(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Leer los embeddings guardados de unos chunks por ID (en lotes, como get_chunks)"""
+        try:
+            ids = list(ids)
+            embeddings: Dict[int, np.ndarray] = {}
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                rows = self.collection.query(expr=f"id in {ids[start:start + DELETE_BATCH_SIZE]}",
+                                             output_fields=["id", "embedding"], timeout=self.timeout)
+                embeddings.update((row["id"], np.asarray(row["embedding"], dtype=np.float32)) for row in rows)
+            return embeddings
+            
+        except Exception as e:
+            logger.error(f"Error al leer embeddings: {e}")
+            raise
+    
+    def delete_chunks(self, ids: Iterable[int]) -> int:
+        """Borrar chunks por ID (en lotes para acotar el tamaño de la expresión)"""
+        try:
+            ids = list(ids)
+            for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                batch = ids[start:start + DELETE_BATCH_SIZE]
+                self.collection.delete(f"id in {batch}", timeout=self.timeout)
+            if ids:
+                logger.info(f"Borrados {len(ids)} chunks")
+            return len(ids)
+            
+        except Exception as e:
+            logger.error(f"Error al borrar chunks: {e}")
+            raise
+    
+    def flush(self):
+        """Persistir en Milvus los datos insertados"""
+        try:
+            self.collection.flush()
+        except Exception as e:
+            logger.error(f"Error al hacer flush de la colección: {e}")
+            raise
+    
+    def search_by_embeddings(self, query_embeddings: np.ndarray, top_k: int = 5,
+                             namespaces: Optional[Sequence[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                             output_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Buscar documentos similares a partir de embeddings ya calculados
+        
+        Con `namespaces` solo se buscan sus particiones (Milvus no recorre las demás). El
+        filtro se pasa como expresión a la búsqueda: Milvus descarta las filas que no lo
+        cumplen antes de recorrer el índice, así que siempre devuelve top_k si los hay.
+        """
+        try:
+            if len(query_embeddings) == 0:
+                return []
+            fields = self.search_fields if output_fields is None else self._output_fields(output_fields)[1:]
+            expr = self._filter_expression(filters)
+            
+            # Cargar la colección (o las particiones) solo la primera vez (o tras recrearla)
+            partitions = self._scope(namespaces)
+            if partitions == []:
+                return [[] for _ in query_embeddings]
             
             # Parámetros de búsqueda
-            search_params = {
-                "metric_type": "L2",
-                "params": {"nprobe": 10}
-            }
+            search_params = self.search_params(top_k)
             
-            # Realizar búsqueda
-            results = self.collection.search(
-                query_embedding,
-                "embedding",
-                search_params,
-                limit=top_k,
-                output_fields=["text"]
-            )
+            # Realizar una única búsqueda vectorizada
+            from pymilvus import MilvusException
+            try:
+                results = self._search(query_embeddings, search_params, top_k, partitions, expr, fields)
+            except MilvusException as e:
+                if "not loaded" not in str(e).lower():
+                    raise
+                # Alguien liberó la colección (release) desde fuera: recargar y reintentar
+                logger.warning(f"La colección '{self.collection_name}' no estaba cargada, recargando")
+                if partitions is not None and self.max_loaded_partitions > 0:
+                    self._load_partitions(partitions, force=True)
+                else:
+                    self.load_collection(force=True)
+                results = self._search(query_embeddings, search_params, top_k, partitions, expr, fields)
             
-            # Formatear resultados
-            similar_docs = []
-            for hits in results:
-                for hit in hits:
-                    similar_docs.append({
-                        "text": hit.entity.get("text"),
+            # Formatear resultados (una lista de documentos por consulta)
+            return [
+                [
+                    {
+                        **{field: hit.entity.get(field) for field in fields},
                         "score": hit.score,
                         "id": hit.id
-                    })
-            
-            return similar_docs
+                    }
+                    for hit in hits
+                ]
+                for hits in results
+            ]
             
         except Exception as e:
             logger.error(f"Error en la búsqueda: {e}")
             raise
     
+    def _search(self, query_embeddings, search_params: Dict[str, Any], top_k: int,
+                partitions: Optional[List[str]] = None, expr: Optional[str] = None,
+                output_fields: Optional[List[str]] = None):
+        """Llamada de búsqueda a Milvus"""
+        return self._next_collection().search(
+            query_embeddings,
+            "embedding",
+            search_params,
+            limit=top_k,
+            expr=expr,
+            partition_names=partitions,
+            output_fields=self.search_fields if output_fields is None else output_fields,
+            timeout=self.timeout
+        )
+    
     def delete_collection(self):
         """Eliminar la colección"""
+        from pymilvus import utility
         try:
             if utility.has_collection(self.collection_name):
                 utility.drop_collection(self.collection_name)
+                self.collection = None
+                self._collections = []
+                self._partitions = {}
+                self._loaded_partitions.clear()
+                self.loaded = False
                 logger.info(f"Colección '{self.collection_name}' eliminada")
         except Exception as e:
             logger.error(f"Error al eliminar la colección: {e}")
@@ -29,6 +29,8 @@ show_help() {
     echo "  clean         Limpiar contenedores y volúmenes"
     echo "  backup        Hacer backup de los datos"
     echo "  restore       Restaurar datos desde backup"
+    echo "  export        Exportar la colección a un snapshot en data/snapshots"
+    echo "  import        Importar un snapshot sin regenerar embeddings (--replace vacía antes)"
     echo "  update        Actualizar imágenes y reiniciar"
     echo "  health        Verificar salud de los servicios"
     echo "  help          Mostrar esta ayuda"
@@ -223,6 +225,44 @@ restore_data() {
     start_services
 }
 
+# Función para exportar la colección (chunks, metadatos y embeddings) a un snapshot
+export_snapshot() {
+    local name="${1:-snapshot_$(date +%Y%m%d_%H%M%S).snap}"
+    mkdir -p ./data/snapshots
+    
+    echo -e "${BLUE}📦 Exportando la colección a data/snapshots/$(basename "$name")...${NC}"
+    run_compose exec rag-app python snapshot.py export "/app/data/snapshots/$(basename "$name")"
+    echo -e "${GREEN}✅ Snapshot exportado${NC}"
+}
+
+# Función para importar un snapshot en la colección
+import_snapshot() {
+    local snapshot="${1:-}"
+    if [[ -z "$snapshot" ]]; then
+        echo -e "${RED}❌ Especifica el snapshot${NC}"
+        echo "Uso: $0 import <fichero en data/snapshots> [--replace]"
+        exit 1
+    fi
+    
+    if [[ ! -f "./data/snapshots/$(basename "$snapshot")" ]]; then
+        echo -e "${RED}❌ Snapshot no encontrado: data/snapshots/$(basename "$snapshot")${NC}"
+        exit 1
+    fi
+    
+    if [[ "${2:-}" == "--replace" ]]; then
+        echo -e "${YELLOW}⚠️  Esto eliminará los documentos actuales. ¿Continuar? (y/N)${NC}"
+        read -r response
+        if [[ ! "$response" =~ ^[Yy]$ ]]; then
+            echo "Operación cancelada"
+            exit 0
+        fi
+    fi
+    
+    echo -e "${BLUE}📥 Importando data/snapshots/$(basename "$snapshot")...${NC}"
+    run_compose exec rag-app python snapshot.py import "/app/data/snapshots/$(basename "$snapshot")" ${2:+"$2"}
+    echo -e "${GREEN}✅ Snapshot importado${NC}"
+}
+
 # Función para limpiar
 clean_system() {
     echo -e "${YELLOW}⚠️  Esto eliminará todos los contenedores y volúmenes. ¿Continuar? (y/N)${NC}"
@@ -280,6 +320,12 @@ main() {
         restore)
             restore_data "${2:-}"
             ;;
+        export)
+            export_snapshot "${2:-}"
+            ;;
+        import)
+            import_snapshot "${2:-}" "${3:-}"
+            ;;
         update)
             echo -e "${BLUE}🔄 Actualizando imágenes...${NC}"
             run_compose pull
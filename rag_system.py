@@ -1,128 +1,802 @@
 import os
-import ollama
-from typing import List, Dict, Any
-from milvus_client import MilvusClient
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Any, Iterable, Iterator, Optional, Sequence, Set, Tuple, Union
+from vector_store import (
+    VectorStore, DEFAULT_NAMESPACE, create_vector_store, chunk_id, document_hash, filter_key, namespace_list,
+    normalize_filters, normalize_tags, to_timestamp
+)
+from embedding_backends import EmbeddingBackend
+from ingestion import IngestionPipeline
+from answer_cache import SemanticAnswerCache
+from sparse_index import NamespacedBM25Index
+from context_budget import ContextBuilder
+from reranking import CrossEncoderReranker
+from chunking import TextChunker, Document
+from metrics import get_metrics, traced
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
 from dotenv import load_dotenv
+import numpy as np
 import logging
 
+if TYPE_CHECKING:
+    import ollama
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
 # Cargar variables de entorno
 load_dotenv()
 
+NO_CONTEXT_ANSWER = "No se encontró información relevante para responder tu pregunta."
+RETRIEVAL_ONLY_ANSWER = ("El modelo de lenguaje no está disponible en este momento. "
+                         "Estos son los fragmentos más relevantes encontrados:")
+# Fragmentos que se incluyen en el texto de una respuesta solo con la recuperación
+RETRIEVAL_ONLY_PASSAGES = 3
+
+# Modos de recuperación para RETRIEVAL_MODE
+RETRIEVAL_MODES = ("dense", "sparse", "hybrid")
+
+# Instrucciones del prompt: siempre el mismo mensaje de sistema al principio, para que Ollama
+# reutilice de una pregunta a otra la parte ya calculada de su cache KV
+SYSTEM_PROMPT = ("Eres un asistente útil que responde preguntas basándose en el contexto proporcionado. "
+                 "Responde a la pregunta de manera precisa y detallada. "
+                 "Si la información no está en el contexto, indícalo claramente.")
+# Tokens del prompt además del contexto (instrucciones, plantilla del chat y pregunta), para
+# comprobar que el contexto y la respuesta caben en OLLAMA_NUM_CTX
+PROMPT_OVERHEAD_TOKENS = 100
+
+
+def parse_keep_alive(value: Optional[str]) -> Union[None, float, str]:
+    """Valor de keep_alive para Ollama: segundos si es un número ("-1" = siempre cargado,
+    "0" = descargar al terminar), una duración como "30m" o "24h", o None si no se define"""
+    if value is None or not value.strip():
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value.strip()
+
+# Espacio o espacios de nombres de una consulta (None es el espacio por defecto)
+Namespaces = Union[None, str, Sequence[str]]
+
+# Con filtro, BM25 (que no conoce los metadatos) busca este múltiplo de top_k candidatos
+FILTERED_SPARSE_CANDIDATES = 4
+
+
+def ollama_unavailable(error: Exception) -> bool:
+    """True si el error indica que Ollama no responde (red, timeout o 5xx), no una petición inválida"""
+    if isinstance(error, (CircuitOpenError, ConnectionError, TimeoutError)):
+        return True
+    import httpx
+    if isinstance(error, httpx.TransportError):
+        return True
+    return getattr(error, "status_code", 0) >= 500
+
 class RAGSystem:
     """Sistema RAG (Retrieval-Augmented Generation) con Milvus y Ollama"""
     
-    def __init__(self):
+    def __init__(self, milvus_client: VectorStore = None, ollama_client: "ollama.Client" = None,
+                 warm_start: Optional[bool] = None):
+        # Perfil de arranque: segundos por fase, en el orden en que se ejecutan
+        self.startup_profile: Dict[str, float] = {}
+        self._ready = threading.Event()
+        self._startup_error: Optional[Exception] = None
+        self._warmup_thread: Optional[threading.Thread] = None
+        started = time.perf_counter()
+        
         # Configurar Ollama
         self.ollama_host = os.getenv('OLLAMA_HOST', 'localhost')
         self.ollama_port = os.getenv('OLLAMA_PORT', '11434')
         self.ollama_model = os.getenv('OLLAMA_MODEL', 'qwen3:4b')
         
-        # Configurar cliente Ollama
-        self.ollama_client = ollama.Client(host=f'http://{self.ollama_host}:{self.ollama_port}')
+        # Parámetros de generación
+        self.generation_options = {
+            "temperature": 0.7,
+            "num_predict": 500
+        }
+        # Ventana de contexto del modelo (sin definir, la de Ollama). Tiene que ser la misma en
+        # todas las peticiones: si cambia, Ollama vuelve a cargar el modelo y pierde su cache
+        num_ctx = int(os.getenv('OLLAMA_NUM_CTX', '0'))
+        if num_ctx > 0:
+            self.generation_options["num_ctx"] = num_ctx
+        # Tiempo que Ollama mantiene el modelo cargado tras cada petición (sin definir, el
+        # OLLAMA_KEEP_ALIVE del servidor de Ollama, 5 minutos por defecto)
+        self.ollama_keep_alive = parse_keep_alive(os.getenv('OLLAMA_KEEP_ALIVE'))
+        # Cargar el modelo y el prefijo fijo del prompt en Ollama al arrancar
+        self.ollama_prewarm = os.getenv('OLLAMA_PREWARM', 'true').lower() == 'true'
         
-        # Inicializar cliente de Milvus
-        self.milvus_client = MilvusClient()
+        # Cliente Ollama (se puede inyectar uno ya creado; si no, se crea en el primer uso)
+        self._ollama_client = ollama_client
+        # Reintentos con jitter de los errores transitorios y circuito que deja de llamar a un
+        # Ollama caído; mientras tanto se responde solo con la recuperación (OLLAMA_FALLBACK)
+        self.ollama_retry = RetryPolicy.from_env('OLLAMA', retry_if=ollama_unavailable, name="Ollama")
+        self.ollama_breaker = CircuitBreaker.from_env('OLLAMA', is_failure=ollama_unavailable, name="Ollama")
+        self.retrieval_fallback = os.getenv('OLLAMA_FALLBACK', 'true').lower() == 'true'
         
-        # Conectar y configurar Milvus
-        self.setup_milvus()
+        # Inicializar el almacén de vectores (Milvus, o local con VECTOR_STORE=local)
+        with self._phase("vector_store"):
+            self.milvus_client = milvus_client or create_vector_store()
+        
+        # División en chunks (en caracteres, o en tokens del modelo de embeddings con CHUNK_UNIT=tokens)
+        self.chunker = TextChunker.from_env(self.milvus_client.encoder)
+        
+        # Cache semántica de respuestas (opcional, con ANSWER_CACHE_ENABLED=true)
+        self.answer_cache = SemanticAnswerCache.from_env(self.milvus_client.embedding_dim)
+        
+        # Preparación del contexto antes de generar (desactivable con CONTEXT_BUDGET_ENABLED=false)
+        self.context_builder = ContextBuilder.from_env(self.milvus_client.encode, self.milvus_client.get_embeddings)
+        if num_ctx > 0 and self.context_builder is not None:
+            needed = self.context_builder.token_budget + self.generation_options["num_predict"] + PROMPT_OVERHEAD_TOKENS
+            if self.context_builder.token_budget <= 0 or needed > num_ctx:
+                # Ollama recortaría el principio del prompt: las instrucciones y la parte reutilizable
+                logger.warning(f"OLLAMA_NUM_CTX={num_ctx} puede no bastar para el contexto "
+                               f"(CONTEXT_TOKEN_BUDGET={self.context_builder.token_budget}) y la respuesta")
+        
+        # Reordenación de los candidatos con un cross-encoder (opcional, con RERANK_ENABLED=true)
+        self.reranker = CrossEncoderReranker.from_env()
+        
+        # Recuperación densa (por defecto), léxica (BM25) o híbrida con fusión por rangos recíprocos
+        self.retrieval_mode = os.getenv('RETRIEVAL_MODE', 'dense').lower()
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperación no soportado: {self.retrieval_mode} (opciones: {', '.join(RETRIEVAL_MODES)})")
+        if self.retrieval_mode != "dense" and not os.getenv('SPARSE_INDEX_DIR'):
+            # Sin índice guardado cada arranque lo reconstruiría recorriendo toda la colección
+            raise ValueError(f"RETRIEVAL_MODE={self.retrieval_mode} necesita SPARSE_INDEX_DIR para guardar el índice BM25")
+        self.rrf_k = int(os.getenv('HYBRID_RRF_K', '60'))
+        # Candidatos que se piden a cada búsqueda por cada documento del top_k final
+        self.hybrid_candidates = int(os.getenv('HYBRID_CANDIDATES', '1'))
+        with self._phase("sparse_index"):
+            self.sparse_index = NamespacedBM25Index.from_env() if self.retrieval_mode != "dense" else None
+        self._sparse_executor: Optional[ThreadPoolExecutor] = None
+        
+        # Conectar y configurar Milvus y cargar los modelos. Con RAG_WARM_START=true se hace en
+        # un hilo en segundo plano y las llamadas que lo necesitan esperan a que termine
+        if warm_start is None:
+            warm_start = os.getenv('RAG_WARM_START', 'false').lower() == 'true'
+        timeout = float(os.getenv('RAG_READY_TIMEOUT', '0'))
+        self.ready_timeout = timeout if timeout > 0 else None
+        if warm_start:
+            self._warmup_thread = threading.Thread(
+                target=self._warm_up, args=(started, False), name="rag-warmup", daemon=True
+            )
+            self._warmup_thread.start()
+        else:
+            self._warm_up(started, True)
+    
+    @property
+    def ollama_client(self) -> "ollama.Client":
+        """Cliente de Ollama, creado en el primer uso (importar ollama y httpx cuesta ~200 ms)
+        
+        Mantiene un pool de conexiones keep-alive (OLLAMA_POOL_SIZE, por defecto una por hilo de
+        consultas del servidor) y timeouts por llamada: OLLAMA_CONNECT_TIMEOUT para conectar y
+        OLLAMA_TIMEOUT como máximo entre dos lecturas (en streaming, entre tokens).
+        """
+        if self._ollama_client is None:
+            import ollama
+            pool_size = int(os.getenv('OLLAMA_POOL_SIZE', os.getenv('RAG_QUERY_THREADS', '16')))
+            self._ollama_client = ollama.Client(**self.ollama_client_options(pool_size))
+        return self._ollama_client
+    
+    def ollama_client_options(self, pool_size: int, keepalive_connections: Optional[int] = None) -> Dict[str, Any]:
+        """Argumentos de ollama.Client / ollama.AsyncClient: host, timeouts y pool de `pool_size` conexiones
+
+        keepalive_connections limita las conexiones libres que se conservan abiertas
+        (por defecto todas las del pool).
+        """
+        import httpx
+        return {
+            "host": self.ollama_url,
+            "timeout": httpx.Timeout(
+                float(os.getenv('OLLAMA_TIMEOUT', '120')),
+                connect=float(os.getenv('OLLAMA_CONNECT_TIMEOUT', '5')),
+            ),
+            "limits": httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=keepalive_connections or pool_size,
+                keepalive_expiry=float(os.getenv('OLLAMA_POOL_KEEPALIVE', '60')),
+            ),
+        }
+    
+    @ollama_client.setter
+    def ollama_client(self, client: "ollama.Client"):
+        self._ollama_client = client
+    
+    @property
+    def ollama_url(self) -> str:
+        """URL de Ollama (la del cliente inyectado, si lo hay)"""
+        client = getattr(self._ollama_client, "_client", None)
+        if client is not None:
+            return str(client.base_url)
+        return f'http://{self.ollama_host}:{self.ollama_port}'
+    
+    @contextmanager
+    def _phase(self, name: str):
+        """Medir una fase del arranque (las llamadas posteriores, como reset_database, no cuentan)"""
+        if self._ready.is_set():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_profile[name] = self.startup_profile.get(name, 0.0) + time.perf_counter() - start
+    
+    def _warm_up(self, started: float, raise_errors: bool):
+        """Configurar Milvus y cargar los modelos; al terminar (o fallar) el sistema queda listo"""
+        try:
+            self.setup_milvus()
+            
+            # El encoder (con una primera pasada, que inicializa el runtime) y el tokenizador
+            # del contexto se cargan ahora y no en la primera consulta
+            encoder = self.milvus_client.encoder
+            if isinstance(encoder, EmbeddingBackend):
+                with self._phase("encoder"):
+                    encoder.load()
+                    encoder.encode(["warm-up"])
+            if self.context_builder is not None:
+                with self._phase("context_tokenizer"):
+                    self.context_builder.tokens.exact
+            if self.reranker is not None:
+                with self._phase("reranker"):
+                    self.reranker.load()
+            if self.ollama_prewarm:
+                with self._phase("ollama"):
+                    self.prewarm_ollama()
+            
+            self.startup_profile["total"] = time.perf_counter() - started
+            phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_profile.items())
+            logger.info(f"Sistema RAG listo ({phases})")
+        except Exception as e:
+            self._startup_error = e
+            if raise_errors:
+                raise
+        finally:
+            self._ready.set()
+    
+    @property
+    def ready(self) -> bool:
+        """True cuando el arranque ha terminado sin errores"""
+        return self._ready.is_set() and self._startup_error is None
+    
+    def wait_ready(self, timeout: Optional[float] = None):
+        """Esperar a que termine el arranque en segundo plano (RAG_WARM_START)
+        
+        Lanza TimeoutError si no termina en `timeout` segundos (por defecto RAG_READY_TIMEOUT,
+        sin límite si no está definido) y RuntimeError si el arranque falló.
+        """
+        if not self._ready.is_set() and threading.current_thread() is not self._warmup_thread:
+            if not self._ready.wait(timeout if timeout is not None else self.ready_timeout):
+                raise TimeoutError("El sistema RAG todavía se está iniciando")
+        if self._startup_error is not None:
+            raise RuntimeError(f"El arranque del sistema RAG falló: {self._startup_error}") from self._startup_error
     
     def setup_milvus(self):
         """Configurar Milvus"""
         try:
-            self.milvus_client.connect()
-            self.milvus_client.create_collection()
-            self.milvus_client.create_index()
+            with self._phase("connect"):
+                self.milvus_client.connect()
+            with self._phase("collection"):
+                self.milvus_client.create_collection()
+            # Si la colección ya tiene índice se adopta sin volver a pedir create_index a Milvus
+            with self._phase("index"):
+                self.milvus_client.create_index()
+            
+            # Cargar la colección una sola vez, no en cada búsqueda
+            with self._phase("load"):
+                self.milvus_client.load_collection()
+            if os.getenv('MILVUS_PREWARM', 'false').lower() == 'true':
+                with self._phase("prewarm"):
+                    self.milvus_client.warmup()
+            
+            # Sin índice BM25 guardado se construye a partir de los chunks que ya hay
+            if self.sparse_index is not None and not len(self.sparse_index):
+                with self._phase("sparse_index"):
+                    self._rebuild_sparse_index()
+            
             logger.info("Milvus configurado exitosamente")
         except Exception as e:
             logger.error(f"Error configurando Milvus: {e}")
             raise
     
-    def add_documents(self, documents: List[str]):
-        """Añadir documentos al sistema"""
+    @traced("add_documents")
+    def add_documents(self, documents: List[str], source: str = "", namespace: Optional[str] = None,
+                      date: Any = None, tags: Optional[List[str]] = None) -> int:
+        """Añadir documentos al sistema y devolver el número de chunks insertados
+        
+        Los IDs de los chunks son deterministas, así que añadir otra vez el mismo
+        documento sustituye sus chunks en lugar de duplicarlos. Con `namespace` (p. ej. el
+        inquilino) los documentos solo se encuentran al consultar ese espacio de nombres.
+        `source`, `date` y `tags` se guardan en cada chunk para filtrar las búsquedas.
+        """
+        self.wait_ready()
         try:
+            metrics = get_metrics()
             # Dividir documentos en chunks si son muy largos
-            chunks = []
-            for doc in documents:
-                chunks.extend(self._split_text(doc))
+            with metrics.span("chunking"):
+                chunks = []
+                for doc in documents:
+                    chunks.extend(self._make_chunks(doc, source=source, namespace=namespace, date=date, tags=tags))
             
-            # Insertar en Milvus
-            self.milvus_client.insert_documents(chunks)
+            # Generar los embeddings e insertar en Milvus
+            embeddings = self.milvus_client.encode_documents([chunk["text"] for chunk in chunks])
+            with metrics.span("insert"):
+                self.milvus_client.insert_chunks(chunks, embeddings, flush=True)
+            with metrics.span("sparse_index"):
+                self._index_sparse(chunks)
+            self._invalidate_answers()
             logger.info(f"Añadidos {len(chunks)} chunks de documentos")
+            return len(chunks)
             
         except Exception as e:
             logger.error(f"Error añadiendo documentos: {e}")
             raise
     
-    def _split_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        """Dividir texto en chunks más pequeños"""
-        chunks = []
-        start = 0
-        
-        while start < len(text):
-            end = start + chunk_size
-            chunk = text[start:end]
-            
-            # Intentar cortar en un punto natural (espacio, punto, etc.)
-            if end < len(text):
-                last_space = chunk.rfind(' ')
-                last_period = chunk.rfind('.')
-                last_newline = chunk.rfind('\n')
+    @traced("add_documents_stream")
+    def add_documents_stream(self, documents: Iterable[Document], batch_size: int = 256,
+                             flush_every: Optional[int] = None, source: str = "",
+                             namespace: Optional[str] = None, date: Any = None,
+                             tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Añadir documentos en streaming (de un iterador) con memoria acotada
+        
+        Los chunks se generan de forma perezosa, se codifican en lotes de batch_size y se
+        insertan mientras se codifica el lote siguiente. El flush se hace al final o cada
+        flush_every chunks. Cada documento puede ser un texto, un fichero abierto o una
+        ruta (Path): los ficheros se trocean leyéndolos por bloques y su ID es su nombre.
+        Devuelve estadísticas de la ingesta (incluye chunks/s).
+        """
+        self.wait_ready()
+        try:
+            pipeline = IngestionPipeline(
+                self.milvus_client,
+                lambda doc: self._iter_chunks(doc, source=source, namespace=namespace, date=date, tags=tags),
+                batch_size=batch_size,
+                flush_every=flush_every,
+                on_insert=self._index_sparse
+            )
+            try:
+                return pipeline.run(documents)
+            finally:
+                # Aunque la ingesta falle a medias, el corpus puede haber cambiado
+                self._invalidate_answers()
+                self._save_sparse()
+            
+        except Exception as e:
+            logger.error(f"Error añadiendo documentos: {e}")
+            raise
+    
+    @traced("sync_documents")
+    def sync_documents(self, documents: Iterable[Tuple[str, Document]], source: str = "", batch_size: int = 256,
+                       flush_every: Optional[int] = None, namespace: Optional[str] = None,
+                       date: Any = None, tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Sincronizar la colección con un corpus de pares (document_id, texto)
+        
+        El texto también puede ser un fichero abierto o una ruta (se lee por bloques).
+        
+        Solo se generan embeddings e insertan los chunks que no están ya guardados
+        (documentos nuevos o modificados). Los chunks de ese `source` que no aparecen
+        en el corpus (documentos borrados o versiones anteriores) se eliminan. Con
+        `namespace` se sincroniza solo ese espacio de nombres. `date` y `tags` no forman
+        parte del ID: si solo cambian ellos, los chunks se consideran sin cambios.
+        Devuelve las estadísticas de la ingesta más `unchanged` y `deleted`.
+        """
+        self.wait_ready()
+        try:
+            namespace = namespace or DEFAULT_NAMESPACE
+            existing = self.milvus_client.existing_chunks(source, namespace)
+            seen: Set[int] = set()
+            
+            def split(document: Tuple[str, Document]) -> Iterator[Dict[str, Any]]:
+                document_id, text = document
+                for chunk in self._iter_chunks(text, document_id=document_id, source=source, namespace=namespace,
+                                               date=date, tags=tags):
+                    seen.add(chunk["id"])
+                    yield chunk
+            
+            pipeline = IngestionPipeline(
+                self.milvus_client,
+                split,
+                batch_size=batch_size,
+                flush_every=flush_every,
+                keep=lambda chunk: chunk["id"] not in existing,
+                final_flush=False,
+                on_insert=self._index_sparse
+            )
+            try:
+                stats = pipeline.run(documents)
                 
-                # Usar el último separador natural encontrado
-                cut_point = max(last_space, last_period, last_newline)
-                if cut_point > start + chunk_size // 2:  # Solo si no está muy al principio
-                    chunk = text[start:start + cut_point + 1]
-                    end = start + cut_point + 1
+                stale = [i for i in existing if i not in seen]
+                stats["unchanged"] = stats["skipped"]
+                stats["deleted"] = self.milvus_client.delete_chunks(stale)
+                if self.sparse_index is not None:
+                    self.sparse_index.remove(stale)
+                # Un único flush para las inserciones pendientes y los borrados
+                if stats["chunks"] or stale:
+                    self.milvus_client.flush()
+                    stats["flushes"] += 1
+            finally:
+                self._invalidate_answers()
+                self._save_sparse()
             
-            chunks.append(chunk.strip())
-            start = max(end - overlap, start + 1)  # Evitar bucles infinitos
+            logger.info(
+                f"Sincronización de '{source}': {stats['chunks']} chunks nuevos, "
+                f"{stats['unchanged']} sin cambios, {stats['deleted']} borrados"
+            )
+            return stats
             
-            if start >= len(text):
-                break
+        except Exception as e:
+            logger.error(f"Error sincronizando documentos: {e}")
+            raise
+    
+    def _index_sparse(self, chunks: List[Dict[str, Any]]):
+        """Añadir al índice BM25 los chunks recién insertados (si está activo)"""
+        if self.sparse_index is not None:
+            self.sparse_index.add(chunks)
+    
+    def _save_sparse(self):
+        if self.sparse_index is not None:
+            self.sparse_index.save()
+    
+    def rebuild_sparse_index(self) -> int:
+        """Reconstruir el índice BM25 con todos los chunks del almacén de vectores"""
+        self.wait_ready()
+        return self._rebuild_sparse_index()
+    
+    def _rebuild_sparse_index(self) -> int:
+        try:
+            self.sparse_index.clear()
+            for namespace in self.milvus_client.namespaces():
+                for chunks in self.milvus_client.iter_chunks(output_fields=["text"], namespace=namespace):
+                    self.sparse_index.add({**chunk, "namespace": namespace} for chunk in chunks)
+            self.sparse_index.save()
+            logger.info(f"Índice BM25 reconstruido con {len(self.sparse_index)} chunks")
+            return len(self.sparse_index)
+        except Exception as e:
+            logger.error(f"Error reconstruyendo el índice BM25: {e}")
+            raise
+    
+    def _invalidate_answers(self):
+        """Descartar las respuestas cacheadas porque el corpus ha cambiado"""
+        if self.answer_cache is not None:
+            self.answer_cache.clear()
+    
+    def _make_chunks(self, text: str, document_id: Optional[str] = None, source: str = "",
+                     namespace: Optional[str] = None, date: Any = None,
+                     tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Dividir un documento en chunks con su ID estable y sus metadatos"""
+        return list(self._iter_chunks(text, document_id, source, namespace, date, tags))
+    
+    def _iter_chunks(self, document: Document, document_id: Optional[str] = None,
+                     source: str = "", namespace: Optional[str] = None, date: Any = None,
+                     tags: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Generar los chunks de un texto, fichero abierto o ruta a medida que se trocea
         
-        return [chunk for chunk in chunks if chunk]  # Filtrar chunks vacíos
+        Sin document_id, un texto se identifica por el hash de su contenido (el mismo
+        texto siempre produce los mismos IDs) y un fichero por su nombre.
+        """
+        if document_id is None:
+            if isinstance(document, str):
+                document_id = document_hash(document)
+            elif isinstance(document, os.PathLike):
+                document_id = os.fspath(document)
+            elif isinstance(getattr(document, "name", None), str):
+                document_id = document.name
+            else:
+                raise ValueError("Un fichero sin nombre necesita document_id")
+        namespace = namespace or DEFAULT_NAMESPACE
+        date, tags = to_timestamp(date), normalize_tags(tags)
+        for offset, chunk in self.chunker.iter_spans(document):
+            yield {
+                "id": chunk_id(document_id, chunk, namespace, offset),
+                "text": chunk,
+                "source": source,
+                "document_id": document_id,
+                "chunk_offset": offset,
+                "date": date,
+                "tags": tags,
+                "namespace": namespace,
+            }
     
-    def retrieve_context(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """Recuperar contexto relevante para una consulta"""
+    def _split_text(self, text: str, chunk_size: Optional[int] = None, overlap: Optional[int] = None) -> List[str]:
+        """Dividir texto en chunks más pequeños"""
+        return [chunk for _, chunk in self._split_text_spans(text, chunk_size, overlap)]
+    
+    def _split_text_spans(self, text: str, chunk_size: Optional[int] = None,
+                          overlap: Optional[int] = None) -> List[Tuple[int, str]]:
+        """Dividir texto en chunks devolviendo también la posición de inicio de cada uno"""
+        chunker = self.chunker
+        if chunk_size is not None or overlap is not None:
+            chunker = TextChunker(
+                chunk_size if chunk_size is not None else chunker.chunk_size,
+                overlap if overlap is not None else chunker.overlap,
+                chunker.unit,
+                chunker.tokenizer,
+            )
+        return chunker.split(text)
+    
+    @traced("retrieve_context")
+    def retrieve_context(self, query: str, top_k: int = 5, namespace: Namespaces = None,
+                         filters: Optional[Dict[str, Any]] = None,
+                         output_fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Recuperar contexto relevante para una consulta
+        
+        Solo del espacio o espacios de nombres indicados y entre los chunks que cumplen
+        `filters` (source, date_from, date_to y tags; ver vector_store.normalize_filters).
+        Con `output_fields` cada resultado trae solo esos campos además de id y score.
+        """
+        self.wait_ready()
         try:
-            similar_docs = self.milvus_client.search_similar(query, top_k)
+            similar_docs = self._search([query], top_k, namespaces=namespace_list(namespace),
+                                        filters=normalize_filters(filters), output_fields=output_fields)[0]
             logger.info(f"Recuperados {len(similar_docs)} documentos relevantes")
             return similar_docs
         except Exception as e:
             logger.error(f"Error recuperando contexto: {e}")
             raise
     
-    def generate_response(self, query: str, context_docs: List[Dict[str, Any]]) -> str:
-        """Generar respuesta usando OpenAI GPT"""
+    @traced("retrieve_context")
+    def retrieve_context_batch(self, queries: List[str], top_k: int = 5, namespace: Namespaces = None,
+                               filters: Optional[Dict[str, Any]] = None,
+                               output_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Recuperar contexto para varias consultas con una sola búsqueda en Milvus"""
+        self.wait_ready()
         try:
-            # Construir el contexto
-            context = "\n\n".join([doc["text"] for doc in context_docs])
+            similar_docs = self._search(queries, top_k, namespaces=namespace_list(namespace),
+                                        filters=normalize_filters(filters), output_fields=output_fields)
+            logger.info(f"Recuperados documentos relevantes para {len(queries)} consultas")
+            return similar_docs
+        except Exception as e:
+            logger.error(f"Error recuperando contexto: {e}")
+            raise
+    
+    def _search(self, queries: List[str], top_k: int, embeddings=None,
+                namespaces: Sequence[str] = (DEFAULT_NAMESPACE,), filters: Optional[Dict[str, Any]] = None,
+                output_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Buscar según retrieval_mode en esos espacios de nombres y con ese filtro (ya normalizado)
+        
+        `embeddings` son los de las consultas si ya se calcularon. Con reranker se piden
+        más candidatos y el cross-encoder elige los top_k.
+        """
+        if self.reranker is None:
+            return self._retrieve(queries, top_k, embeddings, namespaces, filters, output_fields)
+        
+        # El cross-encoder necesita el texto aunque no se haya pedido
+        fields = output_fields if output_fields is not None else self.milvus_client.search_fields
+        fetch_fields = fields if "text" in fields else [*fields, "text"]
+        candidates = self._retrieve(queries, self.reranker.candidates(top_k), embeddings, namespaces, filters,
+                                    fetch_fields)
+        with get_metrics().span("rerank"):
+            results = self.reranker.rerank_batch(queries, candidates, top_k)
+        if "text" not in fields:
+            results = [[{key: value for key, value in doc.items() if key != "text"} for doc in docs] for docs in results]
+        return results
+    
+    def _retrieve(self, queries: List[str], top_k: int, embeddings=None,
+                  namespaces: Sequence[str] = (DEFAULT_NAMESPACE,), filters: Optional[Dict[str, Any]] = None,
+                  output_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Los top_k de la búsqueda densa, BM25 o híbrida (según retrieval_mode)"""
+        metrics = get_metrics()
+        fields = output_fields if output_fields is not None else self.milvus_client.search_fields
+        if self.retrieval_mode == "sparse":
+            # BM25 no sabe filtrar: se piden más candidatos y se descartan al leer sus campos
+            candidates = top_k * FILTERED_SPARSE_CANDIDATES if filters else top_k
+            with metrics.span("sparse_search"):
+                hits = self.sparse_index.search_batch(queries, candidates, namespaces)
+            return [docs[:top_k] for docs in self._with_texts(hits, namespaces, filters, fields)]
+        
+        if self.retrieval_mode == "dense":
+            candidates = top_k
+        else:
+            # Híbrida: la búsqueda léxica corre en paralelo con la densa, con más candidatos
+            candidates = top_k * self.hybrid_candidates
+            if self._sparse_executor is None:
+                self._sparse_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv('HYBRID_THREADS', '4')), thread_name_prefix="rag-sparse"
+                )
+            sparse_future = self._sparse_executor.submit(self._sparse_search, queries, candidates, namespaces)
+        
+        if embeddings is None:
+            dense = self.milvus_client.search_similar_batch(queries, candidates, namespaces, filters, fields)
+        else:
+            with metrics.span("vector_search"):
+                dense = self.milvus_client.search_by_embeddings(embeddings, candidates, namespaces, filters, fields)
+        
+        if self.retrieval_mode == "dense":
+            return dense
+        sparse = sparse_future.result()
+        with metrics.span("fusion"):
+            return self._fuse(dense, sparse, top_k, namespaces, filters, fields)
+    
+    def _sparse_search(self, queries: List[str], top_k: int, namespaces: Sequence[str]) -> List[List[Tuple[int, float]]]:
+        with get_metrics().span("sparse_search"):
+            return self.sparse_index.search_batch(queries, top_k, namespaces)
+    
+    def _with_texts(self, sparse: List[List[Tuple[int, float]]], namespaces: Sequence[str],
+                    filters: Optional[Dict[str, Any]], fields: List[str]) -> List[List[Dict[str, Any]]]:
+        """Completar con su texto (o los campos pedidos) los resultados de BM25 (chunk_id, score)"""
+        ids = {chunk_id for hits in sparse for chunk_id, _ in hits}
+        chunks = self.milvus_client.get_chunks(ids, output_fields=fields, namespaces=namespaces, filters=filters)
+        return [
+            [
+                {**chunks[chunk_id], "score": score, "id": chunk_id}
+                for chunk_id, score in hits if chunk_id in chunks
+            ]
+            for hits in sparse
+        ]
+    
+    def _fuse(self, dense: List[List[Dict[str, Any]]], sparse: List[List[Tuple[int, float]]],
+              top_k: int, namespaces: Sequence[str], filters: Optional[Dict[str, Any]] = None,
+              fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Fusión por rangos recíprocos (RRF): score = Σ 1 / (rrf_k + rango) en cada lista
+        
+        La búsqueda densa ya viene filtrada; con filtro, los candidatos de BM25 que no lo
+        cumplen se descartan antes de quedarse con los top_k.
+        """
+        fused = []
+        missing: Set[int] = set()
+        for dense_docs, sparse_hits in zip(dense, sparse):
+            scores: Dict[int, float] = {}
+            docs = {doc["id"]: doc for doc in dense_docs}
+            for rank, doc in enumerate(dense_docs, 1):
+                scores[doc["id"]] = scores.get(doc["id"], 0.0) + 1 / (self.rrf_k + rank)
+            for rank, (chunk_id, _) in enumerate(sparse_hits, 1):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (self.rrf_k + rank)
+            ranking = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            best = ranking if filters else ranking[:top_k]
+            missing.update(chunk_id for chunk_id, _ in best if chunk_id not in docs)
+            fused.append((best, docs))
+        
+        # Los textos de los chunks que solo encontró BM25 se leen en una sola consulta
+        chunks = {}
+        if missing:
+            chunks = self.milvus_client.get_chunks(
+                missing, output_fields=fields if fields is not None else self.milvus_client.search_fields,
+                namespaces=namespaces, filters=filters
+            )
+        results = []
+        for best, docs in fused:
+            results.append([
+                {**(docs.get(chunk_id) or chunks[chunk_id]), "score": score, "id": chunk_id}
+                for chunk_id, score in best if chunk_id in docs or chunk_id in chunks
+            ][:top_k])
+        return results
+    
+    @traced("retrieve")
+    def retrieve_batch(self, questions: List[str], top_k: int = 5, namespace: Namespaces = None,
+                       filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Recuperar contexto para varias preguntas, consultando antes la cache de respuestas
+        
+        Devuelve un dict por pregunta con "context_docs", o con "cached" si ya hay una
+        respuesta para una pregunta equivalente (en los mismos espacios de nombres y con el
+        mismo filtro), y el "query_embedding" de la pregunta si se calculó (para la cache y
+        para el MMR del contexto). Se completa con answer_retrieved.
+        """
+        self.wait_ready()
+        namespaces = namespace_list(namespace)
+        filters = normalize_filters(filters)
+        # Ámbito de la cache: solo se reutilizan respuestas de los mismos documentos visibles
+        scope = (tuple(namespaces), filter_key(filters)) if filters else tuple(namespaces)
+        if self.answer_cache is None and self.context_builder is None:
+            contexts = self.retrieve_context_batch(questions, top_k, namespaces, filters)
+            return [{"top_k": top_k, "scope": scope, "query_embedding": None, "context_docs": docs, "cached": None}
+                    for docs in contexts]
+        
+        try:
+            # El embedding de la pregunta sirve para la búsqueda, la cache y el MMR del contexto
+            embeddings = self.milvus_client.encode(questions)
+            retrieved = [
+                {
+                    "top_k": top_k,
+                    "scope": scope,
+                    "query_embedding": embedding,
+                    "generation": None,
+                    "context_docs": None,
+                    "cached": None
+                }
+                for embedding in embeddings
+            ]
+            if self.answer_cache is not None:
+                with get_metrics().span("answer_cache"):
+                    for item in retrieved:
+                        item["cached"] = self.answer_cache.lookup(item["query_embedding"], top_k, scope)
+                # Después de las consultas, que ya han visto las invalidaciones de otros procesos
+                generation = self.answer_cache.generation
+                for item in retrieved:
+                    item["generation"] = generation
             
-            # Construir el prompt
-            prompt = f"""Basándote en el siguiente contexto, responde a la pregunta de manera precisa y detallada.
-
-Contexto:
+            pending = [i for i, item in enumerate(retrieved) if item["cached"] is None]
+            if pending:
+                contexts = self._search([questions[i] for i in pending], top_k, embeddings[pending], namespaces, filters)
+                for i, docs in zip(pending, contexts):
+                    retrieved[i]["context_docs"] = docs
+            
+            logger.info(f"Recuperado contexto para {len(pending)} consultas ({len(questions) - len(pending)} desde la cache)")
+            return retrieved
+        except Exception as e:
+            logger.error(f"Error recuperando contexto: {e}")
+            raise
+    
+    def _cache_answer(self, retrieved: Dict[str, Any], result: Dict[str, Any]):
+        """Guardar en la cache una respuesta generada a partir del contexto recuperado"""
+        if self.answer_cache is not None and result["sources"] and not result.get("degraded"):
+            self.answer_cache.store(retrieved["query_embedding"], retrieved["top_k"], result, retrieved["generation"],
+                                    retrieved["scope"])
+    
+    def _build_messages(self, query: str, context_docs: List[Dict[str, Any]],
+                        query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, str]]:
+        """Construir los mensajes de chat para Ollama"""
+        with get_metrics().span("prompt"):
+            return self._prompt_messages(query, context_docs, query_embedding)
+    
+    def _prompt_messages(self, query: str, context_docs: List[Dict[str, Any]],
+                         query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, str]]:
+        # Construir el contexto: sin solapes ni duplicados y dentro del presupuesto de tokens
+        if self.context_builder is None:
+            context = "\n\n".join([doc["text"] for doc in context_docs])
+        else:
+            context = self.context_builder.build(query, context_docs, query_embedding)
+        
+        # Todo lo fijo va en el mensaje de sistema; lo que cambia, después y de más a menos
+        # compartido: el contexto (el mismo en preguntas sobre los mismos chunks) y la pregunta al final
+        prompt = f"""Contexto:
 {context}
 
-Pregunta: {query}
-
-Respuesta:"""
-            
+Pregunta: {query}"""
+        
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def chat_request(self, query: str, context_docs: List[Dict[str, Any]],
+                     query_embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Argumentos de la llamada de chat a Ollama (modelo, mensajes, opciones de generación y keep_alive)
+        
+        `query_embedding` es el de la búsqueda, si se tiene: el contexto no vuelve a codificar la pregunta.
+        """
+        return self._chat_request(self._build_messages(query, context_docs, query_embedding))
+    
+    def _chat_request(self, messages: List[Dict[str, str]], **options) -> Dict[str, Any]:
+        request = {
+            "model": self.ollama_model,
+            "messages": messages,
+            "options": {**self.generation_options, **options} if options else self.generation_options,
+        }
+        if self.ollama_keep_alive is not None:
+            request["keep_alive"] = self.ollama_keep_alive
+        return request
+    
+    def prewarm_ollama(self) -> bool:
+        """Cargar el modelo en Ollama y dejar calculado en su cache el mensaje de sistema
+        
+        Genera un solo token a partir del mensaje de sistema con las mismas opciones
+        (num_ctx) y keep_alive que las preguntas, así que la primera no paga la carga del
+        modelo ni el prefijo. Si Ollama no responde solo se avisa: no impide arrancar.
+        """
+        try:
+            self.ollama_client.chat(**self._chat_request([{"role": "system", "content": SYSTEM_PROMPT}], num_predict=1))
+            logger.info(f"Modelo {self.ollama_model} precargado en Ollama")
+            return True
+        except Exception as e:
+            logger.warning(f"No se pudo precargar el modelo {self.ollama_model} en Ollama: {e}")
+            return False
+    
+    def generate_response(self, query: str, context_docs: List[Dict[str, Any]],
+                          query_embedding: Optional[np.ndarray] = None) -> str:
+        """Generar respuesta usando Ollama"""
+        try:
+            request = self.chat_request(query, context_docs, query_embedding)
+            metrics = get_metrics()
             # Llamar a Ollama
-            response = self.ollama_client.chat(
-                model=self.ollama_model,
-                messages=[
-                    {"role": "system", "content": "Eres un asistente útil que responde preguntas basándose en el contexto proporcionado. Si la información no está en el contexto, indícalo claramente."},
-                    {"role": "user", "content": prompt}
-                ],
-                options={
-                    "temperature": 0.7,
-                    "num_predict": 500
-                }
-            )
+            with metrics.span("generate"):
+                response = self.ollama_breaker.call(
+                    self.ollama_retry.call,
+                    self.ollama_client.chat,
+                    **request
+                )
+            metrics.observe_generation(self.ollama_model, response)
             
             return response['message']['content'].strip()
             
@@ -130,51 +804,256 @@ Respuesta:"""
             logger.error(f"Error generando respuesta: {e}")
             raise
     
-    def ask(self, question: str, top_k: int = 5) -> Dict[str, Any]:
-        """Método principal para hacer preguntas al sistema RAG"""
+    def generate_response_stream(self, query: str, context_docs: List[Dict[str, Any]],
+                                 query_embedding: Optional[np.ndarray] = None) -> Iterator[str]:
+        """Generar respuesta usando Ollama, devolviendo los tokens a medida que llegan"""
         try:
-            # Recuperar contexto relevante
-            context_docs = self.retrieve_context(question, top_k)
+            request = self.chat_request(query, context_docs, query_embedding)
+            metrics = get_metrics()
+            with metrics.span("generate"):
+                start = time.perf_counter()
+                # Solo se reintenta si falla antes del primer token
+                stream = self.ollama_breaker.call_stream(
+                    self.ollama_retry.call_stream,
+                    self.ollama_client.chat,
+                    **request,
+                    stream=True
+                )
+                
+                first_token = True
+                for part in stream:
+                    token = part['message']['content']
+                    if token:
+                        if first_token:
+                            metrics.observe("generate_first_token", time.perf_counter() - start)
+                            first_token = False
+                        yield token
+                    if part.get('done'):
+                        # El último fragmento trae los contadores de Ollama (tokens y duraciones)
+                        metrics.observe_generation(self.ollama_model, part)
             
+        except Exception as e:
+            logger.error(f"Error generando respuesta: {e}")
+            raise
+    
+    def _format_sources(self, context_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Preparar las fuentes que se devuelven al usuario"""
+        return [
+            {
+                "text": doc["text"][:200] + "..." if len(doc["text"]) > 200 else doc["text"],
+                "score": doc["score"]
+            }
+            for doc in context_docs
+        ]
+    
+    def _use_fallback(self, error: Exception) -> bool:
+        """Si ante este error de generación se responde solo con lo recuperado"""
+        return self.retrieval_fallback and ollama_unavailable(error)
+    
+    def _retrieval_only_answer(self, context_docs: List[Dict[str, Any]]) -> str:
+        """Texto de la respuesta cuando Ollama no está disponible: los mejores fragmentos"""
+        passages = [f"[{i}] {doc['text']}" for i, doc in enumerate(context_docs[:RETRIEVAL_ONLY_PASSAGES], 1)]
+        return "\n\n".join([RETRIEVAL_ONLY_ANSWER] + passages)
+    
+    def _error_result(self, question: str, error: Exception) -> Dict[str, Any]:
+        """Respuesta que se devuelve cuando falla una consulta"""
+        return {
+            "question": question,
+            "answer": f"Error procesando la consulta: {str(error)}",
+            "sources": []
+        }
+    
+    def ask_with_context(self, question: str, context_docs: List[Dict[str, Any]],
+                         query_embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Responder a una pregunta con un contexto ya recuperado"""
+        try:
             if not context_docs:
                 return {
                     "question": question,
-                    "answer": "No se encontró información relevante para responder tu pregunta.",
+                    "answer": NO_CONTEXT_ANSWER,
                     "sources": []
                 }
             
             # Generar respuesta
-            answer = self.generate_response(question, context_docs)
-            
-            # Preparar fuentes
-            sources = [
-                {
-                    "text": doc["text"][:200] + "..." if len(doc["text"]) > 200 else doc["text"],
-                    "score": doc["score"]
-                }
-                for doc in context_docs
-            ]
+            answer = self.generate_response(question, context_docs, query_embedding)
             
             return {
                 "question": question,
                 "answer": answer,
-                "sources": sources
+                "sources": self._format_sources(context_docs)
             }
             
         except Exception as e:
-            logger.error(f"Error en consulta RAG: {e}")
+            return self._generation_failed(question, context_docs, e)
+    
+    def _generation_failed(self, question: str, context_docs: List[Dict[str, Any]], error: Exception) -> Dict[str, Any]:
+        """Respuesta cuando falla la generación: solo los fragmentos si Ollama no está disponible"""
+        if self._use_fallback(error):
+            logger.warning(f"Ollama no disponible ({error}): se responde solo con los fragmentos recuperados")
+            get_metrics().annotate(degraded=True, error=str(error))
             return {
                 "question": question,
-                "answer": f"Error procesando la consulta: {str(e)}",
-                "sources": []
+                "answer": self._retrieval_only_answer(context_docs),
+                "sources": self._format_sources(context_docs),
+                "degraded": True
+            }
+        logger.error(f"Error en consulta RAG: {error}")
+        get_metrics().annotate(error=str(error))
+        return self._error_result(question, error)
+    
+    @traced("answer")
+    def answer_retrieved(self, question: str, retrieved: Dict[str, Any]) -> Dict[str, Any]:
+        """Responder a una pregunta a partir de lo que devolvió retrieve_batch"""
+        if retrieved["cached"] is not None:
+            return {**retrieved["cached"], "question": question}
+        
+        result = self.ask_with_context(question, retrieved["context_docs"], retrieved["query_embedding"])
+        self._cache_answer(retrieved, result)
+        return result
+    
+    @traced("ask")
+    def ask(self, question: str, top_k: int = 5, namespace: Namespaces = None,
+            filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Método principal para hacer preguntas al sistema RAG
+        
+        Con `namespace` (uno o varios) solo se usan los documentos de esos espacios de nombres
+        y con `filters` solo los chunks que cumplen el filtro de metadatos.
+        """
+        try:
+            # Recuperar contexto relevante (o una respuesta ya cacheada)
+            retrieved = self.retrieve_batch([question], top_k, namespace, filters)[0]
+        except Exception as e:
+            logger.error(f"Error en consulta RAG: {e}")
+            get_metrics().annotate(error=str(e))
+            return self._error_result(question, e)
+        
+        return self.answer_retrieved(question, retrieved)
+    
+    @traced("ask_batch")
+    def ask_batch(self, questions: List[str], top_k: int = 5, namespace: Namespaces = None,
+                  filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Hacer varias preguntas a la vez: la recuperación se hace en un único lote"""
+        try:
+            retrieved = self.retrieve_batch(questions, top_k, namespace, filters)
+        except Exception as e:
+            logger.error(f"Error en consulta RAG: {e}")
+            get_metrics().annotate(error=str(e))
+            return [self._error_result(question, e) for question in questions]
+        
+        return [self.answer_retrieved(question, item) for question, item in zip(questions, retrieved)]
+    
+    def ask_stream(self, question: str, top_k: int = 5, namespace: Namespaces = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Variante de ask que emite eventos: primero las fuentes y después los tokens de la respuesta
+        
+        Eventos: {"type": "sources"}, {"type": "token"} (uno por fragmento), {"type": "done"}
+        o {"type": "error"} si algo falla.
+        """
+        try:
+            # Recuperar contexto relevante y enviar las fuentes de inmediato
+            retrieved = self.retrieve_batch([question], top_k, namespace, filters)[0]
+            
+            if retrieved["cached"] is not None:
+                cached = retrieved["cached"]
+                yield {"type": "sources", "question": question, "sources": cached["sources"]}
+                yield {"type": "token", "content": cached["answer"]}
+                yield {"type": "done"}
+                return
+            
+            context_docs = retrieved["context_docs"]
+            sources = self._format_sources(context_docs)
+            yield {"type": "sources", "question": question, "sources": sources}
+            
+            if not context_docs:
+                yield {"type": "token", "content": NO_CONTEXT_ANSWER}
+                yield {"type": "done"}
+                return
+            
+            # Reenviar los tokens según los produce Ollama
+            tokens = []
+            try:
+                for token in self.generate_response_stream(question, context_docs, retrieved["query_embedding"]):
+                    tokens.append(token)
+                    yield {"type": "token", "content": token}
+            except Exception as e:
+                # Si Ollama no responde antes del primer token, la respuesta son los fragmentos
+                if tokens or not self._use_fallback(e):
+                    raise
+                logger.warning(f"Ollama no disponible ({e}): se responde solo con los fragmentos recuperados")
+                yield {"type": "token", "content": self._retrieval_only_answer(context_docs)}
+                yield {"type": "done", "degraded": True}
+                return
+            
+            self._cache_answer(retrieved, {"question": question, "answer": "".join(tokens).strip(), "sources": sources})
+            yield {"type": "done"}
+            
+        except Exception as e:
+            logger.error(f"Error en consulta RAG: {e}")
+            yield {"type": "error", "error": self._error_result(question, e)["answer"]}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Contadores internos del sistema (caches, tiempos por etapa y perfil de arranque)"""
+        embedding_cache = self.milvus_client.embedding_cache
+        embedding_pool = self.milvus_client.embedding_pool
+        encoder = self.milvus_client.encoder
+        return {
+            "embeddings": encoder.stats() if isinstance(encoder, EmbeddingBackend) else None,
+            "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+            "embedding_pool": embedding_pool.stats() if embedding_pool is not None else None,
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "sparse_index": self.sparse_index.stats() if self.sparse_index is not None else None,
+            "namespaces": self.milvus_client.namespace_stats(),
+            "context": self.context_builder.stats() if self.context_builder is not None else None,
+            "rerank": self.reranker.stats() if self.reranker is not None else None,
+            "stages": get_metrics().stats(),
+            "ollama": {**self.ollama_breaker.stats(), "retries": self.ollama_retry.retries},
+            "startup": {
+                "ready": self.ready,
+                "error": str(self._startup_error) if self._startup_error is not None else None,
+                "phases": dict(self.startup_profile),
             }
+        }
     
     def reset_database(self):
         """Reiniciar la base de datos (eliminar todos los documentos)"""
+        self.wait_ready()
         try:
             self.milvus_client.delete_collection()
+            self._invalidate_answers()
+            if self.sparse_index is not None:
+                self.sparse_index.clear()
             self.setup_milvus()
             logger.info("Base de datos reiniciada")
         except Exception as e:
             logger.error(f"Error reiniciando base de datos: {e}")
             raise
+    
+    @traced("export_snapshot")
+    def export_snapshot(self, path: str, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """Exportar los chunks con sus embeddings y metadatos a un fichero de snapshot (ver snapshot.py)"""
+        self.wait_ready()
+        from snapshot import export_snapshot
+        return export_snapshot(self.milvus_client, path, namespace=namespace)
+    
+    @traced("import_snapshot")
+    def import_snapshot(self, path: str, replace: bool = False) -> Dict[str, Any]:
+        """Cargar un snapshot sin volver a generar los embeddings
+        
+        Con `replace` se vacía antes la colección y los chunks se insertan sin upsert; si
+        no, se añaden a los que haya (los de mismo ID se sustituyen). El fichero se valida
+        entero antes de tocar la colección: un snapshot truncado, corrupto o de otro modelo
+        se rechaza sin borrar ni insertar nada. El índice BM25 se actualiza con los textos
+        del snapshot y se guarda si la importación termina bien.
+        """
+        self.wait_ready()
+        from snapshot import check_snapshot, import_snapshot
+        check_snapshot(self.milvus_client, path)
+        if replace:
+            self.reset_database()
+        try:
+            stats = import_snapshot(self.milvus_client, path, upsert=not replace, on_insert=self._index_sparse,
+                                    validate=False)
+        finally:
+            self._invalidate_answers()
+        self._save_sparse()
+        return stats
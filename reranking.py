@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Cross-encoder por defecto: MiniLM de 6 capas entrenado en MS MARCO (~90 MB, rápido en CPU)
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def decisive_margin(docs: List[Dict[str, Any]], top_k: int) -> float:
+    """Separación entre el último documento del top_k y el siguiente, según la búsqueda
+
+    Es la diferencia de score entre las posiciones top_k y top_k + 1 dividida por la
+    diferencia entre el primero y el último candidato (0 a 1). Los candidatos vienen
+    ordenados de mejor a peor, así que vale igual para distancias L2 (menor es mejor),
+    similitudes y scores RRF. Con pocos candidatos o todos iguales devuelve 0.
+    """
+    if len(docs) <= top_k or top_k <= 0:
+        return 0.0
+    spread = abs(docs[0]["score"] - docs[-1]["score"])
+    if spread == 0:
+        return 0.0
+    return abs(docs[top_k - 1]["score"] - docs[top_k]["score"]) / spread
+
+
+class CrossEncoderReranker:
+    """Reordena los candidatos de la búsqueda con un cross-encoder y se queda con los top_k
+
+    La búsqueda pide `depth` × top_k candidatos y el cross-encoder puntúa los pares
+    (consulta, texto) por lotes de `batch_size`, en el orden de la búsqueda:
+
+    - Salida temprana: si `margin` > 0 y la separación entre el top_k de la búsqueda y el
+      siguiente candidato (ver decisive_margin) es al menos `margin`, no se puntúa nada y
+      se devuelve el top_k de la búsqueda.
+    - Profundidad adaptativa: el primer lote tiene al menos top_k + 1 candidatos y solo se
+      puntúa el siguiente si alguno de los que estaban fuera del top_k de la búsqueda
+      (o del último lote) entra en el top_k; cuando los candidatos más profundos dejan
+      de entrar se para.
+
+    rerank_batch avanza todas las consultas a la vez, por rondas: los lotes de todas las
+    que siguen activas van en una sola llamada a predict, ordenados por longitud y en tandas de
+    hasta `predict_batch_size` pares.
+
+    El modelo (sentence_transformers.CrossEncoder) se carga la primera vez que se usa;
+    también se puede pasar uno ya creado con el mismo predict(pares, batch_size=...).
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANK_MODEL, depth: int = 4, batch_size: int = 8,
+                 margin: float = 0.0, max_length: int = 512, predict_batch_size: int = 8, model: Any = None):
+        self.model_name = model_name
+        self.depth = max(1, depth)
+        self.batch_size = max(1, batch_size)
+        self.margin = margin
+        self.max_length = max_length
+        self.predict_batch_size = max(1, predict_batch_size)
+        self.load_seconds: Optional[float] = None
+        self._model = model
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.queries = 0
+        self.skipped = 0
+        self.pairs = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["CrossEncoderReranker"]:
+        """Crear el reranker si RERANK_ENABLED=true"""
+        if os.getenv('RERANK_ENABLED', 'false').lower() != 'true':
+            return None
+        return cls(
+            model_name=os.getenv('RERANK_MODEL', DEFAULT_RERANK_MODEL),
+            depth=int(os.getenv('RERANK_DEPTH', '4')),
+            batch_size=int(os.getenv('RERANK_BATCH_SIZE', '8')),
+            margin=float(os.getenv('RERANK_MARGIN', '0')),
+            max_length=int(os.getenv('RERANK_MAX_LENGTH', '512')),
+            predict_batch_size=int(os.getenv('RERANK_PREDICT_BATCH_SIZE', '8')),
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Cargar el cross-encoder si aún no está cargado"""
+        if self._model is not None:
+            return
+        with self._lock:
+            if self._model is not None:
+                return
+            start = time.perf_counter()
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+            self.load_seconds = time.perf_counter() - start
+            logger.info(f"Cross-encoder {self.model_name} cargado en {self.load_seconds:.1f} s")
+
+    def candidates(self, top_k: int) -> int:
+        """Candidatos que hay que pedir a la búsqueda para quedarse con top_k"""
+        return top_k * self.depth
+
+    def _score(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        self.load()
+        # Por longitud, para que cada tanda rellene poco hasta el par más largo
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        sorted_scores = self._model.predict([pairs[i] for i in order], batch_size=self.predict_batch_size,
+                                            show_progress_bar=False)
+        scores = np.empty(len(pairs), dtype=np.float32)
+        scores[order] = np.asarray(sorted_scores, dtype=np.float32).reshape(-1)
+        return scores
+
+    def rerank(self, query: str, docs: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """Los top_k de `docs` (ordenados por la búsqueda) según el cross-encoder
+
+        Cada documento puntuado lleva su puntuación en "rerank_score"; "score" sigue
+        siendo el de la búsqueda.
+        """
+        return self.rerank_batch([query], [docs], top_k)[0]
+
+    def rerank_batch(self, queries: Sequence[str], docs: List[List[Dict[str, Any]]],
+                     top_k: int) -> List[List[Dict[str, Any]]]:
+        """rerank() de cada consulta con sus candidatos, con una llamada a predict por ronda"""
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+        active = []
+        skipped = 0
+        for i, query_docs in enumerate(docs):
+            if not query_docs:
+                results[i] = []
+            elif self.margin > 0 and decisive_margin(query_docs, top_k) >= self.margin:
+                results[i] = query_docs[:top_k]
+                skipped += 1
+            else:
+                active.append(i)
+
+        start = time.perf_counter()
+        scores = {i: np.empty(0, dtype=np.float32) for i in active}
+        reranked = list(active)
+        # El primer lote llega más allá del top_k de la búsqueda para ver si lo de detrás entra
+        size = max(top_k + 1, self.batch_size)
+        while active:
+            pairs, counts = [], []
+            for i in active:
+                batch = docs[i][len(scores[i]):len(scores[i]) + size]
+                pairs.extend((queries[i], doc["text"]) for doc in batch)
+                counts.append(len(batch))
+            new_scores = np.split(self._score(pairs), np.cumsum(counts)[:-1])
+            size = self.batch_size
+
+            still_active = []
+            for i, batch_scores in zip(active, new_scores):
+                first_new = max(top_k, len(scores[i]))
+                scores[i] = np.concatenate([scores[i], batch_scores])
+                if len(scores[i]) < len(docs[i]) and self._goes_deeper(scores[i], first_new, top_k):
+                    still_active.append(i)
+            active = still_active
+
+        for i in reranked:
+            order = np.argsort(-scores[i], kind="stable")[:top_k]
+            results[i] = [{**docs[i][j], "rerank_score": float(scores[i][j])} for j in order]
+        with self._stats_lock:
+            self.queries += len(queries)
+            self.skipped += skipped
+            self.pairs += sum(len(query_scores) for query_scores in scores.values())
+            if reranked:
+                self.seconds += time.perf_counter() - start
+        return results
+
+    @staticmethod
+    def _goes_deeper(scores: np.ndarray, first_new: int, top_k: int) -> bool:
+        """Si hay que puntuar el siguiente lote: algún candidato nuevo entra en el top_k"""
+        if len(scores) <= top_k:
+            return True
+        # Puntuación del último del top_k: si ningún candidato nuevo la alcanza, los siguientes no se miran
+        threshold = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+        return bool((scores[first_new:] >= threshold).any())
+
+    def stats(self) -> Dict[str, Any]:
+        """Consultas reordenadas, saltadas por la salida temprana y pares puntuados"""
+        reranked = self.queries - self.skipped
+        return {
+            "model": self.model_name,
+            "loaded": self.loaded,
+            "depth": self.depth,
+            "margin": self.margin,
+            "queries": self.queries,
+            "skipped": self.skipped,
+            "pairs": self.pairs,
+            "pairs_per_query": self.pairs / reranked if reranked else 0.0,
+            "mean_ms": self.seconds / reranked * 1000 if reranked else 0.0,
+        }
@@ -0,0 +1,290 @@
+import os
+import time
+import random
+import asyncio
+import inspect
+import logging
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Union
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """El circuito está abierto: el servicio ha fallado varias veces seguidas y no se le llama"""
+
+
+# Función de un cliente asíncrono que devuelve un iterador asíncrono, directamente o al
+# esperarla (como ollama.AsyncClient.chat(stream=True))
+AsyncStreamFunction = Callable[..., Union[AsyncIterator, Awaitable[AsyncIterator]]]
+
+
+async def _open_stream(function: AsyncStreamFunction, *args, **kwargs) -> AsyncIterator:
+    stream = function(*args, **kwargs)
+    if inspect.isawaitable(stream):
+        stream = await stream
+    return stream
+
+
+class RetryPolicy:
+    """Reintentos acotados con espera exponencial y jitter completo
+
+    Tras el intento n (empezando en 0) se espera un tiempo aleatorio entre 0 y
+    min(max_delay, base_delay * 2**n): los clientes que fallaron a la vez no vuelven
+    todos en el mismo instante. Solo se reintentan los errores para los que
+    `retry_if` devuelve True (por defecto, todos).
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5.0,
+                 retry_if: Optional[Callable[[Exception], bool]] = None, name: str = ""):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_if = retry_if
+        self.name = name
+        self.retries = 0
+
+    @classmethod
+    def from_env(cls, prefix: str, retry_if: Optional[Callable[[Exception], bool]] = None,
+                 name: str = "") -> "RetryPolicy":
+        """Leer {prefix}_RETRIES (intentos totales), {prefix}_RETRY_BASE_DELAY y {prefix}_RETRY_MAX_DELAY"""
+        return cls(
+            attempts=int(os.getenv(f'{prefix}_RETRIES', '3')),
+            base_delay=float(os.getenv(f'{prefix}_RETRY_BASE_DELAY', '0.2')),
+            max_delay=float(os.getenv(f'{prefix}_RETRY_MAX_DELAY', '5')),
+            retry_if=retry_if,
+            name=name or prefix.capitalize(),
+        )
+
+    def delay(self, attempt: int) -> float:
+        """Espera tras el intento `attempt` fallido"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _should_retry(self, attempt: int, error: Exception) -> bool:
+        return attempt < self.attempts - 1 and (self.retry_if is None or self.retry_if(error))
+
+    def _next_delay(self, attempt: int, error: Exception) -> float:
+        delay = self.delay(attempt)
+        self.retries += 1
+        logger.warning(f"{self.name}: intento {attempt + 1}/{self.attempts} fallido ({error}); reintento en {delay:.2f} s")
+        return delay
+
+    def _wait(self, attempt: int, error: Exception):
+        time.sleep(self._next_delay(attempt, error))
+
+    def call(self, function: Callable, *args, **kwargs) -> Any:
+        """Llamar a `function` reintentando los errores transitorios"""
+        for attempt in range(self.attempts):
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                self._wait(attempt, e)
+
+    def call_stream(self, function: Callable[..., Iterator], *args, **kwargs) -> Iterator:
+        """Como call() para una función que devuelve un iterador
+
+        Solo se reintenta si falla antes del primer elemento: lo ya emitido no se repite.
+        """
+        for attempt in range(self.attempts):
+            started = False
+            try:
+                for item in function(*args, **kwargs):
+                    started = True
+                    yield item
+                return
+            except Exception as e:
+                if started or not self._should_retry(attempt, e):
+                    raise
+                self._wait(attempt, e)
+
+    async def call_async(self, function: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """Como call() para una corrutina; la espera entre intentos no bloquea el event loop"""
+        for attempt in range(self.attempts):
+            try:
+                return await function(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(attempt, e):
+                    raise
+                await asyncio.sleep(self._next_delay(attempt, e))
+
+    async def call_async_stream(self, function: AsyncStreamFunction, *args, **kwargs) -> AsyncIterator:
+        """Como call_stream() para un stream asíncrono (solo se reintenta antes del primer elemento)"""
+        for attempt in range(self.attempts):
+            started = False
+            try:
+                stream = await _open_stream(function, *args, **kwargs)
+                try:
+                    async for item in stream:
+                        started = True
+                        yield item
+                finally:
+                    # Cerrar el stream al salir antes de tiempo (p. ej. petición cancelada)
+                    if hasattr(stream, "aclose"):
+                        await stream.aclose()
+                return
+            except Exception as e:
+                if started or not self._should_retry(attempt, e):
+                    raise
+                await asyncio.sleep(self._next_delay(attempt, e))
+
+
+class CircuitBreaker:
+    """Circuito que deja de llamar a un servicio que falla y lo vuelve a probar pasado un tiempo
+
+    Cerrado: las llamadas pasan. Tras `failure_threshold` fallos seguidos se abre y
+    durante `reset_timeout` segundos las llamadas fallan al momento con
+    CircuitOpenError, sin esperar a timeouts. Después se deja pasar una sola llamada
+    de prueba (semiabierto): si va bien se cierra y si falla vuelve a abrirse. Solo
+    cuentan como fallo los errores para los que `is_failure` devuelve True (por
+    defecto, todos); failure_threshold=0 lo desactiva.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str = "", failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 is_failure: Optional[Callable[[Exception], bool]] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str, is_failure: Optional[Callable[[Exception], bool]] = None,
+                 name: str = "") -> "CircuitBreaker":
+        """Leer {prefix}_BREAKER_THRESHOLD y {prefix}_BREAKER_RESET (segundos)"""
+        return cls(
+            name=name or prefix.capitalize(),
+            failure_threshold=int(os.getenv(f'{prefix}_BREAKER_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv(f'{prefix}_BREAKER_RESET', '30')),
+            is_failure=is_failure,
+        )
+
+    def _before(self):
+        """Dejar pasar la llamada o lanzar CircuitOpenError"""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} no disponible (circuito abierto tras {self.failures} fallos seguidos)")
+
+    def _after(self, error: Optional[Exception]):
+        """Registrar el resultado de una llamada que se dejó pasar"""
+        if self.failure_threshold <= 0:
+            return
+        failed = error is not None and (self.is_failure is None or self.is_failure(error))
+        with self._lock:
+            self._probing = False
+            if not failed:
+                if self.state != self.CLOSED:
+                    logger.info(f"{self.name} vuelve a responder: circuito cerrado")
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                    logger.warning(f"{self.name}: {self.failures} fallos seguidos, circuito abierto durante "
+                                   f"{self.reset_timeout:.0f} s ({error})")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def _release(self):
+        """Olvidar una llamada cancelada antes de saber si el servicio responde (sin cambiar el estado)"""
+        with self._lock:
+            self._probing = False
+
+    def call(self, function: Callable, *args, **kwargs) -> Any:
+        """Llamar a `function` si el circuito lo permite"""
+        self._before()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self._after(e)
+            raise
+        self._after(None)
+        return result
+
+    def call_stream(self, function: Callable[..., Iterator], *args, **kwargs) -> Iterator:
+        """Como call() para una función que devuelve un iterador (se registra al terminarlo)"""
+        self._before()
+        recorded = False
+        try:
+            yield from function(*args, **kwargs)
+        except Exception as e:
+            recorded = True
+            self._after(e)
+            raise
+        finally:
+            # Un stream que termina o que el consumidor cierra antes de acabar cuenta como éxito
+            if not recorded:
+                self._after(None)
+
+    async def call_async(self, function: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """Como call() para una corrutina (una cancelación no cuenta como fallo ni como éxito)"""
+        self._before()
+        try:
+            result = await function(*args, **kwargs)
+        except Exception as e:
+            self._after(e)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self._after(None)
+        return result
+
+    async def call_async_stream(self, function: AsyncStreamFunction, *args, **kwargs) -> AsyncIterator:
+        """Como call_stream() para un stream asíncrono"""
+        self._before()
+        started = False
+        stream = None
+        try:
+            stream = await _open_stream(function, *args, **kwargs)
+            async for item in stream:
+                started = True
+                yield item
+        except Exception as e:
+            self._after(e)
+            raise
+        except BaseException:
+            # Cancelada o cerrada por el consumidor: es un éxito solo si el servicio ya respondía
+            if started:
+                self._after(None)
+            else:
+                self._release()
+            raise
+        else:
+            self._after(None)
+        finally:
+            if stream is not None and hasattr(stream, "aclose"):
+                await stream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del circuito y contadores"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.opened,
+            "rejected": self.rejected,
+        }
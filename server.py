@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP asíncrono para el sistema RAG
+
+Expone RAGSystem en el puerto 8000 (el upstream que ya usa nginx.conf).
+Cada worker de uvicorn mantiene su propio RAGSystem caliente (encoder,
+conexión a Milvus y cliente de Ollama) y ejecuta las llamadas bloqueantes
+en un pool de hilos para no bloquear el event loop. Con RAG_ASYNC=true (por
+defecto) las preguntas pasan por AsyncRAGSystem: la generación no ocupa hilos
+y si el cliente se desconecta se cancela la pregunta y la llamada a Ollama.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+from rag_system import RAGSystem
+from async_rag import AsyncRAGSystem
+from vector_store import filter_key, namespace_list, normalize_filters
+from batching import MicroBatcher
+from metrics import get_metrics
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Cargar variables de entorno
+load_dotenv()
+
+
+class AskRequest(BaseModel):
+    """Cuerpo de una petición a /ask"""
+    question: str
+    top_k: int = 5
+    # Espacio o espacios de nombres (inquilinos) en los que buscar; None es el espacio por defecto
+    namespace: Optional[Union[str, List[str]]] = None
+    # Filtro de metadatos: {"source": ..., "date_from": ..., "date_to": ..., "tags": [...]}
+    filters: Optional[Dict[str, Any]] = None
+
+
+class IngestRequest(BaseModel):
+    """Cuerpo de una petición a /ingest"""
+    documents: List[str]
+    namespace: Optional[str] = None
+    source: str = ""
+    # Fecha ISO 8601 o timestamp Unix (segundos)
+    date: Optional[Union[str, int, float]] = None
+    tags: Optional[List[str]] = None
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    """Serializar un evento de RAGSystem.ask_stream como server-sent event"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def _iterate_in_executor(executor: ThreadPoolExecutor, iterator: Iterator) -> AsyncIterator:
+    """Consumir un iterador bloqueante desde el event loop usando el pool de hilos"""
+    loop = asyncio.get_running_loop()
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(executor, next, iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        # Si el cliente se desconecta se cierra el generador y con él el stream de Ollama
+        try:
+            await loop.run_in_executor(executor, iterator.close)
+        except ValueError:
+            # Un next() sigue en curso en otro hilo: el generador se cerrará al liberarse
+            pass
+
+
+async def _cancel_on_disconnect(request: Request, awaitable):
+    """Esperar `awaitable` y cancelarlo si el cliente cierra la conexión antes (499)"""
+    task = asyncio.ensure_future(awaitable)
+
+    async def watch():
+        # El cuerpo ya se ha leído: lo siguiente que llega es la desconexión
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(watch())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        logger.info("Cliente desconectado: pregunta cancelada")
+        raise HTTPException(status_code=499, detail="Cliente desconectado")
+    return task.result()
+
+
+def _request_filters(body: AskRequest) -> Optional[Dict[str, Any]]:
+    """Validar el filtro de una petición (400 si no es válido) y devolverlo normalizado"""
+    try:
+        return normalize_filters(body.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Filtro no válido: {e}")
+
+
+def _retrieve_batch(rag: RAGSystem, items: List[Tuple[str, int, Any, Any]]) -> List[Dict[str, Any]]:
+    """Recuperar el contexto de un lote de (pregunta, top_k, namespace, filters): una búsqueda
+    por cada combinación distinta de top_k, espacios de nombres y filtro"""
+    results: List[Dict[str, Any]] = [None] * len(items)
+    groups: Dict[Tuple[int, Tuple[str, ...], Tuple], List[int]] = {}
+    for i, (_, top_k, namespace, filters) in enumerate(items):
+        groups.setdefault((top_k, tuple(namespace_list(namespace)), filter_key(filters)), []).append(i)
+
+    for (top_k, namespaces, _), positions in groups.items():
+        filters = items[positions[0]][3]
+        retrieved = rag.retrieve_batch([items[i][0] for i in positions], top_k, list(namespaces), filters)
+        for i, item in zip(positions, retrieved):
+            results[i] = item
+    return results
+
+
+async def _ask_async(state, body: AskRequest, filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Responder una pregunta con AsyncRAGSystem (recuperación agrupada si hay micro-batching)"""
+    async_rag: AsyncRAGSystem = state.async_rag
+    if state.retrieval_batcher is None:
+        return await async_rag.ask(body.question, body.top_k, body.namespace, filters)
+    try:
+        retrieved = await state.retrieval_batcher.submit((body.question, body.top_k, body.namespace, filters))
+    except Exception:
+        # Si falla el lote completo se reintenta la consulta de forma individual
+        return await async_rag.ask(body.question, body.top_k, body.namespace, filters)
+    return await async_rag.answer_retrieved(body.question, retrieved)
+
+
+def create_app(rag_factory: Callable[[], RAGSystem] = RAGSystem,
+               batch_window_ms: Optional[float] = None) -> FastAPI:
+    """Crear la aplicación FastAPI con un RAGSystem por proceso
+
+    Si batch_window_ms > 0, las recuperaciones de peticiones /ask concurrentes se
+    agrupan durante esa ventana y se resuelven con una sola búsqueda en Milvus.
+    """
+    # Cada worker tendría su propio índice BM25 en memoria (sin ver las ingestas de los demás)
+    # y todos guardarían en el mismo SPARSE_INDEX_DIR
+    workers = int(os.getenv('RAG_SERVER_WORKERS', '1'))
+    retrieval_mode = os.getenv('RETRIEVAL_MODE', 'dense').lower()
+    if workers > 1 and retrieval_mode != 'dense':
+        raise ValueError(f"RETRIEVAL_MODE={retrieval_mode} no admite varios workers (RAG_SERVER_WORKERS={workers})")
+    # Cada worker tiene su cache de respuestas: sin marca compartida, una ingesta en un worker
+    # solo invalidaría la suya y los demás seguirían sirviendo respuestas del corpus anterior
+    answer_cache = os.getenv('ANSWER_CACHE_ENABLED', 'false').lower() == 'true'
+    if workers > 1 and answer_cache and not os.getenv('ANSWER_CACHE_STAMP'):
+        raise ValueError(f"ANSWER_CACHE_ENABLED=true con RAG_SERVER_WORKERS={workers} necesita ANSWER_CACHE_STAMP")
+    query_threads = int(os.getenv('RAG_QUERY_THREADS', '16'))
+    ingest_threads = int(os.getenv('RAG_INGEST_THREADS', '1'))
+    if batch_window_ms is None:
+        batch_window_ms = float(os.getenv('RAG_BATCH_WINDOW_MS', '5'))
+    max_batch_size = int(os.getenv('RAG_MAX_BATCH_SIZE', '32'))
+    use_async = os.getenv('RAG_ASYNC', 'true').lower() == 'true'
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Pools separados: una ingesta larga no debe dejar sin hilos a las consultas
+        app.state.query_executor = ThreadPoolExecutor(max_workers=query_threads, thread_name_prefix="rag-query")
+        app.state.ingest_executor = ThreadPoolExecutor(max_workers=ingest_threads, thread_name_prefix="rag-ingest")
+
+        # Inicializar el sistema RAG una sola vez por worker (carga el modelo y conecta). Con
+        # RAG_WARM_START=true vuelve enseguida y termina de arrancar en segundo plano
+        loop = asyncio.get_running_loop()
+        app.state.rag = await loop.run_in_executor(app.state.ingest_executor, rag_factory)
+
+        # Interfaz asíncrona sobre el mismo RAGSystem y el mismo pool de consultas
+        app.state.async_rag = AsyncRAGSystem(app.state.rag, executor=app.state.query_executor) if use_async else None
+
+        app.state.retrieval_batcher = None
+        if batch_window_ms > 0:
+            app.state.retrieval_batcher = MicroBatcher(
+                partial(_retrieve_batch, app.state.rag),
+                app.state.query_executor,
+                max_batch_size=max_batch_size,
+                max_wait_ms=batch_window_ms,
+            )
+        logger.info("Servidor RAG listo para recibir peticiones")
+
+        try:
+            yield
+        finally:
+            if app.state.async_rag is not None:
+                await app.state.async_rag.aclose()
+            app.state.query_executor.shutdown(wait=False, cancel_futures=True)
+            app.state.ingest_executor.shutdown(wait=True)
+
+    app = FastAPI(title="RAG Milvus", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health(request: Request):
+        """Comprobar que el worker está vivo (y si ya terminó de arrancar)"""
+        return {"status": "ok", "ready": request.app.state.rag.ready}
+
+    @app.get("/ready")
+    async def ready(request: Request):
+        """503 mientras el sistema RAG se inicia en segundo plano o si su arranque falló"""
+        rag = request.app.state.rag
+        if not rag.ready:
+            startup = rag.stats()["startup"]
+            raise HTTPException(status_code=503, detail=startup["error"] or "Iniciando")
+        return {"status": "ready", "startup": rag.startup_profile}
+
+    @app.get("/stats")
+    async def stats(request: Request):
+        """Contadores internos del worker (aciertos y fallos de cache, preguntas en vuelo)"""
+        state = request.app.state
+        stats = state.rag.stats()
+        if state.async_rag is not None:
+            stats["async"] = state.async_rag.stats()
+        return stats
+
+    @app.get("/metrics")
+    async def metrics():
+        """Histogramas por etapa y tokens/s de Ollama en el formato de Prometheus (de este worker)"""
+        registry = get_metrics()
+        if not registry.enabled:
+            raise HTTPException(status_code=404, detail="Métricas desactivadas (RAG_METRICS_ENABLED=false)")
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/ask")
+    async def ask(body: AskRequest, request: Request):
+        """Hacer una pregunta al sistema RAG"""
+        if not body.question.strip():
+            raise HTTPException(status_code=400, detail="La pregunta no puede estar vacía")
+        filters = _request_filters(body)
+
+        state = request.app.state
+        if state.async_rag is not None:
+            return await _cancel_on_disconnect(request, _ask_async(state, body, filters))
+
+        loop = asyncio.get_running_loop()
+        if state.retrieval_batcher is None:
+            return await loop.run_in_executor(state.query_executor, state.rag.ask, body.question, body.top_k,
+                                              body.namespace, filters)
+
+        try:
+            retrieved = await state.retrieval_batcher.submit((body.question, body.top_k, body.namespace, filters))
+        except Exception:
+            # Si falla el lote completo se reintenta la consulta de forma individual
+            return await loop.run_in_executor(state.query_executor, state.rag.ask, body.question, body.top_k,
+                                              body.namespace, filters)
+
+        return await loop.run_in_executor(state.query_executor, state.rag.answer_retrieved, body.question, retrieved)
+
+    @app.post("/ask/stream")
+    async def ask_stream(body: AskRequest, request: Request):
+        """Hacer una pregunta y recibir fuentes y tokens como server-sent events"""
+        if not body.question.strip():
+            raise HTTPException(status_code=400, detail="La pregunta no puede estar vacía")
+        filters = _request_filters(body)
+
+        state = request.app.state
+        if state.async_rag is not None:
+            # Si el cliente se desconecta, StreamingResponse cierra el generador y se corta la generación
+            events = state.async_rag.ask_stream(body.question, body.top_k, body.namespace, filters)
+        else:
+            events = _iterate_in_executor(
+                state.query_executor, state.rag.ask_stream(body.question, body.top_k, body.namespace, filters)
+            )
+
+        async def event_stream():
+            async for event in events:
+                yield _sse(event)
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.post("/ingest")
+    async def ingest(body: IngestRequest, request: Request):
+        """Añadir documentos al sistema RAG"""
+        if not body.documents:
+            raise HTTPException(status_code=400, detail="No se recibieron documentos")
+
+        state = request.app.state
+        loop = asyncio.get_running_loop()
+        try:
+            chunks = await loop.run_in_executor(state.ingest_executor, partial(
+                state.rag.add_documents, body.documents, source=body.source, namespace=body.namespace,
+                date=body.date, tags=body.tags
+            ))
+        except ValueError as e:
+            # Fecha o etiquetas no válidas
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Error en la ingesta: {e}")
+            raise HTTPException(status_code=500, detail=f"Error añadiendo documentos: {e}")
+
+        return {"documents": len(body.documents), "chunks": chunks}
+
+    return app
+
+
+app = create_app()
+
+
+def main():
+    """Arrancar el servidor con uvicorn"""
+    import uvicorn
+
+    uvicorn.run(
+        "server:app",
+        host=os.getenv('RAG_SERVER_HOST', '0.0.0.0'),
+        port=int(os.getenv('RAG_SERVER_PORT', '8000')),
+        workers=int(os.getenv('RAG_SERVER_WORKERS', '1')),
+    )
+
+
+if __name__ == "__main__":
+    main()
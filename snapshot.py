@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import zlib
+import time
+import struct
+import logging
+import argparse
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import VectorStore
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Formato del fichero de snapshot
+SNAPSHOT_MAGIC = b"RAGSNAP\x00"
+SNAPSHOT_VERSION = 1
+GROUP_MAGIC = b"ROWG"
+END_MAGIC = b"END\x00"
+
+# Columnas enteras de cada grupo de filas (int64 en bruto); el resto va como JSON comprimido con zlib
+INT_COLUMNS = ("id", "chunk_offset", "date")
+TEXT_COLUMNS = ("text", "source", "document_id", "namespace", "tags")
+
+# Filas por grupo al exportar
+SNAPSHOT_BATCH_SIZE = 4096
+
+
+def store_model(store: VectorStore) -> str:
+    """Identificador del modelo de embeddings de un almacén (el mismo que usa la cache de embeddings)"""
+    return getattr(store.encoder, "cache_key", store.model_name)
+
+
+def _write_block(f: BinaryIO, data: bytes):
+    f.write(struct.pack("<Q", len(data)))
+    f.write(data)
+
+
+def _read_block(f: BinaryIO) -> bytes:
+    (size,) = struct.unpack("<Q", _read_exact(f, 8))
+    return _read_exact(f, size)
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Snapshot truncado")
+    return data
+
+
+def export_snapshot(store: VectorStore, path: str, namespace: Optional[str] = None,
+                    batch_size: int = SNAPSHOT_BATCH_SIZE, compress_level: int = 1) -> Dict[str, Any]:
+    """Exportar la colección (o un espacio de nombres) a un fichero de snapshot columnar
+
+    El fichero empieza con SNAPSHOT_MAGIC y una cabecera JSON (versión, dimensión,
+    métrica y modelo de embeddings) y sigue con un grupo de filas por cada lote que
+    devuelve store.iter_embeddings(): las columnas de texto y las etiquetas como JSON
+    comprimido, las enteras como int64 y los embeddings como un bloque float32 de
+    filas × dimensión, sin convertir. Termina con END_MAGIC y el número de filas, así que
+    un snapshot cortado a medias se detecta al importarlo. Se escribe en un temporal
+    que se renombra al terminar. Devuelve filas, bytes y segundos.
+    """
+    start = time.perf_counter()
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "dim": store.embedding_dim,
+        "metric_type": store.metric_type,
+        "model": store_model(store),
+        "namespace": namespace,
+        "created": int(time.time()),
+    }
+    rows = 0
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            _write_block(f, json.dumps(header).encode("utf-8"))
+            for chunks, embeddings in store.iter_embeddings(batch_size=batch_size, namespace=namespace):
+                columns = {
+                    "text": [chunk.get("text", "") for chunk in chunks],
+                    "source": [chunk.get("source", "") for chunk in chunks],
+                    "document_id": [chunk.get("document_id", "") for chunk in chunks],
+                    "namespace": [chunk.get("namespace", "") for chunk in chunks],
+                    "tags": [list(chunk.get("tags") or ()) for chunk in chunks],
+                }
+                f.write(GROUP_MAGIC)
+                f.write(struct.pack("<Q", len(chunks)))
+                _write_block(f, zlib.compress(json.dumps(columns, ensure_ascii=False).encode("utf-8"), compress_level))
+                for column in INT_COLUMNS:
+                    f.write(np.fromiter((chunk.get(column) or 0 for chunk in chunks), dtype="<i8",
+                                        count=len(chunks)).tobytes())
+                f.write(np.ascontiguousarray(embeddings, dtype="<f4").tobytes())
+                rows += len(chunks)
+            f.write(END_MAGIC)
+            f.write(struct.pack("<Q", rows))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    seconds = time.perf_counter() - start
+    size = os.path.getsize(path)
+    logger.info(f"Snapshot exportado en {path}: {rows} chunks, {size / 2**20:.1f} MB en {seconds:.1f} s")
+    return {"rows": rows, "bytes": size, "seconds": seconds}
+
+
+def read_snapshot_header(f: BinaryIO) -> Dict[str, Any]:
+    """Leer y validar la cabecera de un snapshot abierto"""
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError("El fichero no es un snapshot")
+    header = json.loads(_read_block(f))
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Versión de snapshot no soportada: {header.get('version')}")
+    return header
+
+
+def _read_columns(f: BinaryIO, count: int) -> Dict[str, List[Any]]:
+    """Columnas JSON de un grupo de filas (comprobando que tienen `count` valores)"""
+    try:
+        columns = json.loads(zlib.decompress(_read_block(f)))
+    except (zlib.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Snapshot corrupto: columnas ilegibles ({e})") from e
+    if not isinstance(columns, dict) or any(len(columns.get(name, ())) != count for name in TEXT_COLUMNS):
+        raise ValueError("Snapshot corrupto: columnas incompletas")
+    return columns
+
+
+def validate_snapshot(f: BinaryIO, dim: int) -> int:
+    """Recorrer un snapshot entero (tras read_snapshot_header) sin leer los embeddings
+
+    Comprueba cada grupo de filas (cabecera, columnas JSON y tamaño de las columnas
+    binarias) y el final con el número de filas; lanza ValueError si está truncado o
+    corrupto. Devuelve el número de filas y deja `f` donde estaba.
+    """
+    position = f.tell()
+    size = os.fstat(f.fileno()).st_size
+    rows = 0
+    try:
+        while True:
+            magic = _read_exact(f, 4)
+            if magic == END_MAGIC:
+                (expected,) = struct.unpack("<Q", _read_exact(f, 8))
+                if expected != rows:
+                    raise ValueError(f"Snapshot inconsistente: {rows} filas leídas de {expected}")
+                return rows
+            if magic != GROUP_MAGIC:
+                raise ValueError("Snapshot corrupto: grupo de filas no válido")
+            (count,) = struct.unpack("<Q", _read_exact(f, 8))
+            _read_columns(f, count)
+            # Columnas enteras y embeddings: basta con que estén enteros
+            skip = count * (8 * len(INT_COLUMNS) + 4 * dim)
+            if f.tell() + skip > size:
+                raise ValueError("Snapshot truncado")
+            f.seek(skip, os.SEEK_CUR)
+            rows += count
+    finally:
+        f.seek(position)
+
+
+def iter_snapshot(f: BinaryIO, dim: int) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+    """Recorrer los grupos de filas de un snapshot (tras read_snapshot_header) como (chunks, embeddings)"""
+    rows = 0
+    while True:
+        magic = _read_exact(f, 4)
+        if magic == END_MAGIC:
+            (expected,) = struct.unpack("<Q", _read_exact(f, 8))
+            if expected != rows:
+                raise ValueError(f"Snapshot inconsistente: {rows} filas leídas de {expected}")
+            return
+        if magic != GROUP_MAGIC:
+            raise ValueError("Snapshot corrupto: grupo de filas no válido")
+        (count,) = struct.unpack("<Q", _read_exact(f, 8))
+        columns = _read_columns(f, count)
+        ints = {column: np.frombuffer(_read_exact(f, count * 8), dtype="<i8") for column in INT_COLUMNS}
+        embeddings = np.frombuffer(_read_exact(f, count * dim * 4), dtype="<f4").reshape(count, dim)
+        chunks = [
+            {"id": int(id), "text": text, "source": source, "document_id": document_id, "chunk_offset": int(offset),
+             "date": int(date), "tags": tags, "namespace": namespace}
+            for id, text, source, document_id, offset, date, tags, namespace in zip(
+                ints["id"], columns["text"], columns["source"], columns["document_id"], ints["chunk_offset"],
+                ints["date"], columns["tags"], columns["namespace"])
+        ]
+        rows += count
+        yield chunks, embeddings
+
+
+def _check_header(store: VectorStore, header: Dict[str, Any], check_model: bool):
+    if header["dim"] != store.embedding_dim:
+        raise ValueError(f"El snapshot tiene embeddings de dimensión {header['dim']} y el almacén "
+                         f"{store.embedding_dim}")
+    if check_model and header["model"] != store_model(store):
+        raise ValueError(f"El snapshot se generó con el modelo {header['model']} y el almacén usa "
+                         f"{store_model(store)}")
+
+
+def check_snapshot(store: VectorStore, path: str, check_model: bool = True) -> Dict[str, Any]:
+    """Comprobar sin cargar nada que un snapshot está entero y es compatible con el almacén
+
+    Lanza ValueError si no lo es; devuelve la cabecera con el número de filas ("rows").
+    """
+    with open(path, "rb") as f:
+        header = read_snapshot_header(f)
+        _check_header(store, header, check_model)
+        return {**header, "rows": validate_snapshot(f, header["dim"])}
+
+
+def import_snapshot(store: VectorStore, path: str, upsert: bool = True, check_model: bool = True,
+                    on_insert=None, validate: bool = True) -> Dict[str, Any]:
+    """Cargar un snapshot en el almacén sin volver a generar los embeddings
+
+    Primero se recorre el fichero entero (validate_snapshot): un snapshot truncado o
+    corrupto se rechaza sin insertar nada (validate=False se lo salta si ya se hizo con
+    check_snapshot). Después cada grupo de filas se inserta tal cual con
+    insert_chunks() (con sus IDs, espacio de nombres y metadatos) y se hace un único
+    flush al final. upsert=False es más barato y sirve cuando la colección está vacía
+    (p. ej. recién creada). La dimensión tiene que coincidir con la del almacén y, con
+    check_model, también el modelo de embeddings: los vectores de otro modelo no son
+    comparables con las consultas. on_insert(chunks) se llama tras insertar cada grupo.
+    """
+    start = time.perf_counter()
+    rows = 0
+    with open(path, "rb") as f:
+        header = read_snapshot_header(f)
+        _check_header(store, header, check_model)
+        if header["metric_type"] != store.metric_type:
+            logger.warning(f"El snapshot se exportó con la métrica {header['metric_type']} y el almacén usa "
+                           f"{store.metric_type}")
+        if validate:
+            validate_snapshot(f, header["dim"])
+        for chunks, embeddings in iter_snapshot(f, header["dim"]):
+            store.insert_chunks(chunks, embeddings, upsert=upsert)
+            if on_insert is not None:
+                on_insert(chunks)
+            rows += len(chunks)
+    store.flush()
+
+    seconds = time.perf_counter() - start
+    logger.info(f"Snapshot {path} importado: {rows} chunks en {seconds:.1f} s")
+    return {"rows": rows, "seconds": seconds, "model": header["model"], "created": header["created"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar o importar la colección como snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Exportar la colección a un fichero")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--namespace", default=None, help="Exportar solo este espacio de nombres")
+    import_parser = subparsers.add_parser("import", help="Cargar un fichero en la colección")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--replace", action="store_true",
+                               help="Vaciar la colección antes de importar (carga sin upsert)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from rag_system import RAGSystem
+    # Sin preguntas: no hace falta cargar el modelo en Ollama
+    os.environ.setdefault('OLLAMA_PREWARM', 'false')
+    rag = RAGSystem(warm_start=False)
+    if args.command == "export":
+        stats = rag.export_snapshot(args.path, namespace=args.namespace)
+    else:
+        stats = rag.import_snapshot(args.path, replace=args.replace)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
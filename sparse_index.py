@@ -0,0 +1,361 @@
+import os
+import re
+import json
+import math
+import heapq
+import hashlib
+import atexit
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Palabras y códigos con separadores internos (SKU-1234, v2.3.4, user_id)
+_TOKEN_RE = re.compile(r"\w+(?:[-_./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Términos de un texto: palabras en minúsculas; los códigos compuestos se indexan enteros y por partes"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-_./]", token) if part)
+    return tokens
+
+
+class BM25Index:
+    """Índice invertido en memoria con puntuación BM25, actualizable chunk a chunk
+
+    Complementa la búsqueda densa: encuentra coincidencias exactas de identificadores,
+    códigos o nombres propios que el embedding diluye. Los documentos se indexan por el
+    ID estable del chunk, así que añadir de nuevo un chunk lo sustituye. Si se da
+    `path`, el índice se guarda en `path/bm25.json` (cada `save_every` cambios y al salir).
+
+    Las listas de cada término se buscan como arrays de NumPy (filas y frecuencias), que se
+    construyen la primera vez que se consulta el término y se descartan cuando cambia. De
+    un término con más de `max_postings` chunks (casi una palabra vacía, con IDF cercano a
+    0) solo se recorren los `max_postings` de mayor impacto; 0 los recorre todos.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, save_every: int = 10000,
+                 max_postings: int = 100000):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.save_every = save_every
+        self.max_postings = max_postings
+
+        self._lock = threading.Lock()
+        # término -> {chunk_id: frecuencia}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # chunk_id -> (longitud en términos, términos distintos)
+        self._docs: Dict[int, Tuple[int, Tuple[str, ...]]] = {}
+        self._total_length = 0
+        self._dirty = 0
+        # Cada chunk ocupa una fila de los arrays (las de los borrados se reutilizan)
+        self._rows: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        self._row_ids = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.float32)
+        # término -> (filas, frecuencias, chunks con el término): las listas ya convertidas
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._file = os.path.join(path, "bm25.json")
+            self._load()
+            atexit.register(self.save)
+
+    @classmethod
+    def from_env(cls) -> "BM25Index":
+        """Crear el índice (persistente si SPARSE_INDEX_DIR está definido)"""
+        return cls(
+            path=os.getenv('SPARSE_INDEX_DIR') or None,
+            k1=float(os.getenv('BM25_K1', '1.5')),
+            b=float(os.getenv('BM25_B', '0.75')),
+            max_postings=int(os.getenv('BM25_MAX_POSTINGS', '100000')),
+        )
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _load(self):
+        if not os.path.exists(self._file):
+            return
+        try:
+            with open(self._file, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Índice BM25 ilegible, se reconstruirá: {e}")
+            return
+        for chunk_id, frequencies in data["docs"]:
+            self._add(chunk_id, frequencies)
+        logger.info(f"Índice BM25 cargado con {len(self._docs)} chunks")
+
+    def _add(self, chunk_id: int, frequencies: Dict[str, int]):
+        self._remove(chunk_id)
+        length = sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[chunk_id] = frequency
+            self._arrays.pop(term, None)
+        self._docs[chunk_id] = (length, tuple(frequencies))
+        self._total_length += length
+
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self._rows)
+            if row == len(self._row_ids):
+                capacity = max(1024, 2 * row)
+                self._row_ids = np.resize(self._row_ids, capacity)
+                self._lengths = np.resize(self._lengths, capacity)
+        self._rows[chunk_id] = row
+        self._row_ids[row] = chunk_id
+        self._lengths[row] = length
+
+    def _remove(self, chunk_id: int) -> bool:
+        doc = self._docs.pop(chunk_id, None)
+        if doc is None:
+            return False
+        length, terms = doc
+        for term in terms:
+            postings = self._postings[term]
+            del postings[chunk_id]
+            if not postings:
+                del self._postings[term]
+            self._arrays.pop(term, None)
+        self._total_length -= length
+        self._free_rows.append(self._rows.pop(chunk_id))
+        return True
+
+    def add(self, chunks: Iterable[Dict[str, Any]]):
+        """Indexar chunks (dicts con "id" y "text"); un ID ya indexado se sustituye"""
+        # Tokenizar fuera del lock
+        prepared = [(chunk["id"], Counter(tokenize(chunk["text"]))) for chunk in chunks]
+        with self._lock:
+            for chunk_id, frequencies in prepared:
+                self._add(chunk_id, frequencies)
+            self._dirty += len(prepared)
+            should_save = self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    def remove(self, chunk_ids: Iterable[int]) -> int:
+        """Quitar chunks del índice; devuelve cuántos estaban indexados"""
+        with self._lock:
+            removed = sum(self._remove(chunk_id) for chunk_id in chunk_ids)
+            self._dirty += removed
+        return removed
+
+    def _term_arrays(self, term: str, average_length: float) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+        """Filas y frecuencias de un término (recortadas a max_postings por impacto) y cuántos chunks lo tienen"""
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term)
+            if not postings:
+                return None
+            rows = np.fromiter(map(self._rows.__getitem__, postings), dtype=np.int64, count=len(postings))
+            frequencies = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            if 0 < self.max_postings < len(rows):
+                # El término es casi vacío: solo cuentan los chunks donde más pesa
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[rows] / average_length)
+                keep = np.argpartition(frequencies / (frequencies + norm), len(rows) - self.max_postings)
+                keep = keep[len(rows) - self.max_postings:]
+                rows, frequencies = rows[keep], frequencies[keep]
+            arrays = (rows, frequencies, len(postings))
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Los top_k chunks con mayor puntuación BM25, como (chunk_id, score)"""
+        terms = set(tokenize(query))
+        # Bajo el lock solo se copian las listas de los términos; se puntúa fuera
+        gathered = []
+        with self._lock:
+            num_docs = len(self._docs)
+            if not num_docs or not terms:
+                return []
+            average_length = self._total_length / num_docs
+            for term in terms:
+                arrays = self._term_arrays(term, average_length)
+                if arrays is None:
+                    continue
+                rows, frequencies, count = arrays
+                gathered.append((count, rows, frequencies, self._lengths[rows]))
+            if not gathered:
+                return []
+            row_ids = self._row_ids[:len(self._rows) + len(self._free_rows)].copy()
+
+        scores = []
+        for count, rows, frequencies, lengths in gathered:
+            idf = math.log(1 + (num_docs - count + 0.5) / (count + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            scores.append(idf * frequencies * (self.k1 + 1) / (frequencies + norm))
+        if len(gathered) == 1:
+            rows, scores = gathered[0][1], scores[0]
+        else:
+            # Sumar las puntuaciones de cada chunk en todos los términos (toda puntuación es > 0)
+            accumulator = np.zeros(len(row_ids))
+            for (_, term_rows, _, _), term_scores in zip(gathered, scores):
+                accumulator[term_rows] += term_scores
+            rows = np.flatnonzero(accumulator)
+            scores = accumulator[rows]
+        top_k = min(top_k, len(rows))
+        if top_k <= 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(row_ids[rows[i]]), float(scores[i])) for i in best]
+
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[Tuple[int, float]]]:
+        """search() para varias consultas"""
+        return [self.search(query, top_k) for query in queries]
+
+    def save(self):
+        """Persistir el índice (escritura atómica); no hace nada si es solo en memoria"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            docs = [
+                [chunk_id, {term: self._postings[term][chunk_id] for term in terms}]
+                for chunk_id, (_, terms) in self._docs.items()
+            ]
+            self._dirty = 0
+        tmp_path = self._file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": docs}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._file)
+
+    def clear(self):
+        """Vaciar el índice"""
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._arrays.clear()
+            self._rows.clear()
+            self._free_rows.clear()
+            self._total_length = 0
+            self._dirty += 1
+        self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño del índice"""
+        return {"chunks": len(self._docs), "terms": len(self._postings)}
+
+
+class NamespacedBM25Index:
+    """Un BM25Index por espacio de nombres, con la misma interfaz
+
+    Cada búsqueda solo recorre los índices de sus espacios de nombres, así que un inquilino
+    no ve (ni paga) los chunks de los demás. El índice del espacio por defecto se guarda en
+    `path` (donde estaba antes) y los demás en `path/namespaces/<hash>`, con la lista de
+    espacios de nombres en `path/namespaces.json`.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, save_every: int = 10000,
+                 max_postings: int = 100000):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.save_every = save_every
+        self.max_postings = max_postings
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, BM25Index] = {}
+
+        self._index("")
+        if path and os.path.exists(os.path.join(path, "namespaces.json")):
+            with open(os.path.join(path, "namespaces.json"), encoding="utf-8") as f:
+                for namespace in json.load(f):
+                    self._index(namespace)
+
+    @classmethod
+    def from_env(cls) -> "NamespacedBM25Index":
+        """Crear los índices (persistentes si SPARSE_INDEX_DIR está definido)"""
+        return cls(
+            path=os.getenv('SPARSE_INDEX_DIR') or None,
+            k1=float(os.getenv('BM25_K1', '1.5')),
+            b=float(os.getenv('BM25_B', '0.75')),
+            max_postings=int(os.getenv('BM25_MAX_POSTINGS', '100000')),
+        )
+
+    def _index(self, namespace: str) -> BM25Index:
+        """Índice de un espacio de nombres (se crea la primera vez)"""
+        index = self._indexes.get(namespace)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(namespace)
+                if index is None:
+                    path = self.path
+                    if path and namespace:
+                        digest = hashlib.blake2b(namespace.encode("utf-8"), digest_size=8).hexdigest()
+                        path = os.path.join(path, "namespaces", digest)
+                    index = BM25Index(path, self.k1, self.b, self.save_every, self.max_postings)
+                    self._indexes = {**self._indexes, namespace: index}
+                    if self.path and namespace:
+                        self._save_namespaces()
+        return index
+
+    def _save_namespaces(self):
+        tmp_path = os.path.join(self.path, "namespaces.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([namespace for namespace in self._indexes if namespace], f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, "namespaces.json"))
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._indexes.values())
+
+    def add(self, chunks: Iterable[Dict[str, Any]]):
+        """Indexar chunks en el índice de su espacio de nombres (campo "namespace")"""
+        by_namespace: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            by_namespace.setdefault(chunk.get("namespace", ""), []).append(chunk)
+        for namespace, group in by_namespace.items():
+            self._index(namespace).add(group)
+
+    def remove(self, chunk_ids: Iterable[int]) -> int:
+        """Quitar chunks (de cualquier espacio de nombres)"""
+        chunk_ids = list(chunk_ids)
+        return sum(index.remove(chunk_ids) for index in self._indexes.values())
+
+    def search_batch(self, queries: List[str], top_k: int = 5,
+                     namespaces: Optional[List[str]] = None) -> List[List[Tuple[int, float]]]:
+        """search_batch() en los índices de esos espacios de nombres (todos si es None)
+
+        Con varios, se juntan los top_k de cada uno por puntuación (cada índice tiene su IDF).
+        """
+        indexes = [self._indexes[namespace] for namespace in (namespaces if namespaces is not None else self._indexes)
+                   if namespace in self._indexes]
+        if len(indexes) == 1:
+            return indexes[0].search_batch(queries, top_k)
+        results = []
+        for query in queries:
+            hits = [hit for index in indexes for hit in index.search(query, top_k)]
+            results.append(heapq.nlargest(top_k, hits, key=lambda item: item[1]))
+        return results
+
+    def save(self):
+        """Persistir los índices que hayan cambiado"""
+        for index in self._indexes.values():
+            index.save()
+
+    def clear(self):
+        """Vaciar todos los índices"""
+        for index in self._indexes.values():
+            index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño de los índices"""
+        stats = [index.stats() for index in self._indexes.values()]
+        return {
+            "namespaces": len(stats),
+            "chunks": sum(item["chunks"] for item in stats),
+            "terms": sum(item["terms"] for item in stats),
+        }
@@ -4,9 +4,9 @@ Script de prueba para el sistema RAG dockerizado
 """
 
 import os
-import time
 import logging
 from rag_system import RAGSystem
+from resilience import RetryPolicy
 from dotenv import load_dotenv
 
 # Configurar logging
@@ -21,43 +21,35 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def wait_for_services():
-    """Esperar a que los servicios estén disponibles"""
+    """Esperar a que los servicios estén disponibles
+
+    Reintentos con espera exponencial y jitter (resilience.RetryPolicy): responde en
+    cuanto el servicio está listo en vez de a intervalos fijos de 2 s.
+    """
     logger.info("Esperando a que los servicios estén disponibles...")
-    
-    # Esperar a Ollama
     max_retries = 30
-    for i in range(max_retries):
-        try:
-            import ollama
-            ollama_host = os.getenv('OLLAMA_HOST', 'localhost')
-            ollama_port = os.getenv('OLLAMA_PORT', '11434')
-            client = ollama.Client(host=f'http://{ollama_host}:{ollama_port}')
-            client.list()
-            logger.info("✅ Ollama está disponible")
-            break
-        except Exception as e:
-            if i == max_retries - 1:
-                logger.error(f"❌ No se pudo conectar a Ollama después de {max_retries} intentos")
-                raise
-            logger.info(f"⏳ Esperando a Ollama... ({i+1}/{max_retries})")
-            time.sleep(2)
-    
-    # Esperar a Milvus
-    for i in range(max_retries):
+
+    def check_ollama():
+        import ollama
+        ollama_host = os.getenv('OLLAMA_HOST', 'localhost')
+        ollama_port = os.getenv('OLLAMA_PORT', '11434')
+        client = ollama.Client(host=f'http://{ollama_host}:{ollama_port}', timeout=5)
+        client.list()
+
+    def check_milvus():
+        from pymilvus import connections
+        milvus_host = os.getenv('MILVUS_HOST', 'localhost')
+        milvus_port = os.getenv('MILVUS_PORT', '19530')
+        connections.connect(host=milvus_host, port=milvus_port, timeout=5)
+        connections.disconnect("default")
+
+    for name, check in (("Ollama", check_ollama), ("Milvus", check_milvus)):
         try:
-            from pymilvus import connections
-            milvus_host = os.getenv('MILVUS_HOST', 'localhost')
-            milvus_port = os.getenv('MILVUS_PORT', '19530')
-            connections.connect(host=milvus_host, port=milvus_port)
-            connections.disconnect("default")
-            logger.info("✅ Milvus está disponible")
-            break
-        except Exception as e:
-            if i == max_retries - 1:
-                logger.error(f"❌ No se pudo conectar a Milvus después de {max_retries} intentos")
-                raise
-            logger.info(f"⏳ Esperando a Milvus... ({i+1}/{max_retries})")
-            time.sleep(2)
+            RetryPolicy(attempts=max_retries, base_delay=0.5, max_delay=4, name=f"⏳ {name}").call(check)
+        except Exception:
+            logger.error(f"❌ No se pudo conectar a {name} después de {max_retries} intentos")
+            raise
+        logger.info(f"✅ {name} está disponible")
 
 def main():
     """Función principal de prueba"""
@@ -102,8 +94,8 @@ def main():
         for i, consulta in enumerate(consultas, 1):
             logger.info(f"\n--- Consulta {i}: {consulta} ---")
             try:
-                respuesta = rag.query(consulta)
-                logger.info(f"Respuesta: {respuesta}")
+                respuesta = rag.ask(consulta)
+                logger.info(f"Respuesta: {respuesta['answer']}")
             except Exception as e:
                 logger.error(f"Error en consulta '{consulta}': {e}")
         
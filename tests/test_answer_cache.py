@@ -0,0 +1,103 @@
+"""
+Pruebas de SemanticAnswerCache (answer_cache.py): ámbitos, sustitución y caducidad
+"""
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+def vector(*values) -> np.ndarray:
+    return np.array(values + (0.0,) * (4 - len(values)), dtype=np.float32)
+
+
+def test_similar_question_in_same_scope_hits():
+    cache = SemanticAnswerCache(4, threshold=0.9)
+    cache.store(vector(1, 0.1), 5, {"answer": "a"}, scope="tenant")
+    assert cache.lookup(vector(1, 0.05), 5, scope="tenant") == {"answer": "a"}
+    assert cache.lookup(vector(1, 0.05), 5, scope="otro") is None
+    assert cache.lookup(vector(1, 0.05), 3, scope="tenant") is None
+    assert cache.lookup(vector(0, 1), 5, scope="tenant") is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_lookups_do_not_allocate_scope_codes():
+    cache = SemanticAnswerCache(4)
+    for day in range(1000):
+        assert cache.lookup(vector(1), 5, scope=("filtro", day)) is None
+    assert cache._scope_codes == {}
+    assert cache.misses == 1000
+
+
+def test_scope_codes_are_released_with_their_entries():
+    cache = SemanticAnswerCache(4, max_entries=3)
+    for day in range(10):
+        cache.store(vector(1), 5, {"answer": day}, scope=("filtro", day))
+    # Solo los ámbitos de las entradas que quedan
+    assert set(cache._scope_codes) == {("filtro", 7), ("filtro", 8), ("filtro", 9)}
+    assert cache.lookup(vector(1), 5, scope=("filtro", 9)) == {"answer": 9}
+    assert cache.lookup(vector(1), 5, scope=("filtro", 0)) is None
+
+    # Un ámbito con varias entradas conserva su código hasta sustituir la última
+    cache.store(vector(0, 1), 5, {"answer": "b"}, scope=("filtro", 9))
+    assert set(cache._scope_codes) == {("filtro", 8), ("filtro", 9)}
+    assert cache.lookup(vector(1), 5, scope=("filtro", 9)) == {"answer": 9}
+
+
+def test_expired_entries_are_replaced_first(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(4, ttl=10, max_entries=2)
+    cache.store(vector(1), 5, {"answer": "vieja"}, scope="a")
+    now[0] += 5
+    cache.store(vector(0, 1), 5, {"answer": "reciente"}, scope="b")
+    now[0] += 6
+    assert cache.lookup(vector(1), 5, scope="a") is None
+    cache.store(vector(0, 0, 1), 5, {"answer": "nueva"}, scope="c")
+    assert cache.lookup(vector(0, 1), 5, scope="b") == {"answer": "reciente"}
+    assert set(cache._scope_codes) == {"b", "c"}
+
+
+def test_clear_and_stale_generation():
+    cache = SemanticAnswerCache(4)
+    generation = cache.generation
+    cache.store(vector(1), 5, {"answer": "a"}, scope="a")
+    cache.clear()
+    assert cache.lookup(vector(1), 5, scope="a") is None
+    assert cache._scope_codes == {}
+    # Una respuesta calculada antes de la invalidación no se guarda
+    cache.store(vector(1), 5, {"answer": "a"}, generation=generation, scope="a")
+    assert cache.lookup(vector(1), 5, scope="a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_clear_in_one_process_invalidates_the_others(tmp_path):
+    stamp = str(tmp_path / "cache" / "answers.stamp")
+    # Dos workers: cada uno con su cache y la misma marca compartida
+    worker, other = SemanticAnswerCache(4, stamp_path=stamp), SemanticAnswerCache(4, stamp_path=stamp)
+    other.store(vector(1), 5, {"answer": "vieja"}, scope="a")
+    generation = other.generation
+    assert other.lookup(vector(1), 5, scope="a") == {"answer": "vieja"}
+
+    worker.clear()
+    assert other.lookup(vector(1), 5, scope="a") is None
+    # Tampoco se guarda lo que el otro worker calculó con el corpus anterior
+    other.store(vector(1), 5, {"answer": "vieja"}, generation=generation, scope="a")
+    assert other.lookup(vector(1), 5, scope="a") is None
+    other.store(vector(1), 5, {"answer": "nueva"}, generation=other.generation, scope="a")
+    assert other.lookup(vector(1), 5, scope="a") == {"answer": "nueva"}
+
+
+def test_server_requires_stamp_with_workers(monkeypatch, tmp_path):
+    from server import create_app
+    monkeypatch.setenv("RAG_SERVER_WORKERS", "2")
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    monkeypatch.delenv("ANSWER_CACHE_STAMP", raising=False)
+    monkeypatch.delenv("RETRIEVAL_MODE", raising=False)
+
+    with pytest.raises(ValueError, match="ANSWER_CACHE_STAMP"):
+        create_app()
+    monkeypatch.setenv("ANSWER_CACHE_STAMP", str(tmp_path / "answers.stamp"))
+    create_app()
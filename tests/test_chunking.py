@@ -0,0 +1,178 @@
+"""
+Pruebas de TextChunker (chunking.py): dónde corta, tamaños, solape y lectura por bloques
+"""
+
+import io
+import random
+
+import pytest
+
+import chunking
+from chunking import TextChunker, _APPROXIMATE_TOKEN
+
+
+def words(count: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(["casa", "río", "montaña", "sol", "árbol", "camino", "ñu"]) for _ in range(count))
+
+
+def document(paragraphs: int = 40, seed: int = 0) -> str:
+    """Párrafos de varias frases (con saltos de línea de Windows y Unix)"""
+    rng = random.Random(seed)
+    parts = []
+    for i in range(paragraphs):
+        sentences = [words(rng.randint(3, 25), seed=seed * 1000 + i * 10 + j).capitalize() + rng.choice(".!?…")
+                     for j in range(rng.randint(1, 6))]
+        parts.append(" ".join(sentences))
+    return "".join(part + ("\r\n\r\n" if i % 3 == 0 else "\n\n") for i, part in enumerate(parts))
+
+
+def check_spans(text: str, spans, chunk_size: int):
+    """Cada chunk es el texto de su posición, cabe en chunk_size y entre todos cubren el documento"""
+    covered = [False] * len(text)
+    for start, chunk in spans:
+        assert text[start:start + len(chunk)] == chunk
+        assert chunk == chunk.strip()
+        assert len(chunk) <= chunk_size
+        covered[start:start + len(chunk)] = [True] * len(chunk)
+    assert all(covered[i] for i, char in enumerate(text) if not char.isspace())
+
+
+@pytest.mark.parametrize("chunk_size, overlap, unit", [(100, 100, "chars"), (100, 200, "chars"), (100, -1, "chars"),
+                                                      (100, 10, "palabras")])
+def test_invalid_parameters(chunk_size, overlap, unit):
+    with pytest.raises(ValueError):
+        TextChunker(chunk_size, overlap, unit)
+
+
+def test_empty_and_short_documents():
+    chunker = TextChunker(100, 20)
+    assert chunker.split("") == []
+    assert chunker.split(" \n\t\n ") == []
+    assert chunker.split("  Una frase corta.  \n") == [(2, "Una frase corta.")]
+    # Exactamente chunk_size caracteres: un solo chunk
+    text = "a" * 100
+    assert chunker.split(text) == [(0, text)]
+
+
+def test_chunks_match_offsets_and_sizes():
+    text = document()
+    chunker = TextChunker(300, 60)
+    spans = chunker.split(text)
+    assert len(spans) > 10
+    check_spans(text, spans, 300)
+    # Todos menos el último ocupan más de medio chunk
+    assert all(len(chunk) > 150 - 2 for _, chunk in spans[:-1])
+
+
+def test_prefers_paragraph_then_sentence_then_word():
+    first = "Primera frase del párrafo. " + words(20, seed=1)
+    paragraph = first + "\n\n" + words(40, seed=2)
+    chunker = TextChunker(len(first) + 30, 0)
+    assert chunker.split(paragraph)[0][1] == first
+
+    # El fin de frase tiene que quedar en la segunda mitad del chunk
+    sentence = "Una frase que termina aquí. " + words(40, seed=3)
+    chunker = TextChunker(50, 0)
+    assert chunker.split(sentence)[0][1] == "Una frase que termina aquí."
+
+    plain = words(60, seed=4)
+    for start, chunk in TextChunker(50, 0).split(plain):
+        # Sin cortar palabras
+        assert plain[start + len(chunk):start + len(chunk) + 1] in ("", " ")
+        assert start == 0 or plain[start - 1] == " "
+
+
+def test_abbreviation_without_space_is_not_a_sentence():
+    text = "Versión 2.5 del sistema " + words(30, seed=5)
+    start, chunk = TextChunker(40, 0).split(text)[0]
+    assert not chunk.endswith("2.")
+
+
+def test_word_longer_than_chunk_is_cut():
+    text = "x" * 250
+    assert TextChunker(100, 0).split(text) == [(0, "x" * 100), (100, "x" * 100), (200, "x" * 50)]
+
+
+def test_overlap_starts_at_sentence_or_word():
+    text = document(seed=1)
+    spans = TextChunker(300, 100).split(text)
+    check_spans(text, spans, 300)
+    overlapping = 0
+    for (start, chunk), (next_start, _) in zip(spans, spans[1:]):
+        end = start + len(chunk)
+        assert start < next_start
+        if next_start < end:
+            overlapping += 1
+            # El solape empieza en una frase o una palabra, no a mitad
+            assert text[next_start - 1].isspace()
+    assert overlapping > len(spans) // 2
+
+
+def test_no_overlap_means_disjoint_chunks():
+    text = document(seed=2)
+    spans = TextChunker(200, 0).split(text)
+    for (start, chunk), (next_start, _) in zip(spans, spans[1:]):
+        assert next_start >= start + len(chunk)
+
+
+def test_file_blocks_match_string(monkeypatch, tmp_path):
+    """Leyendo por bloques pequeños (límites a mitad de palabra, de \\r\\n y de chunk) se obtiene lo mismo"""
+    text = document(paragraphs=200, seed=3)
+    chunker = TextChunker(250, 50)
+    expected = chunker.split(text)
+
+    monkeypatch.setattr(chunking, "READ_BLOCK_CHARS", 97)
+    monkeypatch.setattr(chunking, "INDEX_CHARS", 61)
+    assert list(chunker.iter_spans(io.StringIO(text))) == expected
+    # Una ruta se abre en modo texto: los \r\n llegan como \n
+    path = tmp_path / "documento.txt"
+    path.write_text(text, encoding="utf-8", newline="")
+    assert list(chunker.iter_spans(path)) == chunker.split(text.replace("\r\n", "\n"))
+
+
+def test_tokens_unit_without_tokenizer():
+    text = document(seed=4)
+    chunker = TextChunker(64, 16, unit="tokens")
+    spans = chunker.split(text)
+    assert len(spans) > 5
+    check_spans(text, spans, len(text))
+    counts = [len(_APPROXIMATE_TOKEN.findall(chunk)) for _, chunk in spans]
+    assert max(counts) <= 64
+    assert all(count > 32 - 2 for count in counts[:-1])
+    # Con tokens también coincide la lectura por bloques
+    assert list(chunker.iter_spans(io.StringIO(text))) == spans
+
+
+def test_tokens_of_any_text_match_the_regex(monkeypatch):
+    """Los tokens vectorizados son los de _APPROXIMATE_TOKEN también con signos, acentos y emojis"""
+    rng = random.Random(5)
+    text = "".join(rng.choice("ab c.\n!?…\r\tñ€😀_-中。") for _ in range(20000))
+    reader = chunking._Reader([text], tokens=True)
+    reader.has_tokens(len(text))
+    assert list(zip(reader.token_starts.tolist(), reader.token_ends.tolist())) == \
+        [match.span() for match in _APPROXIMATE_TOKEN.finditer(text)]
+
+    # Por bloques pequeños, los inicios y finales de los tokens siguen emparejados al descartar
+    chunker = TextChunker(20, 5, unit="tokens")
+    expected = chunker.split(text)
+    monkeypatch.setattr(chunking, "READ_BLOCK_CHARS", 997)
+    monkeypatch.setattr(chunking, "INDEX_CHARS", 611)
+    assert list(chunker.iter_spans(io.StringIO(text))) == expected
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.delenv("CHUNK_UNIT", raising=False)
+    monkeypatch.delenv("CHUNK_OVERLAP", raising=False)
+    monkeypatch.setenv("CHUNK_SIZE", "500")
+    chunker = TextChunker.from_env()
+    assert (chunker.chunk_size, chunker.overlap, chunker.unit) == (500, 200, "chars")
+
+    class Encoder:
+        max_seq_length = 128
+        tokenizer = None
+
+    monkeypatch.setenv("CHUNK_UNIT", "tokens")
+    monkeypatch.delenv("CHUNK_SIZE")
+    chunker = TextChunker.from_env(Encoder())
+    assert (chunker.chunk_size, chunker.overlap, chunker.unit) == (126, 32, "tokens")
@@ -0,0 +1,95 @@
+"""
+Pruebas de ContextBuilder (context_budget.py): MMR sin volver a codificar y recuento de tokens
+"""
+
+from context_budget import ContextBuilder, SEPARATOR
+from benchmarks.stubs import HashingEncoder, StubMilvusClient
+
+DIM = 32
+
+
+def no_encode(texts):
+    raise AssertionError(f"No se esperaba codificar {len(texts)} textos")
+
+
+def docs_with_embeddings():
+    encoder = HashingEncoder(dim=DIM)
+    texts = ["Milvus guarda los vectores en segmentos.", "Ollama sirve el modelo de lenguaje.",
+             "Milvus guarda los vectores en segmentos!", "BM25 puntúa por términos."]
+    docs = [{"id": i + 1, "text": text, "document_id": f"doc-{i}", "chunk_offset": 0} for i, text in enumerate(texts)]
+    embeddings = {doc["id"]: vector for doc, vector in zip(docs, encoder.encode(texts))}
+    # El tercero es un casi duplicado del primero
+    embeddings[3] = embeddings[1]
+    return docs, embeddings, encoder.encode(["vectores de Milvus"])[0]
+
+
+def test_mmr_uses_query_and_stored_embeddings():
+    docs, embeddings, query_embedding = docs_with_embeddings()
+    requested = []
+
+    def get_embeddings(ids):
+        requested.append(list(ids))
+        return {chunk_id: embeddings[chunk_id] for chunk_id in ids}
+
+    builder = ContextBuilder(no_encode, token_budget=0, get_embeddings=get_embeddings)
+    context = builder.build("vectores de Milvus", docs, query_embedding)
+    assert requested == [[1, 2, 3, 4]]
+    # El casi duplicado se descarta por su embedding guardado
+    assert context.count("Milvus guarda") == 1
+
+
+def test_missing_vectors_are_encoded():
+    docs, embeddings, _ = docs_with_embeddings()
+    encoded = []
+
+    def encode(texts):
+        encoded.extend(texts)
+        return HashingEncoder(dim=DIM).encode(texts)
+
+    builder = ContextBuilder(encode, token_budget=0, get_embeddings=lambda ids: {1: embeddings[1]})
+    builder.build("vectores de Milvus", docs)
+    # La consulta (sin embedding) y los pasajes sin vector guardado, nada más
+    assert sorted(encoded) == sorted(["vectores de Milvus"] + [doc["text"] for doc in docs[1:]])
+
+
+def test_tokens_in_does_not_tokenize_the_whole_context(monkeypatch):
+    docs, embeddings, query_embedding = docs_with_embeddings()
+    builder = ContextBuilder(no_encode, token_budget=0, get_embeddings=lambda ids: {i: embeddings[i] for i in ids})
+    counted = []
+    count = builder.tokens.count
+    monkeypatch.setattr(builder.tokens, "count", lambda text: counted.append(text) or count(text))
+
+    context = builder.build("vectores de Milvus", docs, query_embedding)
+    assert SEPARATOR.join(doc["text"] for doc in docs) not in counted
+    assert context not in counted
+    expected = sum(count(doc["text"]) for doc in docs) + count(SEPARATOR) * (len(docs) - 1)
+    assert builder.stats()["tokens_in"] == expected
+    assert 0 < builder.stats()["tokens_out"] < expected
+
+
+def test_tokenizer_is_opt_in(monkeypatch):
+    monkeypatch.delenv("CONTEXT_TOKENIZER", raising=False)
+    builder = ContextBuilder.from_env(no_encode)
+    assert builder.tokens.tokenizer_name is None
+    assert not builder.tokens.exact
+    assert builder.stats()["tokenizer"] == "estimado"
+
+    monkeypatch.setenv("CONTEXT_TOKENIZER", "org/tokenizador")
+    assert ContextBuilder.from_env(no_encode).tokens.tokenizer_name == "org/tokenizador"
+
+
+def test_ask_encodes_the_question_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("OLLAMA_PREWARM", "false")
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "false")
+    monkeypatch.delenv("CONTEXT_TOKENIZER", raising=False)
+    from rag_system import RAGSystem
+
+    rag = RAGSystem(milvus_client=StubMilvusClient(HashingEncoder(dim=DIM), path=str(tmp_path / "rag")))
+    rag.add_documents([f"Documento {i} sobre Milvus, Ollama y la búsqueda de vectores número {i}." for i in range(20)])
+    encoded = []
+    encode = rag.milvus_client.encode
+    monkeypatch.setattr(rag.milvus_client, "encode", lambda texts: encoded.append(list(texts)) or encode(texts))
+
+    retrieved = rag.retrieve_batch(["¿Qué es Milvus?"], top_k=5)[0]
+    rag.chat_request("¿Qué es Milvus?", retrieved["context_docs"], retrieved["query_embedding"])
+    assert encoded == [["¿Qué es Milvus?"]]
@@ -0,0 +1,40 @@
+"""
+Pruebas de EmbeddingCache (embedding_cache.py): orden LRU persistido
+"""
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+DIM = 4
+
+
+def open_cache(path) -> EmbeddingCache:
+    # Sitio para dos embeddings
+    return EmbeddingCache(str(path), "modelo", DIM, max_bytes=2 * DIM * 4)
+
+
+def test_hits_are_persisted_in_lru_order(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a", "b"], np.eye(2, DIM, dtype=np.float32))
+    cache.save()
+    # Solo una lectura: "a" pasa a ser la usada más recientemente
+    _, missing = cache.get_many(["a"])
+    assert missing == []
+    cache.save()
+
+    reopened = open_cache(tmp_path)
+    reopened.put_many(["c"], np.ones((1, DIM), dtype=np.float32))
+    embeddings, missing = reopened.get_many(["a", "b", "c"])
+    assert missing == [1]
+    np.testing.assert_array_equal(embeddings[0], np.eye(1, DIM, dtype=np.float32)[0])
+
+
+def test_misses_do_not_rewrite_the_index(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put_many(["a"], np.ones((1, DIM), dtype=np.float32))
+    cache.save()
+    mtime = (tmp_path / "index.json").stat().st_mtime_ns
+    cache.get_many(["x", "y"])
+    cache.save()
+    assert (tmp_path / "index.json").stat().st_mtime_ns == mtime
@@ -0,0 +1,203 @@
+"""
+Pruebas de LocalVectorStore (local_store.py): borrado, compactación, reapertura, IVF y
+recorridos concurrentes con una compactación
+"""
+
+import numpy as np
+import pytest
+
+from local_store import LocalVectorStore
+from vector_store import to_timestamp
+from benchmarks.stubs import HashingEncoder
+
+
+def make_store(path, index_type: str = "FLAT", dim: int = 16) -> LocalVectorStore:
+    encoder = HashingEncoder(dim=dim)
+    store = LocalVectorStore(path=str(path), encoder=encoder, index_type=index_type, metric_type="L2")
+    store.embedding_dim = dim
+    store.embedding_cache = None
+    store.create_collection()
+    return store
+
+
+def random_vectors(rows: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def chunks(rows: int):
+    return [{"id": i + 1, "text": f"texto {i}", "document_id": f"doc{i}", "chunk_offset": i} for i in range(rows)]
+
+
+def all_ids(store: LocalVectorStore):
+    return [chunk["id"] for batch in store.iter_chunks(output_fields=[]) for chunk in batch]
+
+
+@pytest.fixture(autouse=True)
+def no_env(monkeypatch):
+    for name in ("LOCAL_STORE_NPROBE", "LOCAL_STORE_FILTER_CACHE", "EMBEDDING_CACHE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_compact_keeps_live_rows(tmp_path):
+    store = make_store(tmp_path)
+    vectors = random_vectors(300, 16)
+    store.insert_chunks(chunks(300), vectors, flush=True)
+    store.delete_chunks(range(1, 301, 2))
+    store.compact()
+
+    assert store.count == 150
+    assert all_ids(store) == list(range(2, 301, 2))
+    # Cada fila se ha movido con su embedding, su registro y su ID
+    hits = store.search_by_embeddings(vectors[[9, 99]], top_k=1, output_fields=["text", "chunk_offset"])
+    assert [(hit[0]["id"], hit[0]["text"], hit[0]["chunk_offset"]) for hit in hits] == [
+        (10, "texto 9", 9), (100, "texto 99", 99)
+    ]
+    assert store.get_chunks([10, 11], output_fields=["text"]) == {10: {"id": 10, "text": "texto 9"}}
+
+    # Persistido: otra instancia abre la colección compactada
+    reopened = make_store(tmp_path)
+    assert reopened.count == 150
+    assert all_ids(reopened) == list(range(2, 301, 2))
+
+
+def test_flush_compacts_when_most_rows_are_dead(tmp_path):
+    store = make_store(tmp_path)
+    store.insert_chunks(chunks(2048), random_vectors(2048, 16), flush=True)
+    store.delete_chunks(range(1, 1500))
+    store.flush()
+    assert store.count == 2048 - 1499
+
+
+def test_upsert_replaces_row(tmp_path):
+    store = make_store(tmp_path)
+    vectors = random_vectors(11, 16)
+    store.insert_chunks(chunks(10), vectors[:10], flush=True)
+    store.insert_chunks([{"id": 5, "text": "nuevo", "document_id": "doc4"}], vectors[10:], flush=True)
+
+    assert sorted(all_ids(store)) == list(range(1, 11))
+    hit = store.search_by_embeddings(vectors[10:], top_k=1, output_fields=["text"])[0][0]
+    assert (hit["id"], hit["text"]) == (5, "nuevo")
+    # La versión anterior ya no aparece
+    hits = store.search_by_embeddings(vectors[4:5], top_k=11, output_fields=["text"])[0]
+    assert len(hits) == 10
+    assert "texto 4" not in [hit["text"] for hit in hits]
+
+
+def test_unflushed_rows_are_lost_on_reopen(tmp_path):
+    store = make_store(tmp_path)
+    store.insert_chunks(chunks(10), random_vectors(10, 16), flush=True)
+    store.insert_chunks(chunks(20)[10:], random_vectors(10, 16, seed=1))
+    assert store.count == 20
+
+    reopened = make_store(tmp_path)
+    assert reopened.count == 10
+    assert all_ids(reopened) == list(range(1, 11))
+
+
+def test_ivf_trains_and_finds_rows(tmp_path):
+    # nlist = 512 para 20k filas: hacen falta 39 filas por lista
+    store = make_store(tmp_path, index_type="IVF")
+    vectors = random_vectors(20000, 16)
+    store.insert_chunks(chunks(20000), vectors, flush=True)
+    store.create_index()
+    assert store.nlist == 512
+    assert (np.asarray(store._columns["lists"][:store.count]) >= 0).all()
+
+    # Cada vector está en la lista de su centroide más cercano: se encuentra a sí mismo
+    queries = np.arange(0, 20000, 997)
+    hits = store.search_by_embeddings(vectors[queries], top_k=1)
+    assert [hit[0]["id"] for hit in hits] == (queries + 1).tolist()
+
+    # Con nprobe = nlist la búsqueda es exacta
+    store.nprobe = store.nlist
+    exact = make_store(tmp_path / "flat")
+    exact.insert_chunks(chunks(20000), vectors)
+    query = random_vectors(3, 16, seed=1)
+    assert ([[hit["id"] for hit in hits] for hits in store.search_by_embeddings(query, top_k=10)] ==
+            [[hit["id"] for hit in hits] for hits in exact.search_by_embeddings(query, top_k=10)])
+
+
+def test_ivf_survives_compaction_and_reopen(tmp_path):
+    store = make_store(tmp_path, index_type="IVF")
+    vectors = random_vectors(20000, 16)
+    store.insert_chunks(chunks(20000), vectors, flush=True)
+    store.create_index()
+    store.delete_chunks(range(1, 20001, 2))
+    store.compact()
+
+    reopened = make_store(tmp_path, index_type="IVF")
+    assert reopened.nlist == 512
+    # Índices impares: las filas de ID par, que siguen vivas
+    queries = np.arange(1, 20000, 2002)
+    hits = reopened.search_by_embeddings(vectors[queries], top_k=1)
+    assert [hit[0]["id"] for hit in hits] == (queries + 1).tolist()
+
+    # Con FLAT se ignora el IVF entrenado
+    assert make_store(tmp_path, index_type="FLAT").nlist == 0
+
+
+def test_ivf_needs_enough_rows(tmp_path):
+    store = make_store(tmp_path, index_type="IVF")
+    store.insert_chunks(chunks(1000), random_vectors(1000, 16), flush=True)
+    store.create_index()
+    assert store.nlist == 0
+    assert len(store.search_by_embeddings(random_vectors(1, 16), top_k=5)[0]) == 5
+
+
+def test_iteration_is_a_snapshot_across_compaction(tmp_path):
+    store = make_store(tmp_path)
+    vectors = random_vectors(3000, 16)
+    store.insert_chunks(chunks(3000), vectors, flush=True)
+
+    batches = store.iter_embeddings(batch_size=500)
+    first = next(batches)
+    # Borrar dos tercios a mitad del recorrido: flush() compactaría
+    store.delete_chunks(range(1, 2001))
+    store.flush()
+    assert store.count == 3000
+
+    seen = [first, *batches]
+    ids = [chunk["id"] for batch, _ in seen for chunk in batch]
+    assert ids == list(range(1, 3001))
+    for batch, embeddings in seen:
+        rows = [chunk["id"] - 1 for chunk in batch]
+        np.testing.assert_allclose(embeddings, vectors[rows])
+        assert [chunk["text"] for chunk in batch] == [f"texto {row}" for row in rows]
+
+    # La compactación aplazada se hace al terminar el recorrido
+    assert store.count == 1000
+    assert all_ids(store) == list(range(2001, 3001))
+
+
+def test_abandoned_iteration_releases_compaction(tmp_path):
+    store = make_store(tmp_path)
+    store.insert_chunks(chunks(2048), random_vectors(2048, 16), flush=True)
+    batches = store.iter_chunks(batch_size=100)
+    next(batches)
+    store.delete_chunks(range(1, 2000))
+    store.flush()
+    assert store.count == 2048
+    batches.close()
+    assert store.count == 49
+
+
+def test_filter_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOCAL_STORE_FILTER_CACHE", "3")
+    store = make_store(tmp_path)
+    rows = [{**chunk, "source": f"fuente{i % 4}", "date": f"2024-01-{i % 28 + 1:02d}"}
+            for i, chunk in enumerate(chunks(200))]
+    store.insert_chunks(rows, random_vectors(200, 16), flush=True)
+    query = random_vectors(1, 16, seed=1)
+
+    # Un filtro distinto por consulta, como los date_from de /ask
+    for day in range(1, 29):
+        date_from = f"2024-01-{day:02d}"
+        hits = store.search_by_embeddings(query, top_k=200, filters={"date_from": date_from}, output_fields=["date"])[0]
+        assert len(hits) == sum(i % 28 + 1 >= day for i in range(200))
+        assert all(hit["date"] >= to_timestamp(date_from) for hit in hits)
+    assert len(store._selected_rows) == 3
+
+    hits = store.search_by_embeddings(query, top_k=200, filters={"source": ["fuente1"]}, output_fields=["source"])[0]
+    assert len(hits) == 50 and {hit["source"] for hit in hits} == {"fuente1"}
+    assert len(store._selected_rows) == 3
@@ -0,0 +1,63 @@
+"""
+Pruebas de CrossEncoderReranker (reranking.py): rondas por lotes y profundidad adaptativa
+"""
+
+import numpy as np
+
+from reranking import CrossEncoderReranker
+
+
+class ScoreModel:
+    """Cross-encoder simulado: la puntuación de cada texto es el número que lleva, y se anotan las llamadas"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size: int = 32, **kwargs) -> np.ndarray:
+        self.calls.append(list(pairs))
+        return np.array([float(text.split()[-1]) for _, text in pairs], dtype=np.float32)
+
+
+def candidates(name: str, scores) -> list:
+    # Ordenados por la búsqueda (score de distancia creciente), no por el cross-encoder
+    return [{"id": f"{name}{i}", "text": f"{name} {score}", "score": float(i)} for i, score in enumerate(scores)]
+
+
+def test_batch_scores_all_queries_in_one_predict_per_round():
+    model = ScoreModel()
+    reranker = CrossEncoderReranker(depth=4, batch_size=2, model=model)
+    docs = [
+        # Lo de detrás no entra en el top 2: se para tras el primer lote (3 pares)
+        candidates("a", [9, 8, 1, 0, 0, 0, 0, 0]),
+        # El mejor está al final: hay que llegar hasta él
+        candidates("b", [1, 2, 3, 4, 5, 6, 7, 8]),
+        [],
+    ]
+    results = reranker.rerank_batch(["qa", "qb", "qc"], docs, top_k=2)
+
+    assert [[doc["id"] for doc in query_results] for query_results in results] == [["a0", "a1"], ["b7", "b6"], []]
+    assert results[1][0]["rerank_score"] == 8.0
+    # Una llamada por ronda con los pares de todas las consultas que siguen activas
+    assert [len(call) for call in model.calls] == [6, 2, 2, 1]
+    assert {query for query, _ in model.calls[0]} == {"qa", "qb"}
+    assert all(query == "qb" for call in model.calls[1:] for query, _ in call)
+    assert reranker.stats()["pairs"] == 3 + 8
+
+
+def test_batch_matches_one_query_at_a_time():
+    rng = np.random.default_rng(0)
+    docs = [candidates(f"q{i}-", rng.integers(0, 100, size=20).tolist()) for i in range(6)]
+    queries = [f"q{i}" for i in range(6)]
+    batched = CrossEncoderReranker(depth=4, batch_size=3, model=ScoreModel()).rerank_batch(queries, docs, 5)
+    single = CrossEncoderReranker(depth=4, batch_size=3, model=ScoreModel())
+    assert batched == [single.rerank(query, query_docs, 5) for query, query_docs in zip(queries, docs)]
+
+
+def test_decisive_margin_skips_the_model():
+    model = ScoreModel()
+    reranker = CrossEncoderReranker(margin=0.5, model=model)
+    docs = candidates("a", [1, 2, 3])
+    docs[2]["score"] = 100.0
+    assert reranker.rerank("q", docs, 2) == docs[:2]
+    assert model.calls == []
+    assert reranker.stats()["skipped"] == 1
@@ -0,0 +1,363 @@
+"""
+Pruebas de RetryPolicy y CircuitBreaker (resilience.py)
+
+El reloj (time.monotonic), las esperas y el jitter (random.uniform) están sustituidos:
+las pruebas son deterministas y no esperan de verdad.
+"""
+
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+
+class Clock:
+    """Reloj manual para time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Esperas pedidas (time.sleep y asyncio.sleep no esperan); el jitter devuelve el máximo"""
+    sleeps = []
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+
+    async def fake_async_sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(resilience.asyncio, "sleep", fake_async_sleep)
+    return sleeps
+
+
+class Flaky:
+    """Función que falla las `failures` primeras veces y después devuelve "ok\""""
+
+    def __init__(self, failures: int, error: Exception = None):
+        self.failures = failures
+        self.error = error or ConnectionError("caído")
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+def fail():
+    raise ConnectionError("caído")
+
+
+# RetryPolicy
+
+
+def test_retry_waits_exponentially_until_success(sleeps):
+    policy = RetryPolicy(attempts=4, base_delay=0.5, max_delay=1.5)
+    function = Flaky(3)
+    assert policy.call(function) == "ok"
+    assert function.calls == 4
+    # min(max_delay, base_delay * 2**n) con el jitter al máximo
+    assert sleeps == [0.5, 1.0, 1.5]
+    assert policy.retries == 3
+
+
+def test_retry_gives_up_after_attempts(sleeps):
+    policy = RetryPolicy(attempts=3, base_delay=0.1)
+    function = Flaky(5)
+    with pytest.raises(ConnectionError):
+        policy.call(function)
+    assert function.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_retry_only_retryable_errors(sleeps):
+    policy = RetryPolicy(attempts=3, retry_if=lambda e: isinstance(e, ConnectionError))
+    function = Flaky(1, ValueError("petición inválida"))
+    with pytest.raises(ValueError):
+        policy.call(function)
+    assert function.calls == 1
+    assert sleeps == []
+
+
+def test_retry_at_least_one_attempt(sleeps):
+    policy = RetryPolicy(attempts=0)
+    assert policy.attempts == 1
+    with pytest.raises(ConnectionError):
+        policy.call(fail)
+    assert sleeps == []
+
+
+def test_retry_stream_before_first_item(sleeps):
+    calls = []
+
+    def stream():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("caído")
+        yield from "abc"
+
+    assert list(RetryPolicy(attempts=2).call_stream(stream)) == ["a", "b", "c"]
+    assert len(calls) == 2
+
+
+def test_retry_stream_not_after_first_item(sleeps):
+    calls = []
+
+    def stream():
+        calls.append(1)
+        yield "a"
+        raise ConnectionError("cortado")
+
+    received = []
+    with pytest.raises(ConnectionError):
+        for item in RetryPolicy(attempts=3).call_stream(stream):
+            received.append(item)
+    # Lo ya emitido no se repite
+    assert received == ["a"]
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_retry_async(sleeps):
+    function = Flaky(2)
+
+    async def coroutine():
+        return function()
+
+    assert asyncio.run(RetryPolicy(attempts=3, base_delay=0.1).call_async(coroutine)) == "ok"
+    assert function.calls == 3
+    assert sleeps == [0.1, 0.2]
+
+
+def test_retry_async_stream_not_after_first_item(sleeps):
+    calls = []
+
+    async def stream():
+        calls.append(1)
+        yield "a"
+        raise ConnectionError("cortado")
+
+    async def consume():
+        received = []
+        with pytest.raises(ConnectionError):
+            async for item in RetryPolicy(attempts=3).call_async_stream(stream):
+                received.append(item)
+        return received
+
+    assert asyncio.run(consume()) == ["a"]
+    assert len(calls) == 1
+
+
+def test_retry_from_env(monkeypatch):
+    monkeypatch.setenv("TEST_RETRIES", "5")
+    monkeypatch.setenv("TEST_RETRY_BASE_DELAY", "0.05")
+    policy = RetryPolicy.from_env("TEST")
+    assert (policy.attempts, policy.base_delay, policy.max_delay, policy.name) == (5, 0.05, 5.0, "Test")
+
+
+# CircuitBreaker
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("Test", failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.CLOSED
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 1
+
+    function = Flaky(0)
+    with pytest.raises(CircuitOpenError):
+        breaker.call(function)
+    assert function.calls == 0
+    assert breaker.rejected == 1
+
+
+def test_breaker_success_resets_failures(clock):
+    breaker = CircuitBreaker("Test", failure_threshold=2)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.call(Flaky(0)) == "ok"
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    # Los fallos tienen que ser seguidos
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_ignores_non_failures(clock):
+    breaker = CircuitBreaker("Test", failure_threshold=1, is_failure=lambda e: isinstance(e, ConnectionError))
+    with pytest.raises(ValueError):
+        breaker.call(Flaky(1, ValueError("petición inválida")))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_single_probe(clock):
+    breaker = CircuitBreaker("Test", failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 9.9
+    with pytest.raises(CircuitOpenError):
+        breaker.call(Flaky(0))
+    clock.now += 0.1
+
+    # Solo pasa una llamada de prueba; las demás se rechazan mientras no termina
+    probe = breaker.call_stream(lambda: iter("ab"))
+    assert next(probe) == "a"
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(Flaky(0))
+    assert list(probe) == ["b"]
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.call(Flaky(0)) == "ok"
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("Test", failure_threshold=2, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    # Vuelve a contar reset_timeout desde la prueba fallida
+    clock.now += 5
+    with pytest.raises(CircuitOpenError):
+        breaker.call(Flaky(0))
+    clock.now += 5
+    assert breaker.call(Flaky(0)) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_disabled_with_zero_threshold(clock):
+    breaker = CircuitBreaker("Test", failure_threshold=0)
+    for _ in range(10):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.call(Flaky(0)) == "ok"
+
+
+def test_breaker_stream_closed_early_is_success(clock):
+    breaker = CircuitBreaker("Test", failure_threshold=1)
+    stream = breaker.call_stream(lambda: iter("abc"))
+    assert next(stream) == "a"
+    stream.close()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_breaker_cancelled_probe_is_released(clock):
+    """Cancelar la prueba no cierra ni abre el circuito, pero deja pasar otra"""
+    breaker = CircuitBreaker("Test", failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        probe = asyncio.ensure_future(breaker.call_async(hang))
+        await started.wait()
+        with pytest.raises(CircuitOpenError):
+            await breaker.call_async(asyncio.sleep, 0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        async def ok():
+            return "ok"
+
+        return await breaker.call_async(ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_async_stream_cancelled(clock):
+    """Un stream cancelado antes del primer elemento se olvida; después, cuenta como éxito"""
+    breaker = CircuitBreaker("Test", failure_threshold=1, reset_timeout=10)
+    open_breaker(breaker)
+    clock.now += 10
+
+    async def scenario():
+        gate = asyncio.Event()
+        closed = []
+
+        class Stream:
+            def __init__(self, items):
+                self.items = list(items)
+
+            def __aiter__(self):
+                return self
+
+            async def __anext__(self):
+                await gate.wait()
+                if not self.items:
+                    raise StopAsyncIteration
+                # Cada elemento espera a que se vuelva a abrir la puerta
+                gate.clear()
+                return self.items.pop(0)
+
+            async def aclose(self):
+                closed.append(True)
+
+        async def consume(results):
+            async for item in breaker.call_async_stream(lambda: Stream("ab")):
+                results.append(item)
+
+        # Cancelada antes del primer elemento: sin cambiar el estado
+        task = asyncio.ensure_future(consume([]))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert closed == [True]
+
+        # Cancelada después del primer elemento: el servicio respondía
+        gate.set()
+        results = []
+        task = asyncio.ensure_future(consume(results))
+        for _ in range(100):
+            if results:
+                break
+            await asyncio.sleep(0)
+        assert results == ["a"]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_from_env(monkeypatch):
+    monkeypatch.setenv("TEST_BREAKER_THRESHOLD", "0")
+    monkeypatch.setenv("TEST_BREAKER_RESET", "2.5")
+    breaker = CircuitBreaker.from_env("TEST")
+    assert (breaker.failure_threshold, breaker.reset_timeout, breaker.name) == (0, 2.5, "Test")
@@ -0,0 +1,206 @@
+"""
+Pruebas de los snapshots (snapshot.py): ida y vuelta, espacio de nombres y ficheros
+truncados o que no corresponden al almacén
+"""
+
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from snapshot import END_MAGIC, export_snapshot, import_snapshot
+from local_store import LocalVectorStore
+from vector_store import DEFAULT_NAMESPACE
+from benchmarks.stubs import HashingEncoder
+
+DIM = 16
+
+
+def make_store(path) -> LocalVectorStore:
+    store = LocalVectorStore(path=str(path), encoder=HashingEncoder(dim=DIM), index_type="FLAT", metric_type="L2")
+    store.embedding_dim = DIM
+    store.embedding_cache = None
+    store.create_collection()
+    return store
+
+
+def contents(store: LocalVectorStore):
+    """Chunks (ordenados por ID) y sus embeddings"""
+    rows = [(chunk, embedding) for chunks, embeddings in store.iter_embeddings(batch_size=7)
+            for chunk, embedding in zip(chunks, embeddings)]
+    rows.sort(key=lambda row: row[0]["id"])
+    return [chunk for chunk, _ in rows], np.array([embedding for _, embedding in rows])
+
+
+@pytest.fixture(autouse=True)
+def no_env(monkeypatch):
+    for name in ("LOCAL_STORE_NPROBE", "LOCAL_STORE_FILTER_CACHE", "EMBEDDING_CACHE_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def source(tmp_path):
+    store = make_store(tmp_path / "source")
+    chunks = [
+        {"text": f"texto número {i} con acentos: ñandú", "source": f"fuente{i % 3}", "document_id": f"doc{i // 4}",
+         "chunk_offset": (i % 4) * 100, "date": f"2024-03-{i % 28 + 1:02d}" if i % 5 else None,
+         "tags": [f"etiqueta{i % 2}"] if i % 3 else [], "namespace": "tenant-a" if i % 2 else DEFAULT_NAMESPACE}
+        for i in range(50)
+    ]
+    store.insert_chunks(chunks, flush=True)
+    return store
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, source):
+    path = str(tmp_path / "coleccion.snap")
+    # Lotes pequeños: varios grupos de filas
+    stats = export_snapshot(source, path, batch_size=8)
+    assert stats["rows"] == 50
+    return path
+
+
+def test_round_trip(tmp_path, source, snapshot_path):
+    target = make_store(tmp_path / "target")
+    stats = import_snapshot(target, snapshot_path, upsert=False)
+    assert stats["rows"] == 50
+
+    source_chunks, source_embeddings = contents(source)
+    target_chunks, target_embeddings = contents(target)
+    assert target_chunks == source_chunks
+    # Los embeddings se copian tal cual, sin volver a generarlos
+    assert np.array_equal(target_embeddings, source_embeddings)
+
+    # Persistido con un único flush al final
+    assert contents(make_store(tmp_path / "target"))[0] == source_chunks
+    assert not os.path.exists(f"{snapshot_path}.tmp")
+
+
+def test_import_upsert_is_idempotent(tmp_path, source, snapshot_path):
+    import_snapshot(source, snapshot_path)
+    chunks, _ = contents(source)
+    assert len(chunks) == 50
+
+
+def test_export_one_namespace(tmp_path, source):
+    path = str(tmp_path / "tenant.snap")
+    assert export_snapshot(source, path, namespace="tenant-a")["rows"] == 25
+    target = make_store(tmp_path / "target")
+    import_snapshot(target, path)
+    chunks, _ = contents(target)
+    assert {chunk["namespace"] for chunk in chunks} == {"tenant-a"}
+    assert target.namespaces() == [DEFAULT_NAMESPACE, "tenant-a"]
+
+
+@pytest.fixture
+def target(tmp_path):
+    """Almacén con unos chunks propios, que una importación fallida no puede tocar"""
+    store = make_store(tmp_path / "target")
+    store.insert_chunks([{"text": f"previo {i}", "document_id": f"previo{i}"} for i in range(5)], flush=True)
+    return store
+
+
+def test_truncated_snapshot_is_rejected(tmp_path, snapshot_path, target):
+    before = contents(target)
+    with open(snapshot_path, "rb") as f:
+        data = f.read()
+    # En la cabecera, a mitad de un grupo, antes del final y sin el último byte
+    for size in (5, 20, len(data) // 2, len(data) - len(END_MAGIC) - 8, len(data) - 1):
+        path = str(tmp_path / f"cortado-{size}.snap")
+        with open(path, "wb") as f:
+            f.write(data[:size])
+        with pytest.raises(ValueError):
+            import_snapshot(target, path)
+        # Rechazado antes de insertar nada
+        assert target.count == 5
+    assert contents(target)[0] == before[0]
+
+
+def test_row_count_mismatch_is_rejected(tmp_path, snapshot_path, target):
+    with open(snapshot_path, "r+b") as f:
+        f.seek(-8, os.SEEK_END)
+        f.write(struct.pack("<Q", 49))
+    with pytest.raises(ValueError, match="inconsistente"):
+        import_snapshot(target, snapshot_path)
+    assert target.count == 5
+
+
+def test_corrupt_group_is_rejected(tmp_path, snapshot_path, target):
+    with open(snapshot_path, "rb") as f:
+        data = bytearray(f.read())
+    # Un byte cambiado en las columnas JSON comprimidas del último grupo
+    last_group = data.rindex(b"ROWG")
+    data[last_group + 4 + 8 + 8 + 10] ^= 0xFF
+    path = str(tmp_path / "corrupto.snap")
+    with open(path, "wb") as f:
+        f.write(data)
+    with pytest.raises(ValueError, match="corrupto"):
+        import_snapshot(target, path)
+    assert target.count == 5
+
+
+def test_rag_replace_keeps_collection_on_bad_snapshot(tmp_path, snapshot_path, monkeypatch):
+    """import_snapshot(replace=True) valida el fichero antes de vaciar la colección"""
+    monkeypatch.setenv("OLLAMA_PREWARM", "false")
+    monkeypatch.setenv("RETRIEVAL_MODE", "hybrid")
+    monkeypatch.setenv("SPARSE_INDEX_DIR", str(tmp_path / "bm25"))
+    from rag_system import RAGSystem
+    from benchmarks.stubs import StubMilvusClient
+
+    rag = RAGSystem(milvus_client=StubMilvusClient(HashingEncoder(dim=DIM), path=str(tmp_path / "rag")))
+    rag.add_documents(["Un documento que tiene que seguir ahí después de la importación fallida."])
+    ids = [chunk["id"] for batch in rag.milvus_client.iter_chunks() for chunk in batch]
+    saved = []
+    monkeypatch.setattr(rag, "_save_sparse", lambda: saved.append(True))
+
+    with open(snapshot_path, "rb") as f:
+        data = f.read()
+    truncated = str(tmp_path / "cortado.snap")
+    with open(truncated, "wb") as f:
+        f.write(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        rag.import_snapshot(truncated, replace=True)
+    assert [chunk["id"] for batch in rag.milvus_client.iter_chunks() for chunk in batch] == ids
+    assert saved == []
+
+    assert rag.import_snapshot(snapshot_path, replace=True)["rows"] == 50
+    assert saved == [True]
+
+
+def test_not_a_snapshot(tmp_path):
+    path = str(tmp_path / "otro.bin")
+    with open(path, "wb") as f:
+        f.write(b"no es un snapshot")
+    with pytest.raises(ValueError, match="no es un snapshot"):
+        import_snapshot(make_store(tmp_path / "target"), path)
+
+
+def test_dimension_and_model_must_match(tmp_path, snapshot_path):
+    other_dim = LocalVectorStore(path=str(tmp_path / "dim"), encoder=HashingEncoder(dim=8), metric_type="L2")
+    other_dim.embedding_dim = 8
+    other_dim.embedding_cache = None
+    with pytest.raises(ValueError, match="dimensión"):
+        import_snapshot(other_dim, snapshot_path)
+
+    other_model = make_store(tmp_path / "model")
+    other_model.model_name = "otro-modelo"
+    with pytest.raises(ValueError, match="modelo"):
+        import_snapshot(other_model, snapshot_path)
+    assert import_snapshot(other_model, snapshot_path, check_model=False)["rows"] == 50
+
+
+def test_failed_export_keeps_previous_file(tmp_path, source, snapshot_path, monkeypatch):
+    with open(snapshot_path, "rb") as f:
+        previous = f.read()
+
+    def broken(*args, **kwargs):
+        yield from ()
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(source, "iter_embeddings", broken)
+    with pytest.raises(OSError):
+        export_snapshot(source, snapshot_path)
+    with open(snapshot_path, "rb") as f:
+        assert f.read() == previous
+    assert not os.path.exists(f"{snapshot_path}.tmp")
@@ -0,0 +1,93 @@
+"""
+Pruebas del índice BM25 (sparse_index.py) y de su configuración en RAGSystem y el servidor
+"""
+
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from sparse_index import BM25Index, NamespacedBM25Index, tokenize
+
+WORDS = ["milvus", "ollama", "vector", "índice", "consulta", "documento", "modelo", "latencia"]
+
+
+def reference_scores(index: BM25Index, query: str):
+    """Puntuaciones BM25 calculadas término a término, sin recortes"""
+    num_docs = len(index._docs)
+    average_length = index._total_length / num_docs
+    scores = Counter()
+    for term in set(tokenize(query)):
+        postings = index._postings.get(term, {})
+        idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        for chunk_id, frequency in postings.items():
+            norm = index.k1 * (1 - index.b + index.b * index._docs[chunk_id][0] / average_length)
+            scores[chunk_id] += idf * frequency * (index.k1 + 1) / (frequency + norm)
+    return scores
+
+
+def random_chunks(rng, ids):
+    return [{"id": i, "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 30))) + f" sku-{i}"}
+            for i in ids]
+
+
+def test_search_matches_reference_after_updates():
+    rng = random.Random(0)
+    index = BM25Index(max_postings=0)
+    index.add(random_chunks(rng, range(500)))
+    index.search("milvus vector")
+    # Sustituciones y borrados después de haber convertido ya algunos términos a arrays
+    index.add(random_chunks(rng, range(0, 500, 7)))
+    index.remove(range(1, 500, 5))
+    index.add(random_chunks(rng, range(500, 600)))
+
+    for query in ["milvus vector", "consulta de latencia sku-42", "sku-503", "modelo modelo índice", "nada"]:
+        expected = reference_scores(index, query)
+        hits = index.search(query, 10)
+        assert len(hits) == min(10, len(expected))
+        for chunk_id, score in hits:
+            assert score == pytest.approx(expected[chunk_id], rel=1e-5)
+        # Los devueltos son los mejores (salvo empates)
+        if hits:
+            assert hits[-1][1] >= sorted(expected.values(), reverse=True)[len(hits) - 1] - 1e-5
+
+
+def test_common_terms_are_capped():
+    index = BM25Index(max_postings=50)
+    index.add({"id": i, "text": "milvus " * (1 + i % 3) + f"sku-{i}"} for i in range(1000))
+    rows, _, count = index._term_arrays("milvus", index._total_length / len(index))
+    assert (len(rows), count) == (50, 1000)
+    # Los identificadores raros se siguen encontrando primero
+    assert index.search("milvus sku-777", 1)[0][0] == 777
+    assert len(index.search("milvus", 100)) == 50
+
+
+def test_persisted_index_is_searchable(tmp_path):
+    index = NamespacedBM25Index(path=str(tmp_path))
+    index.add([{"id": 1, "text": "contrato de acme"}, {"id": 2, "text": "factura", "namespace": "globex"}])
+    index.save()
+    reloaded = NamespacedBM25Index(path=str(tmp_path))
+    assert reloaded.search_batch(["acme"])[0][0][0] == 1
+    assert reloaded.search_batch(["factura"], namespaces=["globex"])[0][0][0] == 2
+
+
+def test_hybrid_requires_sparse_index_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_MODE", "hybrid")
+    monkeypatch.delenv("SPARSE_INDEX_DIR", raising=False)
+    from rag_system import RAGSystem
+    from benchmarks.stubs import HashingEncoder, StubMilvusClient
+
+    with pytest.raises(ValueError, match="SPARSE_INDEX_DIR"):
+        RAGSystem(milvus_client=StubMilvusClient(HashingEncoder(dim=8), path=str(tmp_path)))
+
+
+def test_server_refuses_workers_with_sparse_index(monkeypatch):
+    from server import create_app
+    monkeypatch.setenv("RAG_SERVER_WORKERS", "2")
+    monkeypatch.setenv("RETRIEVAL_MODE", "hybrid")
+
+    with pytest.raises(ValueError, match="RAG_SERVER_WORKERS"):
+        create_app()
+    monkeypatch.setenv("RETRIEVAL_MODE", "dense")
+    create_app()
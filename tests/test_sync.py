@@ -0,0 +1,51 @@
+"""
+Pruebas de los IDs de chunk y de sync_documents (rag_system.py)
+"""
+
+from vector_store import chunk_id
+from benchmarks.stubs import HashingEncoder, StubMilvusClient
+
+PARAGRAPH = "Este párrafo se repite igual en varias partes del mismo documento de prueba."
+
+
+def make_rag(tmp_path, monkeypatch):
+    monkeypatch.setenv("OLLAMA_PREWARM", "false")
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "false")
+    monkeypatch.setenv("RETRIEVAL_MODE", "dense")
+    monkeypatch.setenv("CHUNK_UNIT", "chars")
+    monkeypatch.setenv("CHUNK_SIZE", "100")
+    monkeypatch.setenv("CHUNK_OVERLAP", "0")
+    from rag_system import RAGSystem
+    return RAGSystem(milvus_client=StubMilvusClient(HashingEncoder(dim=16), path=str(tmp_path / "rag")))
+
+
+def stored(rag):
+    return sorted((chunk["chunk_offset"], chunk["text"])
+                  for batch in rag.milvus_client.iter_chunks(output_fields=["text", "chunk_offset"])
+                  for chunk in batch)
+
+
+def test_chunk_id_depends_on_offset():
+    assert chunk_id("doc", PARAGRAPH, offset=0) != chunk_id("doc", PARAGRAPH, offset=80)
+    assert chunk_id("doc", PARAGRAPH, offset=80) == chunk_id("doc", PARAGRAPH, offset=80)
+
+
+def test_repeated_chunks_are_all_stored(tmp_path, monkeypatch):
+    rag = make_rag(tmp_path, monkeypatch)
+    text = "\n\n".join([PARAGRAPH] * 4)
+    spans = rag.chunker.split(text)
+    assert len(spans) == 4 and len({chunk for _, chunk in spans}) == 1
+
+    stats = rag.sync_documents([("faq.txt", text)], source="data")
+    assert stats["chunks"] == 4
+    assert stored(rag) == sorted(spans)
+
+    # Sin cambios no se inserta ni se borra nada
+    stats = rag.sync_documents([("faq.txt", text)], source="data")
+    assert (stats["chunks"], stats["unchanged"], stats["deleted"]) == (0, 4, 0)
+
+    # Texto nuevo al principio: los chunks desplazados se guardan con su offset nuevo
+    edited = "Introducción añadida al principio del documento, antes de los párrafos.\n\n" + text
+    stats = rag.sync_documents([("faq.txt", edited)], source="data")
+    assert (stats["chunks"], stats["deleted"]) == (5, 4)
+    assert stored(rag) == sorted(rag.chunker.split(edited))
@@ -0,0 +1,433 @@
+import os
+import json
+import math
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timezone
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sequence, Tuple, Union
+import numpy as np
+from embedding_backends import EmbeddingBackend, create_embedding_backend
+from embedding_cache import EmbeddingCache
+from embedding_pool import EmbeddingPool
+from metrics import get_metrics
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Backends disponibles para VECTOR_STORE
+VECTOR_STORES = ("milvus", "local")
+
+# Campos de cada chunk además del ID y el embedding
+CHUNK_FIELDS = ("text", "source", "document_id", "chunk_offset", "date", "tags")
+
+# Metadatos escalares por los que se puede filtrar: fecha (segundos Unix, 0 = sin fecha) y etiquetas
+METADATA_FIELDS = ("date", "tags")
+MAX_TAGS = 32
+MAX_TAG_LENGTH = 64
+
+# Claves de un filtro (ver normalize_filters)
+FILTER_KEYS = ("source", "date_from", "date_to", "tags")
+
+# Campos que acompañan a cada resultado de búsqueda (para unir chunks contiguos)
+SEARCH_FIELDS = ("text", "document_id", "chunk_offset")
+
+# Espacio de nombres por defecto (el de los datos anteriores a los espacios de nombres)
+DEFAULT_NAMESPACE = ""
+
+# Tipos de índice y métricas soportados
+INDEX_TYPES = ("FLAT", "IVF_FLAT", "IVF_SQ8", "IVF_PQ", "HNSW", "DISKANN")
+METRIC_TYPES = ("L2", "IP", "COSINE")
+
+# Parámetro de búsqueda que controla el compromiso recall/latencia de cada índice
+SEARCH_PARAM_KEYS = {
+    "IVF_FLAT": "nprobe",
+    "IVF_SQ8": "nprobe",
+    "IVF_PQ": "nprobe",
+    "HNSW": "ef",
+    "DISKANN": "search_list",
+}
+
+
+def auto_index_params(index_type: str, num_rows: int, dim: int) -> Dict[str, Any]:
+    """Parámetros de construcción del índice según el número de filas esperado
+
+    IVF: nlist ≈ 4·sqrt(filas) redondeado a potencia de 2 (128 si la colección está
+    vacía). IVF_PQ: subvectores de 8 dimensiones. HNSW: M=16 (32 a partir de 1M filas).
+    """
+    if index_type in ("IVF_FLAT", "IVF_SQ8", "IVF_PQ"):
+        nlist = 128
+        if num_rows > 0:
+            nlist = 2 ** round(math.log2(4 * math.sqrt(num_rows)))
+            nlist = min(max(nlist, 16), 65536)
+        params = {"nlist": nlist}
+        if index_type == "IVF_PQ":
+            subvector = next(size for size in (8, 4, 2, 1) if dim % size == 0)
+            params.update({"m": dim // subvector, "nbits": 8})
+        return params
+    if index_type == "HNSW":
+        return {"M": 32 if num_rows >= 1_000_000 else 16, "efConstruction": 200}
+    return {}
+
+
+def auto_search_params(index_type: str, index_params: Dict[str, Any], top_k: int) -> Dict[str, Any]:
+    """Parámetros de búsqueda por defecto para un índice y un top_k
+
+    IVF: nprobe = nlist/16 (mínimo 10). HNSW: ef = max(64, 2·top_k). DISKANN:
+    search_list = max(100, top_k).
+    """
+    if index_type in ("IVF_FLAT", "IVF_SQ8", "IVF_PQ"):
+        nlist = index_params.get("nlist", 128)
+        return {"nprobe": min(max(nlist // 16, 10), nlist)}
+    if index_type == "HNSW":
+        return {"ef": max(64, 2 * top_k)}
+    if index_type == "DISKANN":
+        return {"search_list": max(100, top_k)}
+    return {}
+
+
+def document_hash(text: str) -> str:
+    """Identificador de un documento sin ID propio: hash de su contenido"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def chunk_id(document_id: str, text: str, namespace: str = DEFAULT_NAMESPACE, offset: int = 0) -> int:
+    """ID estable de un chunk: hash de 63 bits del espacio de nombres, el documento, la posición y el texto
+
+    La posición (`chunk_offset`) distingue los chunks con el mismo texto dentro de un
+    documento (un párrafo repetido), que con el mismo ID se pisarían. El espacio de nombres
+    por defecto no entra en el hash.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    if namespace:
+        digest.update(namespace.encode("utf-8"))
+        digest.update(b"\0\0")
+    digest.update(document_id.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(str(offset).encode("ascii"))
+    digest.update(b"\0")
+    digest.update(text.encode("utf-8"))
+    # Los INT64 de Milvus tienen signo: se descarta el bit alto para que sea positivo
+    return int.from_bytes(digest.digest(), "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def to_timestamp(value: Union[None, int, float, str, date, datetime]) -> int:
+    """Fecha como segundos Unix: número, date/datetime o ISO 8601 ("2024-05-01"); sin zona, UTC"""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def normalize_tags(tags: Union[None, str, Iterable[str]]) -> List[str]:
+    """Etiquetas de un chunk sin repetir y en orden (como mucho MAX_TAGS de MAX_TAG_LENGTH caracteres)"""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = [tags]
+    tags = sorted({str(tag) for tag in tags})
+    if len(tags) > MAX_TAGS or any(len(tag) > MAX_TAG_LENGTH for tag in tags):
+        raise ValueError(f"Como mucho {MAX_TAGS} etiquetas de {MAX_TAG_LENGTH} caracteres")
+    return tags
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Validar un filtro de metadatos y dejarlo en forma canónica (None si no filtra nada)
+
+    Claves (todas se combinan con AND):
+    - source: un source o una lista (cualquiera de ellos)
+    - date_from / date_to: fechas límite, incluidas (ver to_timestamp)
+    - tags: una etiqueta o una lista (basta con que el chunk tenga una)
+    """
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Claves de filtro no soportadas: {', '.join(sorted(unknown))} (opciones: {', '.join(FILTER_KEYS)})")
+    normalized: Dict[str, Any] = {}
+    if filters.get("source") is not None:
+        sources = filters["source"]
+        normalized["source"] = sorted({sources} if isinstance(sources, str) else set(sources))
+    for key in ("date_from", "date_to"):
+        if filters.get(key) is not None:
+            normalized[key] = to_timestamp(filters[key])
+    if filters.get("tags"):
+        normalized["tags"] = normalize_tags(filters["tags"])
+    return normalized or None
+
+
+def filter_key(filters: Optional[Dict[str, Any]]) -> Optional[Tuple]:
+    """Filtro normalizado como tupla (para usarlo como clave de una cache)"""
+    if filters is None:
+        return None
+    return tuple((key, tuple(value) if isinstance(value, list) else value) for key, value in sorted(filters.items()))
+
+
+def filter_expression(filters: Dict[str, Any]) -> str:
+    """Expresión booleana de Milvus de un filtro normalizado (los valores van escapados como JSON)"""
+    clauses = []
+    if "source" in filters:
+        clauses.append(f"source in {json.dumps(filters['source'], ensure_ascii=False)}")
+    if "date_from" in filters:
+        clauses.append(f"date >= {filters['date_from']}")
+    if "date_to" in filters:
+        clauses.append(f"date <= {filters['date_to']}")
+    if "tags" in filters:
+        clauses.append(f"array_contains_any(tags, {json.dumps(filters['tags'], ensure_ascii=False)})")
+    return " and ".join(clauses)
+
+
+def matches_filters(chunk: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    """Si un chunk (con source, date y tags) cumple un filtro normalizado"""
+    if filters is None:
+        return True
+    if "source" in filters and chunk.get("source", "") not in filters["source"]:
+        return False
+    if "date_from" in filters and chunk.get("date", 0) < filters["date_from"]:
+        return False
+    if "date_to" in filters and chunk.get("date", 0) > filters["date_to"]:
+        return False
+    if "tags" in filters and not set(chunk.get("tags") or ()) & set(filters["tags"]):
+        return False
+    return True
+
+
+def check_output_fields(output_fields: Optional[Sequence[str]]):
+    """Comprobar que los campos pedidos existen (además de id y score, que siempre se devuelven)"""
+    if output_fields is None:
+        return
+    unknown = [field for field in output_fields if field not in CHUNK_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos no soportados: {', '.join(unknown)} (opciones: {', '.join(CHUNK_FIELDS)})")
+
+
+def namespace_list(namespace: Union[None, str, Sequence[str]]) -> List[str]:
+    """Espacios de nombres de una llamada: None es el espacio por defecto; se admite uno o varios"""
+    if namespace is None:
+        return [DEFAULT_NAMESPACE]
+    if isinstance(namespace, str):
+        return [namespace]
+    return sorted(set(namespace))
+
+
+class VectorStore(ABC):
+    """Interfaz común de los almacenes de vectores (Milvus o local)
+
+    La clase base se ocupa del modelo de embeddings y de su cache; cada backend
+    implementa la gestión de la colección, la inserción, la búsqueda y el borrado.
+    Los resultados de búsqueda son listas de {"text", "score", "id"} por consulta, más
+    document_id y chunk_offset si la colección los guarda (ver search_fields).
+
+    Cada chunk pertenece a un espacio de nombres (su campo "namespace", el por defecto si
+    no lo tiene): una partición en Milvus, una columna en el almacén local. Las búsquedas
+    y lecturas con `namespaces` solo ven esos espacios; sin él, todo lo cargado.
+
+    Las búsquedas aceptan además un filtro de metadatos (`filters`, ver normalize_filters),
+    que se aplica antes de buscar los vecinos y no después, y `output_fields` para devolver
+    solo esos campos de cada resultado (p. ej. sin el texto).
+    """
+
+    def __init__(self, encoder: EmbeddingBackend = None, metric_type: str = "L2"):
+        self.collection_name = "documents"
+        self.metric_type = metric_type
+
+        # Modelo de embeddings (EMBEDDING_BACKEND), cargado en el primer uso; se puede
+        # inyectar cualquier objeto con encode(), p. ej. un SentenceTransformer ya cargado
+        self.model_name = 'all-MiniLM-L6-v2'
+        self.encoder = encoder or create_embedding_backend(self.model_name)
+        self.embedding_dim = 384  # Dimensión del modelo all-MiniLM-L6-v2
+
+        # Cache persistente de embeddings (opcional, con EMBEDDING_CACHE_DIR)
+        self.embedding_cache = EmbeddingCache.from_env(getattr(self.encoder, "cache_key", self.model_name),
+                                                       self.embedding_dim)
+
+        # Pool de procesos para los embeddings de la ingesta (opcional, con EMBEDDING_WORKERS).
+        # Cada worker carga model_name, así que con un encoder inyectado no se crea
+        self.embedding_pool = None
+        if encoder is None:
+            self.embedding_pool = EmbeddingPool.from_env(self.model_name, self.embedding_dim, self.encoder.name)
+
+    @abstractmethod
+    def connect(self):
+        """Conectar con el almacén"""
+
+    @abstractmethod
+    def create_collection(self):
+        """Crear la colección si no existe (o abrir la existente)"""
+
+    @abstractmethod
+    def create_index(self):
+        """Crear el índice vectorial si el backend lo necesita"""
+
+    @abstractmethod
+    def load_collection(self, force: bool = False):
+        """Dejar la colección lista para buscar"""
+
+    @abstractmethod
+    def insert_chunks(self, chunks: List[Dict[str, Any]], embeddings: Optional[np.ndarray] = None,
+                      flush: bool = False, upsert: bool = True):
+        """Insertar chunks (text, source, document_id, chunk_offset, date, tags y namespace) con sus embeddings"""
+
+    @abstractmethod
+    def flush(self):
+        """Persistir los datos insertados"""
+
+    @abstractmethod
+    def search_by_embeddings(self, query_embeddings: np.ndarray, top_k: int = 5,
+                             namespaces: Optional[Sequence[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                             output_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Buscar documentos similares a partir de embeddings ya calculados
+
+        Solo en `namespaces` y entre los chunks que cumplen `filters` si se indican; cada
+        resultado trae "id", "score" y los campos de `output_fields` (search_fields por defecto).
+        """
+
+    @abstractmethod
+    def iter_chunks(self, source: Optional[str] = None, output_fields: Optional[List[str]] = None,
+                    batch_size: int = 4096, namespace: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Recorrer en lotes los chunks guardados (de un source y un espacio de nombres concretos si se indican)
+
+        Cada chunk es un dict con "id" y los campos de output_fields (todos los de CHUNK_FIELDS por defecto).
+        """
+
+    @abstractmethod
+    def iter_embeddings(self, batch_size: int = 4096,
+                        namespace: Optional[str] = None) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """Recorrer en lotes los chunks guardados con sus embeddings (para exportarlos sin volver a codificar)
+
+        Cada lote es (chunks, embeddings): los chunks traen "id", todos los campos de
+        CHUNK_FIELDS y su "namespace"; embeddings es una matriz float32 alineada con ellos.
+        """
+
+    @abstractmethod
+    def get_chunks(self, ids: Iterable[int], output_fields: Optional[List[str]] = None,
+                   namespaces: Optional[Sequence[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> Dict[int, Dict[str, Any]]:
+        """Leer chunks por ID (los que no existen o no cumplen `filters` no aparecen en el resultado)"""
+
+    @abstractmethod
+    def get_embeddings(self, ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """Leer los embeddings guardados de unos chunks por ID (los que no existen no aparecen)"""
+
+    @abstractmethod
+    def delete_chunks(self, ids: Iterable[int]) -> int:
+        """Borrar chunks por ID y devolver cuántos se pidieron borrar"""
+
+    @abstractmethod
+    def delete_collection(self):
+        """Eliminar la colección"""
+
+    @abstractmethod
+    def namespaces(self) -> List[str]:
+        """Espacios de nombres con datos (el por defecto es "")"""
+
+    def namespace_stats(self) -> Dict[str, Any]:
+        """Espacios de nombres existentes (y, si el backend los carga por separado, cuáles están cargados)"""
+        return {"namespaces": len(self.namespaces())}
+
+    @property
+    def search_fields(self) -> List[str]:
+        """Campos que devuelve cada resultado de búsqueda"""
+        return list(SEARCH_FIELDS)
+
+    def existing_chunks(self, source: Optional[str] = None, namespace: Optional[str] = None) -> Dict[int, str]:
+        """IDs de los chunks guardados (de un source y un espacio de nombres concretos si se indican) con su document_id"""
+        try:
+            existing: Dict[int, str] = {}
+            for chunks in self.iter_chunks(source, output_fields=["document_id"], namespace=namespace):
+                existing.update((chunk["id"], chunk["document_id"]) for chunk in chunks)
+            return existing
+        except Exception as e:
+            logger.error(f"Error al listar los chunks existentes: {e}")
+            raise
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Generar embeddings, reutilizando los de la cache si está activada"""
+        with get_metrics().span("encode"):
+            return self._encode(self.encoder, texts)
+
+    def encode_documents(self, texts: List[str]) -> np.ndarray:
+        """Embeddings de los chunks a ingerir: en el pool de procesos si está activado
+
+        Las consultas siguen usando encode() en el proceso actual (un lote pequeño no
+        compensa el viaje a los workers).
+        """
+        with get_metrics().span("encode_documents"):
+            return self._encode(self.embedding_pool or self.encoder, texts)
+
+    def _encode(self, encoder, texts: List[str]) -> np.ndarray:
+        if self.embedding_cache is None:
+            embeddings = encoder.encode(texts)
+        else:
+            embeddings = self.embedding_cache.encode(encoder, texts)
+        if self.metric_type in ("IP", "COSINE"):
+            # Con producto interno los embeddings tienen que estar normalizados
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            embeddings = embeddings / norms
+        return embeddings
+
+    def warmup(self):
+        """Precalentar el encoder y el índice con una búsqueda de prueba"""
+        try:
+            self.load_collection()
+            self.search_similar("warmup", top_k=1)
+            logger.info(f"Almacén de vectores precalentado ({type(self).__name__})")
+        except Exception as e:
+            logger.error(f"Error precalentando el almacén de vectores: {e}")
+            raise
+
+    def insert_documents(self, texts: List[str], flush: bool = True):
+        """Insertar documentos en la colección (cada texto es un chunk identificado por su contenido)"""
+        with get_metrics().trace("insert_documents"):
+            chunks = [
+                {"text": text, "source": "", "document_id": document_hash(text), "chunk_offset": 0}
+                for text in texts
+            ]
+            embeddings = self.encode_documents(texts)
+            with get_metrics().span("insert"):
+                return self.insert_chunks(chunks, embeddings, flush=flush)
+
+    def search_similar(self, query: str, top_k: int = 5, namespaces: Optional[Sequence[str]] = None,
+                       filters: Optional[Dict[str, Any]] = None,
+                       output_fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Buscar documentos similares"""
+        return self.search_similar_batch([query], top_k, namespaces, filters, output_fields)[0]
+
+    def search_similar_batch(self, queries: List[str], top_k: int = 5, namespaces: Optional[Sequence[str]] = None,
+                             filters: Optional[Dict[str, Any]] = None,
+                             output_fields: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Buscar documentos similares para varias consultas con una sola búsqueda"""
+        try:
+            if not queries:
+                return []
+
+            with get_metrics().trace("search_similar"):
+                # Generar los embeddings de todas las consultas en una sola pasada del modelo
+                query_embeddings = self.encode(queries)
+                with get_metrics().span("vector_search"):
+                    return self.search_by_embeddings(query_embeddings, top_k, namespaces, filters, output_fields)
+
+        except Exception as e:
+            logger.error(f"Error en la búsqueda: {e}")
+            raise
+
+
+def create_vector_store(backend: str = None, **kwargs) -> VectorStore:
+    """Crear el almacén de vectores indicado en VECTOR_STORE (milvus por defecto)"""
+    backend = (backend or os.getenv('VECTOR_STORE', 'milvus')).lower()
+    if backend == "milvus":
+        from milvus_client import MilvusClient
+        return MilvusClient(**kwargs)
+    if backend == "local":
+        from local_store import LocalVectorStore
+        return LocalVectorStore(**kwargs)
+    raise ValueError(f"Almacén de vectores no soportado: {backend} (opciones: {', '.join(VECTOR_STORES)})")